@@ -0,0 +1,200 @@
+# BPLIM Replication benchmarks
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import statistics
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+BENCHMARKS_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_PATH))
+from workloads import SCALES, createWorkload
+
+# Seconds the stub interpreter runs while the supervision loop is timed
+SUPERVISION_SECONDS = 2
+# Interval of the supervision loop (as in the app)
+SUPERVISION_INTERVAL = 0.01
+# Differences below this (seconds) are noise, whatever the ratio
+MIN_SECONDS = 0.05
+
+
+def timeCall(function, *args, **kwargs) -> float:
+    """Times a call (seconds)"""
+    start = time.perf_counter()
+    function(*args, **kwargs)
+
+    return time.perf_counter() - start
+
+
+def runOnce(workload: dict) -> dict:
+    """Runs every benchmark once on a workload
+
+    Parameters
+    ----------
+    workload : dict
+        workload (see workloads.createWorkload)
+
+    Returns
+    -------
+    dict
+        benchmark and seconds
+    """
+    # imported here: the settings file of the workload must be set first
+    from replication import Replication, USE_COMMANDS, ALERT_COMMANDS
+    from utils.checks import checkFields
+    from utils.misc import tree
+    from utils.datasets import inventoryDatasets
+
+    items = workload['items']
+    results = dict()
+    results['validation'] = timeCall(checkFields, None, items)
+
+    # preparation, and each of its phases
+    phases = list()
+
+    def onProgress(progress: dict) -> None:
+        if not phases or phases[-1][0] != progress['phase']:
+            phases.append((progress['phase'], time.perf_counter()))
+
+    replication = Replication(items=items)
+    start = time.time()
+    results['preparation'] = timeCall(replication.prepare, progressCallback=onProgress)
+    phases.append(('', time.perf_counter()))
+    for (phase, phaseStart), (_, phaseEnd) in zip(phases, phases[1:]):
+        results[f'preparation: {phase}'] = phaseEnd - phaseStart
+
+    structurePath = tempfile.mkdtemp(dir=workload['basePath'])
+    results['folder structure'] = timeCall(
+        replication._replicateFolderStructure, structurePath, workload['mainFolder']
+    )
+    shutil.rmtree(structurePath)
+    deepest = max(
+        (root for root, _, _ in os.walk(workload['mainFolder'])), key=lambda path: path.count(os.sep)
+    )
+    results['folder under main'] = timeCall(replication.isFolderUnderMain, deepest)
+    results['tree'] = timeCall(lambda: list(tree(Path(workload['dataPath']))))
+    results['datasets'] = timeCall(inventoryDatasets, workload['dataPath'], useCache=False)
+    bigScript = os.path.join(workload['mainFolder'], 'analysis.do')
+    results['flag lines'] = timeCall(
+        lambda: [Replication._flagScript(bigScript, commands) for commands in (USE_COMMANDS, ALERT_COMMANDS)]
+    )
+
+    # supervision loop (limits and poll), with a stub interpreter that
+    # runs SUPERVISION_SECONDS
+    os.environ['STUB_SECONDS'] = str(SUPERVISION_SECONDS)
+    process = replication.start()
+    iterations = 0
+    supervision = 0.0
+    while True:
+        iterationStart = time.perf_counter()
+        replication.checkLimits(process)
+        finished = process.poll() is not None
+        supervision += time.perf_counter() - iterationStart
+        iterations += 1
+        if finished:
+            break
+        time.sleep(SUPERVISION_INTERVAL)
+    results['supervision (per iteration)'] = supervision / iterations
+    replication.getReturnCode(process)
+    results['report'] = timeCall(replication.writeReport, start)
+    replication.discard()
+
+    return results
+
+
+def compareResults(current: dict, baseline: dict, threshold: float) -> list:
+    """Compares the results with a baseline
+
+    Parameters
+    ----------
+    current : dict
+        results
+    baseline : dict
+        baseline results
+    threshold : float
+        ratio to the baseline from which a benchmark regressed
+
+    Returns
+    -------
+    list
+        benchmarks that regressed
+    """
+    regressions = list()
+    print(f"\n{'Benchmark':<45}{'Baseline':>12}{'Current':>12}{'Ratio':>8}")
+    print(77 * '-')
+    for name, result in current['results'].items():
+        if name not in baseline['results']:
+            continue
+        before = baseline['results'][name]['seconds']
+        after = result['seconds']
+        ratio = after / before if before > 0 else float('inf')
+        # per-iteration costs are compared by ratio only
+        margin = 0 if 'per iteration' in name else MIN_SECONDS
+        regressed = ratio > threshold and after - before > margin
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<45}{before:>12.4f}{after:>12.4f}{ratio:>8.2f}{'  REGRESSION' if regressed else ''}")
+
+    return regressions
+
+
+parser = argparse.ArgumentParser(
+    "benchmark.py",
+    description='Times the replication pipeline on synthetic projects'
+)
+parser.add_argument('-s', '--scale', default='small', choices=list(SCALES), help='Size of the synthetic project')
+parser.add_argument('-w', '--workdir', default=os.path.join(tempfile.gettempdir(), 'replicationBenchmarks'),
+                    help='Folder of the synthetic projects (reused between runs)')
+parser.add_argument('-r', '--repeat', type=int, default=3, help='Runs of each benchmark (the fastest is kept)')
+parser.add_argument('-o', '--output', default='', help='Results file (default results/<scale>-<date>.json)')
+parser.add_argument('-b', '--baseline', default='', help='Results to compare with')
+parser.add_argument('-t', '--threshold', type=float, default=1.25, help='Ratio to the baseline that fails')
+args = parser.parse_args()
+
+workload = createWorkload(os.path.join(args.workdir, args.scale), args.scale)
+os.environ['REPLICATION_SETTINGS'] = workload['settingsFile']
+
+runs = [runOnce(workload) for _ in range(max(1, args.repeat))]
+results = {
+    'scale': args.scale,
+    'sizes': workload['sizes'],
+    'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    'python': platform.python_version(),
+    'platform': platform.platform(),
+    'cpus': os.cpu_count(),
+    'results': {
+        name: {
+            'seconds': min(run[name] for run in runs if name in run),
+            'median': statistics.median(run[name] for run in runs if name in run),
+            'runs': [run[name] for run in runs if name in run]
+        }
+        for name in runs[0]
+    }
+}
+output = args.output or os.path.join(
+    BENCHMARKS_PATH, 'results', f"{args.scale}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+)
+os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+with open(output, 'w') as f:
+    json.dump(results, f, indent=4)
+
+print(f"{'Benchmark':<45}{'Seconds':>12}{'Median':>12}")
+print(69 * '-')
+for name, result in results['results'].items():
+    print(f"{name:<45}{result['seconds']:>12.4f}{result['median']:>12.4f}")
+print(f"\nResults saved in {output}")
+
+if args.baseline:
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline['scale'] != args.scale:
+        sys.exit(f"The baseline is of scale {baseline['scale']}")
+    regressions = compareResults(results, baseline, args.threshold)
+    if regressions:
+        print(f"\nRegressions (ratio above {args.threshold}): {', '.join(regressions)}")
+        sys.exit(1)
@@ -0,0 +1,207 @@
+# workloads.py
+from typing import Dict, Tuple, Any
+import os
+import json
+import struct
+import random
+
+# Sizes of the synthetic projects. `small` runs in seconds (e.g. before
+# each commit); `full` is the size of the largest projects on the server
+SCALES = {
+    "small": {
+        "depth": 6,
+        "foldersPerLevel": 2,
+        "dataFiles": 2000,
+        "scripts": 50,
+        "bigFiles": 1,
+        "bigFileBytes": 20 * 1024 ** 2,
+        "doFileLines": 20000
+    },
+    "full": {
+        "depth": 12,
+        "foldersPerLevel": 2,
+        "dataFiles": 100000,
+        "scripts": 1000,
+        "bigFiles": 3,
+        "bigFileBytes": 2 * 1024 ** 3,
+        "doFileLines": 500000
+    }
+}
+PROJECT = 'pxxx_Benchmark'
+# Stub interpreter: runs STUB_SECONDS and writes the Stata log of the
+# script it runs, as the batch mode of Stata does
+STUB_INTERPRETER = """#!/bin/sh
+script="$3"
+sleep "${STUB_SECONDS:-0}"
+echo "running $script" > "${script%.*}.log"
+echo "end of do-file" >> "${script%.*}.log"
+"""
+# Lines of the large do-file (use/list lines are flagged in the report)
+DO_FILE_LINES = (
+    'use "${path_source}/data_%d.dta", clear',
+    'list firm_id wage in 1/%d',
+    'display "step %d"',
+    'gen x%d = runiform()',
+    'merge 1:1 firm_id using "${path_source_i}/merge_%d.dta"',
+    'summarize x%d'
+)
+
+
+def createDtaHeader(nobs: int, names: Tuple[str, ...]) -> bytes:
+    """Creates the header of a Stata dataset (format 118, double
+    variables), up to the data
+
+    Parameters
+    ----------
+    nobs : int
+        number of observations
+    names : Tuple[str, ...]
+        variable names
+
+    Returns
+    -------
+    bytes
+        header, map, variable types and names
+    """
+    header = (
+        b'<stata_dta><header><release>118</release><byteorder>LSF</byteorder>'
+        + b'<K>' + struct.pack('<H', len(names)) + b'</K><N>' + struct.pack('<Q', nobs) + b'</N>'
+        + b'<label>' + struct.pack('<H', 9) + b'Benchmark</label>'
+        + b'<timestamp>' + bytes([17]) + b'01 Jan 2024 00:00</timestamp></header>'
+    )
+    mapOffset = len(header)
+    typesOffset = mapOffset + len(b'<map>') + 112 + len(b'</map>')
+    namesOffset = typesOffset + len(b'<variable_types>') + 2 * len(names) + len(b'</variable_types>')
+    dataOffset = namesOffset + len(b'<varnames>') + 129 * len(names) + len(b'</varnames>')
+    offsets = [0, mapOffset, typesOffset, namesOffset] + [dataOffset] * 10
+
+    return (
+        header
+        + b'<map>' + struct.pack('<14Q', *offsets) + b'</map>'
+        + b'<variable_types>' + struct.pack(f'<{len(names)}H', *[65526] * len(names)) + b'</variable_types>'
+        + b'<varnames>' + b''.join(name.encode().ljust(129, b'\0') for name in names) + b'</varnames>'
+    )
+
+
+def createWorkload(basePath: str, scale: str = 'small', seed: int = 0) -> Dict[str, Any]:
+    """Creates a synthetic project under `basePath/projects`: a deep
+    hierarchy of folders under the work area, many small data files in
+    `initial_dataset`, a few large files (sparse) and a large do-file
+    full of use/list lines. Existing workloads of the same scale are
+    reused
+
+    Parameters
+    ----------
+    basePath : str
+        folder of the workload
+    scale : str, optional
+        size of the project (see SCALES), by default 'small'
+    seed : int, optional
+        random seed, by default 0
+
+    Returns
+    -------
+    Dict[str, Any]
+        replication fields (as in structure.json), settings file and
+        paths of the workload
+    """
+    sizes = SCALES[scale]
+    random.seed(seed)
+    projectsPath = os.path.join(basePath, 'projects')
+    rootPath = os.path.join(projectsPath, PROJECT)
+    mainFolder = os.path.join(rootPath, 'work_area', 'analysis')
+    dataPath = os.path.join(rootPath, 'initial_dataset')
+    markerFile = os.path.join(basePath, f'.{scale}.json')
+    workload = {
+        'basePath': basePath,
+        'rootPath': rootPath,
+        'mainFolder': mainFolder,
+        'dataPath': dataPath,
+        'settingsFile': os.path.join(basePath, 'settings.json'),
+        'interpreter': os.path.join(basePath, 'stubInterpreter'),
+        'sizes': sizes
+    }
+    if os.path.isfile(markerFile):
+        with open(markerFile) as f:
+            workload['items'] = json.load(f)
+        return workload
+
+    # deep hierarchy of folders (mostly empty, as output folders are)
+    folders = [mainFolder]
+    level = [mainFolder]
+    for depth in range(sizes['depth']):
+        level = [
+            os.path.join(folder, f'level{depth}_{index}')
+            for folder in level for index in range(sizes['foldersPerLevel'])
+        ][:512]
+        folders.extend(level)
+    for folder in folders:
+        os.makedirs(folder, exist_ok=True)
+    # small data files
+    for index in range(sizes['dataFiles']):
+        folder = os.path.join(dataPath, f'year{index % 20 + 2000}')
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f'data_{index}.dta'), 'wb') as f:
+            f.write(createDtaHeader(random.randint(1, 10 ** 6), ('firm_id', 'wage', f'x{index}')))
+            f.write(os.urandom(random.randint(100, 4096)))
+    # large files (sparse: they take no space, but are read and copied in full)
+    bigFiles = list()
+    for index in range(sizes['bigFiles']):
+        bigFile = os.path.join(mainFolder, 'inputs', f'big_{index}.dta')
+        os.makedirs(os.path.dirname(bigFile), exist_ok=True)
+        with open(bigFile, 'wb') as f:
+            f.truncate(sizes['bigFileBytes'])
+        bigFiles.append(bigFile)
+    # scripts
+    scripts = list()
+    for index in range(sizes['scripts']):
+        script = os.path.join(random.choice(folders), f'script_{index}.do')
+        with open(script, 'w') as f:
+            for line in range(50):
+                f.write(random.choice(DO_FILE_LINES) % line + '\n')
+        scripts.append(script)
+    bigScript = os.path.join(mainFolder, 'analysis.do')
+    with open(bigScript, 'w') as f:
+        for line in range(sizes['doFileLines']):
+            f.write(random.choice(DO_FILE_LINES) % line + '\n')
+    mainScript = os.path.join(mainFolder, 'main.do')
+    with open(mainScript, 'w') as f:
+        f.write('clear all\ndo "analysis.do"\n')
+    # stub interpreter and settings (local runtime, caches in the workload)
+    with open(workload['interpreter'], 'w') as f:
+        f.write(STUB_INTERPRETER)
+    os.chmod(workload['interpreter'], 0o755)
+    with open(workload['settingsFile'], 'w') as f:
+        json.dump(
+            {
+                'projectsPath': projectsPath,
+                'cacheDir': os.path.join(basePath, 'cache'),
+                'runtime': 'local',
+                'programs': {'stata': f"{workload['interpreter']} -b do"},
+                'limitsCheckInterval': 0,
+                'diskCheckInterval': 0
+            },
+            f,
+            indent=4
+        )
+    items = {
+        'mainFolderInput': mainFolder,
+        'mainScriptInput': mainScript,
+        'runtime': 'local',
+        'containerImage': '',
+        'containerDefinition': '',
+        'dependencies': sorted([bigScript, *scripts, *bigFiles]),
+        'tools': [],
+        'parallelRun': False,
+        'stagedRun': False,
+        'slurmRun': False,
+        'limitTime': '',
+        'limitMemory': '',
+        'limitCpus': '',
+        'limitDisk': ''
+    }
+    with open(markerFile, 'w') as f:
+        json.dump(items, f, indent=4)
+    workload['items'] = items
+
+    return workload
@@ -1,4 +1,7 @@
 import PySimpleGUI as sg
+from utils.runtimes import RUNTIMES
+from utils.processes import PRIORITY_CLASSES
+from utils.settings import loadSettings
 
 # Tooltips
 mainPathTooltip = """Main directory of the replication. All sub-directories contained in 
@@ -10,6 +13,10 @@ dependencies in case they exist. This file must be in the main
 directory, otherwise the replication will not run."""
 containerImageTooltip = """Container to run the replication. Singularity image that contains 
 the runtime used (Stata, R, Python, Julia) to run the analysis."""
+runtimeTooltip = """Runtime used to run the replication: Singularity/Apptainer (SIF image),
+Docker/Podman (image reference) or local (interpreters installed 
+on the host, no container). The local runtime is meant for quick 
+iterations and tests."""
 containerDefTooltip = """Definition file used to create the container. This field is optional,
  but it is recommended that the user provides this file for 
 reproducibility purposes."""
@@ -25,6 +32,44 @@ paths to use the tools inside them during the replication. If
 the path(s) is(are) under the main directory, the entire folder,
  as well as sub-folders and files are copied to the replication 
 area. In this case the folder size cannot exceed 10MB."""
+treePickerTooltip = """Picks files (folders) of the main directory in a tree. Folders are 
+listed when expanded, and the filter (text or glob pattern) searches 
+the whole main directory. Check entries with the space bar, a double 
+click or the buttons; checking a folder checks the files under it."""
+importTooltip = """Adds the scripts matched by glob patterns (relative to the main 
+directory, ** for any number of folders) or under folders."""
+discoverTooltip = """Adds the scripts called by the main script, recursively (do/run/include, 
+source, include, run_path and imports of Python modules in the main 
+directory)."""
+parallelRunTooltip = """Runs the sub-scripts called by the main script in separate processes. 
+Sub-scripts that do not depend on each other (inferred from the 
+data files they read and write, or declared in comments with 
+@inputs and @outputs) run concurrently."""
+stagedRunTooltip = """Runs each sub-script called by the main script in a separate process,
+one after the other, and records the stages that finished. A 
+replication run by stages may be resumed from the stage that failed."""
+sparseStructureTooltip = """Creates only the folders of the files copied and of the outputs of 
+the scripts (declared with @outputs or inferred), instead of every 
+folder under the main directory. Folders and files matched by the 
+patterns in .replicationignore (main directory) are never replicated."""
+overlayRunTooltip = """Runs the replication in an overlay of the main directory instead of 
+copying the files: the main directory is read-only and the replication 
+folder keeps only the files written by the run. Needs fuse-overlayfs. 
+The main directory must not change while the replication runs."""
+priorityTooltip = """CPU and I/O priority of the run and of the copies: normal, low (nice 10)
+or background (nice 19, idle I/O). Use low priorities for heavy runs on 
+a shared server."""
+pauseTooltip = """Pauses the replication running (SIGSTOP) and resumes it (SIGCONT). The
+time paused is not counted as run time."""
+resumeTooltip = """Resumes a replication that failed (Ctrl+Shift+U). Stages that 
+succeeded, and whose inputs are unchanged, are skipped."""
+slurmRunTooltip = """Submits the replication to Slurm (sbatch) instead of running it on 
+this host. Resources are requested from the limits, and the job is 
+tracked until it ends."""
+limitsTooltip = """Limits of the run: wall-clock time (hours), memory (GB), CPUs and 
+growth of the replication folder (GB). The run is stopped if a limit 
+is exceeded. Empty fields use the project limits (settings file), 
+which are also the maximum allowed."""
 
 ############################
 ########## Layout ##########
@@ -56,7 +101,18 @@ mainScriptFrameLayout = [
 ]
 # Container Image frame layout
 containerImageFrameLayout = [
-    [sg.Text('[3] Select Container Image')],
+    [
+        sg.Text('[3] Select Container Image'),
+        sg.Push(),
+        sg.Text('Runtime'),
+        sg.Combo(
+            list(RUNTIMES),
+            default_value=loadSettings()['runtime'],
+            key='runtime',
+            readonly=True,
+            tooltip=runtimeTooltip
+        )
+    ],
     [
         sg.Input(key='containerImage', expand_x=True, tooltip=containerImageTooltip), 
         sg.Button('Browse', key='containerImageBrowse', tooltip='Ctrl+3', size=(8, 1)),
@@ -85,7 +141,12 @@ dependenciesFrameLayout = [
             size=(1, 6),
             tooltip=dependenciesTooltip
         ), 
-        sg.Button('Browse', key='dependenciesBrowse', tooltip='Ctrl+5', size=(8, 1)),
+        sg.Column([
+            [sg.Button('Browse', key='dependenciesBrowse', tooltip='Ctrl+5', size=(8, 1))],
+            [sg.Button('Tree', key='dependenciesTree', tooltip=treePickerTooltip, size=(8, 1))],
+            [sg.Button('Import', key='dependenciesImport', tooltip=importTooltip, size=(8, 1))],
+            [sg.Button('Discover', key='dependenciesDiscover', tooltip=discoverTooltip, size=(8, 1))]
+        ]),
         sg.Button('Remove Selected', key='removeDependencies', tooltip='Alt+5', size=(14, 1))
     ]    
 ]
@@ -102,10 +163,36 @@ toolsFrameLayout = [
             size=(1, 3),
             tooltip=toolsTooltip
         ), 
-        sg.Button('Browse', key='toolsBrowse', tooltip='Ctrl+6', size=(8, 1)),
+        sg.Column([
+            [sg.Button('Browse', key='toolsBrowse', tooltip='Ctrl+6', size=(8, 1))],
+            [sg.Button('Tree', key='toolsTree', tooltip=treePickerTooltip, size=(8, 1))]
+        ]),
         sg.Button('Remove Selected', key='removeToolsFolders', tooltip='Alt+6', size=(14, 1))
     ]    
 ]
+# Limits
+limitsFrameLayout = [
+    [
+        sg.Text('[7] Limits (Optional)', tooltip=limitsTooltip),
+        sg.Text('Hours'),
+        sg.Input(key='limitTime', size=(6, 1), tooltip=limitsTooltip),
+        sg.Text('Memory (GB)'),
+        sg.Input(key='limitMemory', size=(6, 1), tooltip=limitsTooltip),
+        sg.Text('CPUs'),
+        sg.Input(key='limitCpus', size=(6, 1), tooltip=limitsTooltip),
+        sg.Text('Disk (GB)'),
+        sg.Input(key='limitDisk', size=(6, 1), tooltip=limitsTooltip),
+        sg.Push(),
+        sg.Text('Priority'),
+        sg.Combo(
+            list(PRIORITY_CLASSES),
+            default_value=loadSettings()['priority'],
+            key='priority',
+            readonly=True,
+            tooltip=priorityTooltip
+        )
+    ]
+]
 # Run and load from File
 outLayout = [
     [sg.VPush()],
@@ -113,10 +200,30 @@ outLayout = [
         sg.Push(), 
         sg.Button('Load From File', key='loadFromFile', tooltip='Ctrl+Shift+L', size=(16, 1)),
         sg.Button('Run', key='runStopApp', tooltip='Ctrl+Shift+R', size=(5, 1)),
+        sg.Button('Pause', key='pauseResume', tooltip=pauseTooltip, size=(7, 1)),
+        sg.Button('Resume', key='resumeReplication', tooltip=resumeTooltip, size=(8, 1)),
+        sg.Push()
+    ],
+    [
+        sg.Push(),
+        sg.Checkbox('Run independent sub-scripts in parallel', key='parallelRun', tooltip=parallelRunTooltip),
+        sg.Checkbox('Record stages (resumable)', key='stagedRun', tooltip=stagedRunTooltip),
+        sg.Checkbox('Submit to Slurm', key='slurmRun', tooltip=slurmRunTooltip),
+        sg.Checkbox('Only needed folders', key='sparseStructure', tooltip=sparseStructureTooltip),
+        sg.Checkbox('Overlay (no copies)', key='overlayRun', tooltip=overlayRunTooltip),
         sg.Push()
     ],
     [sg.VPush()]
 ]
+# Preparation progress
+progressLayout = [
+    [
+        sg.Push(),
+        sg.ProgressBar(100, orientation='h', size=(40, 10), key='progressBar'),
+        sg.Push()
+    ],
+    [sg.Push(), sg.Text('', key='progress'), sg.Push()]
+]
 # Time 
 timeLayout = [
     [sg.Push(), sg.Text('', font='Young 15', key='time'), sg.Push()]
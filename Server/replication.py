@@ -2,21 +2,65 @@
 import PySimpleGUI as sg
 import os
 import shlex
-import shutil
 import re
 import json
+import time
+import sqlite3
+import threading
 import subprocess
 from pathlib import Path
-from datetime import datetime
-from typing import Dict, List, Union, Tuple, Generator, Any
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Union, Tuple, Generator, Any
 from templates.stata import createProfile
 from templates.rlang import createConfigFile as createRConfigFile
 from templates.pylang import createConfigFile as createPyConfigFile
+from templates.julia import createConfigFile as createJuliaConfigFile
 from utils.misc import tree
+from utils.updateFields import getWindowItems
+from utils.container import getContainerInfo
+from utils.scripts import getLanguage, getPathVariables, getScriptInputsOutputs, checkStataLog
+from utils.dag import buildStages, readStagesState, recordAttempt, StageRunner, STAGES_STATE_FILE
+from utils.settings import loadSettings
+from utils.numbering import allocateReplicationFolder, releaseReplicationFolder
+from utils.progress import CopyProgress, formatBytes
+from utils.limits import (
+    ResourceLimits,
+    Watchdog,
+    getLimitsBackend,
+    getPreexecFunction,
+    wrapCommand
+)
+from utils.allocation import getCoreAllocation
+from utils.julia import JuliaEnvironment, findJuliaProject, getProjectFiles
+from utils.slurm import BATCH_SCRIPT, SlurmJob, createBatchScript
+from utils.runtimes import SIF_RUNTIMES, getRuntime, getProgram, describeRuntime
+from utils.ignore import IgnoreRules
+from utils.overlay import Overlay, OverlayError, getOverlayBackend
+from utils.datasets import inventoryDatasets, getLargestDataset
+from utils.tracer import STRACE_FOLDER, AccessTracer, getTracerBackend
+from utils.snapshot import takeSnapshot, diffSnapshots
+from utils.processes import PRIORITY_CLASSES, RunPause, setPriority, terminateProcess
+from utils.catalog import readReplication, upsertReplications, getProject, PROJECT_REGULAR_EXPRESSION
+from utils.history import (
+    getMetrics,
+    getHistory,
+    compareWithHistory,
+    estimateRunTime,
+    describeRegressions
+)
 
 # Gobals
 STATA_VERSION = 18
-PROJECT_REGULAR_EXPRESSION = r'(p|r)(\d{3}|xxx)_[a-zA-Z]+'
+# Output of the replication process, when saved to a file
+OUTPUT_LOG = '.output.log'
+# Lines of output returned by default
+OUTPUT_LINES = 50
+# Data files opened by the run (see utils/tracer.py)
+DATA_ACCESS_FILE = 'dataaccess.json'
+# Data files listed in the report (the JSON file lists all of them)
+DATA_ACCESS_ROWS = 100
+# Files of the app in the replication folder, left out of the outputs
+APP_FILES = ('.report.txt', OUTPUT_LOG, DATA_ACCESS_FILE, STAGES_STATE_FILE, STRACE_FOLDER)
 # Use commands (Stata): key -> command; value -> regular expression
 USE_COMMANDS = {
     "use": r"^use", 
@@ -33,16 +77,83 @@ class Replication(object):
     """Class that handles the replication process
     """
 
-    def __init__(self, window: sg.Window):
+    def __init__(
+        self,
+        window: Union[sg.Window, None] = None,
+        resumePath: str = '',
+        items: Union[Dict[str, Any], None] = None,
+        logOutput: bool = False
+    ):
 
         self._window = window
-        self._mainFolderPath = self._window['mainFolderInput'].get()
-        self._mainScript = self._window['mainScriptInput'].get()
-        self._containerImage = self._window['containerImage'].get()
-        self._containerDef = self._window['containerDefinition'].get()
-        self._dependencies = self._window['dependencies'].get_list_values()
+        # Window values are read here, since the preparation may run
+        # outside the GUI thread. Without a window (e.g. in the daemon)
+        # the values are given as a dictionary (as in structure.json)
+        self._items = self._getItems() if items is None else dict(items)
+        self._mainFolderPath = self._items['mainFolderInput']
+        self._mainScript = self._items['mainScriptInput']
+        self._containerImage = self._items.get('containerImage', '')
+        self._containerDef = self._items.get('containerDefinition', '')
+        self._dependencies = self._items.get('dependencies', [])
+        self._parallelRun = bool(self._items.get('parallelRun'))
+        self._stagedRun = bool(self._items.get('stagedRun'))
+        self._slurmRun = bool(self._items.get('slurmRun'))
+        self._sparseStructure = bool(self._items.get('sparseStructure'))
+        self._overlayRun = bool(self._items.get('overlayRun'))
+        self._overlay = None
+        # Files staged ahead of the preparation (see stage and useStaged)
+        self._incremental = False
+        self._structureStaged = False
+        self._ignoreRules = IgnoreRules([])
+        # Output of the process saved to a file, instead of a pipe
+        self._logOutput = logOutput
         self._userDefinedTools, self._externalTools = self._splitToolsPaths()
-        self._replicationPath = self._getReplicationPath()
+        self._replicationPath = resumePath or self._getReplicationPath()
+        self._attempt = 1
+        self._previousReport = ''
+        self._containerInfo = dict()
+        self._stageRunner = None
+        self._slurmJob = None
+        self._executionNote = ''
+        self._progress = CopyProgress()
+        self._preparationTime = 0.0
+        self._limits = ResourceLimits.fromValues(self._items)
+        self._limitsBackend = getLimitsBackend()
+        self._watchdog = None
+        # Priority class of the run and time paused (see pauseRun/continueRun)
+        self._priority = self._items.get('priority') or loadSettings()['priority']
+        if self._priority not in PRIORITY_CLASSES:
+            self._priority = 'normal'
+        self._pause = RunPause()
+        # Stata datasets of the project (see utils/datasets.py)
+        self._datasets = list()
+        # Data files opened by the run
+        self._tracer = None
+        # Files of the replication folder before the run (see takeSnapshot)
+        self._snapshot = None
+        # Lines flagged in the report, for the catalog (see _writeFlagCommands)
+        self._flagged = None
+        # How the run was stopped (see stop)
+        self._termination = None
+        self._terminationLock = threading.Lock()
+        self._julia = None
+        self._history = None
+        self._comparison = list()
+        self._runtime = getRuntime(
+            self._items.get('runtime') or loadSettings()['runtime'],
+            self._containerImage,
+            mounts=[
+                self._getRootPath(mainFolderPath=self._mainFolderPath),
+                loadSettings()['cacheDir']
+            ]
+        )
+        self._allocation = getCoreAllocation(
+            self._limits,
+            self._limitsBackend,
+            workers=loadSettings()['parallelWorkers'] if self._parallelRun and not self._slurmRun else 1,
+            slot=int(re.sub(r'\D', '', os.path.basename(self._replicationPath)) or 0),
+            remote=self._slurmRun
+        )
 
     def _splitToolsPaths(self) -> Tuple[List[str]]:
         """Splits tools paths into user paths and 
@@ -55,7 +166,7 @@ class Replication(object):
         """
         userDefinedTools = list()
         externalTools = list()
-        toolsFolders = self._window['tools'].get_list_values()
+        toolsFolders = self._items.get('tools', [])
         for folder in toolsFolders:
             if self.isFolderUnderMain(folder):
                 userDefinedTools.append(folder)
@@ -65,82 +176,19 @@ class Replication(object):
         return userDefinedTools, externalTools
 
     def _getReplicationPath(self) -> str:
-        """Getter for replication path
+        """Getter for replication path. The replication number is
+        allocated under a lock, so concurrent runs never share
+        the same folder
 
         Returns
         -------
         str
             Replication path
         """
-        replicationFolderExists = self._replicationFolderExists(self._mainFolderPath)
-        if not replicationFolderExists:
-            repPath = self._makeDir(self._mainFolderPath, 'Replications')
-            repPathNumber = self._makeDir(repPath, 'Rep001')
-        else:
-            repPath = os.path.join(self._mainFolderPath, 'Replications')
-            repNumber = self._getReplicationNumber(repPath)
-            repPathNumber  = self._makeDir(repPath, f'Rep{repNumber:03}')
- 
-        return repPathNumber
-
-    def _replicationFolderExists(self, mainFolder) -> bool:
-        """Verifies if there is a replication path set
-
-        Parameters
-        ----------
-        mainFolder : str
-            App main folder
-
-        Returns
-        -------
-        bool
-            True if replication folder already exists
-        """
-        return "Replications" in os.listdir(mainFolder)
-
-    def _getReplicationNumber(self, replicationsPath: str) -> int:
-        """Gets the number of the current replication
-
-        Parameters
-        ----------
-        replicationsPath : str
-            Path for replications
-
-        Returns
-        -------
-        int
-            Replication number
-        """
-        dirs = [file for file in os.listdir(replicationsPath) 
-                if os.path.isdir(os.path.join(replicationsPath, file))]
-        try:
-            replicationNumber = max(
-                [int(re.search(r'\d{3}', file)[0]) for file in dirs]
-            ) + 1
-        except ValueError:
-            replicationNumber = 1
-
-        return replicationNumber
-
-    def _makeDir(self, base: str, folder: str) -> str:
-        """Creates a new folder in a specified path
-
-        Parameters
-        ----------
-        base : str
-            path where the folder is going to be created
-        folder : str
-            folder to create
+        return allocateReplicationFolder(
+            os.path.join(self._mainFolderPath, 'Replications')
+        )
 
-        Returns
-        -------
-        str
-            folder created
-        """
-        os.mkdir(os.path.join(base, folder))
-        
-        return os.path.join(base, folder)
-        
     def _getItems(self) -> Dict[str, Union[str, List[str]]]:
         """Gets main folder input
 
@@ -149,41 +197,77 @@ class Replication(object):
         Dict[str, Union[str, List[str]]]
             Main entry path for replication
         """
-        finalDict = {}
-        windowDict = self._window.key_dict
-        for key in windowDict.keys():
-            if isinstance(windowDict[key], sg.Input):
-                finalDict[key] = windowDict[key].get()
-            if isinstance(windowDict[key], sg.Listbox):   
-                finalDict[key] = windowDict[key].get_list_values()
-
-        return finalDict
+        return getWindowItems(self._window)
 
     def _writeToJson(self) -> None:
         """writes dictionary with replication info to a 
         JSON file
         """
-        replicationInfo = self._getItems()
+        replicationInfo = self._items
         jsonFile = os.path.join(self._replicationPath, 'structure.json')
         with open(jsonFile, 'w') as outFile:
             json.dump(replicationInfo, outFile, indent=4)
 
     def _createReplicationStructure(self) -> None:
         """Creates folders and copies files needed 
-        for the replication process
+        for the replication process. In sparse mode, only the folders
+        of the files copied and of the outputs of the scripts are created
         """
-        self._replicateFolderStructure(
+        self._ignoreRules = IgnoreRules.fromFolder(self._mainFolderPath)
+        if self._overlayRun:
+            self._progress.setPhase('Preparing overlay')
+            self._overlay = self._getOverlay()
+            self._progress.setPhase('Copying files')
+            self._copyFiles(
+                self._replicationPath,
+                self._mainFolderPath
+            )
+            return
+        if not self._sparseStructure and not self._structureStaged:
+            self._progress.setPhase('Creating folders')
+            self._replicateFolderStructure(
+                self._replicationPath,
+                self._mainFolderPath
+            )
+        self._progress.setPhase('Copying files')
+        self._copyFiles(
             self._replicationPath,
             self._mainFolderPath
         )
-        self._copyFiles(
+        if self._sparseStructure:
+            self._progress.setPhase('Creating folders')
+            self._createOutputFolders()
+
+    def _getOverlay(self) -> Overlay:
+        """Gets the overlay of the replication folder (the main folder
+        is the lower layer), with the folder of the main script created
+        in the upper layer for the configuration file
+
+        Returns
+        -------
+        Overlay
+            overlay, not mounted yet
+        """
+        overlay = Overlay(
+            self._mainFolderPath,
             self._replicationPath,
-            self._mainFolderPath
+            getOverlayBackend(self._runtime.name)
         )
+        overlay.prepare(self._ignoreRules)
+        os.makedirs(
+            os.path.join(
+                self._replicationPath,
+                os.path.relpath(os.path.dirname(self._items['mainScriptInput']), self._mainFolderPath)
+            ),
+            exist_ok=True
+        )
+
+        return overlay
 
     def _replicateFolderStructure(self, destinationPath: str, sourcePath: str) -> None:
         """Replicates the folder structure under `sourcePath`
-        in `destinationPath`
+        in `destinationPath`. Folders matched by the ignore rules
+        are pruned (with their content)
         Parameters
         ----------
         destinationPath : str
@@ -191,15 +275,16 @@ class Replication(object):
         sourcePath : str
             source path
         """
+        self._progress.checkCancelled()
+        prefix = os.path.relpath(sourcePath, self._mainFolderPath)
+        prefix = '' if prefix == '.' else prefix.replace(os.sep, '/') + '/'
         with os.scandir(sourcePath) as content:
             for item in content:
                 if (
                     item.is_dir() and 
-                    not item.name.startswith(".") and 
-                    not item.name.startswith("initial_dataset") and 
-                    not item.name.startswith("Replications")
+                    not self._ignoreRules.matches(prefix + item.name, isFolder=True)
                 ):
-                    os.mkdir(os.path.join(destinationPath, item.name))
+                    os.makedirs(os.path.join(destinationPath, item.name), exist_ok=True)
                     self._replicateFolderStructure(
                         os.path.join(destinationPath, item.name),
                         os.path.join(sourcePath, item.name)
@@ -207,7 +292,8 @@ class Replication(object):
 
     def _copyFiles(self, destinationPath: str, sourcePath: str) -> None:
         """Copy the files selected by the user to the directory where
-        the replication is going to be run
+        the replication is going to be run. Missing folders (sparse
+        mode, or folders ignored) are created
         Parameters
         ----------
         destinationPath : str
@@ -215,18 +301,118 @@ class Replication(object):
         sourcePath : str
             main folder selected by the user
         """
-        filesList = self._getFilesForReplication()
-        for file in filesList:
-            relativeFilePath = os.path.relpath(file, sourcePath) 
-            shutil.copy2(
-                file,
-                os.path.join(destinationPath, relativeFilePath)
-            )
+        if self._overlayRun:
+            # scripts and data are read from the lower layer. The Julia
+            # project is copied to build its environment
+            filesList = self._getJuliaProjectFiles()
+        else:
+            filesList = self._getFilesForReplication()
         if self._containerDef:
-            shutil.copy2(
-                self._containerDef,
-                self._replicationPath
+            filesList.append(self._containerDef)
+        self._progress.setTotals(
+            totalFiles=len(filesList),
+            totalBytes=sum(os.path.getsize(file) for file in filesList)
+        )
+        destinations = [
+            os.path.join(self._replicationPath, os.path.basename(file)) if file == self._containerDef
+            else os.path.join(destinationPath, os.path.relpath(file, sourcePath))
+            for file in filesList
+        ]
+        if self._incremental:
+            self._removeStaleFiles(destinations)
+        createdFolders = set()
+        for file, destination in zip(filesList, destinations):
+            folder = os.path.dirname(destination)
+            if folder not in createdFolders:
+                os.makedirs(folder, exist_ok=True)
+                createdFolders.add(folder)
+            if self._incremental and Replication._isStaged(file, destination):
+                self._progress.skipFile(os.path.getsize(file))
+                continue
+            self._progress.copyFile(file, destination)
+
+    @staticmethod
+    def _isStaged(source: str, destination: str) -> bool:
+        """Checks if a file was already copied and is unchanged (same
+        size and modification time, which the copy preserves)
+
+        Parameters
+        ----------
+        source : str
+            source file
+        destination : str
+            copied file
+
+        Returns
+        -------
+        bool
+            True if the copy is up to date
+        """
+        try:
+            sourceStat = os.stat(source)
+            destinationStat = os.stat(destination)
+        except OSError:
+            return False
+
+        return (
+            sourceStat.st_size == destinationStat.st_size and
+            sourceStat.st_mtime_ns == destinationStat.st_mtime_ns
+        )
+
+    def _removeStaleFiles(self, destinations: List[str]) -> None:
+        """Removes the files staged that are no longer selected
+
+        Parameters
+        ----------
+        destinations : List[str]
+            files copied to the replication folder
+        """
+        keep = {
+            os.path.normcase(destination)
+            for destination in [*destinations, os.path.join(self._replicationPath, 'structure.json')]
+        }
+        for root, _, files in os.walk(self._replicationPath):
+            for file in files:
+                path = os.path.join(root, file)
+                if os.path.normcase(path) not in keep:
+                    os.remove(path)
+
+    def _createOutputFolders(self) -> None:
+        """Creates the folders of the outputs of the scripts (declared
+        with `@outputs:` or inferred from the save/export commands) in the
+        replication folder (sparse mode)
+        """
+        language = getLanguage(self._mainScript)
+        variables = getPathVariables(
+            language,
+            self._getRootPath(mainFolderPath=self._mainFolderPath),
+            self._replicationPath
+        )
+        replicationRoot = os.path.normpath(self._replicationPath) + os.sep
+        mainScript = os.path.join(
+            self._replicationPath, os.path.relpath(self._mainScript, self._mainFolderPath)
+        )
+        workPath = os.path.dirname(mainScript)
+        # scripts called by the main script are inspected with it (and the
+        # globals it defines); other scripts of the language on their own
+        visited = set()
+        outputs = set()
+        for script in self._getFilesForReplication():
+            if getLanguage(script) != language:
+                continue
+            replicatedScript = os.path.join(
+                self._replicationPath, os.path.relpath(script, self._mainFolderPath)
             )
+            if script == self._mainScript:
+                replicatedScript = mainScript
+            elif os.path.normcase(replicatedScript) in visited:
+                continue
+            _, scriptOutputs, _ = getScriptInputsOutputs(replicatedScript, variables, workPath, visited)
+            outputs.update(scriptOutputs)
+        for output in outputs:
+            folder = os.path.normpath(os.path.dirname(output))
+            if (folder + os.sep).startswith(replicationRoot):
+                os.makedirs(folder, exist_ok=True)
 
     def _getFilesForReplication(self) -> List[str]:
         """Gets list of files to proceed with
@@ -241,14 +427,37 @@ class Replication(object):
         # Main script and dependencies
         replicationFiles.append(self._mainScript)
         replicationFiles.extend(self._dependencies)
+        # Julia project (environment) of the main script
+        replicationFiles.extend(
+            file for file in self._getJuliaProjectFiles()
+            if file not in replicationFiles
+        )
         if self._userDefinedTools:
             for path in self._userDefinedTools:
-                for root, _, files in os.walk(path):
+                for root, dirs, files in os.walk(path):
+                    relativeRoot = os.path.relpath(root, self._mainFolderPath)
+                    dirs[:] = self._ignoreRules.filterFolders(relativeRoot, dirs)
                     for file in files:
-                        replicationFiles.append(os.path.join(root, file))
+                        if not self._ignoreRules.matches(os.path.join(relativeRoot, file)):
+                            replicationFiles.append(os.path.join(root, file))
 
         return replicationFiles
 
+    def _getJuliaProjectFiles(self) -> List[str]:
+        """Gets the files of the Julia project (environment) of the
+        main script
+
+        Returns
+        -------
+        List[str]
+            project files (empty if the main script has no project)
+        """
+        if not self._mainScript.endswith(".jl"):
+            return list()
+        projectPath = findJuliaProject(self._mainScript, self._mainFolderPath)
+
+        return getProjectFiles(projectPath) if projectPath else list()
+
     def isFolderUnderMain(self, folder: str) -> bool:
         """Checks if a folder is under the main 
         path
@@ -294,6 +503,47 @@ class Replication(object):
             infoLine = f'{numberFolders} directories, {numberFiles} files'
             fileOut.write(infoLine)
 
+    def _writeDatasets(self, rootPath: str, outFile: str, jsonFile: str) -> None:
+        """Adds the inventory of the Stata datasets (from their headers)
+        to the data files list, and saves it with the variable names in
+        a JSON file. Both files are saved in the replication area
+
+        Parameters
+        ----------
+        rootPath : str
+            folder of the datasets
+        outFile : str
+            data files list (tree file)
+        jsonFile : str
+            inventory file
+        """
+        with open(os.path.join(self._replicationPath, jsonFile), 'w', encoding='utf-8') as fileOut:
+            json.dump(
+                [dict(item, path=os.path.relpath(item['path'], rootPath)) for item in self._datasets],
+                fileOut,
+                indent=4,
+                ensure_ascii=False
+            )
+        if not self._datasets:
+            return
+        files = [os.path.relpath(item['path'], rootPath) for item in self._datasets]
+        rightOffset = Replication._getRightOffset(files, 10)
+        with open(os.path.join(self._replicationPath, outFile), 'a', encoding='utf-8') as fileOut:
+            fileOut.write('\n\nStata datasets (headers)\n\n')
+            fileOut.write(
+                f"{'File':<{rightOffset}}{'Format':>7}{'Observations':>15}{'Variables':>11}"
+                f"{'Size':>12}{'Memory':>12}  Label\n"
+            )
+            fileOut.write((rightOffset + 64) * '-' + '\n')
+            for file, item in zip(files, self._datasets):
+                if 'error' in item:
+                    fileOut.write(f"{file:<{rightOffset}}  {item['error']}\n")
+                    continue
+                fileOut.write(
+                    f"{file:<{rightOffset}}{item['version']:>7}{item['nobs']:>15,}{item['nvars']:>11,}"
+                    f"{formatBytes(item['size']):>12}{formatBytes(item['memory']):>12}  {item['label']}\n"
+                )
+
     def _prepareReplication(self) -> None:
         """Creates structure for the replication, including
         copying necessary files, creating folders and creating 
@@ -301,6 +551,13 @@ class Replication(object):
         """
         self._writeToJson()
         self._createReplicationStructure()
+        self._setReplicationPaths()
+        self._createConfigFile()
+
+    def _setReplicationPaths(self) -> None:
+        """Sets the main script and the user defined tools to
+        their paths in the replication folder
+        """
         self._mainScript = os.path.join(
             self._replicationPath,
             os.path.relpath(self._mainScript, self._mainFolderPath)
@@ -316,12 +573,10 @@ class Replication(object):
             
             self._userDefinedTools = _temp  
 
-        self._createConfigFile()
-
     def _createProcessArgs(self, script: str) -> List[str]:
         """Creates the arguments to run in the subprocess 
         command. The command depends on the extension of the 
-        script
+        script and on the runtime
 
         Parameters
         ----------
@@ -332,46 +587,1009 @@ class Replication(object):
         -------
             List[str]: arguments for subprocess.Popen
         """
-        if script.endswith(".py"):
-            program = "python3"
-        elif script.endswith(".R"):
-            program = "Rscript"
-        elif script.endswith(".do"):
-            program = "stata-mp -b do"
+        language = getLanguage(script)
+        if language == "julia" and self._julia:
+            program = self._julia.getProgram(self._allocation.threads)
+        else:
+            program = getProgram(language)
+
+        return self._runtime.wrap(
+            [*shlex.split(program), script],
+            list(self._getRunVariables())
+        )
+
+    def prepare(
+        self,
+        progressCallback: Union[Callable[[Dict[str, Any]], None], None] = None,
+        cancelEvent: Union[threading.Event, None] = None
+    ) -> None:
+        """Public method to prepare the replication (structure, files,
+        configuration, container metadata and tree files). It does not
+        use the window, so it may run in a worker thread
+
+        Parameters
+        ----------
+        progressCallback : Callable[[Dict[str, Any]], None], optional
+            function called with the progress of the preparation 
+            (see `CopyProgress.snapshot`), by default None
+        cancelEvent : threading.Event, optional
+            event set to cancel the preparation, by default None
+
+        Raises
+        ------
+        PreparationCancelled
+            if the preparation is cancelled
+        """
+        preparationStart = time.time()
+        if threading.current_thread() is not threading.main_thread():
+            # copies at the priority of the run (the priority of a thread
+            # cannot be raised back, so the main thread is left as is)
+            setPriority(self._priority)
+        self._progress = CopyProgress(progressCallback, cancelEvent)
+        self._prepareReplication()
+        self._progress.setPhase('Inspecting container')
+        self._containerInfo = self._getContainerInfo()
+        self._progress.checkCancelled()
+        self._progress.setPhase('Measuring runtime start-up')
+        self._runtime.measureStartup()
+        self._progress.checkCancelled()
+        if self._mainScript.endswith(".jl"):
+            self._progress.setPhase('Preparing Julia environment')
+            self._julia = self._getJuliaEnvironment()
+            self._julia.prepare()
+            self._progress.checkCancelled()
+        self._progress.setPhase('Listing files')
+        self._createTreeFile(self._replicationPath, "tree.txt")
+        # List data files and save them in file "datafiles.txt"
+        dataPath = self._getDataPath()
+        self._createTreeFile(dataPath, "datafiles.txt")
+        self._progress.setPhase('Reading datasets')
+        self._datasets = inventoryDatasets(dataPath) if os.path.isdir(dataPath) else list()
+        self._writeDatasets(dataPath, "datafiles.txt", "datasets.json")
+        self._preparationTime = time.time() - preparationStart
+
+    def stage(
+        self,
+        progressCallback: Union[Callable[[Dict[str, Any]], None], None] = None,
+        cancelEvent: Union[threading.Event, None] = None
+    ) -> None:
+        """Public method to stage the folders and files of the 
+        replication ahead of its preparation (e.g. in a hidden folder
+        while the fields of the app are filled, see utils/staging.py).
+        Files already staged and unchanged are not copied again, and 
+        files no longer selected are removed
+
+        Parameters
+        ----------
+        progressCallback : Callable[[Dict[str, Any]], None], optional
+            function called with the progress of the staging, by 
+            default None
+        cancelEvent : threading.Event, optional
+            event set to cancel the staging, by default None
+
+        Raises
+        ------
+        PreparationCancelled
+            if the staging is cancelled
+        """
+        self._progress = CopyProgress(progressCallback, cancelEvent)
+        self._incremental = True
+        self._createReplicationStructure()
 
-        command = f"singularity exec {self._containerImage} {program} {script}"
+    def useStaged(self, structureStaged: bool) -> None:
+        """Public method to use the files staged in the replication
+        folder (moved there before the preparation). The preparation
+        only copies the files missing or changed since
+
+        Parameters
+        ----------
+        structureStaged : bool
+            the folder structure was fully staged
+        """
+        self._incremental = True
+        self._structureStaged = structureStaged
 
-        return shlex.split(command)
+    def start(self) -> Union[subprocess.Popen, StageRunner]:
+        """Public method to start the replication, once prepared
+
+        Returns
+        -------
+        subprocess.Popen | StageRunner
+            Replication process
+        """
+        return self._startProcess()
+
+    def discard(self) -> None:
+        """Public method to remove the replication folder of a 
+        replication whose preparation was cancelled or failed. Its
+        number is reused if no later replication was created meanwhile
+        """
+        releaseReplicationFolder(
+            os.path.join(self._mainFolderPath, 'Replications'),
+            self._replicationPath
+        )
 
-    def run(self) -> subprocess.Popen:
+    def run(self) -> Union[subprocess.Popen, StageRunner]:
         """Public method to run replication
 
         Returns
         -------
-        subprocess.Popen
+        subprocess.Popen | StageRunner
             Replication process
         """
-        self._prepareReplication()
-        self._createTreeFile(self._replicationPath, "tree.txt")
-        # List data files and save them in file "datafiles.txt"
-        dataPath = os.path.join(
-            self._getRootPath(mainFolderPath=self._mainFolderPath),
-            "initial_dataset"
+        self.prepare()
+
+        return self.start()
+
+    def resume(self) -> Union[subprocess.Popen, StageRunner]:
+        """Public method to resume a replication that failed. The
+        replication folder is re-entered (files are not copied again)
+        and the stages that succeeded, and whose inputs are unchanged,
+        are skipped
+
+        Returns
+        -------
+        subprocess.Popen | StageRunner
+            Replication process
+        """
+        stateFile = os.path.join(self._replicationPath, STAGES_STATE_FILE)
+        self._attempt = len(readStagesState(stateFile).get('attempts', [])) + 1
+        reportPath = os.path.join(self._replicationPath, '.report.txt')
+        if os.path.isfile(reportPath):
+            with open(reportPath, 'r') as report:
+                self._previousReport = report.read()
+        self._setReplicationPaths()
+        if self._overlayRun:
+            self._ignoreRules = IgnoreRules.fromFolder(self._mainFolderPath)
+            self._overlay = self._getOverlay()
+        self._containerInfo = self._getContainerInfo()
+        self._runtime.measureStartup()
+        if self._mainScript.endswith(".jl"):
+            # uses the cache built by the first attempt, if any
+            self._julia = self._getJuliaEnvironment()
+
+        return self._startProcess()
+
+    def _getJuliaEnvironment(self) -> JuliaEnvironment:
+        """Gets the cached environment of the Julia project of the
+        main script (in the replication folder)
+
+        Returns
+        -------
+        JuliaEnvironment
+            Julia environment
+        """
+        return JuliaEnvironment(
+            self._runtime,
+            findJuliaProject(self._mainScript, self._replicationPath)
         )
-        self._createTreeFile(dataPath, "datafiles.txt")
+
+    def _startProcess(self) -> Union[subprocess.Popen, StageRunner]:
+        """Starts the replication process. The main script runs in a 
+        single process, unless stages are run separately (parallel 
+        execution, stages recorded or resumed replication)
+
+        Returns
+        -------
+        subprocess.Popen | StageRunner
+            Replication process
+        """
         path, script = os.path.split(self._mainScript)
-        if path:
-            os.chdir(path)
+        # taken before the overlay is mounted: the replication folder
+        # holds the upper layer once it is released
+        self._snapshot = takeSnapshot(self._replicationPath, APP_FILES)
+        if self._overlay:
+            self._mountOverlay()
+        # the working directory of the app is left as is (the daemon
+        # starts several replications at the same time): the processes
+        # get it through cwd, and the script is given by its full path
+        self._runtime.workPath = path
+        self._watchdog = Watchdog(
+            self._limits,
+            self._overlay.upperPath if self._overlay else self._replicationPath
+        )
+        if self._slurmRun:
+            job = self._submitSlurmJob(script)
+            self._recordAttempt()
+            return job
+        self._tracer = AccessTracer(self._getDataPath(), self._replicationPath, getTracerBackend())
+        self._tracer.start()
+        if self._overlay and self._overlay.backend == 'singularity' and \
+                (self._parallelRun or self._stagedRun or self._attempt > 1):
+            # the scripts are only visible in the container
+            self._executionNote = 'Stages are not run separately with the overlay mounted in the container. The main script ran in a single process'
+        elif self._parallelRun or self._stagedRun or self._attempt > 1:
+            stageRunner = self._createStageRunner()
+            if stageRunner:
+                return stageRunner.start()
         
+        args = self._createRunArgs(self._mainScript)
+        if self._logOutput:
+            with open(os.path.join(self._replicationPath, OUTPUT_LOG), 'w') as output:
+                process = subprocess.Popen(
+                    args,
+                    stderr=subprocess.STDOUT,
+                    stdout=output,
+                    cwd=path or None,
+                    env=self._getEnvironment(),
+                    preexec_fn=self._getPreexecFunction()
+                )
+        else:
+            process = subprocess.Popen(
+                args,
+                stderr=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                cwd=path or None,
+                env=self._getEnvironment(),
+                preexec_fn=self._getPreexecFunction()
+            )
+        self._recordAttempt()
+
+        return process
+
+    def _recordAttempt(self, returnCode: Union[int, None] = None) -> None:
+        """Records the attempt of a replication run in a single process
+        (or Slurm job) in the state of the stages, so that it can be
+        resumed. The StageRunner records the attempts of runs by stages
+
+        Parameters
+        ----------
+        returnCode : int | None, optional
+            return code once the run ended, by default None (started)
+        """
+        if self._stageRunner:
+            return
+        try:
+            recordAttempt(
+                os.path.join(self._replicationPath, STAGES_STATE_FILE),
+                self._attempt,
+                returnCode
+            )
+        except OSError as error:
+            print(f"Attempt not recorded: {error}")
+
+    def _mountOverlay(self) -> None:
+        """Mounts the overlay of the replication folder: on the host
+        (fuse-overlayfs backend), or in the container, through the
+        options of the runtime (singularity backend)
+
+        Raises
+        ------
+        OverlayError
+            if the overlay is not mounted
+        """
+        if self._overlay.backend == 'singularity':
+            self._runtime.options = self._overlay.getFuseMount()
+            return
+        try:
+            self._overlay.mount()
+        except OverlayError:
+            self._overlay.release()
+            self._overlay = None
+            raise
+
+    def _releaseOverlay(self) -> None:
+        """Unmounts the overlay once the run ended, so the replication
+        folder holds the files written by the run. Errors are added to
+        the execution note of the report
+        """
+        if not self._overlay:
+            return
+        try:
+            self._overlay.release()
+        except OverlayError as error:
+            self._executionNote = ' '.join(filter(None, [self._executionNote, str(error)]))
+        self._runtime.options = list()
+        self._overlay = None
+
+    def _submitSlurmJob(self, script: str) -> SlurmJob:
+        """Submits the replication to Slurm. The batch script requests
+        the resources from the limits of the run, and the limits are
+        enforced by Slurm. The main script runs in a single job
+
+        Parameters
+        ----------
+        script : str
+            main script
+
+        Returns
+        -------
+        SlurmJob
+            Replication job
+
+        Raises
+        ------
+        RuntimeError
+            if the job is not submitted
+        """
+        if self._parallelRun or self._stagedRun or self._attempt > 1:
+            self._executionNote = 'Stages are not run separately in Slurm jobs. The main script ran in a single job'
+        batchScript = os.path.join(self._replicationPath, BATCH_SCRIPT)
+        createBatchScript(
+            outFile=batchScript,
+            jobName=f'replication-{os.path.basename(self._replicationPath)}',
+            args=self._createProcessArgs(script),
+            workPath=os.path.dirname(self._mainScript),
+            logPath=self._replicationPath,
+            limits=self._limits,
+            cpus=self._allocation.threads,
+            variables=self._getRunVariables()
+        )
+        self._slurmJob = SlurmJob(batchScript, self._mainScript, self._replicationPath)
+
+        return self._slurmJob.submit()
+
+    def _createRunArgs(self, script: str) -> List[str]:
+        """Creates the arguments to run a script, with the memory 
+        and CPU limits applied
+
+        Parameters
+        ----------
+        script : str
+            script to run
+
+        Returns
+        -------
+        List[str]
+            arguments for subprocess.Popen
+        """
         args = self._createProcessArgs(script)
-        
-        return subprocess.Popen(
-            args,
-            stderr=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            preexec_fn=os.setsid
+
+        return wrapCommand(
+            self._tracer.wrap(args) if self._tracer else args,
+            self._limits,
+            self._limitsBackend,
+            priority=self._priority
+        )
+
+    def _getRunVariables(self) -> Dict[str, str]:
+        """Gets the environment variables set for the replication 
+        processes (thread variables and, for Julia, the depot of the
+        cached environment)
+
+        Returns
+        -------
+        Dict[str, str]
+            variable name and value
+        """
+        variables = dict(self._allocation.variables)
+        if self._julia:
+            variables.update(self._julia.getEnvironment())
+
+        return variables
+
+    def _getEnvironment(self) -> Dict[str, str]:
+        """Gets the environment of the replication processes
+
+        Returns
+        -------
+        Dict[str, str]
+            environment for `subprocess.Popen(env=...)`
+        """
+        return {**os.environ, **self._getRunVariables()}
+
+    def _getPreexecFunction(self) -> Callable[[], None]:
+        """Gets the function that applies the limits and the CPU 
+        affinity of the run in each child process
+
+        Returns
+        -------
+        Callable[[], None]
+            function for `subprocess.Popen(preexec_fn=...)`
+        """
+        return getPreexecFunction(
+            self._limits,
+            self._limitsBackend,
+            cpus=self._allocation.cpus,
+            priority=self._priority
+        )
+
+    def checkLimits(self, process: object) -> Union[str, None]:
+        """Public method to check the limits of the run (wall-clock,
+        memory and disk growth). The caller stops the process if a 
+        limit is exceeded
+
+        Parameters
+        ----------
+        process : subprocess.Popen | StageRunner
+            Replication process
+
+        Returns
+        -------
+        str | None
+            description of the limit exceeded, or None
+        """
+        if not self._watchdog or isinstance(process, SlurmJob):
+            # limits of Slurm jobs are enforced by Slurm
+            return None
+        pids = process.pids if isinstance(process, StageRunner) else [process.pid]
+        if self._tracer:
+            self._tracer.sample(pids)
+
+        return self._watchdog.check(pids)
+
+    def stop(self, process: object, reason: str = 'Stopped by the user') -> None:
+        """Public method to stop the replication: SIGTERM, then SIGKILL
+        to the processes left after the grace period (see
+        `terminationGracePeriod`). Blocks until the processes end or are
+        killed, so the app calls it from a thread. Later calls (e.g.
+        limits checked while stopping) do nothing
+
+        Parameters
+        ----------
+        process : subprocess.Popen | StageRunner | SlurmJob
+            replication process
+        reason : str, optional
+            why the run was stopped, by default 'Stopped by the user'
+        """
+        with self._terminationLock:
+            if self._termination is not None:
+                return
+            self._termination = {'reason': reason}
+        # paused processes are continued after SIGTERM (see terminateProcess)
+        if self._pause.end() and self._watchdog:
+            self._watchdog.resume()
+        self._termination.update(
+            terminateProcess(process, loadSettings()['terminationGracePeriod'])
         )
 
+    def pauseRun(self, process: object) -> bool:
+        """Public method to pause the replication (SIGSTOP to the
+        processes of the run). The time paused is not counted as run
+        time, nor against the wall-clock limit
+
+        Parameters
+        ----------
+        process : subprocess.Popen | StageRunner
+            replication process
+
+        Returns
+        -------
+        bool
+            True if the replication was paused (Slurm jobs are not)
+        """
+        if isinstance(process, SlurmJob) or not self._pause.start(process):
+            return False
+        if self._watchdog:
+            self._watchdog.pause()
+
+        return True
+
+    def continueRun(self, process: object) -> None:
+        """Public method to continue a replication paused (SIGCONT).
+        Not to be confused with resume, which runs a failed replication
+        again
+
+        Parameters
+        ----------
+        process : subprocess.Popen | StageRunner
+            replication process
+        """
+        if self._pause.end(process) and self._watchdog:
+            self._watchdog.resume()
+
+    @property
+    def paused(self) -> bool:
+        """True if the replication is paused"""
+        return self._pause.active
+
+    @property
+    def pausedTime(self) -> float:
+        """Time paused in seconds (including the current pause)"""
+        return self._pause.pausedTime
+
+    @property
+    def stopped(self) -> bool:
+        """True if the replication was stopped (see stop)"""
+        return self._termination is not None
+
+    @property
+    def exceededLimit(self) -> str:
+        """Description of the limit exceeded (empty if none)"""
+        return self._watchdog.exceeded if self._watchdog else ''
+
+    def _createStageRunner(self) -> Union[StageRunner, None]:
+        """Creates the runner for the sub-scripts called by the main 
+        script. Each sub-script runs in its own container process, 
+        concurrently with independent sub-scripts if parallel execution
+        is selected. The state of the stages is recorded so that the 
+        replication can be resumed. If the main script cannot be split 
+        into stages, the replication runs sequentially
+
+        Returns
+        -------
+        StageRunner | None
+            stage runner, or None if the main script cannot be split
+        """
+        variables = getPathVariables(
+            getLanguage(self._mainScript),
+            self._getRootPath(mainFolderPath=self._mainFolderPath),
+            self._replicationPath
+        )
+        try:
+            prelude, stages = buildStages(
+                self._mainScript,
+                variables,
+                sequential=not self._parallelRun
+            )
+        except (OSError, ValueError) as error:
+            self._executionNote = f'Stages not possible ({error}). Main script run in a single process'
+            return None
+        self._stageRunner = StageRunner(
+            mainScript=self._mainScript,
+            prelude=prelude,
+            stages=stages,
+            createArgs=self._createRunArgs,
+            maxWorkers=loadSettings()['parallelWorkers'],
+            stateFile=os.path.join(self._replicationPath, STAGES_STATE_FILE),
+            attempt=self._attempt,
+            env=self._getEnvironment(),
+            preexecFn=self._getPreexecFunction()
+        )
+
+        return self._stageRunner
+
+    def getReturnCode(self, process: object) -> Tuple[int, List[str]]:
+        """Gets the return code of the replication process and the 
+        errors, if any
+
+        Parameters
+        ----------
+        process : subprocess.Popen | StageRunner
+            replication process
+
+        Returns
+        -------
+        Tuple[int, List[str]]
+            return code and errors
+        """
+        _, err = process.communicate()
+        self._stopTracer()
+        self._releaseOverlay()
+        if self.exceededLimit:
+            return 1, [self.exceededLimit]
+        if self._termination:
+            return 1, [self._termination['reason']]
+        if isinstance(process, StageRunner):
+            return process.returncode, process.errors
+        # the script is the last element of the process arguments
+        script = os.path.join(os.path.dirname(self._mainScript), process.args[-1])
+        # Stata always return a code of 0, so we have to examine the log
+        if script.endswith(".do"):
+            returnCode, lastLines = checkStataLog(script[:-3] + ".log")
+            errors = lastLines if returnCode else []
+        else:
+            returnCode = process.returncode
+            if returnCode and err is None:
+                # output saved to a file (see logOutput)
+                err = self.getOutput().encode()
+            errors = err.decode().split("\n") if returnCode else []
+
+        return returnCode, errors
+
+    def _stopTracer(self) -> None:
+        """Stops tracing the data files opened by the run and saves
+        them in the replication folder (see DATA_ACCESS_FILE)
+        """
+        if not self._tracer:
+            return
+        self._tracer.stop()
+        try:
+            self._tracer.writeJson(os.path.join(self._replicationPath, DATA_ACCESS_FILE))
+        except OSError as error:
+            self._tracer.note = f'{DATA_ACCESS_FILE} not written ({error})'
+
+    @property
+    def replicationPath(self) -> str:
+        """Replication folder"""
+        return self._replicationPath
+
+    def getOutput(self, lines: int = OUTPUT_LINES) -> str:
+        """Public method to get the last lines of the output of the
+        replication: the log of the Slurm job, the Stata log, or the
+        output saved to a file (see logOutput). For stages, the logs
+        of the stages run are listed
+
+        Parameters
+        ----------
+        lines : int, optional
+            number of lines, by default OUTPUT_LINES
+
+        Returns
+        -------
+        str
+            output
+        """
+        if self._stageRunner:
+            text = ''
+            for stage in self._stageRunner.stages:
+                text += f"{stage.name}: {stage.status} ({stage.log})\n"
+            return text
+        if self._slurmJob:
+            logFile = self._slurmJob.logFile
+        elif self._mainScript.endswith(".do"):
+            logFile = self._mainScript[:-3] + ".log"
+        else:
+            logFile = os.path.join(self._replicationPath, OUTPUT_LOG)
+        if not os.path.isfile(logFile):
+            return ''
+        with open(logFile, 'r', errors='replace') as f:
+            return ''.join(f.readlines()[-lines:])
+
+    def _writeStages(self, fileHandler: object) -> None:
+        """Writes the execution of the stages (sub-scripts run in 
+        parallel) in the report
+
+        Parameters
+        ----------
+        fileHandler : io.TextIOWrapper
+            file handler
+        """
+        if self._executionNote:
+            fileHandler.write('\n\n')
+            fileHandler.write(self._executionNote + '\n')
+        if not self._stageRunner:
+            return
+        fileHandler.write('\n\n')
+        fileHandler.write("*********** Stages *************\n\n")
+        stages = self._stageRunner.stages
+        rightOffset = Replication._getRightOffset(
+            [os.path.relpath(stage.script, self._replicationPath) for stage in stages], 10
+        )
+        header = (
+            f"{'Stage':<7}{'Script':<{rightOffset}}{'Depends on':<15}"
+            f"{'Status':<11}{'Attempt':>8}{'Duration':>10}{'Exit code':>11}\n"
+        )
+        fileHandler.write(header)
+        fileHandler.write((62 + rightOffset) * '-' + '\n')
+        for stage in stages:
+            dependencies = ','.join(str(index) for index in sorted(stage.dependencies)) or '-'
+            duration = str(timedelta(seconds=round(stage.duration)))
+            returnCode = '' if stage.returnCode is None else str(stage.returnCode)
+            attempt = '' if stage.attempt is None else str(stage.attempt)
+            line = (
+                f"{stage.index:<7}"
+                f"{os.path.relpath(stage.script, self._replicationPath):<{rightOffset}}"
+                f"{dependencies:<15}{stage.status:<11}{attempt:>8}{duration:>10}{returnCode:>11}\n"
+            )
+            fileHandler.write(line)
+        fileHandler.write('\nLogs:\n\n')
+        for stage in stages:
+            if stage.log:
+                fileHandler.write(f"[{stage.index}] {os.path.relpath(stage.log, self._replicationPath)}\n")
+
+    def _getTimes(self, startTime: datetime) -> Tuple[float, float]:
+        """Gets the time spent preparing the replication and running
+        the scripts
+
+        Parameters
+        ----------
+        startTime : datetime
+            replication start time
+
+        Returns
+        -------
+        Tuple[float, float]
+            preparation and run time in seconds
+        """
+        totalTime = (datetime.now() - startTime).total_seconds()
+
+        return self._preparationTime, max(totalTime - self._preparationTime - self.pausedTime, 0)
+
+    def _writeTimes(self, fileHandler: object, startTime: datetime) -> None:
+        """Writes the time spent preparing the replication and
+        running the scripts
+
+        Parameters
+        ----------
+        fileHandler : io.TextIOWrapper
+            file handler
+        startTime : datetime
+            replication start time
+        """
+        preparationSeconds, runSeconds = self._getTimes(startTime)
+        preparationTime = timedelta(seconds=round(preparationSeconds))
+        runTime = timedelta(seconds=round(runSeconds))
+        fileHandler.write(f"Preparation: {preparationTime}\n")
+        fileHandler.write(f"Run time   : {runTime}\n")
+        if self.pausedTime:
+            fileHandler.write(f"Paused     : {timedelta(seconds=round(self.pausedTime))}\n")
+
+    def _getHistory(self) -> List[Dict[str, float]]:
+        """Gets the metrics of the previous successful runs of the main
+        script (read from the catalog once). A catalog that cannot be
+        read gives no history
+
+        Returns
+        -------
+        List[Dict[str, float]]
+            metrics of each run
+        """
+        if self._history is None:
+            try:
+                self._history = getHistory(
+                    getProject(self._mainFolderPath),
+                    self._items['mainScriptInput'],
+                    excludePath=self._replicationPath
+                )
+            except (OSError, sqlite3.Error) as error:
+                print(f"History not read: {error}")
+                self._history = list()
+
+        return self._history
+
+    @property
+    def expectedRunTime(self) -> Union[float, None]:
+        """Run time expected from the previous runs (seconds), or
+        None without history"""
+        return estimateRunTime(self._getHistory())
+
+    @property
+    def regressions(self) -> str:
+        """Metrics of the run that regressed against the history"""
+        return describeRegressions(self._comparison)
+
+    def _compareWithHistory(self, startTime: datetime) -> None:
+        """Compares the times of the run (total, phases and stages)
+        with the previous runs
+
+        Parameters
+        ----------
+        startTime : datetime
+            replication start time
+        """
+        stageSeconds = None
+        if self._stageRunner:
+            # stages skipped on resume keep the times of a previous
+            # attempt, so only the stages run in this attempt count
+            stageSeconds = {
+                os.path.relpath(stage.script, self._replicationPath): stage.duration
+                for stage in self._stageRunner.stages
+                if stage.status == 'done'
+            }
+        self._comparison = compareWithHistory(
+            getMetrics(*self._getTimes(startTime), stageSeconds),
+            self._getHistory()
+        )
+
+    def _writePerformance(self, fileHandler: object) -> None:
+        """Writes the comparison of the times of the run with the
+        previous runs of the main script, and the regressions
+
+        Parameters
+        ----------
+        fileHandler : io.TextIOWrapper
+            file handler
+        """
+        if not self._comparison:
+            return
+        rightOffset = Replication._getRightOffset([row['metric'] for row in self._comparison], 10)
+        fileHandler.write('\n\n')
+        fileHandler.write("********* Performance **********\n\n")
+        fileHandler.write(
+            f"{'Metric':<{rightOffset}}{'Current':>10}{'Median':>10}{'Ratio':>8}{'Runs':>6}\n"
+        )
+        fileHandler.write((34 + rightOffset) * '-' + '\n')
+        for row in self._comparison:
+            current = str(timedelta(seconds=round(row['current'])))
+            median = str(timedelta(seconds=round(row['median'])))
+            ratio = '' if row['ratio'] is None else f"{row['ratio']:.2f}"
+            flag = '  REGRESSION' if row['regression'] else ''
+            fileHandler.write(
+                f"{row['metric']:<{rightOffset}}{current:>10}{median:>10}{ratio:>8}{row['runs']:>6}{flag}\n"
+            )
+        if self.regressions:
+            fileHandler.write(f"\nRegressions: {self.regressions}\n")
+
+    def _writeLimits(self, fileHandler: object) -> None:
+        """Writes the limits of the run, the peaks observed and the
+        limit exceeded, if any
+
+        Parameters
+        ----------
+        fileHandler : io.TextIOWrapper
+            file handler
+        """
+        fileHandler.write('\n\n')
+        fileHandler.write("************ Limits ************\n\n")
+        fileHandler.write(f"{'Limit':<15}{'Value':>15}\n")
+        fileHandler.write(30 * '-' + '\n')
+        for name, value in self._limits.describe().items():
+            fileHandler.write(f"{name:<15}{value:>15}\n")
+        fileHandler.write(f"\nBackend  : {self._limitsBackend}\n")
+        largest = getLargestDataset(self._datasets)
+        if largest:
+            fileHandler.write(
+                f"Largest dataset in memory: {formatBytes(largest['memory'])} "
+                f"({os.path.basename(largest['path'])}, {largest['nobs']:,} observations)\n"
+            )
+        if self._watchdog:
+            fileHandler.write(f"Peak memory: {formatBytes(self._watchdog.peakMemory)}\n")
+            if self._limits.disk:
+                fileHandler.write(f"Peak disk growth: {formatBytes(self._watchdog.peakDisk)}\n")
+            if self._watchdog.exceeded:
+                fileHandler.write(f"Stopped: {self._watchdog.exceeded}\n")
+
+    def _writeDataAccess(self, fileHandler: object) -> None:
+        """Writes the data files opened by the run, the number of
+        opens and the bytes read (the largest read offset sampled,
+        so at least that)
+
+        Parameters
+        ----------
+        fileHandler : io.TextIOWrapper
+            file handler
+        """
+        if not self._tracer or self._tracer.backend == 'off' and not self._tracer.note:
+            return
+        files = self._tracer.files
+        dataPath = self._getDataPath()
+        fileHandler.write('\n\n')
+        fileHandler.write("********* Data accessed ********\n\n")
+        fileHandler.write(f"Tracer   : {self._tracer.backend}\n")
+        if self._tracer.note:
+            fileHandler.write(f"Note     : {self._tracer.note}\n")
+        if self._tracer.backend == 'off':
+            return
+        if self._tracer.shared:
+            fileHandler.write("Shared   : other runs traced the data folder at the same time, opens may include theirs\n")
+        size = sum(item['size'] or 0 for item in files)
+        read = sum(item['read'] or 0 for item in files)
+        fileHandler.write(f"Opened   : {len(files)} data files ({formatBytes(size)})\n")
+        fileHandler.write(f"Read     : {formatBytes(read)} at least\n")
+        if not files:
+            return
+        rows = files[:DATA_ACCESS_ROWS]
+        paths = [os.path.relpath(item['path'], os.path.realpath(dataPath)) for item in rows]
+        leftJustified = max(len(path) for path in paths) + 5
+        fileHandler.write(f"\n{'File':<{leftJustified}}{'Opens':>8}{'Size':>12}{'Read':>12}\n")
+        fileHandler.write((leftJustified + 32) * '-' + '\n')
+        for path, item in zip(paths, rows):
+            size = '-' if item['size'] is None else formatBytes(item['size'])
+            read = '-' if item['read'] is None else formatBytes(item['read'])
+            fileHandler.write(f"{path:<{leftJustified}}{item['opens']:>8}{size:>12}{read:>12}\n")
+        if len(files) > len(rows):
+            fileHandler.write(f"... {len(files) - len(rows)} more in {DATA_ACCESS_FILE}\n")
+
+    def _writeTermination(self, fileHandler: object) -> None:
+        """Writes how the run was stopped, if it was: the signal that
+        ended it, the duration of the shutdown and the processes left
+
+        Parameters
+        ----------
+        fileHandler : io.TextIOWrapper
+            file handler
+        """
+        if not self._termination:
+            return
+        fileHandler.write('\n\n')
+        fileHandler.write("*********** Shutdown ***********\n\n")
+        fileHandler.write(f"Reason   : {self._termination['reason']}\n")
+        if 'signal' not in self._termination:
+            fileHandler.write("Ended by : stopping\n")
+            return
+        endedBy = {
+            'SIGTERM': 'SIGTERM',
+            'SIGKILL': 'SIGKILL (grace period exceeded)',
+            'cancel': 'cancelled (Slurm job or daemon run)'
+        }[self._termination['signal']]
+        fileHandler.write(f"Ended by : {endedBy}\n")
+        fileHandler.write(f"Shutdown : {self._termination['duration']:.1f} s\n")
+        fileHandler.write(f"Processes: {self._termination['processes']}\n")
+        if self._termination['survivors']:
+            survivors = ', '.join(str(pid) for pid in self._termination['survivors'])
+            fileHandler.write(f"Still running: {survivors}\n")
+
+    def _writeAllocation(self, fileHandler: object) -> None:
+        """Writes the core allocation of the run
+
+        Parameters
+        ----------
+        fileHandler : io.TextIOWrapper
+            file handler
+        """
+        fileHandler.write('\n\n')
+        fileHandler.write("******** Core allocation *******\n\n")
+        for name, value in self._allocation.describe().items():
+            fileHandler.write(f"{name:<25}{value:>15}\n")
+        fileHandler.write(f"{'Priority':<25}{self._priority:>15}\n")
+
+    def _writeSlurm(self, fileHandler: object) -> None:
+        """Writes the Slurm job of the replication (id, state, nodes,
+        elapsed time and log)
+
+        Parameters
+        ----------
+        fileHandler : io.TextIOWrapper
+            file handler
+        """
+        if not self._slurmJob:
+            return
+        fileHandler.write('\n\n')
+        fileHandler.write("************ Slurm *************\n\n")
+        for name, value in self._slurmJob.describe().items():
+            fileHandler.write(f"{name:<13}: {value}\n")
+
+    def _writeRuntime(self, fileHandler: object) -> None:
+        """Writes the runtime used and its start-up overhead (start-up
+        time of each process times the processes started)
+
+        Parameters
+        ----------
+        fileHandler : io.TextIOWrapper
+            file handler
+        """
+        starts = 1
+        if self._stageRunner:
+            starts = len([
+                stage for stage in self._stageRunner.stages
+                if stage.status not in ('skipped', 'pending', 'cancelled')
+            ])
+        fileHandler.write('\n\n')
+        fileHandler.write("*********** Runtime ************\n\n")
+        for name, value in describeRuntime(self._runtime, starts).items():
+            fileHandler.write(f"{name:<9}: {value}\n")
+
+    def _writeJulia(self, fileHandler: object) -> None:
+        """Writes the Julia environment used (project, cache and 
+        sysimage)
+
+        Parameters
+        ----------
+        fileHandler : io.TextIOWrapper
+            file handler
+        """
+        if not self._julia:
+            return
+        fileHandler.write('\n\n')
+        fileHandler.write("****** Julia environment *******\n\n")
+        for name, value in self._julia.describe().items():
+            fileHandler.write(f"{name:<13}: {value}\n")
+        for error in self._julia.errors:
+            fileHandler.write(f"\n{error}\n")
+
+    def _writeAttemptHeader(self, fileHandler: object) -> None:
+        """Writes the attempt number in the report of a resumed
+        replication
+
+        Parameters
+        ----------
+        fileHandler : io.TextIOWrapper
+            file handler
+        """
+        if self._attempt > 1:
+            fileHandler.write(f"Attempt  : {self._attempt} (resumed)\n")
+
+    def _writePreviousAttempts(self, fileHandler: object) -> None:
+        """Writes the reports of the previous attempts (resumed
+        replication), so that logs and timings are kept separate
+
+        Parameters
+        ----------
+        fileHandler : io.TextIOWrapper
+            file handler
+        """
+        if self._previousReport:
+            fileHandler.write('\n\n')
+            fileHandler.write("****** Previous attempts *******\n\n")
+            fileHandler.write(self._previousReport)
+
+    def _getContainerInfo(self) -> Dict[str, Any]:
+        """Gets the container image metadata (labels, definition 
+        file and runtime versions) for provenance purposes
+
+        Returns
+        -------
+        Dict[str, Any]
+            container metadata
+        """
+        if self._runtime.name not in SIF_RUNTIMES:
+            return dict()
+        try:
+            return getContainerInfo(self._containerImage)
+        except (OSError, ValueError) as error:
+            return {'image': self._containerImage, 'error': str(error)}
+
     def _createConfigFile(self) -> None:
         """Create configure script
         """
@@ -382,6 +1600,30 @@ class Replication(object):
             self._createRconfig(os.path.join(head, 'config.R'))
         elif self._mainScript.endswith(".py"):
             self._createPyconfig(os.path.join(head, 'config.py'))
+        elif self._mainScript.endswith(".jl"):
+            self._createJuliaConfig(os.path.join(head, 'config.jl'))
+
+    def _createJuliaConfig(self, outfile: str) -> None:
+        """Create Julia configuration file
+
+        Parameters
+        ----------
+        outfile : str
+            path to config file
+        """
+        rootPath = self._getRootPath(
+            mainFolderPath=self._mainFolderPath
+        )
+        createJuliaConfigFile(
+            replicationPath=self._replicationPath,
+            outFile=outfile,
+            rootPath=rootPath,
+            toolsPaths=[
+                *self._externalTools,
+                *self._userDefinedTools
+            ],
+            threads=self._allocation.threads
+        )
 
     def _createPyconfig(self, outfile: str) -> None:
         """Create Python configuration file
@@ -401,7 +1643,8 @@ class Replication(object):
             toolsPaths=[
                 *self._externalTools,
                 *self._userDefinedTools
-            ]
+            ],
+            threads=self._allocation.threads
         )
 
     def _createRconfig(self, outfile: str) -> None:
@@ -422,7 +1665,8 @@ class Replication(object):
             toolsPaths=[
                 *self._externalTools,
                 *self._userDefinedTools
-            ]
+            ],
+            threads=self._allocation.threads
         )
 
     def _createStataProfile(self, outfile: str) -> None:
@@ -444,7 +1688,22 @@ class Replication(object):
             toolsPaths=[
                 *self._externalTools,
                 *self._userDefinedTools
-            ]
+            ],
+            threads=self._allocation.threads,
+            maxMemory=self._allocation.memory
+        )
+
+    def _getDataPath(self) -> str:
+        """Gets the data folder of the project (initial_dataset)
+
+        Returns
+        -------
+        str
+            data folder
+        """
+        return os.path.join(
+            self._getRootPath(mainFolderPath=self._mainFolderPath),
+            "initial_dataset"
         )
 
     def _getRootPath(self, mainFolderPath: str) -> str:
@@ -468,7 +1727,7 @@ class Replication(object):
         except TypeError:
             raise ValueError('Project not found')
         else: 
-            return os.path.join('/bplimext', 'projects', projectName)
+            return os.path.join(loadSettings()['projectsPath'], projectName)
         
     def writeErrorReport(self, startTime: float, errors: List[str]) -> None:
         """Writes an error report on the details of the replication, namely the start and
@@ -479,15 +1738,32 @@ class Replication(object):
         startTime : float
             Process start time      
         """
+        self._stopTracer()
+        self._releaseOverlay()
         startTime = datetime.fromtimestamp(startTime)
+        self._flagged = None
         reportPath = os.path.join(self._replicationPath, '.report.txt') 
         with open(reportPath, 'w') as report:
+            self._writeAttemptHeader(report)
             report.write("Started  : " + startTime.strftime('%Y-%m-%d %H:%M:%S') + "\n")
             report.write("Finished : " + datetime.now().strftime('%Y-%m-%d %H:%M:%S') + "\n")
+            self._writeTimes(report, startTime)
             report.write("Exit code: 1\n\n")
             report.write("Errors: \n\n")
             for line in errors:
                 report.write(line + "\n")
+            self._writeStages(report)
+            self._writeTermination(report)
+            self._writeDataAccess(report)
+            self._writeLimits(report)
+            self._writeSlurm(report)
+            self._writeRuntime(report)
+            self._writeAllocation(report)
+            self._writeJulia(report)
+            self._writeContainerProvenance(report)
+            self._writePreviousAttempts(report)
+        self._recordAttempt(1)
+        self._updateCatalog()
         
     def writeReport(self, startTime: float) -> None:
         """Writes a report on the details of the replication, namely the start and
@@ -499,25 +1775,86 @@ class Replication(object):
         startTime : float
             Process start time      
         """
+        self._stopTracer()
+        self._releaseOverlay()
         startTime = datetime.fromtimestamp(startTime)
-        filesInfo = self._getFilesInfo()
-        maxFileLength = max([len(file) for file, _ in filesInfo])
-        leftJUstified = maxFileLength + 5
+        self._compareWithHistory(startTime)
         reportPath = os.path.join(self._replicationPath, '.report.txt') 
         with open(reportPath, 'w') as report:
+            self._writeAttemptHeader(report)
             report.write("Started  : " + startTime.strftime('%Y-%m-%d %H:%M:%S') + "\n")
             report.write("Finished : " + datetime.now().strftime('%Y-%m-%d %H:%M:%S') + "\n")
+            self._writeTimes(report, startTime)
             report.write("Exit code: 0\n\n")
             report.write("Root Path: " + self._replicationPath + "\n\n")
-            header = f"{'File':<{leftJUstified}}{'Date modified':>23}\n"
-            report.write(header)
-            report.write((leftJUstified + 23) * '-' + '\n')
-            for file, dateModified in filesInfo:
-                line = f"{file:<{leftJUstified}}{dateModified:>23}\n"
-                report.write(line)
+            self._writeOutputs(report)
+            self._writeStages(report)
+            self._writeDataAccess(report)
+            self._writePerformance(report)
+            self._writeLimits(report)
+            self._writeSlurm(report)
+            self._writeRuntime(report)
+            self._writeAllocation(report)
+            self._writeJulia(report)
+            self._writeContainerProvenance(report)
             scriptFiles = list(self._getScriptFiles())
+            self._flagged = list()
             self._writeFlagCommands(report, scriptFiles)
             self._writeFlagCommands(report, scriptFiles, flag='alert')
+            self._writePreviousAttempts(report)
+        self._recordAttempt(0)
+        self._updateCatalog()
+
+    def _updateCatalog(self) -> None:
+        """Writes the replication in the catalog (from the report just
+        written). The peaks are taken from the watchdog, since the
+        report rounds them, and the flagged lines from the scripts
+        (none in error reports: the lines of a previous report are
+        kept). A catalog that cannot be written does not fail the
+        replication
+        """
+        try:
+            record = readReplication(self._replicationPath, flagged=False)
+            record['flagged'] = self._flagged
+            if self._watchdog:
+                record['peakMemory'] = self._watchdog.peakMemory
+                if self._limits.disk:
+                    record['peakDisk'] = self._watchdog.peakDisk
+            upsertReplications([record])
+        except (OSError, sqlite3.Error) as error:
+            print(f"Catalog not updated: {error}")
+
+    def _writeContainerProvenance(self, fileHandler: object) -> None:
+        """Writes the container provenance (image, digest, runtime
+        versions, labels and definition file) in the report
+
+        Parameters
+        ----------
+        fileHandler : io.TextIOWrapper
+            file handler
+        """
+        info = self._containerInfo
+        if not info:
+            return
+        fileHandler.write('\n\n')
+        fileHandler.write("***** Container provenance *****\n\n")
+        fileHandler.write(f"Image    : {info['image']}\n")
+        if 'error' in info:
+            fileHandler.write(f"Error    : {info['error']}\n")
+            return
+        size, _, digest = info['key'].split(':')
+        fileHandler.write(f"Size     : {size} bytes\n")
+        fileHandler.write(f"Digest   : sha256:{digest}\n")
+        fileHandler.write(f"Inspected: {info['inspected']}\n\n")
+        fileHandler.write(f"{'Runtime':<15}{'Version':>15}\n")
+        fileHandler.write(30 * '-' + '\n')
+        for runtime, version in info['runtimes'].items():
+            fileHandler.write(f"{runtime:<15}{version:>15}\n")
+        fileHandler.write("\nLabels:\n\n")
+        for label, value in (info['labels'] or {}).items():
+            fileHandler.write(f"{label}: {value}\n")
+        fileHandler.write("\nDefinition file:\n\n")
+        fileHandler.write(info['definition'] + "\n")
 
     def _writeFlagCommands(
             self, 
@@ -526,7 +1863,8 @@ class Replication(object):
             flag: str = 'use'
         ) -> None:
         """Writes commands to flag in the report. Commands may
-        be of two types: use commands and alert commands 
+        be of two types: use commands and alert commands. The lines
+        flagged are kept for the catalog
         Parameters
         ----------
         fileHandler : io.TextIOWrapper
@@ -556,7 +1894,10 @@ class Replication(object):
         for file, lines in flagDict.items():
             if lines:
                 fileNumber += 1
-                relativePath = os.path.relpath(file, self._replicationPath)
+                if Path(self._replicationPath) in Path(file).parents:
+                    relativePath = os.path.relpath(file, self._replicationPath)
+                else:
+                    relativePath = os.path.relpath(file, self._mainFolderPath)
                 fileLine = f"[{fileNumber}] File: {relativePath}\n\n"
                 fileHandler.write(fileLine)
                 rightOffset = Replication._getRightOffset([line for _, line in lines], 14)
@@ -566,6 +1907,10 @@ class Replication(object):
                 for num, line in sorted(lines, key=lambda x: x[1], reverse=True):
                     lineFlagged = f"{line:<{rightOffset}}{str(num):>15}\n"
                     fileHandler.write(lineFlagged)
+                    if self._flagged is not None:
+                        self._flagged.append(
+                            {'file': relativePath, 'line': num, 'type': flag, 'text': line}
+                        )
                 fileHandler.write('\n')
 
     def _getScriptFiles(self) -> Generator[str, Any, Any]:
@@ -575,35 +1920,42 @@ class Replication(object):
         str
             files' full path
         """
+        if self._overlayRun:
+            # the scripts were read from the main folder (lower layer)
+            for file in [self._items['mainScriptInput'], *self._dependencies]:
+                if re.search(r"(\.do$)|(\.py$)|(\.R$)|(\.jl$)", file):
+                    yield file
         for root, _, files in os.walk(self._replicationPath):
             for file in files:
                 if re.search(r"(\.do$)|(\.py$)|(\.R$)|(\.jl$)", file):
                     yield os.path.join(root, file)
 
-    def _getFilesInfo(self) -> List[Tuple[str, str]]:
-        """Gets information (name and modification time) about all the
-        files used and created during the replication 
-        Returns
-        -------
-        list[tuple[str, str]]
-            files and corresponding modification time
+    def _writeOutputs(self, fileHandler: object) -> None:
+        """Writes the outputs of the run: the files of the replication
+        folder added or modified since the start of the run (compared
+        with the snapshot taken then, by size and modification time),
+        their sizes and the total size written
+
+        Parameters
+        ----------
+        fileHandler : io.TextIOWrapper
+            file handler
         """
-        filesInfo = list()
-        for root, _, files in os.walk(self._replicationPath):
-            for file in files:
-                fullPath = os.path.join(root, file)
-                relativePath = os.path.relpath(fullPath, self._replicationPath)
-                filesInfo.append(
-                    (
-                        relativePath, 
-                        datetime.\
-                            fromtimestamp(os.path.getmtime(fullPath)).\
-                            strftime('%Y-%m-%d %H:%M:%S')
-                    )
-                ) 
-        filesInfo.sort(key=lambda x: x[0])
-
-        return filesInfo
+        after = takeSnapshot(self._replicationPath, APP_FILES)
+        added, modified, removed = diffSnapshots(self._snapshot or dict(), after)
+        outputs = sorted([(path, 'added') for path in added] + [(path, 'modified') for path in modified])
+        fileHandler.write(
+            f"Files    : {len(after)} ({len(added)} added, {len(modified)} modified, "
+            f"{len(removed)} removed)\n"
+        )
+        fileHandler.write(f"Written  : {formatBytes(sum(after[path][0] for path, _ in outputs))}\n")
+        if not outputs:
+            return
+        leftJustified = max(len(path) for path, _ in outputs) + 5
+        fileHandler.write(f"\n{'Output':<{leftJustified}}{'Status':>10}{'Size':>12}\n")
+        fileHandler.write((leftJustified + 22) * '-' + '\n')
+        for path, status in outputs:
+            fileHandler.write(f"{path:<{leftJustified}}{status:>10}{formatBytes(after[path][0]):>12}\n")
 
     @staticmethod
     def _readLines(file: str) -> List[str]:
@@ -7,6 +7,8 @@ import os
 import argparse
 import re
 import signal
+import threading
+from typing import Callable, Dict, Any
 from layout import (
     mainFolderFrameLayout,
     mainScriptFrameLayout,
@@ -14,35 +16,139 @@ from layout import (
     containerDefinitionFrameLayout,
     dependenciesFrameLayout,
     toolsFrameLayout,
+    limitsFrameLayout,
     outLayout,
+    progressLayout,
     timeLayout,
     statusLayout,
     returnLayout
 )
-from utils.checks import checkFields
+from utils.checks import checkFields, checkResumeFolder
 from utils.updateFields import (
     updateField,
     updateListboxItems,
     enableDisableFields,
-    setFromJson
+    setFromJson,
+    getWindowItems
 )
 from utils.dialog import (
     selectFile,
     selectFolder,
+    selectFromTree,
+    importPatternsBox,
     errorMessageBox,
     warningMessageBox,
     stopMessageBox
 )
 from utils.misc import convertFileToBase64
+from utils.processes import signalProcessGroup
+from utils.slurm import SlurmJob
+from utils.settings import loadSettings
+from utils.daemonClient import RemoteRun, DaemonError
+from utils.history import formatEta
+from utils.progress import PreparationCancelled
+from utils.staging import Stager
+from utils.dependencies import expandPatterns, discoverDependencies
 from replication import Replication
 
 
+def prepareReplication(
+    window: sg.Window,
+    replication: Replication,
+    cancelEvent: threading.Event,
+    stager: Stager,
+    items: Dict[str, Any]
+) -> None:
+    """Prepares the replication in a worker thread. Progress and 
+    completion are posted to the window as events. The files staged
+    in the background are moved to the replication folder first
+
+    Parameters
+    ----------
+    window : sg.Window
+        App window
+    replication : Replication
+        replication to prepare
+    cancelEvent : threading.Event
+        event set to cancel the preparation
+    stager : Stager
+        background staging of the fields
+    items : Dict[str, Any]
+        fields of the replication
+    """
+    try:
+        structureStaged = stager.claim(items, replication.replicationPath)
+        if structureStaged is not None:
+            replication.useStaged(structureStaged)
+        replication.prepare(
+            progressCallback=lambda progress: window.write_event_value(
+                'preparationProgress', progress
+            ),
+            cancelEvent=cancelEvent
+        )
+    except PreparationCancelled:
+        replication.discard()
+        window.write_event_value('preparationCancelled', None)
+    except Exception as error:
+        # the folder is partly filled, and never run
+        replication.discard()
+        window.write_event_value('preparationFailed', str(error))
+    else:
+        window.write_event_value('preparationDone', None)
+
+
+def stageReplication(
+    items: Dict[str, Any],
+    stagingPath: str,
+    cancelEvent: threading.Event,
+    progressCallback: Callable[[Dict[str, Any]], None]
+) -> None:
+    """Stages the files of the replication of the fields in a staging
+    folder (background staging, see utils/staging.py)
+
+    Parameters
+    ----------
+    items : Dict[str, Any]
+        fields of the app
+    stagingPath : str
+        staging folder
+    cancelEvent : threading.Event
+        event set to cancel the staging
+    progressCallback : Callable[[Dict[str, Any]], None]
+        function called with the progress of the staging
+    """
+    Replication(items=items, resumePath=stagingPath).stage(progressCallback, cancelEvent)
+
+
+def stopReplication(replication: Replication, process: object, reason: str) -> threading.Thread:
+    """Stops the replication in a thread (SIGTERM, grace period and
+    SIGKILL, see Replication.stop), so the window stays responsive
+
+    Parameters
+    ----------
+    replication : Replication
+        replication running
+    process : subprocess.Popen | StageRunner | SlurmJob
+        replication process
+    reason : str
+        why the run is stopped
+
+    Returns
+    -------
+    threading.Thread
+        thread stopping the replication
+    """
+    thread = threading.Thread(target=replication.stop, args=(process, reason), daemon=True)
+    thread.start()
+
+    return thread
+
+
 ##### Globals #####
 PY_SCRIPT_ABS_PATH, _ = os.path.split(os.path.abspath(__file__))
 APP_RELATIVE_WIDTH = 0.6
 APP_RELATIVE_HEIGHT = 0.5 if platform.system() == "Windows" else 0.4
 PROJECT_REGULAR_EXPRESSION = r'p(\d{3}|xxx)_[a-zA-Z]+'
-STATA_ERROR_REGEX = "^r\(([0-9]+)\);"
 APP_LOGO_ENCODED = convertFileToBase64(os.path.join(PY_SCRIPT_ABS_PATH, '.images/appLogo.gif'))
 WARNING_ICON_ENCODED = convertFileToBase64(os.path.join(PY_SCRIPT_ABS_PATH, '.images/warning.gif'))
 ERROR_ICON_ENCODED = convertFileToBase64(os.path.join(PY_SCRIPT_ABS_PATH, '.images/error.gif'))
@@ -62,6 +168,8 @@ dependenciesFileTypes = (
     ('R files (*.R)', '*.R'),
     ('Julia files (*.jl)', '*.jl')
 )
+# Extensions of the dependencies listed in the tree picker
+DEPENDENCY_EXTENSIONS = ('.do', '.py', '.R', '.jl')
 # Allowed types for container image
 containerImageFileTypes = (
     ('Singularity image (*.sif)', '*.sif'),
@@ -90,7 +198,9 @@ appLayout = [
     *containerDefinitionFrameLayout,
     *dependenciesFrameLayout,
     *toolsFrameLayout,
+    *limitsFrameLayout,
     *outLayout,
+    *progressLayout,
     *timeLayout,
     *statusLayout,
     *returnLayout
@@ -118,20 +228,40 @@ for i in range(1, 7):
 window.bind(f"<Control-Q>", "ctrl-shift-q")
 window.bind(f"<Control-L>", "ctrl-shift-l")
 window.bind(f"<Control-R>", "ctrl-shift-r")
+window.bind(f"<Control-U>", "ctrl-shift-u")
 
 running = False
+preparing = False
+stopThread = None
+cancelPreparation = threading.Event()
+stager = Stager(
+    stageReplication,
+    callback=lambda progress: window.write_event_value('stagingProgress', progress)
+)
 
 while True:
     event, values = window.read(timeout=10)
 
     if event in (sg.WIN_CLOSED, 'ctrl-shift-q'):
+        stager.discard()
+        if preparing:
+            cancelPreparation.set()
+            break
         if running:
             killReplication = stopMessageBox(
                 window=window,
                 icon=WARNING_ICON_ENCODED
             )
             if killReplication:
-                os.killpg(os.getpgid(process.pid), signal.SIGTERM)
+                if isinstance(process, RemoteRun):
+                    signalProcessGroup(process, signal.SIGTERM)
+                else:
+                    print("\nStopping the replication")
+                    replication.stop(process, 'Stopped by the user (app closed)')
+                    if stopThread is not None:
+                        stopThread.join()
+                    _, errors = replication.getReturnCode(process)
+                    replication.writeErrorReport(startTime, errors)
                 break
         break 
     ##### Main folder #####
@@ -218,6 +348,74 @@ while True:
                 key='dependencies',
                 files=dependencies
             )
+    # Select inputs in the tree of the main folder
+    if event in ('dependenciesTree', 'toolsTree'):
+        if not os.path.isdir(values['mainFolderInput']):
+            errorMessageBox(
+                window=window,
+                errors={'Main folder': ['Select the main folder first']},
+                icon=ERROR_ICON_ENCODED
+            )
+        else:
+            key = 'dependencies' if event == 'dependenciesTree' else 'tools'
+            paths = selectFromTree(
+                window=window,
+                mainFolder=values['mainFolderInput'],
+                title='Select Dependencies' if key == 'dependencies' else 'Select Tools Folders',
+                extensions=DEPENDENCY_EXTENSIONS,
+                foldersOnly=key == 'tools',
+                icon=APP_LOGO_ENCODED
+            )
+            if paths:
+                updateListboxItems(
+                    window=window,
+                    key=key,
+                    files=paths
+                )
+    # Import inputs (glob patterns and folders) or discover them from the main script
+    if event in ('dependenciesImport', 'dependenciesDiscover'):
+        mainFolder = values['mainFolderInput']
+        if not os.path.isdir(mainFolder):
+            errorMessageBox(
+                window=window,
+                errors={'Main folder': ['Select the main folder first']},
+                icon=ERROR_ICON_ENCODED
+            )
+        elif event == 'dependenciesDiscover' and not os.path.isfile(values['mainScriptInput']):
+            errorMessageBox(
+                window=window,
+                errors={'Main script': ['Select the main script first']},
+                icon=ERROR_ICON_ENCODED
+            )
+        else:
+            if event == 'dependenciesImport':
+                patterns = importPatternsBox(window=window, mainFolder=mainFolder, icon=APP_LOGO_ENCODED)
+                dependencies, unmatched = expandPatterns(patterns, mainFolder)
+                notFound = {'Patterns without scripts in the main folder': unmatched}
+            else:
+                project = re.search(PROJECT_REGULAR_EXPRESSION, mainFolder)
+                dependencies, unresolved = discoverDependencies(
+                    values['mainScriptInput'],
+                    mainFolder,
+                    rootPath=os.path.join(loadSettings()['projectsPath'], project[0]) if project else None
+                )
+                if len(unresolved) > 10:
+                    unresolved = unresolved[:10] + [f'... and {len(unresolved) - 10} more']
+                notFound = {'Calls not resolved (add the scripts manually)': unresolved}
+            mainScript = os.path.normcase(values['mainScriptInput'])
+            dependencies = [path for path in dependencies if os.path.normcase(path) != mainScript]
+            if dependencies:
+                updateListboxItems(
+                    window=window,
+                    key='dependencies',
+                    files=dependencies
+                )
+            if any(notFound.values()):
+                errorMessageBox(
+                    window=window,
+                    errors=notFound,
+                    icon=WARNING_ICON_ENCODED
+                )
     # Remove inputs
     if event in ('removeDependencies', 'Ctrl-r-5'):
         updateListboxItems(
@@ -257,21 +455,30 @@ while True:
 
     ### Run and Stop App ###
     if event in ('runStopApp', "ctrl-shift-r"):
-        if running:
+        if preparing:
+            cancelPreparation.set()
+            window['status'].update('Status: Cancelling')
+        elif running:
             killReplication = stopMessageBox(
                 window=window,
                 icon=WARNING_ICON_ENCODED
             )
-            if killReplication:
-                os.killpg(os.getpgid(process.pid), signal.SIGTERM)
+            if killReplication and isinstance(process, RemoteRun):
+                signalProcessGroup(process, signal.SIGTERM)
                 window['runStopApp'].update('Run')
                 window['status'].update('Status: Interrupted')
                 running = False
                 enableDisableFields(
                     window=window,
-                    exceptionKeys=['runStopApp', 'time', 'status', 'return'],
+                    exceptionKeys=['runStopApp', 'pauseResume', 'time', 'status', 'return'],
                     enable=True
                 )
+            elif killReplication and stopThread is None:
+                # the report is written when the processes have ended
+                stopThread = stopReplication(replication, process, 'Stopped by the user')
+                window['runStopApp'].update(disabled=True)
+                window['pauseResume'].update('Pause')
+                window['status'].update('Status: Stopping')
         else:
             proceed = False
             warnings, errors = checkFields(window, values)
@@ -290,64 +497,207 @@ while True:
                     )
                 else:
                     proceed = True
-            if proceed:
+            if proceed and loadSettings()['useDaemon']:
+                # the daemon prepares, runs and reports the replication
+                try:
+                    process = RemoteRun.submit(getWindowItems(window))
+                except DaemonError as error:
+                    errorMessageBox(
+                        window=window,
+                        errors={'Daemon': [str(error)]},
+                        icon=ERROR_ICON_ENCODED
+                    )
+                else:
+                    window['runStopApp'].update('Stop')
+                    window['status'].update(f'Status: Submitted (run {process.runId})')
+                    window['return'].update('')
+                    running = True
+                    startTime = time.time()
+                    preparationTime = 0.0
+                    processStartTime = startTime
+                    enableDisableFields(
+                        window=window,
+                        exceptionKeys=['runStopApp', 'pauseResume', 'time', 'status', 'return']
+                    )
+            elif proceed:
                 window['runStopApp'].update('Stop')
-                window['status'].update('')
+                window['status'].update('Status: Preparing')
                 window['return'].update('')
-                running = True
+                preparing = True
                 startTime = time.time()
                 enableDisableFields(
                     window=window,
-                    exceptionKeys=['runStopApp', 'time', 'status', 'return']
+                    exceptionKeys=['runStopApp', 'pauseResume', 'time', 'status', 'return']
                 )
                 replication = Replication(window)
-                process = replication.run()
+                cancelPreparation = threading.Event()
+                threading.Thread(
+                    target=prepareReplication,
+                    args=(window, replication, cancelPreparation, stager, getWindowItems(window)),
+                    daemon=True
+                ).start()
+
+    ### Background staging ###
+    if event == 'stagingProgress' and not preparing and not running:
+        window['progress'].update(f"Background staging: {values[event]['text']}")
+    elif event not in (sg.TIMEOUT_KEY, 'stagingProgress') and not preparing and not running:
+        # restarted (incrementally) if the fields changed
+        stager.update(getWindowItems(window))
+
+    ### Preparation (worker thread events) ###
+    if event == 'preparationProgress':
+        window['progressBar'].update(values[event]['percentage'])
+        window['progress'].update(values[event]['text'])
+    if event == 'preparationDone':
+        preparing = False
+        running = True
+        window['progressBar'].update(100)
+        window['progress'].update('')
+        window['status'].update('Status: Running')
+        preparationTime = time.time() - startTime
+        processStartTime = time.time()
+        try:
+            process = replication.start()
+        except RuntimeError as error:
+            # e.g. the Slurm job was not submitted
+            running = False
+            window.write_event_value('preparationFailed', str(error))
+    if event in ('preparationCancelled', 'preparationFailed'):
+        preparing = False
+        window['runStopApp'].update('Run')
+        window['progressBar'].update(0)
+        window['progress'].update('')
+        enableDisableFields(
+            window=window,
+            exceptionKeys=['runStopApp', 'pauseResume', 'time', 'status', 'return'],
+            enable=True
+        )
+        if event == 'preparationCancelled':
+            window['status'].update('Status: Cancelled')
+        else:
+            window['status'].update('Status: Preparation failed')
+            errorMessageBox(
+                window=window,
+                errors={'Preparation': [values[event]]},
+                icon=ERROR_ICON_ENCODED
+            )
+
+    ### Pause and resume replication ###
+    if event == 'pauseResume' and running and stopThread is None and not isinstance(process, RemoteRun):
+        if replication.paused:
+            replication.continueRun(process)
+            window['pauseResume'].update('Pause')
+            window['status'].update('Status: Running')
+        elif replication.pauseRun(process):
+            window['pauseResume'].update('Resume')
+            window['status'].update('Status: Paused')
+
+    ### Resume replication ###
+    if event in ('resumeReplication', "ctrl-shift-u") and not running:
+        resumeFolder = selectFolder('Select Replication')
+        if resumeFolder:
+            flagResume, errorsResume = checkResumeFolder(resumeFolder)
+            if not flagResume:
+                errorMessageBox(
+                    window=window,
+                    errors={'Resume': errorsResume},
+                    icon=ERROR_ICON_ENCODED
+                )
+            else:
+                setFromJson(
+                    window=window,
+                    jsonFile=os.path.join(resumeFolder, 'structure.json')
+                )
+                window['runStopApp'].update('Stop')
+                window['status'].update('Status: Resumed')
+                window['return'].update('')
+                running = True
+                startTime = time.time()
+                preparationTime = 0.0
+                processStartTime = startTime
+                enableDisableFields(
+                    window=window,
+                    exceptionKeys=['runStopApp', 'pauseResume', 'time', 'status', 'return']
+                )
+                replication = Replication(window, resumePath=resumeFolder)
+                process = replication.resume()
+
+    if preparing:
+        preparationFormatted = str(datetime.timedelta(seconds=round(time.time() - startTime)))
+        window['time'].update(f'Preparation: {preparationFormatted}')
 
     if running:
-        elapsedTime = round(time.time() - startTime, 0)
+        # time paused is not counted (runs of the daemon are not paused)
+        pausedTime = 0.0 if isinstance(process, RemoteRun) else replication.pausedTime
+        elapsedTime = round(time.time() - processStartTime - pausedTime, 0)
         elapsedTimeFormatted = str(datetime.timedelta(seconds=elapsedTime))
-        window['time'].update(f'Elapsed: {elapsedTimeFormatted}')
-        if process.poll() is None:
-            pass
-        else:
-            out, err = process.communicate()
-            # the script is the last element of the process arguments
-            script = process.args[-1]
-            # Stata always return a code of 0, so we have to examine the log
-            if script.endswith(".do"):
-                log_file = script[:-3] + ".log"
-                with open(log_file, 'r', encoding="latin-1") as f:
-                    last_lines = f.readlines()[-10:]
-                    last_line = last_lines[-1]
-                    error_match = re.search(STATA_ERROR_REGEX, last_line)
-                    if error_match:
-                        returnCode = 1
-                    else:
-                        returnCode = 0
+        preparationFormatted = str(datetime.timedelta(seconds=round(preparationTime)))
+        window['time'].update(
+            f'Preparation: {preparationFormatted} | Elapsed: {elapsedTimeFormatted}'
+        )
+        if isinstance(process, RemoteRun):
+            if process.poll() is None:
+                window['status'].update(
+                    f'Status: Run {process.runId} {process.status} {process.progress}'.rstrip()
+                )
             else:
-                returnCode = process.returncode
-            print(f"\nProcess {process.pid} finished")
+                print(f"\nRun {process.runId} {process.status}")
+                print(f"Return code: {process.returncode}")
+                if process.errors:
+                    print("Errors:", process.errors)
+                print("Replication:", process.replicationPath)
+                running = False
+                window['runStopApp'].update('Run')
+                enableDisableFields(
+                    window=window,
+                    exceptionKeys=['runStopApp', 'pauseResume', 'time', 'status', 'return'],
+                    enable=True
+                )
+                window['status'].update(f'Status: {process.status.capitalize()}')
+                window['return'].update(f'Return code: {process.returncode}')
+            continue
+        eta = formatEta(replication.expectedRunTime, time.time() - processStartTime - pausedTime)
+        if eta:
+            window['time'].update(
+                f'Preparation: {preparationFormatted} | Elapsed: {elapsedTimeFormatted} | {eta}'
+            )
+        exceededLimit = replication.checkLimits(process)
+        if exceededLimit and stopThread is None:
+            print(f"\n{exceededLimit}. Stopping the replication")
+            stopThread = stopReplication(replication, process, exceededLimit)
+            window['status'].update(f'Status: {exceededLimit}')
+        if process.poll() is None or (stopThread is not None and stopThread.is_alive()):
+            if isinstance(process, SlurmJob):
+                window['status'].update(f'Status: Slurm job {process.jobId} ({process.state})')
+        else:
+            returnCode, errors = replication.getReturnCode(process)
+            print(f"\nProcess {process.args[-1]} finished")
             print(f"Return code: {returnCode}")
             if returnCode == 1:
-                if script.endswith(".do"):
-                    errors = last_lines
-                else:
-                    errors = err.decode().split("\n")
                 print("Errors:", errors)
             print("Arguments: ", process.args)
-            print("Main script directory:", os.getcwd())
+            print("Main script directory:", os.path.dirname(process.args[-1]))
             running = False
-            window['runStopApp'].update('Run')
+            stopThread = None
+            window['runStopApp'].update('Run', disabled=False)
+            window['pauseResume'].update('Pause')
             enableDisableFields(
                 window=window,
-                exceptionKeys=['runStopApp', 'time', 'status', 'return'],
+                exceptionKeys=['runStopApp', 'pauseResume', 'time', 'status', 'return'],
                 enable=True
             )
-            window['status'].update('Status: Finished')
             window['return'].update(f'Return code: {returnCode}')
             if returnCode == 0:
                 replication.writeReport(startTime)
             else:
                 replication.writeErrorReport(startTime, errors)
+            if replication.exceededLimit:
+                window['status'].update(f'Status: Stopped ({replication.exceededLimit})')
+            elif replication.stopped:
+                window['status'].update('Status: Interrupted')
+            elif replication.regressions:
+                window['status'].update(f'Status: Finished (slower than usual: {replication.regressions})')
+            else:
+                window['status'].update('Status: Finished')
 
 window.close()
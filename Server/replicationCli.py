@@ -0,0 +1,149 @@
+# BPLIM Replication command line client
+import os
+import sys
+import json
+import time
+import datetime
+import sqlite3
+import argparse
+from utils.daemonClient import FINAL_STATUS, DaemonError, request, startDaemon
+from utils.catalog import importReplications, queryReplications, searchFlaggedLines
+
+
+def formatTime(timestamp: float) -> str:
+    """Formats a timestamp (empty if None)"""
+    if timestamp is None:
+        return ''
+
+    return datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def printRun(run: dict) -> None:
+    """Prints the status of a run"""
+    print(f"Run {run['id']}: {run['status']} {run['progress']}".rstrip())
+    print(f"  Main script: {run['mainScript']}")
+    print(f"  Replication: {run['replicationPath']}")
+    print(f"  Submitted: {formatTime(run['submitted'])}")
+    print(f"  Started: {formatTime(run['started'])}")
+    print(f"  Finished: {formatTime(run['finished'])}")
+    if run['returnCode'] is not None:
+        print(f"  Return code: {run['returnCode']}")
+    for error in run['errors']:
+        print(f"  Error: {error}")
+
+
+def readItems(jsonFile: str) -> dict:
+    """Reads the fields of a replication (structure.json format).
+    Relative paths are resolved from the current directory, since the
+    daemon may run elsewhere"""
+    with open(jsonFile) as f:
+        items = json.load(f)
+    for key in ('mainFolderInput', 'mainScriptInput', 'containerImage',
+                'containerDefinition'):
+        if items.get(key) and not os.path.isabs(items[key]):
+            items[key] = os.path.abspath(items[key])
+    for key in ('dependencies', 'tools'):
+        items[key] = [os.path.abspath(path) for path in items.get(key, [])]
+
+    return items
+
+
+parser = argparse.ArgumentParser(
+    "replicationCli.py",
+    description='Submits and queries replications run by the replication daemon, '
+                'and queries the catalog of replications'
+)
+commands = parser.add_subparsers(dest='command')
+commands.add_parser('start', help='Start the daemon')
+submitParser = commands.add_parser('submit', help='Submit a replication')
+submitParser.add_argument('fields', help='JSON file with the fields (as structure.json)')
+submitParser.add_argument('-w', '--wait', action='store_true', help='Wait for the run to end')
+statusParser = commands.add_parser('status', help='Status of a run')
+statusParser.add_argument('id', type=int, help='Run id')
+commands.add_parser('list', help='List the runs')
+cancelParser = commands.add_parser('cancel', help='Cancel a run')
+cancelParser.add_argument('id', type=int, help='Run id')
+logsParser = commands.add_parser('logs', help='Last lines of the output of a run')
+logsParser.add_argument('id', type=int, help='Run id')
+logsParser.add_argument('-n', '--lines', type=int, default=50, help='Number of lines')
+commands.add_parser('shutdown', help='Stop the daemon (no run may be active)')
+importParser = commands.add_parser('import', help='Backfill the catalog from existing replications')
+importParser.add_argument('paths', nargs='+', help='Projects, work areas or Replications folders')
+importParser.add_argument('-w', '--workers', type=int, default=8, help='Replications read at the same time')
+queryParser = commands.add_parser('query', help='Query the catalog (most recent first)')
+queryParser.add_argument('-p', '--project', default='', help='Project (e.g. p001_BPLIM)')
+queryParser.add_argument('--failed', action='store_true', help='Only failed replications')
+queryParser.add_argument('--succeeded', action='store_true', help='Only successful replications')
+queryParser.add_argument('--since', default='', help='Started on or after (YYYY-MM-DD)')
+queryParser.add_argument('--until', default='', help='Started before (YYYY-MM-DD)')
+queryParser.add_argument('-s', '--script', default='', help='Text in the main script path')
+queryParser.add_argument('-n', '--limit', type=int, default=100, help='Maximum number of replications')
+searchParser = commands.add_parser('search', help='Search the flagged lines (use and alert commands)')
+searchParser.add_argument('text', help='Words to search (every word must be in the line)')
+searchParser.add_argument('-p', '--project', default='', help='Project (e.g. p001_BPLIM)')
+searchParser.add_argument('-t', '--type', default='', choices=('', 'use', 'alert'), help='Type of command')
+searchParser.add_argument('--raw', action='store_true', help='Text is an FTS5 query')
+searchParser.add_argument('-n', '--limit', type=int, default=100, help='Maximum number of lines')
+args = parser.parse_args()
+
+if not args.command:
+    parser.print_help()
+    sys.exit(1)
+
+try:
+    if args.command == 'start':
+        startDaemon()
+        print(f"Daemon running (pid {request('ping')['pid']})")
+    elif args.command == 'submit':
+        startDaemon()
+        response = request('submit', items=readItems(args.fields))
+        for warning in response['warnings']:
+            print(f"Warning: {warning}")
+        run = response['run']
+        print(f"Submitted run {run['id']}")
+        if args.wait:
+            while run['status'] not in FINAL_STATUS:
+                time.sleep(2)
+                run = request('status', id=run['id'])['run']
+            printRun(run)
+            sys.exit(run['returnCode'])
+    elif args.command == 'status':
+        printRun(request('status', id=args.id)['run'])
+    elif args.command == 'list':
+        for run in request('list')['runs']:
+            print(
+                f"{run['id']:>5}  {run['status']:<11}  "
+                f"{formatTime(run['submitted'])}  {run['mainScript']}"
+            )
+    elif args.command == 'cancel':
+        run = request('cancel', id=args.id)['run']
+        print(f"Cancelling run {run['id']} ({run['status']})")
+    elif args.command == 'logs':
+        print(request('logs', id=args.id, lines=args.lines)['logs'])
+    elif args.command == 'shutdown':
+        request('shutdown')
+        print('Daemon stopped')
+    elif args.command == 'import':
+        result = importReplications(args.paths, args.workers)
+        print(f"Imported {result['imported']} replications ({result['failed']} not readable)")
+    elif args.command == 'query':
+        failed = True if args.failed else False if args.succeeded else None
+        for replication in queryReplications(
+            args.project, failed, args.since, args.until, args.script, args.limit
+        ):
+            print(
+                f"{replication['started'] or '':<19}  {replication['project']:<15}  "
+                f"{replication['replication']:<8}  {str(replication['exitCode']):>4}  "
+                f"{replication['mainScript']}"
+            )
+    elif args.command == 'search':
+        for flagged in searchFlaggedLines(
+            args.text, args.project, args.type, args.raw, args.limit
+        ):
+            print(
+                f"{flagged['project']}/{flagged['replication']}/{flagged['file']}:"
+                f"{flagged['line']} [{flagged['type']}] {flagged['text']}"
+            )
+except (DaemonError, sqlite3.Error) as error:
+    print(f'Error: {error}', file=sys.stderr)
+    sys.exit(1)
@@ -0,0 +1,483 @@
+# BPLIM Replication daemon
+from typing import Dict, List, Union, Any
+import os
+import json
+import time
+import signal
+import socket
+import struct
+import threading
+import traceback
+import socketserver
+from replication import Replication
+from utils.checks import checkFields
+from utils.progress import PreparationCancelled
+from utils.history import formatEta
+from utils.settings import loadSettings
+from utils.daemonClient import (
+    FINAL_STATUS,
+    getDaemonPath,
+    getSocketPath,
+    sendMessage,
+    receiveMessage,
+    isDaemonRunning
+)
+
+# File (in the daemon folder) with the runs of the daemon
+STATE_FILE = 'daemon.json'
+# Seconds between scheduling rounds
+SCHEDULER_INTERVAL = 0.5
+# Credentials of the client of a Unix socket (pid, uid and gid)
+PEER_CREDENTIALS = struct.Struct('3i')
+
+
+class Run(object):
+    """Replication submitted to the daemon"""
+
+    def __init__(self, runId: int, items: Dict[str, Any]) -> None:
+
+        self.id = runId
+        self.items = items
+        self.status = 'queued'
+        self.progress = ''
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.returnCode = None
+        self.errors = list()
+        self.replicationPath = ''
+        self.replication = None
+        self.process = None
+        self.runStarted = None
+        self.cancelEvent = threading.Event()
+        self.prepareThread = None
+        # thread stopping the processes (see Replication.stop)
+        self.stopThread = None
+
+    def toDict(self) -> Dict[str, Any]:
+        """Gets the run as a dictionary (API responses and state file)
+
+        Returns
+        -------
+        Dict[str, Any]
+            run
+        """
+        return {
+            'id': self.id,
+            'mainScript': self.items.get('mainScriptInput', ''),
+            'status': self.status,
+            'progress': self.progress,
+            'submitted': self.submitted,
+            'started': self.started,
+            'finished': self.finished,
+            'returnCode': self.returnCode,
+            'errors': self.errors,
+            'replicationPath': self.replicationPath,
+            'items': self.items
+        }
+
+    @classmethod
+    def fromDict(cls, data: Dict[str, Any]) -> 'Run':
+        """Creates a run from the state file. Queued runs stay in the
+        queue; other runs that had not ended when the daemon stopped
+        are lost (they cannot be supervised)
+
+        Parameters
+        ----------
+        data : Dict[str, Any]
+            run
+
+        Returns
+        -------
+        Run
+            run
+        """
+        run = cls(data['id'], data['items'])
+        for key in ('status', 'progress', 'submitted', 'started', 'finished',
+                    'returnCode', 'errors', 'replicationPath'):
+            setattr(run, key, data.get(key))
+        if run.status not in FINAL_STATUS and run.status != 'queued':
+            run.status = 'lost'
+            run.errors = ['The daemon stopped before the run ended']
+
+        return run
+
+
+class ReplicationDaemon(object):
+    """Owns the queue of replications of a user on this server: runs
+    are prepared (copy and configuration) in worker threads, started
+    when there is a free slot (`daemonMaxRuns`), supervised (limits
+    and return code) and reported. Runs are independent of the
+    clients (app or CLI), which only submit and query them. Only the
+    user of the daemon is served (credentials of the socket), since
+    the runs take the uid of the daemon
+    """
+
+    def __init__(self) -> None:
+
+        settings = loadSettings()
+        self._maxRuns = settings['daemonMaxRuns']
+        self._stateFile = os.path.join(getDaemonPath(), STATE_FILE)
+        self._lock = threading.RLock()
+        self._runs = dict()
+        self._stopEvent = threading.Event()
+        self._readState()
+
+    def _readState(self) -> None:
+        """Reads the runs of previous sessions"""
+        if not os.path.isfile(self._stateFile):
+            return
+        with open(self._stateFile) as f:
+            for data in json.load(f):
+                run = Run.fromDict(data)
+                self._runs[run.id] = run
+
+    def _saveState(self) -> None:
+        """Saves the runs (atomically)"""
+        with self._lock:
+            runs = [run.toDict() for run in self._runs.values()]
+        temporary = f'{self._stateFile}.{os.getpid()}'
+        with open(temporary, 'w') as f:
+            json.dump(runs, f, indent=4)
+        os.replace(temporary, self._stateFile)
+
+    def _getRun(self, runId: Any) -> Run:
+        """Gets a run
+
+        Raises
+        ------
+        ValueError
+            if the run does not exist
+        """
+        try:
+            return self._runs[int(runId)]
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f'Run {runId} does not exist')
+
+    ##### API #####
+    def submit(self, items: Dict[str, Any]) -> Dict[str, Any]:
+        """Submits a replication. The fields are checked as in the app
+
+        Parameters
+        ----------
+        items : Dict[str, Any]
+            replication fields (as in structure.json)
+
+        Returns
+        -------
+        Dict[str, Any]
+            run and warnings
+
+        Raises
+        ------
+        ValueError
+            if the fields are not valid
+        """
+        warnings, errors = checkFields(None, items)
+        if errors:
+            raise ValueError('; '.join(
+                f'{field}: {", ".join(messages)}' for field, messages in errors.items()
+            ))
+        with self._lock:
+            run = Run(max(self._runs, default=0) + 1, items)
+            self._runs[run.id] = run
+        self._saveState()
+
+        return {'run': run.toDict(), 'warnings': warnings}
+
+    def status(self, runId: Any) -> Dict[str, Any]:
+        """Gets the status of a run"""
+        with self._lock:
+            return {'run': self._getRun(runId).toDict()}
+
+    def list(self) -> Dict[str, Any]:
+        """Lists the runs (without the fields)"""
+        with self._lock:
+            runs = [run.toDict() for run in self._runs.values()]
+        for run in runs:
+            del run['items']
+
+        return {'runs': runs}
+
+    def cancel(self, runId: Any) -> Dict[str, Any]:
+        """Cancels a run: queued runs are removed from the queue, the
+        preparation is cancelled and running processes are stopped"""
+        with self._lock:
+            run = self._getRun(runId)
+            if run.status == 'queued':
+                self._finishRun(run, 'cancelled', 1, ['Cancelled'])
+            elif run.status in ('preparing', 'prepared'):
+                run.cancelEvent.set()
+            elif run.status == 'running':
+                run.cancelEvent.set()
+                self._stopRun(run, 'Stopped by the user')
+            else:
+                raise ValueError(f'Run {run.id} already ended ({run.status})')
+
+            return {'run': run.toDict()}
+
+    def logs(self, runId: Any, lines: int = 50) -> Dict[str, Any]:
+        """Gets the last lines of the output of a run"""
+        with self._lock:
+            run = self._getRun(runId)
+        if run.replication is None:
+            return {'logs': ''}
+
+        return {'logs': run.replication.getOutput(int(lines))}
+
+    def shutdown(self) -> Dict[str, Any]:
+        """Stops the daemon, if no run is active"""
+        with self._lock:
+            active = [run.id for run in self._runs.values() if run.status not in FINAL_STATUS]
+        if active:
+            raise ValueError(f'Runs still active: {active}')
+        self.stop()
+
+        return dict()
+
+    def stop(self) -> None:
+        """Stops the scheduling loop (active runs are then interrupted,
+        see interruptRuns)"""
+        self._stopEvent.set()
+
+    def handle(self, message: Dict[str, Any], uid: Union[int, None] = None) -> Dict[str, Any]:
+        """Handles a request
+
+        Parameters
+        ----------
+        message : Dict[str, Any]
+            request
+        uid : int, optional
+            user of the client, by default the user of the daemon
+
+        Returns
+        -------
+        Dict[str, Any]
+            response
+        """
+        command = message.get('command')
+        if uid is not None and uid != os.getuid():
+            # the runs of other users would run with the uid of the daemon
+            return {'ok': False, 'error': 'The daemon only serves its own user'}
+        try:
+            if command == 'ping':
+                response = {'pid': os.getpid()}
+            elif command == 'submit':
+                response = self.submit(message['items'])
+            elif command == 'status':
+                response = self.status(message.get('id'))
+            elif command == 'list':
+                response = self.list()
+            elif command == 'cancel':
+                response = self.cancel(message.get('id'))
+            elif command == 'logs':
+                response = self.logs(message.get('id'), message.get('lines', 50))
+            elif command == 'shutdown':
+                response = self.shutdown()
+            else:
+                raise ValueError(f'Unknown command "{command}"')
+        except (KeyError, ValueError) as error:
+            return {'ok': False, 'error': str(error)}
+
+        return {'ok': True, **response}
+
+    ##### Scheduling #####
+    def _prepareRun(self, run: Run) -> None:
+        """Prepares a run (worker thread)"""
+        def report(progress: Dict[str, Any]) -> None:
+            run.progress = progress['text']
+
+        try:
+            run.replication.prepare(progressCallback=report, cancelEvent=run.cancelEvent)
+        except PreparationCancelled:
+            run.replication.discard()
+            self._finishRun(run, 'cancelled', 1, ['Cancelled'])
+        except Exception as error:
+            traceback.print_exc()
+            run.replication.discard()
+            self._finishRun(run, 'failed', 1, [f'Preparation failed: {error}'])
+        else:
+            with self._lock:
+                run.status = 'prepared'
+                run.progress = ''
+
+    def _startRun(self, run: Run) -> None:
+        """Starts the preparation of a run"""
+        run.status = 'preparing'
+        run.started = time.time()
+        try:
+            run.replication = Replication(items=run.items, logOutput=True)
+        except Exception as error:
+            self._finishRun(run, 'failed', 1, [f'Replication not created: {error}'])
+            return
+        run.replicationPath = run.replication.replicationPath
+        run.prepareThread = threading.Thread(target=self._prepareRun, args=(run,), daemon=True)
+        run.prepareThread.start()
+
+    def _superviseRun(self, run: Run) -> None:
+        """Starts a prepared run, checks the limits of a running run
+        and writes the report when it ends"""
+        if run.status == 'prepared' and run.cancelEvent.is_set():
+            run.replication.discard()
+            self._finishRun(run, 'cancelled', 1, ['Cancelled'])
+            return
+        if run.status == 'prepared':
+            try:
+                run.process = run.replication.start()
+            except Exception as error:
+                self._finishRun(run, 'failed', 1, [f'Replication not started: {error}'])
+                return
+            run.status = 'running'
+            run.runStarted = time.time()
+            return
+        exceededLimit = run.replication.checkLimits(run.process)
+        if exceededLimit:
+            self._stopRun(run, exceededLimit)
+        if run.process.poll() is None or (run.stopThread is not None and run.stopThread.is_alive()):
+            run.progress = formatEta(run.replication.expectedRunTime, time.time() - run.runStarted)
+            return
+        returnCode, errors = run.replication.getReturnCode(run.process)
+        if run.cancelEvent.is_set():
+            errors = ['Cancelled', *errors]
+        if returnCode == 0:
+            run.replication.writeReport(run.started)
+        else:
+            run.replication.writeErrorReport(run.started, errors)
+        status = 'cancelled' if run.cancelEvent.is_set() else 'finished' if returnCode == 0 else 'failed'
+        run.progress = f'slower than usual: {run.replication.regressions}' if run.replication.regressions else ''
+        self._finishRun(run, status, returnCode, errors)
+
+    def _stopRun(self, run: Run, reason: str) -> None:
+        """Stops the processes of a run in a thread (SIGTERM, grace
+        period and SIGKILL); the report is written when they ended"""
+        if run.stopThread is None:
+            run.stopThread = threading.Thread(
+                target=run.replication.stop,
+                args=(run.process, reason),
+                daemon=True
+            )
+            run.stopThread.start()
+
+    def _finishRun(self, run: Run, status: str, returnCode: int, errors: List[str]) -> None:
+        """Records the end of a run"""
+        with self._lock:
+            run.status = status
+            run.returnCode = returnCode
+            run.errors = errors
+            run.finished = time.time()
+        self._saveState()
+
+    def interruptRuns(self, reason: str = 'The daemon was stopped') -> None:
+        """Interrupts the active runs when the daemon stops: running
+        processes are stopped as when cancelled (SIGTERM, grace period
+        and SIGKILL) and reported, and preparations are cancelled.
+        Queued runs stay in the queue
+
+        Parameters
+        ----------
+        reason : str, optional
+            why the runs were interrupted, by default 'The daemon was
+            stopped'
+        """
+        with self._lock:
+            runs = [
+                run for run in self._runs.values()
+                if run.status in ('preparing', 'prepared', 'running')
+            ]
+        for run in runs:
+            run.cancelEvent.set()
+            if run.status == 'running':
+                self._stopRun(run, reason)
+        for run in runs:
+            errors = [reason]
+            try:
+                if run.process is not None:
+                    run.stopThread.join()
+                    _, errors = run.replication.getReturnCode(run.process)
+                    run.replication.writeErrorReport(run.started, errors)
+                else:
+                    run.prepareThread.join()
+                    if run.status == 'prepared':
+                        run.replication.discard()
+            except Exception:
+                traceback.print_exc()
+            self._finishRun(run, 'interrupted', 1, errors)
+
+    def schedule(self) -> None:
+        """Scheduling loop: supervises the active runs and starts
+        queued runs when there are free slots"""
+        while not self._stopEvent.is_set():
+            with self._lock:
+                runs = list(self._runs.values())
+            for run in runs:
+                if run.status in ('prepared', 'running'):
+                    try:
+                        self._superviseRun(run)
+                    except Exception as error:
+                        traceback.print_exc()
+                        self._finishRun(run, 'failed', 1, [f'Supervision failed: {error}'])
+            active = len([run for run in runs if run.status in ('preparing', 'prepared', 'running')])
+            for run in runs:
+                if active >= self._maxRuns:
+                    break
+                if run.status == 'queued':
+                    self._startRun(run)
+                    active += 1
+            self._stopEvent.wait(SCHEDULER_INTERVAL)
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """Handles one request (a line of JSON) per connection"""
+
+    def handle(self) -> None:
+        try:
+            message = receiveMessage(self.request)
+        except (OSError, ValueError):
+            return
+        try:
+            credentials = self.request.getsockopt(
+                socket.SOL_SOCKET, socket.SO_PEERCRED, PEER_CREDENTIALS.size
+            )
+            _, uid, _ = PEER_CREDENTIALS.unpack(credentials)
+        except (AttributeError, OSError):
+            # no credentials (not Linux): the user of the daemon
+            uid = os.getuid()
+        sendMessage(self.request, self.server.daemon.handle(message, uid))
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server of the daemon"""
+
+    daemon_threads = True
+
+
+def main() -> None:
+    if isDaemonRunning():
+        print('The daemon is already running')
+        return
+    socketPath = getSocketPath()
+    if os.path.exists(socketPath):
+        # left by a daemon that did not stop cleanly
+        os.remove(socketPath)
+    daemon = ReplicationDaemon()
+    # the socket is private to the user (as the daemon folder)
+    previousMask = os.umask(0o077)
+    server = DaemonServer(socketPath, RequestHandler)
+    os.umask(previousMask)
+    server.daemon = daemon
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    signal.signal(signal.SIGTERM, lambda *_: daemon.stop())
+    print(f'Daemon {os.getpid()} listening on {socketPath}', flush=True)
+    try:
+        daemon.schedule()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+        os.remove(socketPath)
+        daemon.interruptRuns()
+
+
+if __name__ == '__main__':
+    main()
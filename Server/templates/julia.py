@@ -0,0 +1,84 @@
+# Template for Julia
+from typing import List, Union
+import os
+
+
+def createConfigFile(
+    replicationPath: str,
+    outFile: str,
+    rootPath: str,
+    toolsPaths: Union[List[str], None] = None,
+    threads: int = 0
+) -> None:
+    """Creates Julia configuration file
+
+    Parameters
+    ----------
+    replicationPath : str
+       Base path for replication
+    outFile: str
+       Path to profile
+    rootPath : str
+        Path for project
+    toolsPaths : List[str]
+        List of paths for tools, by default []
+    threads : int
+        Number of BLAS threads, by default not set (Julia threads 
+        are set in the command line)
+    """  
+    replicationRelPath = os.path.relpath(replicationPath, rootPath)
+    script = f"""println("## Running config.jl file ##")
+versioninfo()
+
+# Root path
+root_path = "{rootPath}"
+# Base path for replications
+path_rep = joinpath(root_path, "{replicationRelPath}")
+
+#### Paths for data ####
+# Set the path for non perturbed data source
+path_source = joinpath(root_path, "initial_dataset")
+# Set the path for perturbed data source
+path_source_p = joinpath(path_source, "modified")
+# Set the path for intermediate data source
+path_source_i = joinpath(path_source, "intermediate")
+# Set the path for external data source
+path_source_e = joinpath(path_source, "external")
+
+# Globals for type of modified dataset
+# Perturbed
+M1 = "P"
+# Shuffle
+M2 = "S"
+# Randomized
+M3 = "R"
+# Dummy 
+M4 = "D"
+
+#### Example: using non-modified and modified datasets ####
+# using ReadStatTables
+# anonymized = joinpath(path_source, "CB_A_YFRM_2010_JUN21_ROSTO_V01.dta")
+# perturbed = joinpath(path_source_p, "CRC_$(M1)_MFRM_2010_APR19_COBR_V01.dta")
+# shuffle = joinpath(path_source_p, "PE056_$(M2)_rejected_applications.dta")
+# randomized = joinpath(path_source_p, "CRC_$(M3)_MFRMBNK_2007_APR19_CO_V01.dta")
+# dummy = joinpath(path_source_p, "SLB_$(M4)_YBNK_20102018_OCT20_QA1_V01.dta")
+# Example reading the perturbed dataset
+# data = readstat(perturbed)
+
+"""
+    if threads:
+        script += '# Threads allocated to the replication\n'
+        script += 'using LinearAlgebra\n'
+        script += f'BLAS.set_num_threads({threads})\n'
+        script += 'println("Julia threads: ", Threads.nthreads())\n\n'
+    if toolsPaths:
+        script += '# User Defined modules\n'
+        for path in toolsPaths:
+            relPath = os.path.relpath(path, rootPath)
+            script += f'push!(LOAD_PATH, joinpath(root_path, "{relPath}"))\n'
+        script += '\n'
+
+    script += 'println("## Finish running config.jl file ##")\n'
+
+    with open(outFile, 'w') as fOut:
+        fOut.write(script)
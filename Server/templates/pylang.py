@@ -1,13 +1,15 @@
 # Template for Stata 
 from typing import List, Union
 import os
+from utils.allocation import THREAD_VARIABLES
 
 
 def createConfigFile(
     replicationPath: str,
     outFile: str,
     rootPath: str,
-    toolsPaths: Union[List[str], None] = None
+    toolsPaths: Union[List[str], None] = None,
+    threads: int = 0
 ) -> None:
     """Creates the Python configuration file
 
@@ -21,6 +23,8 @@ def createConfigFile(
         Path for project
     toolsPaths : List[str]
         List of paths for tools, by default []
+    threads : int
+        Number of threads (OpenMP/BLAS), by default not set
     """  
     replicationRelPath = os.path.relpath(replicationPath, rootPath)
     script = f"""from pathlib import Path
@@ -68,6 +72,11 @@ M4 = "D"
 # pd.read_stata(PATH_SOURCE_P / f"SLB_{{M4}}_YBNK_20102018_OCT20_QA1_V01.dta")
 #######################################################################
 """
+    if threads:
+        # must be set before numerical libraries are imported
+        script += "\n### Threads allocated to the replication ###\nimport os\n\n"
+        for variable in THREAD_VARIABLES:
+            script += f'os.environ["{variable}"] = "{threads}"\n'
     if toolsPaths:
         script += "\nimport sys\n\n"
         for path in toolsPaths:
@@ -1,13 +1,15 @@
 # Template for R
 from typing import List, Union
 import os
+from utils.allocation import THREAD_VARIABLES
 
 
 def createConfigFile(
     replicationPath: str,
     outFile: str,
     rootPath: str,
-    toolsPaths: Union[List[str], None] = None
+    toolsPaths: Union[List[str], None] = None,
+    threads: int = 0
 ) -> None:
     """Creates R configuration file
     
@@ -21,6 +23,8 @@ def createConfigFile(
         Path for project
     toolsPaths : List[str]
         List of paths for tools, by default []
+    threads : int
+        Number of threads (OpenMP/BLAS), by default not set
     """  
     replicationRelPath = os.path.relpath(replicationPath, rootPath)
     script = f"""print("## Running config.R file ##")
@@ -59,6 +63,17 @@ M4 <- "D"
 # data <- read_dta(perturbed)
 
 """
+    if threads:
+        script += '# Threads allocated to the replication\n'
+        script += 'Sys.setenv(\n'
+        script += ',\n'.join(f'    {variable} = "{threads}"' for variable in THREAD_VARIABLES)
+        script += '\n)\n'
+        script += f'options(mc.cores = {threads})\n'
+        script += 'if (requireNamespace("RhpcBLASctl", quietly = TRUE)) {\n'
+        script += f'    RhpcBLASctl::blas_set_num_threads({threads})\n'
+        script += f'    RhpcBLASctl::omp_set_num_threads({threads})\n'
+        script += '}\n'
+        script += f'if (requireNamespace("data.table", quietly = TRUE)) data.table::setDTthreads({threads})\n\n'
     if toolsPaths:
         script += '# User Defined libraries\n'
         script += '.libPaths(c('
@@ -8,7 +8,9 @@ def createProfile(
     replicationPath: str,
     outFile: str,
     rootPath: str,
-    toolsPaths: Union[List[str], None] = None
+    toolsPaths: Union[List[str], None] = None,
+    threads: int = 0,
+    maxMemory: int = 0
 ) -> None:
     """Creates the Stata profile do-file
     Parameters
@@ -23,6 +25,10 @@ def createProfile(
         Path for project
     toolsPaths : List[str]
         List of paths for tools, by default []
+    threads : int
+        Number of processors (Stata/MP), by default all
+    maxMemory : int
+        Maximum memory in bytes, by default no limit
     """  
     replicationRelPath = os.path.relpath(replicationPath, rootPath)
     script = f"""*********************************************************
@@ -36,7 +42,7 @@ set rmsg on
 set matsize 10000
 set linesize 255
 capture log close
-*********************************************************
+{_getResources(threads, maxMemory)}*********************************************************
 *               Define globals                          *
 *********************************************************  
 **** Path for replication ****
@@ -88,4 +94,29 @@ use "${{path_source_p}}/SLB_${{M4}}_YBNK_20102018_OCT20_QA1_V01.dta"
 
 
     with open(outFile, 'w') as fOut:
-        fOut.write(script)
\ No newline at end of file
+        fOut.write(script)
+
+
+def _getResources(threads: int, maxMemory: int) -> str:
+    """Gets the commands that set the resources of the run
+
+    Parameters
+    ----------
+    threads : int
+        number of processors (0 to use all)
+    maxMemory : int
+        maximum memory in bytes (0 for no limit)
+
+    Returns
+    -------
+    str
+        Stata commands
+    """
+    commands = ''
+    if threads:
+        # only Stata/MP accepts more than one processor
+        commands += f'capture set processors {threads}\n'
+    if maxMemory:
+        commands += f'set max_memory {maxMemory // 1024 ** 2}m\n'
+
+    return commands
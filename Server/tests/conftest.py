@@ -0,0 +1,26 @@
+# conftest.py
+import os
+import sys
+import json
+import tempfile
+import pytest
+
+# The modules of the app are imported from the Server folder, with
+# settings of their own (see REPLICATION_SETTINGS in utils/settings.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['REPLICATION_SETTINGS'] = os.path.join(tempfile.mkdtemp(), 'settings.json')
+
+
+@pytest.fixture
+def settings():
+    """Writes the settings of a test (keys missing take the default
+    value), removed after the test"""
+    settingsFile = os.environ['REPLICATION_SETTINGS']
+
+    def write(**values):
+        with open(settingsFile, 'w') as fileOut:
+            json.dump(values, fileOut)
+
+    yield write
+    if os.path.isfile(settingsFile):
+        os.remove(settingsFile)
@@ -0,0 +1,49 @@
+# test_catalog.py
+import os
+from utils import catalog
+from utils.catalog import connect, getFilesystemType, getProject, isNetworkPath
+
+
+def writeMounts(tmp_path, monkeypatch, *mounts):
+    mountsFile = tmp_path / 'mounts'
+    mountsFile.write_text(''.join(
+        f'server:/export {point} {filesystemType} rw 0 0\n'
+        for point, filesystemType in mounts
+    ))
+    monkeypatch.setattr(catalog, 'MOUNTS_FILE', str(mountsFile))
+
+
+def test_filesystem_type(tmp_path, monkeypatch):
+    share = tmp_path / 'share'
+    writeMounts(tmp_path, monkeypatch, ('/', 'ext4'), (str(share), 'nfs4'))
+    # the longest mount point wins, but not a mere prefix of a folder name
+    assert getFilesystemType(str(share / 'projects')) == 'nfs4'
+    assert getFilesystemType(str(tmp_path / 'shared')) == 'ext4'
+    assert isNetworkPath(str(share))
+    assert not isNetworkPath(str(tmp_path))
+    writeMounts(tmp_path, monkeypatch, ('/', 'fuse.sshfs'))
+    assert isNetworkPath(str(tmp_path))
+
+
+def test_journal_mode(tmp_path, monkeypatch):
+    share = tmp_path / 'share'
+    writeMounts(tmp_path, monkeypatch, ('/', 'ext4'), (str(share), 'nfs'))
+    local = connect(str(tmp_path / 'local' / 'catalog.db'))
+    shared = connect(str(share / 'catalog.db'))
+    try:
+        assert local.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert shared.execute('PRAGMA journal_mode').fetchone()[0] == 'delete'
+    finally:
+        local.close()
+        shared.close()
+
+
+def test_project(settings, tmp_path):
+    projectsPath = tmp_path / 'bplim'
+    settings(projectsPath=str(projectsPath))
+    # the folder under projectsPath, whatever its name
+    assert getProject(str(projectsPath / 'other' / 'Scripts' / 'main.do')) == 'other'
+    assert getProject(str(projectsPath)) == ''
+    # elsewhere, the project folder in the path
+    assert getProject(os.path.join(str(tmp_path), 'projects', 'p001_name', 'Rep001')) == 'p001_name'
+    assert getProject(str(tmp_path / 'projects' / 'folder')) == ''
@@ -0,0 +1,77 @@
+# test_container.py
+import os
+import stat
+import struct
+from utils import container
+from utils.container import RUNTIME_PROBES, SIF_MAGIC, SIF_MAGIC_OFFSET, getContainerInfo
+
+LABELS = '{"data": {"attributes": {"labels": {"Version": "1.0"}}}}'
+
+
+def writeSif(path):
+    header = bytearray(128)
+    header[SIF_MAGIC_OFFSET:SIF_MAGIC_OFFSET + len(SIF_MAGIC)] = SIF_MAGIC
+    struct.pack_into('<qq', header, 96, 128, 16)
+    with open(path, 'wb') as fileOut:
+        fileOut.write(bytes(header) + b'\0' * 16)
+
+
+def writeSingularity(binPath, probe):
+    """Stub of singularity: labels, definition file and the output of
+    the runtime probes"""
+    os.makedirs(binPath)
+    path = os.path.join(binPath, 'singularity')
+    with open(path, 'w') as fileOut:
+        fileOut.write(
+            '#!/bin/sh\n'
+            f'case "$2" in --json) echo \'{LABELS}\';; --deffile) echo "Bootstrap: docker";; '
+            f'*) printf \'{probe}\';; esac\n'
+        )
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+
+
+def getProbeOutput(stata):
+    versions = dict.fromkeys(RUNTIME_PROBES, '')
+    versions.update(Stata=stata, Python='Python 3.11.7')
+
+    return ''.join(f'@@runtime@@{runtime}\\n{version}\\n' for runtime, version in versions.items())
+
+
+def test_cache_complete(tmp_path, settings, monkeypatch):
+    settings(cacheDir=str(tmp_path / 'cache'))
+    writeSif(str(tmp_path / 'image.sif'))
+    writeSingularity(str(tmp_path / 'bin'), getProbeOutput('Stata 17 (MP)'))
+    monkeypatch.setenv('PATH', f"{tmp_path / 'bin'}{os.pathsep}{os.environ['PATH']}")
+    info = getContainerInfo(str(tmp_path / 'image.sif'))
+    assert info['complete'] and not info['cached']
+    assert info['labels'] == {'Version': '1.0'}
+    assert info['runtimes']['Stata'] == 'Stata 17 (MP)'
+    assert info['runtimes']['R'] == 'Not found'
+    assert getContainerInfo(str(tmp_path / 'image.sif'))['cached']
+
+
+def test_failures_not_cached(tmp_path, settings, monkeypatch):
+    settings(cacheDir=str(tmp_path / 'cache'))
+    writeSif(str(tmp_path / 'image.sif'))
+    # singularity missing
+    monkeypatch.setenv('PATH', str(tmp_path / 'bin'))
+    info = getContainerInfo(str(tmp_path / 'image.sif'))
+    assert not info['complete']
+    assert 'Error' in info['labels']
+    assert info['runtimes'] == {}
+    assert not getContainerInfo(str(tmp_path / 'image.sif'))['cached']
+    # Stata found but its version not displayed (e.g. no licence)
+    writeSingularity(str(tmp_path / 'bin'), getProbeOutput('stata-mp found, version unknown'))
+    assert not getContainerInfo(str(tmp_path / 'image.sif'))['complete']
+    assert not getContainerInfo(str(tmp_path / 'image.sif'))['cached']
+
+
+def test_stata_probe(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / 'bin')
+    stata = str(tmp_path / 'bin' / 'stata-se')
+    # console mode: the command is echoed, then its output
+    with open(stata, 'w') as fileOut:
+        fileOut.write('#!/bin/sh\nread line\necho ". $line"\necho "Stata 18 (SE)"\n')
+    os.chmod(stata, os.stat(stata).st_mode | stat.S_IEXEC)
+    monkeypatch.setenv('PATH', f"{tmp_path / 'bin'}{os.pathsep}/usr/bin{os.pathsep}/bin")
+    assert container._runCommand(['sh', '-c', RUNTIME_PROBES['Stata']], 10) == (True, 'Stata 18 (SE)')
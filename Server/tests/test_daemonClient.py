@@ -0,0 +1,26 @@
+# test_daemonClient.py
+import os
+import stat
+import pytest
+from utils.daemonClient import DaemonError, getDaemonPath, getServerPath
+
+
+def test_private_folder(settings, tmp_path):
+    settings(daemonPath=str(tmp_path / 'daemons'))
+    daemonPath = getDaemonPath()
+    assert daemonPath == os.path.join(str(tmp_path / 'daemons'), str(os.getuid()))
+    assert stat.S_IMODE(os.stat(daemonPath).st_mode) == 0o700
+    # every user may create their folder, but only remove their own
+    assert stat.S_IMODE(os.stat(getServerPath()).st_mode) == 0o1777
+    # a folder opened up is made private again
+    os.chmod(daemonPath, 0o775)
+    getDaemonPath()
+    assert stat.S_IMODE(os.stat(daemonPath).st_mode) == 0o700
+
+
+@pytest.mark.skipif(os.getuid() != 0, reason='needs to create a folder of another user')
+def test_folder_of_another_user(settings, tmp_path):
+    settings(daemonPath=str(tmp_path))
+    os.chown(getDaemonPath(), 65534, 65534)
+    with pytest.raises(DaemonError):
+        getDaemonPath()
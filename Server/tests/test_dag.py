@@ -0,0 +1,84 @@
+# test_dag.py
+import os
+import sys
+from utils.dag import STAGE_PREFIX, Stage, StageRunner, readStagesState, recordAttempt
+
+
+def createStages(workPath):
+    """Two stages: the first appends a line to a.txt, the second
+    fails while the file `fail` exists"""
+    with open(os.path.join(workPath, 'a.py'), 'w') as fileOut:
+        fileOut.write('open("a.txt", "a").write("run\\n")\n')
+    with open(os.path.join(workPath, 'b.py'), 'w') as fileOut:
+        fileOut.write('import os, sys\nsys.exit(1 if os.path.exists("fail") else 0)\n')
+    first = Stage(1, os.path.join(workPath, 'a.py'), 'exec(open("a.py").read())')
+    second = Stage(2, os.path.join(workPath, 'b.py'), 'exec(open("b.py").read())')
+    second.dependencies.add(1)
+
+    return [first, second]
+
+
+def runStages(workPath, attempt, stages=None):
+    runner = StageRunner(
+        os.path.join(workPath, 'main.py'),
+        [],
+        stages or createStages(workPath),
+        lambda script: [sys.executable, script],
+        stateFile=os.path.join(workPath, '.stages.json'),
+        attempt=attempt
+    )
+    runner.start()
+    runner.communicate()
+
+    return runner
+
+
+def readRuns(workPath):
+    with open(os.path.join(workPath, 'a.txt')) as fileIn:
+        return fileIn.read().count('run')
+
+
+def test_resume_skips_stages_done(tmp_path):
+    workPath = str(tmp_path)
+    open(os.path.join(workPath, 'fail'), 'w').close()
+    runner = runStages(workPath, 1)
+    assert runner.returncode == 1
+    assert [stage.status for stage in runner.stages] == ['done', 'failed']
+
+    os.remove(os.path.join(workPath, 'fail'))
+    runner = runStages(workPath, 2)
+    assert runner.returncode == 0
+    assert [stage.status for stage in runner.stages] == ['skipped', 'done']
+    assert [stage.attempt for stage in runner.stages] == [1, 2]
+    assert readRuns(workPath) == 1
+    # logs of the previous attempt are kept
+    assert os.path.isfile(os.path.join(workPath, f'{STAGE_PREFIX}02_b.log'))
+    assert os.path.isfile(os.path.join(workPath, f'{STAGE_PREFIX}02_b_attempt2.log'))
+
+
+def test_resume_runs_stages_changed(tmp_path):
+    workPath = str(tmp_path)
+    open(os.path.join(workPath, 'fail'), 'w').close()
+    runStages(workPath, 1)
+    os.remove(os.path.join(workPath, 'fail'))
+    stages = createStages(workPath)
+    with open(stages[0].script, 'a') as fileOut:
+        fileOut.write('# changed\n')
+    runner = runStages(workPath, 2, stages)
+    assert runner.returncode == 0
+    assert [stage.status for stage in runner.stages] == ['done', 'done']
+    assert readRuns(workPath) == 2
+
+
+def test_record_attempt(tmp_path):
+    stateFile = str(tmp_path / '.stages.json')
+    recordAttempt(stateFile, 1)
+    recordAttempt(stateFile, 1, 1)
+    state = readStagesState(stateFile)
+    assert [(item['attempt'], item['returnCode']) for item in state['attempts']] == [(1, 1)]
+    assert state['attempts'][0]['finished'] >= state['attempts'][0]['started']
+    # resumed by stages: the runner adds the next attempt
+    workPath = str(tmp_path)
+    runner = runStages(workPath, 2)
+    assert runner.returncode == 0
+    assert [item['attempt'] for item in readStagesState(stateFile)['attempts']] == [1, 2]
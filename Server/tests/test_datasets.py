@@ -0,0 +1,115 @@
+# test_datasets.py
+import struct
+import pytest
+from utils.datasets import getLargestDataset, inventoryDatasets, readDtaHeader
+
+NAMES = ('id', 'value', 'name')
+
+
+def writeOldDta(path, release=114, order='<', nobs=1000):
+    """Writes a dataset of the 113-115 formats: a long, a double and a
+    str10 variable"""
+    header = bytes([release, 2 if order == '<' else 1, 1, 0]) + struct.pack(f'{order}hi', len(NAMES), nobs)
+    header += b'Old data'.ljust(81, b'\0') + b'01 Jan 2020 10:00'.ljust(18, b'\0')
+    header += bytes([253, 255, 10]) + b''.join(name.encode().ljust(33, b'\0') for name in NAMES)
+    with open(path, 'wb') as fileOut:
+        fileOut.write(header + b'\0' * (2 * (len(NAMES) + 1)) + b'\0' * (nobs * 22))
+
+
+def writeNewDta(path, release=118, order='<', nobs=5 * 10 ** 9, label='Dados é'):
+    """Writes the header of a dataset of the 117+ formats: a long, a
+    double and a str2045 variable"""
+    kBytes, nBytes, labelBytes, nameBytes = {
+        117: (2, 4, 1, 33), 118: (2, 8, 2, 129), 119: (4, 8, 2, 129)
+    }[release]
+    byteorder = 'big' if order == '>' else 'little'
+    label = label.encode('latin-1' if release == 117 else 'utf-8')
+    header = (
+        b'<stata_dta><header><release>' + str(release).encode() + b'</release>'
+        + b'<byteorder>' + (b'MSF' if order == '>' else b'LSF') + b'</byteorder>'
+        + b'<K>' + len(NAMES).to_bytes(kBytes, byteorder) + b'</K>'
+        + b'<N>' + nobs.to_bytes(nBytes, byteorder) + b'</N>'
+        + b'<label>' + len(label).to_bytes(labelBytes, byteorder) + label + b'</label>'
+        + b'<timestamp>' + bytes([17]) + b'01 Jan 2020 10:00' + b'</timestamp></header>'
+    )
+    mapOffset = len(header)
+    header += b'<map>' + b'\0' * 112 + b'</map>'
+    typesOffset = len(header)
+    header += b'<variable_types>' + struct.pack(f'{order}3H', 65528, 65526, 2045) + b'</variable_types>'
+    namesOffset = len(header)
+    header += b'<varnames>' + b''.join(name.encode().ljust(nameBytes, b'\0') for name in NAMES) + b'</varnames>'
+    offsets = struct.pack(f'{order}14Q', 0, mapOffset, typesOffset, namesOffset, *[len(header)] * 10)
+    header = header[:mapOffset + 5] + offsets + header[mapOffset + 5 + 112:]
+    with open(path, 'wb') as fileOut:
+        fileOut.write(header + b'\0' * 100)
+
+
+@pytest.mark.parametrize('release', [113, 114, 115])
+@pytest.mark.parametrize('order', ['<', '>'])
+def test_old_formats(tmp_path, release, order):
+    path = str(tmp_path / 'old.dta')
+    writeOldDta(path, release, order)
+    header = readDtaHeader(path)
+    assert header == {
+        'version': release,
+        'nobs': 1000,
+        'nvars': 3,
+        'label': 'Old data',
+        'varnames': list(NAMES),
+        'width': 4 + 8 + 10
+    }
+
+
+@pytest.mark.parametrize('release', [117, 118, 119])
+@pytest.mark.parametrize('order', ['<', '>'])
+def test_new_formats(tmp_path, release, order):
+    path = str(tmp_path / 'new.dta')
+    nobs = 70000 if release == 117 else 5 * 10 ** 9
+    writeNewDta(path, release, order, nobs)
+    header = readDtaHeader(path)
+    assert header['version'] == release
+    assert header['nobs'] == nobs
+    assert header['nvars'] == 3
+    assert header['label'] == 'Dados é'
+    assert header['varnames'] == list(NAMES)
+    assert header['width'] == 4 + 8 + 2045
+
+
+def test_not_a_dataset(tmp_path):
+    path = tmp_path / 'text.dta'
+    path.write_text('id,value\n1,2\n')
+    with pytest.raises(ValueError):
+        readDtaHeader(str(path))
+    path.write_bytes(b'')
+    with pytest.raises(ValueError):
+        readDtaHeader(str(path))
+
+
+def test_truncated(tmp_path):
+    path = tmp_path / 'old.dta'
+    writeOldDta(str(path))
+    path.write_bytes(path.read_bytes()[:120])
+    with pytest.raises(ValueError, match='Truncated'):
+        readDtaHeader(str(path))
+
+
+def test_inventory(tmp_path, settings):
+    settings(cacheDir=str(tmp_path / 'cache'))
+    dataPath = tmp_path / 'data'
+    (dataPath / 'sub').mkdir(parents=True)
+    writeOldDta(str(dataPath / 'a.dta'))
+    writeNewDta(str(dataPath / 'sub' / 'b.DTA'))
+    (dataPath / 'bad.dta').write_text('not stata')
+    (dataPath / 'c.csv').write_text('id\n')
+    inventory = inventoryDatasets(str(dataPath))
+    assert [item['path'] for item in inventory] == [
+        str(dataPath / 'a.dta'), str(dataPath / 'bad.dta'), str(dataPath / 'sub' / 'b.DTA')
+    ]
+    assert 'error' in inventory[1]
+    assert inventory[0]['memory'] == 1000 * 22
+    assert getLargestDataset(inventory)['path'] == str(dataPath / 'sub' / 'b.DTA')
+    # headers are cached, and read again once the file changes
+    cached = inventoryDatasets(str(dataPath))
+    assert cached == inventory
+    writeOldDta(str(dataPath / 'a.dta'), nobs=10)
+    assert inventoryDatasets(str(dataPath))[0]['nobs'] == 10
@@ -0,0 +1,62 @@
+# test_history.py
+import pytest
+from utils.history import (
+    RUN_METRIC,
+    TOTAL_METRIC,
+    compareWithHistory,
+    describeRegressions,
+    estimateRunTime,
+    getMetrics
+)
+
+
+def getHistory(*runSeconds):
+    return [getMetrics(10.0, seconds) for seconds in runSeconds]
+
+
+def getRow(comparison, metric):
+    return next(row for row in comparison if row['metric'] == metric)
+
+
+def test_median(settings):
+    settings(regression={'minSeconds': 0})
+    # the median ignores the outlier (a mean would be 370)
+    comparison = compareWithHistory(getMetrics(10.0, 200.0), getHistory(100, 110, 1200, 90))
+    row = getRow(comparison, RUN_METRIC)
+    assert row['median'] == 105
+    assert row['runs'] == 4
+    assert row['ratio'] == pytest.approx(200 / 105)
+    assert row['regression']
+    assert getRow(comparison, TOTAL_METRIC)['median'] == 115
+    assert describeRegressions(comparison).startswith('Total 1.8x')
+
+
+def test_thresholds(settings):
+    settings(regression={'threshold': 1.5, 'minSeconds': 60})
+    # 2x the median, but only 20 s above it
+    row = getRow(compareWithHistory(getMetrics(0.0, 40.0), getHistory(20, 20)), RUN_METRIC)
+    assert not row['regression']
+    # 80 s above the median, but under the threshold
+    row = getRow(compareWithHistory(getMetrics(0.0, 280.0), getHistory(200, 200)), RUN_METRIC)
+    assert not row['regression']
+    row = getRow(compareWithHistory(getMetrics(0.0, 200.0), getHistory(100, 100)), RUN_METRIC)
+    assert row['regression']
+
+
+def test_min_runs(settings):
+    settings(regression={'minRuns': 3})
+    assert compareWithHistory(getMetrics(1.0, 1.0), getHistory(1, 1)) == []
+    # metrics missing from some runs (e.g. stages) have less runs
+    history = [
+        getMetrics(1.0, 1.0, {'a.do': 5.0}),
+        getMetrics(1.0, 1.0, {'a.do': 5.0}),
+        getMetrics(1.0, 1.0)
+    ]
+    metrics = [row['metric'] for row in compareWithHistory(getMetrics(1.0, 1.0, {'a.do': 5.0}), history)]
+    assert RUN_METRIC in metrics
+    assert 'Stage a.do' not in metrics
+
+
+def test_estimate_run_time():
+    assert estimateRunTime([]) is None
+    assert estimateRunTime(getHistory(30, 10, 20) + [getMetrics(None, None)]) == 20
@@ -0,0 +1,61 @@
+# test_ignore.py
+import os
+from utils.ignore import IGNORE_FILE, IgnoreRules
+
+
+def test_names_at_any_depth():
+    rules = IgnoreRules(['*.log', 'tmp'])
+    assert rules.matches('run.log')
+    assert rules.matches(os.path.join('code', 'sub', 'run.log'))
+    assert not rules.matches('run.log.txt')
+    assert rules.matches(os.path.join('code', 'tmp'), isFolder=True)
+    assert rules.matches(os.path.join('code', 'tmp'))
+
+
+def test_paths_relative_to_main():
+    rules = IgnoreRules(['/output/*.csv', 'code/*/cache'])
+    assert rules.matches('output/a.csv')
+    assert not rules.matches('code/output/a.csv')
+    # `*` does not match `/`
+    assert not rules.matches('output/sub/a.csv')
+    assert rules.matches('code/x/cache', isFolder=True)
+    assert not rules.matches('code/x/y/cache', isFolder=True)
+
+
+def test_double_star():
+    rules = IgnoreRules(['logs/**/*.txt', 'build/**'])
+    assert rules.matches('logs/a.txt')
+    assert rules.matches('logs/x/y/a.txt')
+    assert not rules.matches('other/logs/a.txt')
+    assert rules.matches('build/x/y')
+
+
+def test_folder_patterns():
+    rules = IgnoreRules(['data/', '# comment', '', 'file[0-9].do', 'keep[!a].do'])
+    assert rules.patterns == ['data/', 'file[0-9].do', 'keep[!a].do']
+    assert rules.matches('data', isFolder=True)
+    assert not rules.matches('data')
+    assert rules.matches('file1.do')
+    assert not rules.matches('filex.do')
+    assert rules.matches('keepb.do')
+    assert not rules.matches('keepa.do')
+
+
+def test_no_patterns():
+    rules = IgnoreRules([])
+    assert not rules.matches('a')
+    assert not rules.matches('a', isFolder=True)
+
+
+def test_from_folder(tmp_path, settings):
+    settings(ignorePatterns=['*.tmp'])
+    with open(tmp_path / IGNORE_FILE, 'w') as fileOut:
+        fileOut.write('*.log\nsecret/\n')
+    rules = IgnoreRules.fromFolder(str(tmp_path))
+    for folder in ('.git', 'initial_dataset', 'initial_dataset_v2', 'Replications', 'secret'):
+        assert rules.matches(folder, isFolder=True)
+    assert rules.matches('a.tmp')
+    assert rules.matches('a.log')
+    assert not rules.matches('.profile')
+    assert rules.filterFolders('.', ['code', '.git', 'secret']) == ['code']
+    assert rules.filterFolders('code', ['secret', 'data']) == ['data']
@@ -0,0 +1,34 @@
+# test_limits.py
+import sys
+import subprocess
+import pytest
+from utils.limits import ResourceLimits, getPreexecFunction
+
+pytest.importorskip('resource')
+
+# Maps 4 GB read-only (address space, not memory used), then allocates
+# the memory given in MB
+SCRIPT = '''
+import sys, mmap
+reserved = mmap.mmap(-1, 4 * 1024 ** 3, prot=mmap.PROT_READ)
+data = bytearray(int(sys.argv[1]) * 1024 ** 2)
+'''
+
+
+def runLimited(megabytes):
+    preexec = getPreexecFunction(ResourceLimits(memory=512 * 1024 ** 2), 'prlimit')
+    return subprocess.run(
+        [sys.executable, '-c', SCRIPT, str(megabytes)],
+        preexec_fn=preexec,
+        stderr=subprocess.PIPE
+    )
+
+
+def test_prlimit_allows_reserved_address_space():
+    assert runLimited(64).returncode == 0
+
+
+def test_prlimit_limits_memory_allocated():
+    result = runLimited(1024)
+    assert result.returncode != 0
+    assert b'MemoryError' in result.stderr
@@ -0,0 +1,76 @@
+# test_numbering.py
+import os
+from concurrent.futures import ProcessPoolExecutor
+from utils.numbering import (
+    COUNTER_FILE,
+    allocateReplicationFolder,
+    getReplicationFolder,
+    iterReplicationFolders,
+    releaseReplicationFolder
+)
+
+
+def test_shards():
+    assert getReplicationFolder('R', 7) == os.path.join('R', 'Rep007')
+    assert getReplicationFolder('R', 999) == os.path.join('R', 'Rep999')
+    assert getReplicationFolder('R', 1000) == os.path.join('R', 'Rep1000-1999', 'Rep1000')
+    assert getReplicationFolder('R', 12345) == os.path.join('R', 'Rep12000-12999', 'Rep12345')
+
+
+def test_iter_folders(tmp_path):
+    for folder in ('Rep001', 'Rep999', 'Rep1000-1999/Rep1234', 'Rep1000-1999/Other', 'Other', 'Rep12a'):
+        os.makedirs(tmp_path / folder)
+    open(tmp_path / 'Rep002', 'w').close()
+    numbers = sorted(number for number, _ in iterReplicationFolders(str(tmp_path)))
+    assert numbers == [1, 999, 1234]
+    assert list(iterReplicationFolders(str(tmp_path / 'missing'))) == []
+
+
+def test_allocate_sequence(tmp_path):
+    replicationsPath = str(tmp_path / 'Replications')
+    assert allocateReplicationFolder(replicationsPath) == os.path.join(replicationsPath, 'Rep001')
+    assert allocateReplicationFolder(replicationsPath) == os.path.join(replicationsPath, 'Rep002')
+    with open(os.path.join(replicationsPath, COUNTER_FILE)) as counter:
+        assert counter.read() == '2'
+
+
+def test_allocate_without_counter(tmp_path):
+    # folders created by older versions of the app (no counter file)
+    os.makedirs(tmp_path / 'Rep004')
+    os.makedirs(tmp_path / 'Rep1000-1999' / 'Rep1001')
+    assert allocateReplicationFolder(str(tmp_path)) == getReplicationFolder(str(tmp_path), 1002)
+
+
+def test_allocate_skips_existing(tmp_path):
+    with open(tmp_path / COUNTER_FILE, 'w') as counter:
+        counter.write('998')
+    # created without the lock
+    os.makedirs(tmp_path / 'Rep999')
+    assert allocateReplicationFolder(str(tmp_path)) == getReplicationFolder(str(tmp_path), 1000)
+    assert os.path.isdir(tmp_path / 'Rep1000-1999' / 'Rep1000')
+
+
+def test_allocate_concurrent(tmp_path):
+    replicationsPath = str(tmp_path)
+    with ProcessPoolExecutor(8) as executor:
+        folders = list(executor.map(allocateReplicationFolder, [replicationsPath] * 64))
+    assert len(set(folders)) == 64
+    assert sorted(number for number, _ in iterReplicationFolders(replicationsPath)) == list(range(1, 65))
+    with open(os.path.join(replicationsPath, COUNTER_FILE)) as counter:
+        assert counter.read() == '64'
+
+
+def test_release(tmp_path):
+    replicationsPath = str(tmp_path)
+    first = allocateReplicationFolder(replicationsPath)
+    second = allocateReplicationFolder(replicationsPath)
+    releaseReplicationFolder(replicationsPath, second)
+    assert not os.path.exists(second)
+    # the number is allocated again
+    assert allocateReplicationFolder(replicationsPath) == second
+    third = allocateReplicationFolder(replicationsPath)
+    releaseReplicationFolder(replicationsPath, first)
+    # a later number was allocated: the number is not reused
+    assert not os.path.exists(first)
+    assert allocateReplicationFolder(replicationsPath) == getReplicationFolder(replicationsPath, 4)
+    assert os.path.isdir(third)
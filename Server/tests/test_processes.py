@@ -0,0 +1,74 @@
+# test_processes.py
+import os
+import ast
+import time
+import subprocess
+import pytest
+from utils.processes import RunPause
+
+REPLICATION_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'replication.py')
+
+
+def getState(pid):
+    with open(f'/proc/{pid}/stat') as fileIn:
+        return fileIn.read().rsplit(')', 1)[1].split()[0]
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc'), reason='needs /proc')
+def test_pause_and_continue():
+    pause = RunPause()
+    process = subprocess.Popen(['sh', '-c', 'sleep 30'], start_new_session=True)
+    try:
+        time.sleep(0.2)
+        assert pause.start(process)
+        assert pause.active
+        # already paused
+        assert not pause.start(process)
+        time.sleep(0.2)
+        assert getState(process.pid) == 'T'
+        assert pause.end(process)
+        assert not pause.active
+        assert not pause.end(process)
+        pausedTime = pause.pausedTime
+        assert pausedTime >= 0.2
+        time.sleep(0.2)
+        assert getState(process.pid) == 'S'
+        # the time paused is not counted once continued
+        assert pause.pausedTime == pausedTime
+    finally:
+        process.kill()
+        process.wait()
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc'), reason='needs /proc')
+def test_end_without_signal():
+    # e.g. a run terminated while paused (terminateProcess continues it)
+    pause = RunPause()
+    process = subprocess.Popen(['sleep', '30'], start_new_session=True)
+    try:
+        pause.start(process)
+        time.sleep(0.2)
+        assert pause.end()
+        assert pause.pausedTime >= 0.2
+        assert getState(process.pid) == 'T'
+    finally:
+        process.kill()
+        process.wait()
+
+
+def test_resume_is_not_redefined():
+    # Replication.resume runs a failed replication again (no process),
+    # continueRun ends a pause. Checked from the source, since the
+    # module needs PySimpleGUI
+    with open(REPLICATION_SCRIPT) as fileIn:
+        tree = ast.parse(fileIn.read())
+    replication = next(
+        node for node in tree.body if isinstance(node, ast.ClassDef) and node.name == 'Replication'
+    )
+    methods = [node for node in replication.body if isinstance(node, ast.FunctionDef)]
+    names = [method.name for method in methods]
+    assert len(names) == len(set(names))
+    arguments = {method.name: [arg.arg for arg in method.args.args] for method in methods}
+    assert arguments['resume'] == ['self']
+    assert arguments['pauseRun'] == ['self', 'process']
+    assert arguments['continueRun'] == ['self', 'process']
@@ -0,0 +1,62 @@
+# test_progress.py
+import os
+import errno
+import threading
+import pytest
+from utils import progress
+from utils.progress import COPY_CHUNK_SIZE, CopyProgress, PreparationCancelled
+
+
+def createFile(path, size):
+    content = os.urandom(size)
+    with open(path, 'wb') as fileOut:
+        fileOut.write(content)
+    os.utime(path, (1000000000, 1000000000))
+
+    return content
+
+
+def test_copy_file(tmp_path):
+    size = 2 * COPY_CHUNK_SIZE + 123
+    content = createFile(tmp_path / 'a.bin', size)
+    os.mkdir(tmp_path / 'out')
+    copyProgress = CopyProgress()
+    copyProgress.setTotals(1, size)
+    copyProgress.copyFile(str(tmp_path / 'a.bin'), str(tmp_path / 'out'))
+    assert (tmp_path / 'out' / 'a.bin').read_bytes() == content
+    assert os.path.getmtime(tmp_path / 'out' / 'a.bin') == 1000000000
+    assert copyProgress.copiedBytes == size
+    assert copyProgress.copiedFiles == 1
+
+
+def test_copy_fallback(tmp_path, monkeypatch):
+    # copy_file_range and sendfile not supported: chunks are read and
+    # written
+    def unsupported(*args):
+        raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+
+    monkeypatch.setattr(progress, '_copyChunkRange', unsupported)
+    monkeypatch.setattr(progress, '_sendChunk', unsupported)
+    size = COPY_CHUNK_SIZE + 1
+    content = createFile(tmp_path / 'a.bin', size)
+    copyProgress = CopyProgress()
+    copyProgress.copyFile(str(tmp_path / 'a.bin'), str(tmp_path / 'b.bin'))
+    assert (tmp_path / 'b.bin').read_bytes() == content
+    assert copyProgress.copiedBytes == size
+
+
+def test_copy_cancelled(tmp_path):
+    createFile(tmp_path / 'a.bin', 10)
+    cancelEvent = threading.Event()
+    cancelEvent.set()
+    with pytest.raises(PreparationCancelled):
+        CopyProgress(cancelEvent=cancelEvent).copyFile(str(tmp_path / 'a.bin'), str(tmp_path / 'b.bin'))
+
+
+def test_skip_file():
+    copyProgress = CopyProgress()
+    copyProgress.setTotals(2, 300)
+    copyProgress.skipFile(200)
+    assert copyProgress.totalBytes == 100
+    assert copyProgress.copiedBytes == 0
+    assert copyProgress.copiedFiles == 1
@@ -0,0 +1,44 @@
+# test_replication.py
+import os
+import pytest
+
+pytest.importorskip('PySimpleGUI')
+from replication import Replication
+from utils.dag import Stage
+from utils.history import STAGE_PREFIX, getMetrics
+
+
+class FakeRunner(object):
+
+    def __init__(self, stages):
+        self.stages = stages
+
+
+def createReplication(replicationPath):
+    """Replication with the attributes set by the run, without the
+    fields of the app"""
+    replication = Replication.__new__(Replication)
+    replication._replicationPath = replicationPath
+    replication._stageRunner = None
+
+    return replication
+
+
+def test_compare_stages_run(tmp_path, settings):
+    settings(regression={'minRuns': 1})
+    replicationPath = str(tmp_path)
+    stages = list()
+    for index, status in enumerate(('done', 'skipped', 'failed'), 1):
+        stage = Stage(index, os.path.join(replicationPath, f's{index}.py'), '')
+        stage.status = status
+        stage.startTime, stage.endTime = 0.0, 5.0
+        stages.append(stage)
+    replication = createReplication(replicationPath)
+    replication._stageRunner = FakeRunner(stages)
+    replication._getTimes = lambda startTime: (1.0, 15.0)
+    replication._getHistory = lambda: [getMetrics(1.0, 15.0, {'s1.py': 5.0, 's2.py': 5.0, 's3.py': 5.0})]
+    replication._compareWithHistory(None)
+    metrics = [row['metric'] for row in replication._comparison]
+    # skipped stages keep the times of a previous attempt
+    assert [metric for metric in metrics if metric.startswith(STAGE_PREFIX)] == [f'{STAGE_PREFIX}s1.py']
+
@@ -0,0 +1,139 @@
+# allocation.py
+from typing import Dict, List, Union
+import os
+import math
+from .settings import loadSettings
+from .limits import ResourceLimits
+
+# Environment variables that control the threads of OpenMP and BLAS libraries
+THREAD_VARIABLES = (
+    'OMP_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'VECLIB_MAXIMUM_THREADS',
+    'NUMEXPR_NUM_THREADS'
+)
+
+
+def getAvailableCpus() -> List[int]:
+    """Gets the CPUs the app is allowed to run on
+
+    Returns
+    -------
+    List[int]
+        CPU numbers
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+
+    return list(range(os.cpu_count() or 1))
+
+
+class CoreAllocation(object):
+    """Cores allocated to a replication run: threads of each process
+    (Stata `set processors`, OpenMP/BLAS threads), CPUs the processes
+    are bound to (None if not bound) and memory available to Stata
+    (`set max_memory`, in bytes, 0 if not set)
+    """
+
+    def __init__(
+        self,
+        threads: int,
+        cpus: Union[List[int], None] = None,
+        memory: int = 0
+    ) -> None:
+
+        self.threads = max(1, threads)
+        self.cpus = cpus
+        self.memory = memory
+
+    @property
+    def variables(self) -> Dict[str, str]:
+        """Thread environment variables"""
+        return {variable: str(self.threads) for variable in THREAD_VARIABLES}
+
+    def getEnvironment(self) -> Dict[str, str]:
+        """Gets the environment of the replication processes (the
+        environment of the app with the thread variables)
+
+        Returns
+        -------
+        Dict[str, str]
+            environment for `subprocess.Popen(env=...)`
+        """
+        return {**os.environ, **self.variables}
+
+    def describe(self) -> Dict[str, str]:
+        """Describes the allocation
+
+        Returns
+        -------
+        Dict[str, str]
+            item and value
+        """
+        description = {
+            'Threads per process': str(self.threads),
+            'CPU affinity': ','.join(map(str, self.cpus)) if self.cpus else 'None',
+            'Stata max_memory': f'{self.memory // 1024 ** 2}m' if self.memory else 'Default'
+        }
+        description.update(self.variables)
+
+        return description
+
+
+def getCoreAllocation(
+    limits: ResourceLimits,
+    backend: str,
+    workers: int = 1,
+    slot: int = 0,
+    remote: bool = False
+) -> CoreAllocation:
+    """Computes the core allocation of a run. The cores of a run are
+    the CPU limit, else the `threadsPerRun` setting, else every CPU
+    available. In parallel runs they are split among the workers.
+    Processes are bound to the cores when `cpuAffinity` is set, or
+    when the CPU limit is applied through the prlimit backend. The
+    cores bound start at an offset given by `slot` (the replication
+    number), so that concurrent replications use different cores.
+    The memory limit is also split among the workers. Runs on other
+    nodes (remote, e.g. Slurm jobs) are not bound to cores, and use
+    one core if neither the CPU limit nor `threadsPerRun` are set
+
+    Parameters
+    ----------
+    limits : ResourceLimits
+        limits of the run
+    backend : str
+        limits backend
+    workers : int, optional
+        processes run concurrently, by default 1
+    slot : int, optional
+        offset of the cores bound, by default 0
+    remote : bool, optional
+        the run is not on this host, by default False
+
+    Returns
+    -------
+    CoreAllocation
+        allocation of the run
+    """
+    settings = loadSettings()
+    workers = max(1, workers)
+    if remote:
+        return CoreAllocation(
+            threads=(math.ceil(limits.cpus) or settings['threadsPerRun'] or 1) // workers,
+            memory=int(limits.memory) // workers
+        )
+    available = getAvailableCpus()
+    cores = math.ceil(limits.cpus) or settings['threadsPerRun'] or len(available)
+    cores = min(cores, len(available))
+    cpus = None
+    if settings['cpuAffinity'] or (limits.cpus and backend == 'prlimit'):
+        start = slot * cores % len(available)
+        cpus = sorted((available * 2)[start:start + cores])
+
+    return CoreAllocation(
+        threads=cores // workers,
+        cpus=cpus,
+        memory=int(limits.memory) // workers
+    )
@@ -0,0 +1,787 @@
+# catalog.py
+from typing import Dict, List, Iterable, Generator, Union, Any
+import os
+import re
+import json
+import time
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from .settings import loadSettings
+
+# Catalog file (in CATALOG_FOLDER under the projects folder, unless
+# `catalogPath` is set)
+CATALOG_FOLDER = '.replicationApp'
+CATALOG_FILE = 'catalog.db'
+REPORT_FILE = '.report.txt'
+STRUCTURE_FILE = 'structure.json'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Replications written to the catalog in each transaction (import)
+BATCH_SIZE = 500
+# Seconds to wait for other writers
+CATALOG_TIMEOUT = 30
+# Filesystems shared over the network: the WAL shared memory index does
+# not work between hosts, so the catalog uses a rollback journal there
+NETWORK_FILESYSTEMS = (
+    'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'lustre', 'gpfs', 'beegfs',
+    'ceph', 'glusterfs', 'afs', '9p'
+)
+MOUNTS_FILE = '/proc/mounts'
+# Project folders (e.g. p001_name) when a path is not under projectsPath
+PROJECT_REGULAR_EXPRESSION = r'(p|r)(\d{3}|xxx)_[a-zA-Z]+'
+# Columns of the catalog (name -> SQL type)
+COLUMNS = {
+    'path': 'TEXT PRIMARY KEY',
+    'project': 'TEXT',
+    'replication': 'TEXT',
+    'mainScript': 'TEXT',
+    'runtime': 'TEXT',
+    'image': 'TEXT',
+    'parallel': 'INTEGER',
+    'staged': 'INTEGER',
+    'slurm': 'INTEGER',
+    'config': 'TEXT',
+    'attempt': 'INTEGER',
+    'started': 'TEXT',
+    'finished': 'TEXT',
+    'preparationSeconds': 'REAL',
+    'runSeconds': 'REAL',
+    'exitCode': 'INTEGER',
+    'errors': 'TEXT',
+    'stopped': 'TEXT',
+    'peakMemory': 'INTEGER',
+    'peakDisk': 'INTEGER',
+    'files': 'INTEGER',
+    'outputFiles': 'INTEGER',
+    'stageSeconds': 'TEXT',
+    'regressions': 'TEXT',
+    'updated': 'REAL'
+}
+INDEXES = {
+    'replicationsProject': ('project', 'started'),
+    'replicationsStarted': ('started',),
+    'replicationsExitCode': ('exitCode', 'started')
+}
+# Sizes in the report (formatBytes)
+SIZE_UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3, 'TB': 1024 ** 4}
+# Flagged lines (use and alert commands) of the replications. The text
+# is indexed in flaggedText (FTS5, external content), kept in sync by
+# triggers, so replacing the lines of a replication uses the index on
+# path instead of scanning the full-text index
+FLAGGED_COLUMNS = {
+    'id': 'INTEGER PRIMARY KEY',
+    'path': 'TEXT',
+    'project': 'TEXT',
+    'replication': 'TEXT',
+    'file': 'TEXT',
+    'line': 'INTEGER',
+    'type': 'TEXT',
+    'text': 'TEXT'
+}
+FLAGGED_TRIGGERS = {
+    'flaggedInsert': 'AFTER INSERT ON flagged BEGIN '
+        'INSERT INTO flaggedText(rowid, text) VALUES (new.id, new.text); END',
+    'flaggedDelete': 'AFTER DELETE ON flagged BEGIN '
+        "INSERT INTO flaggedText(flaggedText, rowid, text) VALUES ('delete', old.id, old.text); END"
+}
+# Sections of the report with flagged lines (header -> type)
+FLAG_SECTIONS = {
+    '********* Use commands *********': 'use',
+    '******* Alert commands *********': 'alert'
+}
+# Width of the line number column of flagged lines in the report
+LINE_NUMBER_WIDTH = 15
+# Line after which the report of a resumed replication keeps the
+# reports of previous attempts (not parsed)
+PREVIOUS_ATTEMPTS = '****** Previous attempts *******'
+
+
+def getCatalogPath() -> str:
+    """Gets the path of the catalog (`catalogPath` setting, by
+    default shared by every project, under the projects folder)
+
+    Returns
+    -------
+    str
+        catalog path
+    """
+    settings = loadSettings()
+
+    return settings['catalogPath'] or os.path.join(
+        settings['projectsPath'], CATALOG_FOLDER, CATALOG_FILE
+    )
+
+
+def getFilesystemType(path: str) -> str:
+    """Gets the type of the filesystem of a path (the mount
+    point in MOUNTS_FILE with the longest prefix of the path)
+
+    Parameters
+    ----------
+    path : str
+        path
+
+    Returns
+    -------
+    str
+        filesystem type (e.g. nfs4), or an empty string if unknown
+    """
+    path = os.path.realpath(path)
+    mountPoint, filesystemType = '', ''
+    try:
+        with open(MOUNTS_FILE) as fileIn:
+            mounts = [line.split() for line in fileIn]
+    except OSError:
+        return ''
+    for mount in mounts:
+        if len(mount) < 3:
+            continue
+        # spaces in mount points are written as \040
+        point = mount[1].replace('\\040', ' ')
+        inside = path == point or path.startswith(point.rstrip(os.sep) + os.sep)
+        if inside and len(point) >= len(mountPoint):
+            mountPoint, filesystemType = point, mount[2]
+
+    return filesystemType
+
+
+def isNetworkPath(path: str) -> bool:
+    """Checks if a path is on a filesystem shared over the
+    network (NETWORK_FILESYSTEMS, or FUSE filesystems such as sshfs)
+
+    Parameters
+    ----------
+    path : str
+        path
+
+    Returns
+    -------
+    bool
+        True if the filesystem is shared over the network
+    """
+    filesystemType = getFilesystemType(path)
+
+    return (
+        filesystemType.split('.')[0] in NETWORK_FILESYSTEMS or
+        filesystemType.startswith('fuse')
+    )
+
+
+def connect(catalogPath: Union[str, None] = None) -> sqlite3.Connection:
+    """Opens the catalog, creating the table and indexes if needed
+
+    Parameters
+    ----------
+    catalogPath : str, optional
+        catalog path, by default the path in the settings
+
+    Returns
+    -------
+    sqlite3.Connection
+        connection (rows as sqlite3.Row)
+    """
+    catalogPath = catalogPath or getCatalogPath()
+    catalogFolder = os.path.dirname(os.path.abspath(catalogPath))
+    if not os.path.isdir(catalogFolder):
+        os.makedirs(catalogFolder, exist_ok=True)
+        # shared by the users of the group (files inherit the group)
+        os.chmod(catalogFolder, 0o2775)
+    created = not os.path.exists(catalogPath)
+    connection = sqlite3.connect(catalogPath, timeout=CATALOG_TIMEOUT)
+    connection.row_factory = sqlite3.Row
+    # readers are not blocked while a replication is written (WAL), but
+    # only on local storage: on a network share the hosts do not share
+    # the WAL index, so a rollback journal is used
+    if isNetworkPath(catalogFolder):
+        connection.execute('PRAGMA journal_mode=DELETE')
+    else:
+        connection.execute('PRAGMA journal_mode=WAL')
+    if created:
+        # writable by the group (the journal files take the same permissions)
+        os.chmod(catalogPath, 0o664)
+    columns = ', '.join(f'{name} {sqlType}' for name, sqlType in COLUMNS.items())
+    connection.execute(f'CREATE TABLE IF NOT EXISTS replications ({columns})')
+    # columns added after the catalog was created
+    existing = [row['name'] for row in connection.execute('PRAGMA table_info(replications)')]
+    for name, sqlType in COLUMNS.items():
+        if name not in existing:
+            connection.execute(f'ALTER TABLE replications ADD COLUMN {name} {sqlType}')
+    for index, columns in INDEXES.items():
+        connection.execute(
+            f'CREATE INDEX IF NOT EXISTS {index} ON replications ({", ".join(columns)})'
+        )
+    columns = ', '.join(f'{name} {sqlType}' for name, sqlType in FLAGGED_COLUMNS.items())
+    connection.execute(f'CREATE TABLE IF NOT EXISTS flagged ({columns})')
+    connection.execute('CREATE INDEX IF NOT EXISTS flaggedPath ON flagged (path)')
+    if hasFullTextSearch(connection):
+        connection.execute(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS flaggedText '
+            "USING fts5(text, content='flagged', content_rowid='id')"
+        )
+        for trigger, statement in FLAGGED_TRIGGERS.items():
+            connection.execute(f'CREATE TRIGGER IF NOT EXISTS {trigger} {statement}')
+    connection.commit()
+
+    return connection
+
+
+def hasFullTextSearch(connection: sqlite3.Connection) -> bool:
+    """Checks if SQLite was built with FTS5. Without it, flagged
+    lines are still stored, and searched with LIKE
+
+    Parameters
+    ----------
+    connection : sqlite3.Connection
+        catalog connection
+
+    Returns
+    -------
+    bool
+        True if FTS5 is available
+    """
+    options = [row[0] for row in connection.execute('PRAGMA compile_options')]
+
+    return 'ENABLE_FTS5' in options
+
+
+def getProject(path: str) -> str:
+    """Gets the project of a path: the folder under `projectsPath`,
+    or else the project folder in the path (PROJECT_REGULAR_EXPRESSION)
+
+    Parameters
+    ----------
+    path : str
+        path
+
+    Returns
+    -------
+    str
+        project name, or an empty string
+    """
+    path = os.path.abspath(path)
+    projectsPath = os.path.abspath(loadSettings()['projectsPath'])
+    relativePath = os.path.relpath(path, projectsPath)
+    if relativePath != os.curdir and not relativePath.startswith(os.pardir):
+        return relativePath.split(os.sep)[0]
+    project = re.search(PROJECT_REGULAR_EXPRESSION, path)
+
+    return project[0] if project else ''
+
+
+def parseSize(size: str) -> Union[int, None]:
+    """Parses a size written in the report (e.g. 1.2 GB)
+
+    Parameters
+    ----------
+    size : str
+        formatted size
+
+    Returns
+    -------
+    int | None
+        bytes (approximate), or None if not a size
+    """
+    match = re.match(r'^([\d.]+) (B|KB|MB|GB|TB)$', size.strip())
+    if not match:
+        return None
+
+    return int(float(match[1]) * SIZE_UNITS[match[2]])
+
+
+def parseDuration(duration: str) -> Union[float, None]:
+    """Parses a duration written in the report ([D day(s), ]H:MM:SS)
+
+    Parameters
+    ----------
+    duration : str
+        formatted duration
+
+    Returns
+    -------
+    float | None
+        seconds, or None if not a duration
+    """
+    match = re.match(r'^(?:(\d+) days?, )?(\d+):(\d{2}):(\d{2})$', duration.strip())
+    if not match:
+        return None
+    days, hours, minutes, seconds = (int(value or 0) for value in match.groups())
+
+    return float(((days * 24 + hours) * 60 + minutes) * 60 + seconds)
+
+
+def parseReport(reportPath: str) -> Dict[str, Any]:
+    """Parses the report of a replication (the current attempt, if
+    resumed)
+
+    Parameters
+    ----------
+    reportPath : str
+        path to .report.txt
+
+    Returns
+    -------
+    Dict[str, Any]
+        times (total and per stage), exit code, errors, peaks, runtime,
+        regressions and files listed
+    """
+    with open(reportPath, errors='replace') as f:
+        lines = f.read().split(PREVIOUS_ATTEMPTS)[0].splitlines()
+    record = dict()
+    fields = {
+        'Attempt  :': ('attempt', lambda value: int(value.split()[0])),
+        'Started  :': ('started', str.strip),
+        'Finished :': ('finished', str.strip),
+        'Preparation:': ('preparationSeconds', parseDuration),
+        'Run time   :': ('runSeconds', parseDuration),
+        'Exit code:': ('exitCode', int),
+        'Peak memory:': ('peakMemory', parseSize),
+        'Peak disk growth:': ('peakDisk', parseSize),
+        'Stopped:': ('stopped', str.strip),
+        'Runtime  :': ('runtime', str.strip),
+        'Regressions:': ('regressions', str.strip)
+    }
+    files = None
+    errors = None
+    stages = None
+    for index, line in enumerate(lines):
+        for prefix, (key, parse) in fields.items():
+            if line.startswith(prefix) and key not in record:
+                try:
+                    record[key] = parse(line[len(prefix):])
+                except ValueError:
+                    pass
+        if line.startswith('Errors:') and errors is None:
+            errors = list()
+            for errorLine in lines[index + 2:]:
+                if not errorLine.strip():
+                    break
+                errors.append(errorLine)
+        if line.startswith('Files    :') and 'files' not in record:
+            # files of the folder, then the ones added, modified and removed
+            counts = [int(number) for number in re.findall(r'\d+', line)]
+            if len(counts) == 4:
+                record['files'], record['outputFiles'] = counts[0], counts[1] + counts[2]
+        # reports written before the outputs section list every file
+        if line.startswith('File ') and line.rstrip().endswith('Date modified') and files is None:
+            files = list()
+            for fileLine in lines[index + 2:]:
+                if not fileLine.strip():
+                    break
+                files.append(fileLine[-19:])
+        if line.startswith('Stage  ') and 'Depends on' in line and stages is None:
+            # duration (right-aligned, 10 characters) precedes the exit code (11)
+            scriptEnd = line.index('Depends on')
+            stages = dict()
+            for stageLine in lines[index + 2:]:
+                if not stageLine.strip():
+                    break
+                duration = parseDuration(stageLine[-21:-11])
+                if duration is not None:
+                    stages[stageLine[7:scriptEnd].strip()] = duration
+    record.setdefault('attempt', 1)
+    if stages is not None:
+        record['stageSeconds'] = json.dumps(stages)
+    record['errors'] = '\n'.join(errors or list())
+    if files is not None and 'files' not in record:
+        record['files'] = len(files)
+        record['outputFiles'] = len([date for date in files if date >= record.get('started', '')])
+
+    return record
+
+
+def parseFlaggedLines(reportPath: str) -> Union[List[Dict[str, Any]], None]:
+    """Parses the flagged lines (use and alert commands) of the report
+    of a replication
+
+    Parameters
+    ----------
+    reportPath : str
+        path to .report.txt
+
+    Returns
+    -------
+    List[Dict[str, Any]] | None
+        file, line number, type and text of each line, or None if the
+        report has no flagged lines sections (failed replications)
+    """
+    with open(reportPath, errors='replace') as f:
+        lines = f.read().split(PREVIOUS_ATTEMPTS)[0].splitlines()
+    flagged = None
+    flagType = file = None
+    inTable = False
+    for line in lines:
+        if line in FLAG_SECTIONS:
+            flagged = flagged or list()
+            flagType = FLAG_SECTIONS[line]
+            file = None
+        elif flagType and line.startswith('[') and '] File: ' in line:
+            file = line.split('] File: ', 1)[1]
+            inTable = False
+        elif file and line.startswith('---'):
+            inTable = True
+        elif file and inTable and line.strip():
+            try:
+                number = int(line[-LINE_NUMBER_WIDTH:])
+            except ValueError:
+                continue
+            flagged.append({
+                'file': file,
+                'line': number,
+                'type': flagType,
+                'text': line[:-LINE_NUMBER_WIDTH].rstrip()
+            })
+        elif file and inTable:
+            inTable = False
+        elif line.startswith('*' * 5) and line not in FLAG_SECTIONS:
+            flagType = file = None
+
+    return flagged
+
+
+def countFiles(replicationPath: str, started: str) -> Dict[str, int]:
+    """Counts the files of a replication, and the ones modified after
+    the start (outputs)
+
+    Parameters
+    ----------
+    replicationPath : str
+        replication folder
+    started : str
+        start of the replication (DATE_FORMAT)
+
+    Returns
+    -------
+    Dict[str, int]
+        files and outputFiles
+    """
+    try:
+        start = datetime.strptime(started, DATE_FORMAT).timestamp()
+    except (TypeError, ValueError):
+        start = float('inf')
+    files = outputFiles = 0
+    for root, _, fileNames in os.walk(replicationPath):
+        for fileName in fileNames:
+            try:
+                modified = os.stat(os.path.join(root, fileName)).st_mtime
+            except OSError:
+                continue
+            files += 1
+            outputFiles += modified >= start
+
+    return {'files': files, 'outputFiles': outputFiles}
+
+
+def readReplication(replicationPath: str, flagged: bool = True) -> Dict[str, Any]:
+    """Reads the catalog record of a replication from its folder
+    (structure.json and .report.txt)
+
+    Parameters
+    ----------
+    replicationPath : str
+        replication folder
+    flagged : bool, optional
+        parse the flagged lines of the report (import of existing
+        replications; runs give them from the scripts), by default True
+
+    Returns
+    -------
+    Dict[str, Any]
+        record (keys in COLUMNS, and `flagged` lines)
+    """
+    replicationPath = os.path.abspath(replicationPath)
+    config = dict()
+    structureFile = os.path.join(replicationPath, STRUCTURE_FILE)
+    if os.path.isfile(structureFile):
+        try:
+            with open(structureFile) as f:
+                config = json.load(f)
+        except ValueError:
+            config = dict()
+    record = dict.fromkeys(COLUMNS)
+    record.update({
+        'path': replicationPath,
+        'project': getProject(config.get('mainFolderInput') or replicationPath),
+        'replication': os.path.basename(replicationPath),
+        'mainScript': config.get('mainScriptInput', ''),
+        'runtime': config.get('runtime', ''),
+        'image': config.get('containerImage', ''),
+        'parallel': int(bool(config.get('parallelRun'))),
+        'staged': int(bool(config.get('stagedRun'))),
+        'slurm': int(bool(config.get('slurmRun'))),
+        'config': json.dumps(config, sort_keys=True)
+    })
+    reportPath = os.path.join(replicationPath, REPORT_FILE)
+    if os.path.isfile(reportPath):
+        report = parseReport(reportPath)
+        if not report.get('runtime'):
+            report.pop('runtime', None)
+        record.update(report)
+        if record['files'] is None:
+            record.update(countFiles(replicationPath, record['started']))
+        if flagged:
+            record['flagged'] = parseFlaggedLines(reportPath)
+    record['updated'] = time.time()
+
+    return record
+
+
+def upsertReplications(
+    records: Iterable[Dict[str, Any]],
+    connection: Union[sqlite3.Connection, None] = None
+) -> int:
+    """Inserts or replaces replications in the catalog (by path).
+    The flagged lines of a replication are replaced when the record
+    has them
+
+    Parameters
+    ----------
+    records : Iterable[Dict[str, Any]]
+        records (see readReplication)
+    connection : sqlite3.Connection, optional
+        catalog connection, by default a new connection
+
+    Returns
+    -------
+    int
+        replications written
+    """
+    ownConnection = connection is None
+    connection = connection or connect()
+    names = list(COLUMNS)
+    records = list(records)
+    rows = [tuple(record.get(name) for name in names) for record in records]
+    flaggedNames = [name for name in FLAGGED_COLUMNS if name != 'id']
+    try:
+        with connection:
+            connection.executemany(
+                f'INSERT OR REPLACE INTO replications ({", ".join(names)}) '
+                f'VALUES ({", ".join("?" * len(names))})',
+                rows
+            )
+            for record in records:
+                if record.get('flagged') is None:
+                    continue
+                connection.execute('DELETE FROM flagged WHERE path = ?', (record['path'],))
+                connection.executemany(
+                    f'INSERT INTO flagged ({", ".join(flaggedNames)}) '
+                    f'VALUES ({", ".join("?" * len(flaggedNames))})',
+                    [
+                        (record['path'], record['project'], record['replication'],
+                         line['file'], line['line'], line['type'], line['text'])
+                        for line in record['flagged']
+                    ]
+                )
+    finally:
+        if ownConnection:
+            connection.close()
+
+    return len(rows)
+
+
+def findReplications(paths: List[str]) -> Generator[str, Any, Any]:
+    """Finds the replication folders (with a report) under some paths
+    (projects, work areas or Replications folders). Replication
+    folders are not searched further
+
+    Parameters
+    ----------
+    paths : List[str]
+        paths to search
+
+    Yields
+    ------
+    str
+        replication folder
+    """
+    for path in paths:
+        for root, folders, fileNames in os.walk(path):
+            if REPORT_FILE in fileNames:
+                folders[:] = list()
+                yield root
+            else:
+                # hidden folders (e.g. staging areas) are skipped
+                folders[:] = [folder for folder in folders if not folder.startswith('.')]
+
+
+def importReplications(
+    paths: List[str],
+    workers: int = 8,
+    catalogPath: Union[str, None] = None
+) -> Dict[str, int]:
+    """Backfills the catalog from the replications under some paths.
+    Replications are read in parallel and written in batches
+
+    Parameters
+    ----------
+    paths : List[str]
+        paths to search
+    workers : int, optional
+        replications read at the same time, by default 8
+    catalogPath : str, optional
+        catalog path, by default the path in the settings
+
+    Returns
+    -------
+    Dict[str, int]
+        replications imported and failed
+    """
+    connection = connect(catalogPath)
+    imported = failed = 0
+    batch = list()
+
+    def read(replicationPath: str) -> Union[Dict[str, Any], None]:
+        try:
+            return readReplication(replicationPath)
+        except (OSError, ValueError):
+            return None
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for record in executor.map(read, findReplications(paths)):
+                if record is None:
+                    failed += 1
+                    continue
+                batch.append(record)
+                if len(batch) >= BATCH_SIZE:
+                    imported += upsertReplications(batch, connection)
+                    batch = list()
+        imported += upsertReplications(batch, connection)
+    finally:
+        connection.close()
+
+    return {'imported': imported, 'failed': failed}
+
+
+def queryReplications(
+    project: str = '',
+    failed: Union[bool, None] = None,
+    since: str = '',
+    until: str = '',
+    script: str = '',
+    limit: int = 100,
+    catalogPath: Union[str, None] = None
+) -> List[Dict[str, Any]]:
+    """Queries the catalog (most recent replications first)
+
+    Parameters
+    ----------
+    project : str, optional
+        project, by default every project
+    failed : bool, optional
+        only failed (True) or successful (False) replications, by
+        default both
+    since : str, optional
+        started on or after (YYYY-MM-DD[ HH:MM:SS]), by default ''
+    until : str, optional
+        started before (YYYY-MM-DD[ HH:MM:SS]), by default ''
+    script : str, optional
+        text in the main script path, by default ''
+    limit : int, optional
+        maximum number of replications, by default 100
+    catalogPath : str, optional
+        catalog path, by default the path in the settings
+
+    Returns
+    -------
+    List[Dict[str, Any]]
+        replications
+    """
+    conditions = list()
+    parameters = list()
+    if project:
+        conditions.append('project = ?')
+        parameters.append(project)
+    if failed is not None:
+        conditions.append('exitCode != 0' if failed else 'exitCode = 0')
+    if since:
+        conditions.append('started >= ?')
+        parameters.append(since)
+    if until:
+        conditions.append('started < ?')
+        parameters.append(until)
+    if script:
+        conditions.append('mainScript LIKE ?')
+        parameters.append(f'%{script}%')
+    where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+    connection = connect(catalogPath)
+    try:
+        rows = connection.execute(
+            f'SELECT * FROM replications {where} ORDER BY started DESC LIMIT ?',
+            (*parameters, limit)
+        ).fetchall()
+    finally:
+        connection.close()
+
+    return [dict(row) for row in rows]
+
+
+def searchFlaggedLines(
+    text: str,
+    project: str = '',
+    flagType: str = '',
+    raw: bool = False,
+    limit: int = 100,
+    catalogPath: Union[str, None] = None
+) -> List[Dict[str, Any]]:
+    """Searches the flagged lines of every replication (most recent
+    first)
+
+    Parameters
+    ----------
+    text : str
+        words to search (every word must be in the line). With `raw`,
+        an FTS5 query (e.g. `collapse NEAR(mean sd)`, `firm*`)
+    project : str, optional
+        project, by default every project
+    flagType : str, optional
+        use or alert, by default both
+    raw : bool, optional
+        `text` is an FTS5 query, by default False
+    limit : int, optional
+        maximum number of lines, by default 100
+    catalogPath : str, optional
+        catalog path, by default the path in the settings
+
+    Returns
+    -------
+    List[Dict[str, Any]]
+        flagged lines (project, replication, file, line, type, text)
+    """
+    connection = connect(catalogPath)
+    conditions = list()
+    parameters = list()
+    if hasFullTextSearch(connection):
+        # words are quoted, so that punctuation (e.g. data.dta) is
+        # searched as a phrase instead of read as FTS5 syntax
+        query = text if raw else ' '.join(
+            '"' + word.replace('"', '""') + '"' for word in text.split()
+        )
+        source = 'flaggedText JOIN flagged ON flagged.id = flaggedText.rowid'
+        conditions.append('flaggedText MATCH ?')
+        parameters.append(query)
+        order = 'flaggedText.rowid DESC'
+    else:
+        source = 'flagged'
+        for word in text.split():
+            conditions.append('flagged.text LIKE ?')
+            parameters.append(f'%{word}%')
+        order = 'flagged.id DESC'
+    if project:
+        conditions.append('flagged.project = ?')
+        parameters.append(project)
+    if flagType:
+        conditions.append('flagged.type = ?')
+        parameters.append(flagType)
+    where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+    try:
+        rows = connection.execute(
+            f'SELECT flagged.project, flagged.replication, flagged.path, flagged.file, '
+            f'flagged.line, flagged.type, flagged.text FROM {source} {where} '
+            f'ORDER BY {order} LIMIT ?',
+            (*parameters, limit)
+        ).fetchall()
+    finally:
+        connection.close()
+
+    return [dict(row) for row in rows]
+
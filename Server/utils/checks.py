@@ -2,11 +2,20 @@
 import PySimpleGUI as sg
 from typing import List, Tuple, Dict
 import os
+import shutil
 from pathlib import Path
 from .dialog import errorMessageBox
+from .container import isSifImage
+from .limits import LIMIT_FIELDS
+from .runtimes import SIF_RUNTIMES, getRuntime
+from .settings import loadSettings
+from .overlay import OVERLAY_BACKENDS, OVERLAY_PROGRAM, getOverlayBackend
+from .dependencies import getFilesUnderMain
 
 # Maximum size for tools folder in MegaBytes
 maxToolsSize = 10
+# Maximum number of missing dependencies listed in the errors
+maxErrorsShown = 10
 
 def checkFields(window: object, values: dict) -> Tuple[List[str], Dict[str, List[str]]]:
     """Check if fields are correctly filled
@@ -14,7 +23,8 @@ def checkFields(window: object, values: dict) -> Tuple[List[str], Dict[str, List
     Parameters
     ----------
     window: object
-        App window
+        App window (None to check the values of a replication 
+        submitted without the app, e.g. to the daemon)
     values : dict
         window values
 
@@ -38,14 +48,23 @@ def checkFields(window: object, values: dict) -> Tuple[List[str], Dict[str, List
     )
     if not flagMainScript:
         errors['Main script'] = errorsMainScript
-    ### Container image ### 
-    flagContainerIMage, errorsContainerImage = checkContainerFiles(
-        values['containerImage']
-    )
+    ### Runtime and container image ### 
+    runtime = values.get('runtime') or loadSettings()['runtime']
+    flagRuntime, errorsRuntime = checkRuntime(runtime, bool(values.get('slurmRun')))
+    if not flagRuntime:
+        errors['Runtime'] = errorsRuntime
+    if runtime in SIF_RUNTIMES:
+        flagContainerIMage, errorsContainerImage = checkContainerImage(
+            values['containerImage']
+        )
+    elif runtime != 'local' and not values['containerImage']:
+        flagContainerIMage, errorsContainerImage = False, ['No image specified']
+    else:
+        flagContainerIMage, errorsContainerImage = True, []
     if not flagContainerIMage:
         errors['Container - Image'] = errorsContainerImage
     ### Container definition file ###
-    definitionFile = values['containerDefinition']
+    definitionFile = values.get('containerDefinition', '')
     if definitionFile:
         flagContainerDefinition, errorsContainerDefinition = checkContainerFiles(
             definitionFile
@@ -55,7 +74,7 @@ def checkFields(window: object, values: dict) -> Tuple[List[str], Dict[str, List
     else:
         warnings.append('No definition file for container specified. This file is important for reproducibility purposes')
     ### Dependencies
-    dependencies = window['dependencies'].get_list_values()
+    dependencies = window['dependencies'].get_list_values() if window else values.get('dependencies', [])
     if dependencies:
         flagDependencies, errorsDependencies = checkDependencies(
             dependencies,
@@ -66,7 +85,7 @@ def checkFields(window: object, values: dict) -> Tuple[List[str], Dict[str, List
     else:
         warnings.append('Dependencies field is empty')
     ### Tools
-    tools = window['tools'].get_list_values()
+    tools = window['tools'].get_list_values() if window else values.get('tools', [])
     if tools:
         flagTools, errorsTools = checkTools(
             tools,
@@ -74,6 +93,15 @@ def checkFields(window: object, values: dict) -> Tuple[List[str], Dict[str, List
         ) 
         if not flagTools:
             errors['Tools'] = errorsTools
+    ### Overlay
+    if values.get('overlayRun'):
+        flagOverlay, errorsOverlay = checkOverlay(runtime, bool(values.get('slurmRun')))
+        if not flagOverlay:
+            errors['Overlay'] = errorsOverlay
+    ### Limits
+    flagLimits, errorsLimits = checkLimits(values)
+    if not flagLimits:
+        errors['Limits'] = errorsLimits
 
     return warnings, errors
 
@@ -152,6 +180,116 @@ def checkContainerFiles(inputText: str) -> Tuple[bool, List[str]]:
     return False, [f'"{inputText}" is not a valid file']
 
 
+def checkRuntime(runtime: str, slurmRun: bool = False) -> Tuple[bool, List[str]]:
+    """Check runtime field (the runtime must be installed, on this
+    host unless the replication is submitted to Slurm: the job runs
+    on a compute node, and fails there if it is missing)
+
+    Parameters
+    ----------
+    runtime : str
+        runtime name
+    slurmRun : bool, optional
+        replication submitted to Slurm, by default False
+
+    Returns
+    -------
+    Tuple[bool, List[str]]
+        True if checks passed. If false return also the 
+        errors (List of strings)
+    """
+    try:
+        available = slurmRun or getRuntime(runtime).isAvailable()
+    except ValueError as error:
+        return False, [str(error)]
+    if available:
+        return True, []
+    return False, [f'Runtime "{runtime}" is not installed']
+
+
+def checkOverlay(runtime: str, slurmRun: bool) -> Tuple[bool, List[str]]:
+    """Check the overlay option (fuse-overlayfs must be installed,
+    and mounted on the host only for runs on this host)
+
+    Parameters
+    ----------
+    runtime : str
+        runtime name
+    slurmRun : bool
+        replication submitted to Slurm
+
+    Returns
+    -------
+    Tuple[bool, List[str]]
+        True if checks passed. If false return also the 
+        errors (List of strings)
+    """
+    backend = getOverlayBackend(runtime)
+    errorMessages = list()
+    if backend not in OVERLAY_BACKENDS:
+        errorMessages.append(f'Unknown overlay backend "{backend}"')
+    elif backend == 'singularity' and runtime not in SIF_RUNTIMES:
+        errorMessages.append(f'The overlay is mounted by Singularity, but the runtime is "{runtime}"')
+    elif backend == 'fuse-overlayfs' and slurmRun:
+        errorMessages.append('The overlay is mounted on this host and cannot be used by Slurm jobs')
+    if not shutil.which(OVERLAY_PROGRAM):
+        errorMessages.append(f'{OVERLAY_PROGRAM} is not installed')
+
+    return not errorMessages, errorMessages
+
+
+def checkContainerImage(inputText: str) -> Tuple[bool, List[str]]:
+    """Check container image field. Besides the file, the SIF 
+    header of the image is validated
+
+    Parameters
+    ----------
+    inputText : str
+        field text
+
+    Returns
+    -------
+    Tuple[bool, List[str]]
+        True if checks passed. If false return also the 
+        errors (List of strings)
+    """
+    flagFile, errorMessages = checkContainerFiles(inputText)
+    if not flagFile:
+        return flagFile, errorMessages
+    if isSifImage(inputText):
+        return True, []
+    return False, [f'"{inputText}" is not a valid Singularity image (SIF header)']
+
+
+def checkLimits(values: dict) -> Tuple[bool, List[str]]:
+    """Check limits fields. Empty fields are allowed (project 
+    limits are used)
+
+    Parameters
+    ----------
+    values : dict
+        window values
+
+    Returns
+    -------
+    Tuple[bool, List[str]]
+        True if checks passed. If false return also the 
+        errors (List of strings)
+    """
+    errorMessages = list()
+    for key, (name, _) in LIMIT_FIELDS.items():
+        value = str(values.get(key) or '').strip()
+        if not value:
+            continue
+        try:
+            if float(value) < 0:
+                raise ValueError
+        except ValueError:
+            errorMessages.append(f'"{value}" is not a valid limit ({name})')
+
+    return not errorMessages, errorMessages
+
+
 def checkDependencies(dependencies: List[str], mainFolder: str) -> Tuple[bool, List[str]]:
     """Check main folder field
 
@@ -168,19 +306,21 @@ def checkDependencies(dependencies: List[str], mainFolder: str) -> Tuple[bool, L
         True if checks passed. If false return also the 
         errors (List of strings)
     """
-    if mainFolder:
-        flagErrors = []
-        errorMessages = []
-        for dependency in dependencies:
-            flag = isFileUnderMain(dependency, mainFolder)
-            if not flag:
-                flagErrors.append(flag)
-                errorMessages.append(f'"{dependency}" not in main folder')
-                break
-    else:
+    if not mainFolder:
         return False, ['Main folder not specified']
-
-    return all(flagErrors), errorMessages
+    if not dependencies:
+        return True, []
+    # a single walk of the main folder for every dependency
+    filesUnderMain = getFilesUnderMain(mainFolder)
+    missing = [
+        dependency for dependency in dependencies
+        if os.path.normcase(dependency) not in filesUnderMain
+    ]
+    errorMessages = [f'"{dependency}" not in main folder' for dependency in missing[:maxErrorsShown]]
+    if len(missing) > maxErrorsShown:
+        errorMessages.append(f'... and {len(missing) - maxErrorsShown} more dependencies not in main folder')
+
+    return not missing, errorMessages
 
 def checkTools(tools: List[str], mainFolder: str) -> Tuple[bool, List[str]]:
     """Check main folder field
@@ -199,9 +339,9 @@ def checkTools(tools: List[str], mainFolder: str) -> Tuple[bool, List[str]]:
     """
     flagErrors = []
     errorMessages = []
+    foldersUnderMain = getFilesUnderMain(mainFolder, folders=True) if tools else set()
     for folder in tools:
-        flag = isFileUnderMain(folder, mainFolder, folder=True)
-        if flag:
+        if os.path.normcase(folder) in foldersUnderMain:
             if getFolderSize(folder) > maxToolsSize:
                 flagErrors.append(False)
                 errorMessages.append(f'"{folder}" > {maxToolsSize}MB')
@@ -209,6 +349,37 @@ def checkTools(tools: List[str], mainFolder: str) -> Tuple[bool, List[str]]:
     return all(flagErrors), errorMessages
 
     
+def checkResumeFolder(folder: str) -> Tuple[bool, List[str]]:
+    """Check if a replication folder can be resumed. The attempts of
+    the replication must have been recorded (every replication started
+    by the app records them, whether run by stages or not)
+
+    Parameters
+    ----------
+    folder : str
+        replication folder
+
+    Returns
+    -------
+    Tuple[bool, List[str]]
+        True if checks passed. If false return also the 
+        errors (List of strings)
+    """
+    errorMessages = []
+    if not isPathValid(folder, file=False):
+        return False, [f'"{folder}" is not a valid folder']
+    if not isPathValid(os.path.join(folder, 'structure.json')):
+        errorMessages.append(f'"{folder}" is not a replication folder (structure.json not found)')
+    if not isPathValid(os.path.join(folder, '.stages.json')):
+        errorMessages.append(
+            f'"{folder}" has no record of its attempts (.stages.json not found): '
+            'it was not started, or was started by a version of the app that only '
+            'recorded runs by stages, and cannot be resumed'
+        )
+
+    return not errorMessages, errorMessages
+
+
 def isPathValid(path: str, file=True) -> bool:
     """Checks if a path is valid
 
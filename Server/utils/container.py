@@ -0,0 +1,279 @@
+# container.py
+from typing import Dict, List, Tuple, Union, Any
+import os
+import json
+import struct
+import hashlib
+import subprocess
+from datetime import datetime
+from .settings import loadSettings, getCachePath
+
+# SIF global header: launch script (32 bytes) followed by the magic
+SIF_MAGIC = b'SIF_MAGIC\x00'
+SIF_MAGIC_OFFSET = 32
+SIF_HEADER_SIZE = 128
+# Offsets of descriptors offset and length (int64, little endian)
+SIF_DESCRIPTORS_OFFSET = 96
+# Upper bound for the descriptors region read to compute the digest
+MAX_DESCRIPTORS_SIZE = 4 * 1024 ** 2
+# Cache file (under the cache directory)
+CONTAINER_CACHE_FILE = 'containers.json'
+# Stata version probe: the first Stata installed displays its version
+# in console mode (the command echoed starts with ". ", not "Stata")
+STATA_UNKNOWN = 'version unknown'
+STATA_PROBE = (
+    'for stata in stata-mp stata-se stata; do '
+    'if command -v $stata >/dev/null; then '
+    'echo \'display "Stata " c(stata_version) " (" c(edition_real) ")"\' | $stata -q 2>&1 '
+    f'| grep -m 1 "^Stata " || echo "$stata found, {STATA_UNKNOWN}"; '
+    'break; fi; done'
+)
+# Runtime version probes: key -> runtime; value -> shell command
+RUNTIME_PROBES = {
+    "Stata": STATA_PROBE,
+    "R": "Rscript --version 2>&1 | head -n 1",
+    "Python": "python3 --version 2>&1",
+    "Julia": "julia --version 2>&1"
+}
+
+
+def readSifHeader(image: str) -> Union[bytes, None]:
+    """Reads the SIF global header of an image
+
+    Parameters
+    ----------
+    image : str
+        path to image
+
+    Returns
+    -------
+    bytes | None
+        header, or None if the file is not a SIF image
+    """
+    try:
+        with open(image, 'rb') as fileIn:
+            header = fileIn.read(SIF_HEADER_SIZE)
+    except OSError:
+        return None
+    if len(header) < SIF_HEADER_SIZE:
+        return None
+    magic = header[SIF_MAGIC_OFFSET:SIF_MAGIC_OFFSET + len(SIF_MAGIC)]
+    if magic != SIF_MAGIC:
+        return None
+
+    return header
+
+
+def isSifImage(image: str) -> bool:
+    """Checks if a file has a valid SIF header
+
+    Parameters
+    ----------
+    image : str
+        path to image
+
+    Returns
+    -------
+    bool
+        True if valid SIF image
+    """
+    return readSifHeader(image) is not None
+
+
+def getImageDigest(image: str) -> str:
+    """Computes a cheap digest of the image, based on the
+    SIF header and the descriptors region (which holds the
+    image UUID and the layout of every object in the image).
+    The data objects are not read
+
+    Parameters
+    ----------
+    image : str
+        path to image
+
+    Returns
+    -------
+    str
+        SHA-256 hex digest
+    """
+    header = readSifHeader(image)
+    if header is None:
+        raise ValueError(f'"{image}" is not a SIF image')
+    descriptorsOffset, descriptorsLength = struct.unpack_from(
+        '<qq', header, SIF_DESCRIPTORS_OFFSET
+    )
+    digest = hashlib.sha256(header)
+    with open(image, 'rb') as fileIn:
+        fileIn.seek(descriptorsOffset)
+        digest.update(fileIn.read(min(descriptorsLength, MAX_DESCRIPTORS_SIZE)))
+
+    return digest.hexdigest()
+
+
+def getImageKey(image: str) -> str:
+    """Gets the cache key of an image (size, modification
+    time and digest)
+
+    Parameters
+    ----------
+    image : str
+        path to image
+
+    Returns
+    -------
+    str
+        cache key
+    """
+    stat = os.stat(image)
+
+    return f'{stat.st_size}:{stat.st_mtime_ns}:{getImageDigest(image)}'
+
+
+def _runCommand(args: List[str], timeout: int) -> Tuple[bool, str]:
+    """Runs a command and returns its standard output. Errors
+    are returned as text, since they are informative in
+    the report
+
+    Parameters
+    ----------
+    args : List[str]
+        command arguments
+    timeout : int
+        timeout in seconds
+
+    Returns
+    -------
+    Tuple[bool, str]
+        True if the command succeeded, and its output (or error)
+    """
+    try:
+        result = subprocess.run(
+            args,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            timeout=timeout
+        )
+    except (OSError, subprocess.TimeoutExpired) as error:
+        return False, f'Error: {error}'
+    if result.returncode != 0:
+        return False, f'Error: {result.stderr.strip()}'
+
+    return True, result.stdout.strip()
+
+
+def inspectImage(image: str) -> Dict[str, Any]:
+    """Inspects an image with `singularity inspect` (labels and
+    definition file) and probes the runtimes installed. The
+    inspection is complete if every command succeeded and every
+    runtime was probed (a runtime not installed is probed)
+
+    Parameters
+    ----------
+    image : str
+        path to image
+
+    Returns
+    -------
+    Dict[str, Any]
+        image metadata, and 'complete'
+    """
+    timeout = loadSettings()['inspectTimeout']
+    labelsDone, labelsOutput = _runCommand(
+        ['singularity', 'inspect', '--json', '--labels', image], timeout
+    )
+    try:
+        labels = json.loads(labelsOutput)['data']['attributes']['labels']
+    except (ValueError, KeyError, TypeError):
+        labels = {'Error': labelsOutput}
+        labelsDone = False
+    definitionDone, definition = _runCommand(
+        ['singularity', 'inspect', '--deffile', image], timeout
+    )
+    separator = '@@runtime@@'
+    probe = '; '.join(
+        f'echo "{separator}{runtime}"; {command}'
+        for runtime, command in RUNTIME_PROBES.items()
+    )
+    probeDone, probeOutput = _runCommand(
+        ['singularity', 'exec', image, 'sh', '-c', probe], timeout
+    )
+    runtimes = dict()
+    for block in probeOutput.split(separator)[1:]:
+        runtime, _, version = block.partition('\n')
+        runtimes[runtime] = version.strip() or 'Not found'
+    probeDone = (
+        probeDone and
+        set(runtimes) == set(RUNTIME_PROBES) and
+        not runtimes['Stata'].endswith(STATA_UNKNOWN)
+    )
+
+    return {
+        "labels": labels,
+        "definition": definition,
+        "runtimes": runtimes,
+        "complete": labelsDone and definitionDone and probeDone
+    }
+
+
+def _readCache(cacheFile: str) -> Dict[str, Any]:
+    """Reads the container metadata cache
+
+    Parameters
+    ----------
+    cacheFile : str
+        cache file
+
+    Returns
+    -------
+    Dict[str, Any]
+        cache content
+    """
+    try:
+        with open(cacheFile) as fileIn:
+            return json.load(fileIn)
+    except (OSError, ValueError):
+        return dict()
+
+
+def getContainerInfo(image: str) -> Dict[str, Any]:
+    """Gets the metadata of an image. The image is inspected the
+    first time it is seen, and the result is cached by the image
+    key if the inspection is complete. Later calls reuse the cached
+    metadata, so images whose inspection failed (e.g. Singularity
+    missing or timeout) are inspected again
+
+    Parameters
+    ----------
+    image : str
+        path to image
+
+    Returns
+    -------
+    Dict[str, Any]
+        image metadata
+    """
+    cacheFile = os.path.join(getCachePath(), CONTAINER_CACHE_FILE)
+    key = getImageKey(image)
+    cache = _readCache(cacheFile)
+    # entries written before the inspections were checked have no
+    # 'complete' and are inspected again
+    if cache.get(key, dict()).get('complete'):
+        info = cache[key]
+        info['cached'] = True
+    else:
+        info = inspectImage(image)
+        info['inspected'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        if info['complete']:
+            # Re-read the cache in case another run updated it meanwhile
+            cache = _readCache(cacheFile)
+            cache[key] = info
+            tempFile = f'{cacheFile}.{os.getpid()}'
+            with open(tempFile, 'w') as fileOut:
+                json.dump(cache, fileOut, indent=4)
+            os.replace(tempFile, cacheFile)
+        info = dict(info, cached=False)
+    info['image'] = image
+    info['key'] = key
+
+    return info
@@ -0,0 +1,315 @@
+# daemonClient.py
+from typing import Dict, Union, Any
+import os
+import sys
+import json
+import stat
+import time
+import signal
+import socket
+import subprocess
+from .settings import loadSettings
+
+# Daemon script (next to the app)
+DAEMON_SCRIPT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'replicationDaemon.py'
+)
+SOCKET_FILE = 'daemon.sock'
+DAEMON_LOG = 'daemon.log'
+# Seconds to wait for a response
+REQUEST_TIMEOUT = 30
+# Minimum interval (seconds) between status requests of a run
+STATUS_INTERVAL = 1.0
+# Status of runs that ended
+FINAL_STATUS = ('finished', 'failed', 'cancelled', 'interrupted', 'lost')
+
+
+class DaemonError(Exception):
+    """Raised when the daemon is not running or rejects a request"""
+
+
+def getServerPath() -> str:
+    """Gets the folder of the daemons of the server (`daemonPath`),
+    holding a private folder per user. Like /tmp, every user may
+    create files in it, but only remove their own (sticky)
+
+    Returns
+    -------
+    str
+        folder of the daemons
+    """
+    serverPath = loadSettings()['daemonPath']
+    if not os.path.isdir(serverPath):
+        os.makedirs(serverPath, exist_ok=True)
+        # the mode of makedirs is masked by the umask
+        os.chmod(serverPath, 0o1777)
+
+    return serverPath
+
+
+def getDaemonPath() -> str:
+    """Gets the folder of the daemon of the user (socket, runs and
+    log): the folder named after the uid in the folder of the daemons,
+    private to the user. The daemon runs the replications of its user
+    only, with the uid of that user
+
+    Returns
+    -------
+    str
+        daemon folder
+
+    Raises
+    ------
+    DaemonError
+        if the folder belongs to another user
+    """
+    daemonPath = os.path.join(getServerPath(), str(os.getuid()))
+    os.makedirs(daemonPath, mode=0o700, exist_ok=True)
+    status = os.lstat(daemonPath)
+    if status.st_uid != os.getuid() or not stat.S_ISDIR(status.st_mode):
+        raise DaemonError(f'The daemon folder {daemonPath} belongs to another user')
+    if stat.S_IMODE(status.st_mode) != 0o700:
+        os.chmod(daemonPath, 0o700)
+
+    return daemonPath
+
+
+def getSocketPath() -> str:
+    """Gets the path of the daemon socket (`daemonSocket` setting,
+    by default in the daemon folder)
+
+    Returns
+    -------
+    str
+        socket path
+    """
+    return loadSettings()['daemonSocket'] or os.path.join(getDaemonPath(), SOCKET_FILE)
+
+
+def sendMessage(connection: socket.socket, message: Dict[str, Any]) -> None:
+    """Sends a message (one line of JSON)
+
+    Parameters
+    ----------
+    connection : socket.socket
+        connection
+    message : Dict[str, Any]
+        message
+    """
+    connection.sendall(json.dumps(message).encode() + b'\n')
+
+
+def receiveMessage(connection: socket.socket) -> Dict[str, Any]:
+    """Receives a message (one line of JSON)
+
+    Parameters
+    ----------
+    connection : socket.socket
+        connection
+
+    Returns
+    -------
+    Dict[str, Any]
+        message
+
+    Raises
+    ------
+    DaemonError
+        if the connection is closed before the message ends
+    """
+    data = b''
+    while not data.endswith(b'\n'):
+        chunk = connection.recv(65536)
+        if not chunk:
+            raise DaemonError('Connection closed by the daemon')
+        data += chunk
+
+    return json.loads(data)
+
+
+def request(command: str, **parameters: Any) -> Dict[str, Any]:
+    """Sends a request to the daemon
+
+    Parameters
+    ----------
+    command : str
+        command (submit, status, list, cancel, logs, ping, shutdown)
+    parameters : Any
+        parameters of the command
+
+    Returns
+    -------
+    Dict[str, Any]
+        response
+
+    Raises
+    ------
+    DaemonError
+        if the daemon is not running or the request fails
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(REQUEST_TIMEOUT)
+            connection.connect(getSocketPath())
+            sendMessage(connection, {'command': command, **parameters})
+            response = receiveMessage(connection)
+    except OSError as error:
+        raise DaemonError(f'Daemon not available ({error})')
+    if not response.get('ok'):
+        raise DaemonError(response.get('error', 'Request failed'))
+
+    return response
+
+
+def isDaemonRunning() -> bool:
+    """Checks if the daemon is running
+
+    Returns
+    -------
+    bool
+        True if the daemon answers
+    """
+    try:
+        request('ping')
+    except DaemonError:
+        return False
+
+    return True
+
+
+def startDaemon(timeout: float = 10) -> None:
+    """Starts the daemon of the user in a new session (it survives
+    the app and the terminal), unless it is already running
+
+    Parameters
+    ----------
+    timeout : float, optional
+        seconds to wait for the daemon, by default 10
+
+    Raises
+    ------
+    DaemonError
+        if the daemon does not start
+    """
+    if isDaemonRunning():
+        return
+    try:
+        with open(os.path.join(getDaemonPath(), DAEMON_LOG), 'a') as log:
+            subprocess.Popen(
+                [sys.executable, DAEMON_SCRIPT],
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                start_new_session=True
+            )
+    except OSError as error:
+        raise DaemonError(f'The daemon did not start ({error})')
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if isDaemonRunning():
+            return
+        time.sleep(0.2)
+    raise DaemonError('The daemon did not start (see daemon.log in the daemon folder)')
+
+
+class RemoteRun(object):
+    """Replication run by the daemon. Mimics the interface of
+    `subprocess.Popen` (`poll`, `returncode`, `args`, `send_signal`),
+    so that the app supervises it as a local process. The report is
+    written by the daemon
+    """
+
+    def __init__(self, runId: int, mainScript: str = '') -> None:
+
+        self.runId = runId
+        self.args = [mainScript]
+        self.returncode = None
+        self.errors = list()
+        self.status = 'queued'
+        self.progress = ''
+        self.replicationPath = ''
+        self._lastStatus = 0.0
+
+    @classmethod
+    def submit(cls, items: Dict[str, Any]) -> 'RemoteRun':
+        """Submits a replication to the daemon of the user, starting
+        it if it is not running
+
+        Parameters
+        ----------
+        items : Dict[str, Any]
+            replication fields (as in structure.json)
+
+        Returns
+        -------
+        RemoteRun
+            the run
+        """
+        startDaemon()
+        response = request('submit', items=items)
+
+        return cls(response['run']['id'], items.get('mainScriptInput', ''))
+
+    def update(self, run: Dict[str, Any]) -> None:
+        """Updates the run from a status response
+
+        Parameters
+        ----------
+        run : Dict[str, Any]
+            run status
+        """
+        self.status = run['status']
+        self.progress = run.get('progress', '')
+        self.replicationPath = run.get('replicationPath', '')
+        if self.status in FINAL_STATUS:
+            self.returncode = run['returnCode'] if run['returnCode'] is not None else 1
+            self.errors = run.get('errors', [])
+
+    def poll(self) -> Union[int, None]:
+        """Checks if the run ended (at most once every STATUS_INTERVAL
+        seconds)
+
+        Returns
+        -------
+        int | None
+            return code, or None if the run is queued or running
+        """
+        if self.returncode is not None or time.time() - self._lastStatus < STATUS_INTERVAL:
+            return self.returncode
+        self._lastStatus = time.time()
+        try:
+            self.update(request('status', id=self.runId)['run'])
+        except DaemonError as error:
+            self.status = 'lost'
+            self.returncode = 1
+            self.errors = [str(error)]
+
+        return self.returncode
+
+    def send_signal(self, sig: int) -> None:
+        """Cancels the run (SIGTERM/SIGKILL)
+
+        Parameters
+        ----------
+        sig : int
+            signal
+        """
+        if sig in (signal.SIGTERM, signal.SIGKILL):
+            request('cancel', id=self.runId)
+            self._lastStatus = 0.0
+
+    def getLogs(self, lines: int = 50) -> str:
+        """Gets the last lines of the output of the run
+
+        Parameters
+        ----------
+        lines : int, optional
+            number of lines, by default 50
+
+        Returns
+        -------
+        str
+            output
+        """
+        return request('logs', id=self.runId, lines=lines)['logs']
@@ -0,0 +1,479 @@
+# dag.py
+from typing import Any, Callable, Dict, List, Tuple, Union
+import os
+import re
+import json
+import time
+import hashlib
+import signal
+import subprocess
+from .scripts import (
+    HOUSEKEEPING_REGEX,
+    PRELUDE_EXCLUDE_REGEX,
+    getLanguage,
+    getScriptCalls,
+    getScriptInputsOutputs,
+    readScriptLines,
+    updateVariables,
+    checkStataLog
+)
+
+# Prefix of the files (wrappers and logs) created for each stage
+STAGE_PREFIX = '_stage'
+# Configuration files created by the app. Calls to these files are
+# part of the prelude, not stages
+CONFIG_FILES = ('profile.do', 'config.R', 'config.py', 'config.jl')
+# File (in the replication folder) with the state of the stages
+STAGES_STATE_FILE = '.stages.json'
+
+
+class Stage(object):
+    """Sub-script called by the master script. Each stage runs in
+    its own process, through a wrapper script made of the master
+    script's prelude and the call to the sub-script
+    """
+
+    def __init__(self, index: int, script: str, callLine: str) -> None:
+
+        self.index = index
+        self.script = script
+        self.callLine = callLine
+        self.name = os.path.splitext(os.path.basename(script))[0]
+        self.inputs = set()
+        self.outputs = set()
+        self.opaque = False
+        self.dependencies = set()
+        self.wrapper = ''
+        self.log = ''
+        self.process = None
+        self.status = 'pending'
+        self.startTime = None
+        self.endTime = None
+        self.returnCode = None
+        self.errors = list()
+        self.attempt = None
+        self.fingerprint = ''
+
+    @property
+    def key(self) -> str:
+        """Key of the stage in the state file"""
+        return f'{self.index}:{self.callLine}'
+
+    def getFingerprint(self) -> str:
+        """Fingerprint of the stage: content of the sub-script and
+        size and modification time of the inputs that exist
+
+        Returns
+        -------
+        str
+            SHA-256 hex digest
+        """
+        digest = hashlib.sha256()
+        with open(self.script, 'rb') as f:
+            digest.update(f.read())
+        for path in sorted(self.inputs):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            digest.update(f'{path}:{stat.st_size}:{stat.st_mtime_ns}'.encode())
+
+        return digest.hexdigest()
+
+    @property
+    def duration(self) -> float:
+        """Duration of the stage in seconds"""
+        if self.startTime is None:
+            return 0.0
+        return (self.endTime or time.time()) - self.startTime
+
+
+def buildStages(
+    mainScript: str,
+    variables: Dict[str, str],
+    sequential: bool = False
+) -> Tuple[List[str], List[Stage]]:
+    """Builds the DAG of the sub-scripts called by the master script.
+    Stage B depends on stage A (called before B) if B reads or writes
+    what A writes, if B writes what A reads, or if any of the two is
+    opaque (reads or writes that cannot be resolved)
+
+    Parameters
+    ----------
+    mainScript : str
+        master script
+    variables : Dict[str, str]
+        known path variables (see `scripts.getPathVariables`)
+    sequential : bool, optional
+        every stage depends on the previous one, by default False
+
+    Returns
+    -------
+    Tuple[List[str], List[Stage]]
+        prelude lines and stages
+
+    Raises
+    ------
+    ValueError
+        if the master script cannot be split into stages
+    """
+    language = getLanguage(mainScript)
+    workPath, _ = os.path.split(mainScript)
+    calls = {
+        number: path for number, _, path in getScriptCalls(mainScript, variables, workPath)
+        if not path or os.path.basename(path) not in CONFIG_FILES
+    }
+    if not calls:
+        raise ValueError('The main script does not call other scripts')
+    with open(mainScript, 'r', encoding='latin-1') as f:
+        lines = f.readlines()
+    firstCall = min(calls)
+    prelude = [
+        line.rstrip('\n') for line in lines[:firstCall - 1]
+        if not re.search(PRELUDE_EXCLUDE_REGEX[language], line.strip())
+    ]
+    variables = dict(variables)
+    stages = list()
+    for number, statement in readScriptLines(mainScript):
+        if number < firstCall:
+            # Globals defined in the prelude are known to every stage
+            updateVariables(statement, language, variables, workPath)
+            continue
+        if number in calls:
+            path = calls[number]
+            if path is None or not os.path.isfile(path):
+                raise ValueError(f'Line {number}: script "{statement}" cannot be resolved')
+            stages.append(Stage(len(stages) + 1, path, lines[number - 1].strip()))
+        elif not re.search(HOUSEKEEPING_REGEX[language], statement):
+            raise ValueError(f'Line {number}: "{statement}" runs between sub-scripts')
+    for stage in stages:
+        stage.inputs, stage.outputs, stage.opaque = getScriptInputsOutputs(
+            stage.script, variables, workPath
+        )
+    for position, stage in enumerate(stages):
+        for previous in stages[:position]:
+            if (
+                sequential or
+                stage.opaque or
+                previous.opaque or
+                previous.outputs & (stage.inputs | stage.outputs) or
+                previous.inputs & stage.outputs
+            ):
+                stage.dependencies.add(previous.index)
+
+    return prelude, stages
+
+
+def readStagesState(stateFile: str) -> Dict[str, Any]:
+    """Reads the state of the stages of a replication
+
+    Parameters
+    ----------
+    stateFile : str
+        state file
+
+    Returns
+    -------
+    Dict[str, Any]
+        attempts and state of each stage (empty if the file
+        does not exist)
+    """
+    try:
+        with open(stateFile) as fIn:
+            return json.load(fIn)
+    except (OSError, ValueError):
+        return dict()
+
+
+def recordAttempt(stateFile: str, attempt: int, returnCode: Union[int, None] = None) -> None:
+    """Records an attempt of a replication run in a single process (or
+    job) in the state file, as the StageRunner does, so that any
+    replication can be resumed
+
+    Parameters
+    ----------
+    stateFile : str
+        state file
+    attempt : int
+        attempt number
+    returnCode : int | None, optional
+        return code once the attempt finished, by default None (started)
+    """
+    state = readStagesState(stateFile)
+    state.setdefault('attempts', list())
+    state.setdefault('stages', dict())
+    for item in state['attempts']:
+        if item['attempt'] == attempt:
+            break
+    else:
+        item = {'attempt': attempt, 'started': time.time(), 'finished': None, 'returnCode': None}
+        state['attempts'].append(item)
+    if returnCode is not None:
+        item['finished'] = time.time()
+        item['returnCode'] = returnCode
+    tempFile = f'{stateFile}.tmp'
+    with open(tempFile, 'w') as fOut:
+        json.dump(state, fOut, indent=4)
+    os.replace(tempFile, stateFile)
+
+
+class StageRunner(object):
+    """Runs the stages of the master script, concurrently when they
+    are independent. Mimics the interface of `subprocess.Popen`
+    (`poll`, `communicate`, `returncode`, `args`), so that the app
+    supervises it as a single process
+    """
+
+    def __init__(
+        self,
+        mainScript: str,
+        prelude: List[str],
+        stages: List[Stage],
+        createArgs: Callable[[str], List[str]],
+        maxWorkers: int = 1,
+        stateFile: str = '',
+        attempt: int = 1,
+        env: Union[Dict[str, str], None] = None,
+        preexecFn: Callable[[], None] = os.setsid
+    ) -> None:
+
+        self._mainScript = mainScript
+        self._workPath, _ = os.path.split(mainScript)
+        self._language = getLanguage(mainScript)
+        self._prelude = prelude
+        self.stages = stages
+        self._createArgs = createArgs
+        self._maxWorkers = max(1, maxWorkers)
+        self._env = env
+        self._preexecFn = preexecFn
+        self.args = [mainScript]
+        self.returncode = None
+        self.errors = list()
+        self._stateFile = stateFile
+        self.attempt = attempt
+        self._state = readStagesState(stateFile) if stateFile else dict()
+        self._state.setdefault('attempts', list())
+        self._state.setdefault('stages', dict())
+        self._state['attempts'].append(
+            {'attempt': attempt, 'started': time.time(), 'finished': None, 'returnCode': None}
+        )
+
+    @property
+    def pids(self) -> List[int]:
+        """Process ids of the stages running"""
+        return [stage.process.pid for stage in self.stages if stage.status == 'running']
+
+    def _writeWrapper(self, stage: Stage) -> None:
+        """Writes the wrapper script of a stage (prelude of the master
+        script followed by the call to the sub-script)
+
+        Parameters
+        ----------
+        stage : Stage
+            stage
+        """
+        _, extension = os.path.splitext(self._mainScript)
+        baseName = f'{STAGE_PREFIX}{stage.index:02}_{stage.name}'
+        # Logs of previous attempts are kept
+        if self.attempt > 1:
+            baseName += f'_attempt{self.attempt}'
+        stage.wrapper = os.path.join(self._workPath, baseName + extension)
+        stage.log = os.path.join(self._workPath, baseName + '.log')
+        with open(stage.wrapper, 'w', encoding='latin-1') as fOut:
+            fOut.write('\n'.join([*self._prelude, stage.callLine]) + '\n')
+
+    def _startStage(self, stage: Stage) -> None:
+        """Starts the process of a stage
+
+        Parameters
+        ----------
+        stage : Stage
+            stage
+        """
+        self._writeWrapper(stage)
+        args = self._createArgs(os.path.basename(stage.wrapper))
+        # Stata writes its own log in batch mode
+        if self._language == "stata":
+            output = open(os.devnull, 'w')
+        else:
+            output = open(stage.log, 'w')
+        with output:
+            stage.process = subprocess.Popen(
+                args,
+                stdout=output,
+                stderr=subprocess.STDOUT,
+                cwd=self._workPath,
+                env=self._env,
+                preexec_fn=self._preexecFn
+            )
+        stage.status = 'running'
+        stage.startTime = time.time()
+        stage.attempt = self.attempt
+        self._saveState(stage)
+
+    def _finishStage(self, stage: Stage) -> None:
+        """Sets the return code of a stage that finished
+
+        Parameters
+        ----------
+        stage : Stage
+            stage
+        """
+        stage.endTime = time.time()
+        if self._language == "stata":
+            stage.returnCode, stage.errors = checkStataLog(stage.log)
+            if stage.process.returncode:
+                stage.returnCode = stage.process.returncode
+        else:
+            stage.returnCode = stage.process.returncode
+            with open(stage.log, 'r', encoding='latin-1') as f:
+                stage.errors = f.readlines()[-20:]
+        stage.status = 'done' if stage.returnCode == 0 else 'failed'
+        self._saveState(stage)
+
+    def _skipStage(self, stage: Stage) -> bool:
+        """Skips a stage that succeeded in a previous attempt, if the
+        sub-script and its inputs are unchanged
+
+        Parameters
+        ----------
+        stage : Stage
+            stage ready to run
+
+        Returns
+        -------
+        bool
+            True if the stage is skipped
+        """
+        stage.fingerprint = stage.getFingerprint()
+        previous = self._state['stages'].get(stage.key)
+        if (
+            previous and
+            previous['status'] in ('done', 'skipped') and
+            previous['fingerprint'] == stage.fingerprint
+        ):
+            stage.status = 'skipped'
+            stage.returnCode = 0
+            stage.attempt = previous['attempt']
+            stage.startTime = previous['start']
+            stage.endTime = previous['end']
+            stage.log = previous['log']
+            return True
+
+        return False
+
+    def _saveState(self, stage: Stage = None) -> None:
+        """Saves the state of the stages, so that a failed replication
+        can be resumed
+
+        Parameters
+        ----------
+        stage : Stage, optional
+            stage whose state changed, by default None
+        """
+        if not self._stateFile:
+            return
+        if stage:
+            self._state['stages'][stage.key] = {
+                'script': stage.script,
+                'status': stage.status,
+                'returnCode': stage.returnCode,
+                'fingerprint': stage.fingerprint,
+                'attempt': stage.attempt,
+                'start': stage.startTime,
+                'end': stage.endTime,
+                'log': stage.log
+            }
+        tempFile = f'{self._stateFile}.tmp'
+        with open(tempFile, 'w') as fOut:
+            json.dump(self._state, fOut, indent=4)
+        os.replace(tempFile, self._stateFile)
+
+    def start(self) -> 'StageRunner':
+        """Starts the stages without dependencies
+
+        Returns
+        -------
+        StageRunner
+            the runner itself
+        """
+        self.poll()
+
+        return self
+
+    def poll(self) -> Union[int, None]:
+        """Checks the stages running and starts the stages whose
+        dependencies finished. No stage is started after a failure
+
+        Returns
+        -------
+        int | None
+            return code, or None if stages are still running
+        """
+        if self.returncode is not None:
+            return self.returncode
+        for stage in self.stages:
+            if stage.status == 'running' and stage.process.poll() is not None:
+                self._finishStage(stage)
+        failed = [stage for stage in self.stages if stage.status == 'failed']
+        cancelled = [stage for stage in self.stages if stage.status == 'cancelled']
+        running = [stage for stage in self.stages if stage.status == 'running']
+        if not failed and not cancelled:
+            finished = {stage.index for stage in self.stages if stage.status in ('done', 'skipped')}
+            for stage in self.stages:
+                if len(running) >= self._maxWorkers:
+                    break
+                if stage.status == 'pending' and stage.dependencies <= finished:
+                    if self._skipStage(stage):
+                        self._saveState(stage)
+                        continue
+                    self._startStage(stage)
+                    running.append(stage)
+        pending = [stage for stage in self.stages if stage.status == 'pending']
+        if running or (pending and not failed and not cancelled):
+            return None
+        if failed or cancelled:
+            self.returncode = 1
+            for stage in failed:
+                self.errors.append(f'Stage {stage.index} ({os.path.basename(stage.script)}) failed:')
+                self.errors.extend(line.rstrip('\n') for line in stage.errors)
+        else:
+            self.returncode = 0
+        self._state['attempts'][-1]['finished'] = time.time()
+        self._state['attempts'][-1]['returnCode'] = self.returncode
+        self._saveState()
+
+        return self.returncode
+
+    def communicate(self) -> Tuple[bytes, bytes]:
+        """Waits for the stages to finish. Outputs are in the logs
+        of each stage
+
+        Returns
+        -------
+        Tuple[bytes, bytes]
+            empty standard output and error
+        """
+        while self.poll() is None:
+            time.sleep(0.1)
+
+        return b'', b''
+
+    def send_signal(self, sig: int) -> None:
+        """Sends a signal to the process groups of the stages running.
+        Stages pending are not started after a termination signal
+
+        Parameters
+        ----------
+        sig : int
+            signal
+        """
+        if sig in (signal.SIGTERM, signal.SIGKILL):
+            for stage in self.stages:
+                if stage.status == 'pending':
+                    stage.status = 'cancelled'
+        for pid in self.pids:
+            try:
+                os.killpg(os.getpgid(pid), sig)
+            except ProcessLookupError:
+                pass
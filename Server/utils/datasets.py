@@ -0,0 +1,326 @@
+# datasets.py
+from typing import Any, Dict, List, Tuple, Union
+import os
+import json
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from .settings import getCachePath
+
+# Cache of the headers read: key -> device, inode, mtime and size
+DATASETS_CACHE_FILE = 'datasets.json'
+# Headers read at the same time
+INVENTORY_WORKERS = 8
+# Bytes read at the start of a file (header of the 117+ formats)
+HEADER_CHUNK = 4096
+# Formats supported: release -> (bytes of K, bytes of N, bytes of the
+# label length, bytes of each variable name, name encoding)
+DTA_FORMATS = {
+    113: (2, 4, 0, 33, 'latin-1'),
+    114: (2, 4, 0, 33, 'latin-1'),
+    115: (2, 4, 0, 33, 'latin-1'),
+    117: (2, 4, 1, 33, 'latin-1'),
+    118: (2, 8, 2, 129, 'utf-8'),
+    119: (4, 8, 2, 129, 'utf-8'),
+    120: (2, 8, 2, 129, 'utf-8'),
+    121: (4, 8, 2, 129, 'utf-8')
+}
+# Bytes per observation of the numeric types: formats 113-115 (1 byte
+# codes, strings are 1-244) and 117+ (2 byte codes, strings are 1-2045)
+OLD_TYPE_WIDTHS = {251: 1, 252: 2, 253: 4, 254: 4, 255: 8}
+NEW_TYPE_WIDTHS = {65530: 1, 65529: 2, 65528: 4, 65527: 4, 65526: 8, 32768: 8}
+
+
+def _readTag(data: bytes, offset: int, tag: str) -> int:
+    """Checks an opening tag of the 117+ formats
+
+    Parameters
+    ----------
+    data : bytes
+        header bytes
+    offset : int
+        position of the tag
+    tag : str
+        tag name
+
+    Returns
+    -------
+    int
+        position after the tag
+
+    Raises
+    ------
+    ValueError
+        if the tag is not found
+    """
+    marker = f'<{tag}>'.encode()
+    if data[offset:offset + len(marker)] != marker:
+        raise ValueError(f'<{tag}> not found')
+
+    return offset + len(marker)
+
+
+def _skipTag(data: bytes, offset: int, tag: str) -> int:
+    """Checks a closing tag of the 117+ formats (see _readTag)"""
+    return _readTag(data, offset, f'/{tag}')
+
+
+def _getWidth(types: List[int], release: int) -> int:
+    """Gets the bytes per observation of a dataset (strL variables
+    count as their 8 byte reference)
+
+    Parameters
+    ----------
+    types : List[int]
+        type codes of the variables
+    release : int
+        format version
+
+    Returns
+    -------
+    int
+        bytes per observation
+    """
+    widths = OLD_TYPE_WIDTHS if release < 117 else NEW_TYPE_WIDTHS
+
+    return sum(widths.get(code, code) for code in types)
+
+
+def readDtaHeader(path: str) -> Dict[str, Any]:
+    """Reads the header of a Stata dataset (formats 113 to 121), the
+    variable types and names, without reading the data. Only a few
+    KB are read (and the names: 33 or 129 bytes per variable)
+
+    Parameters
+    ----------
+    path : str
+        dataset
+
+    Returns
+    -------
+    Dict[str, Any]
+        format 'version', number of observations ('nobs') and
+        variables ('nvars'), 'label', 'varnames' and 'width' (bytes
+        per observation in memory)
+
+    Raises
+    ------
+    ValueError
+        if the file is not a supported Stata dataset
+    """
+    with open(path, 'rb') as fileIn:
+        data = fileIn.read(HEADER_CHUNK)
+        if data[:1] and data[0] in (113, 114, 115):
+            return _readOldHeader(fileIn, data)
+        if data.startswith(b'<stata_dta>'):
+            return _readNewHeader(fileIn, data)
+
+    raise ValueError('Not a Stata dataset (formats 113-121)')
+
+
+def _readOldHeader(fileIn: object, data: bytes) -> Dict[str, Any]:
+    """Reads the header of the 113-115 formats (binary header of 109
+    bytes, then the type list and the variable names)"""
+    release = data[0]
+    order = '>' if data[1] == 1 else '<'
+    nvars, nobs = struct.unpack(f'{order}hi', data[4:10])
+    if data[2] != 1 or nvars < 0 or nobs < 0:
+        raise ValueError('Not a Stata dataset (formats 113-121)')
+    label = data[10:91].split(b'\0', 1)[0].decode('latin-1')
+    fileIn.seek(109)
+    types = list(fileIn.read(nvars))
+    names = fileIn.read(33 * nvars)
+    if len(types) != nvars or len(names) != 33 * nvars:
+        raise ValueError('Truncated header')
+
+    return {
+        'version': release,
+        'nobs': nobs,
+        'nvars': nvars,
+        'label': label,
+        'varnames': [
+            names[start:start + 33].split(b'\0', 1)[0].decode('latin-1')
+            for start in range(0, 33 * nvars, 33)
+        ],
+        'width': _getWidth(types, release)
+    }
+
+
+def _readNewHeader(fileIn: object, data: bytes) -> Dict[str, Any]:
+    """Reads the header of the 117+ formats (tagged header and map,
+    then the variable types and names at the offsets of the map)"""
+    offset = _readTag(data, len(b'<stata_dta>'), 'header')
+    offset = _readTag(data, offset, 'release')
+    release = int(data[offset:offset + 3])
+    if release not in DTA_FORMATS:
+        raise ValueError(f'Unsupported format {release}')
+    kBytes, nBytes, labelBytes, nameBytes, encoding = DTA_FORMATS[release]
+    offset = _skipTag(data, offset + 3, 'release')
+    offset = _readTag(data, offset, 'byteorder')
+    order = '>' if data[offset:offset + 3] == b'MSF' else '<'
+    offset = _skipTag(data, offset + 3, 'byteorder')
+    offset = _readTag(data, offset, 'K')
+    nvars = int.from_bytes(data[offset:offset + kBytes], 'big' if order == '>' else 'little')
+    offset = _skipTag(data, offset + kBytes, 'K')
+    offset = _readTag(data, offset, 'N')
+    nobs = int.from_bytes(data[offset:offset + nBytes], 'big' if order == '>' else 'little')
+    offset = _skipTag(data, offset + nBytes, 'N')
+    offset = _readTag(data, offset, 'label')
+    length = int.from_bytes(data[offset:offset + labelBytes], 'big' if order == '>' else 'little')
+    label = data[offset + labelBytes:offset + labelBytes + length].decode(encoding, errors='replace')
+    offset = _skipTag(data, offset + labelBytes + length, 'label')
+    offset = _readTag(data, offset, 'timestamp')
+    offset = _skipTag(data, offset + 1 + data[offset], 'timestamp')
+    offset = _skipTag(data, offset, 'header')
+    offset = _readTag(data, offset, 'map')
+    offsets = struct.unpack(f'{order}14Q', data[offset:offset + 112])
+    fileIn.seek(offsets[2] + len(b'<variable_types>'))
+    rawTypes = fileIn.read(2 * nvars)
+    fileIn.seek(offsets[3] + len(b'<varnames>'))
+    names = fileIn.read(nameBytes * nvars)
+    if len(rawTypes) != 2 * nvars or len(names) != nameBytes * nvars:
+        raise ValueError('Truncated header')
+
+    return {
+        'version': release,
+        'nobs': nobs,
+        'nvars': nvars,
+        'label': label,
+        'varnames': [
+            names[start:start + nameBytes].split(b'\0', 1)[0].decode(encoding, errors='replace')
+            for start in range(0, nameBytes * nvars, nameBytes)
+        ],
+        'width': _getWidth(list(struct.unpack(f'{order}{nvars}H', rawTypes)), release)
+    }
+
+
+def _readCache(cacheFile: str) -> Dict[str, Any]:
+    """Reads the cache of the dataset headers
+
+    Parameters
+    ----------
+    cacheFile : str
+        cache file
+
+    Returns
+    -------
+    Dict[str, Any]
+        cache content
+    """
+    try:
+        with open(cacheFile) as fileIn:
+            return json.load(fileIn)
+    except (OSError, ValueError):
+        return dict()
+
+
+def _getKey(stat: os.stat_result) -> str:
+    """Gets the cache key of a file (device, inode, mtime and size)"""
+    return f'{stat.st_dev}:{stat.st_ino}:{stat.st_mtime_ns}:{stat.st_size}'
+
+
+def findDatasets(rootPath: str) -> List[Tuple[str, os.stat_result]]:
+    """Finds the Stata datasets under a folder
+
+    Parameters
+    ----------
+    rootPath : str
+        folder
+
+    Returns
+    -------
+    List[Tuple[str, os.stat_result]]
+        path and stat of each dataset, sorted by path
+    """
+    datasets = list()
+    for root, dirs, files in os.walk(rootPath):
+        dirs.sort()
+        for file in sorted(files):
+            if file.lower().endswith('.dta'):
+                path = os.path.join(root, file)
+                try:
+                    datasets.append((path, os.stat(path)))
+                except OSError:
+                    continue
+
+    return datasets
+
+
+def inventoryDatasets(
+    rootPath: str,
+    workers: int = INVENTORY_WORKERS,
+    useCache: bool = True
+) -> List[Dict[str, Any]]:
+    """Inventories the Stata datasets under a folder from their
+    headers, read in parallel. Headers are cached by device, inode,
+    modification time and size, so unchanged datasets are not read
+    again
+
+    Parameters
+    ----------
+    rootPath : str
+        folder
+    workers : int, optional
+        headers read at the same time, by default INVENTORY_WORKERS
+    useCache : bool, optional
+        use the cache of the headers, by default True
+
+    Returns
+    -------
+    List[Dict[str, Any]]
+        for each dataset: 'path', 'size' (bytes), the header (see
+        readDtaHeader) and 'memory' (estimated bytes in memory), or
+        'error' if the header cannot be read
+    """
+    cacheFile = os.path.join(getCachePath(), DATASETS_CACHE_FILE) if useCache else ''
+    cache = _readCache(cacheFile) if useCache else dict()
+    datasets = findDatasets(rootPath)
+
+    def read(dataset: Tuple[str, os.stat_result]) -> Dict[str, Any]:
+        path, stat = dataset
+        key = _getKey(stat)
+        if key in cache:
+            return dict(cache[key], path=path, size=stat.st_size, cached=True)
+        try:
+            header = readDtaHeader(path)
+            header['memory'] = header['nobs'] * header['width']
+        except (OSError, ValueError, struct.error) as error:
+            header = {'error': str(error)}
+
+        return dict(header, path=path, size=stat.st_size, key=key, cached=False)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        inventory = list(executor.map(read, datasets))
+    parsed = [item for item in inventory if not item.pop('cached') and 'error' not in item]
+    if useCache and parsed:
+        # Re-read the cache in case another run updated it meanwhile
+        cache = _readCache(cacheFile)
+        for item in parsed:
+            cache[item['key']] = {
+                name: value for name, value in item.items() if name not in ('path', 'size', 'key')
+            }
+        tempFile = f'{cacheFile}.{os.getpid()}'
+        with open(tempFile, 'w') as fileOut:
+            json.dump(cache, fileOut)
+        os.replace(tempFile, cacheFile)
+    for item in inventory:
+        item.pop('key', None)
+
+    return inventory
+
+
+def getLargestDataset(inventory: List[Dict[str, Any]]) -> Union[Dict[str, Any], None]:
+    """Gets the dataset that takes the most memory once loaded
+
+    Parameters
+    ----------
+    inventory : List[Dict[str, Any]]
+        inventory (see inventoryDatasets)
+
+    Returns
+    -------
+    Dict[str, Any] | None
+        dataset, or None if no header was read
+    """
+    datasets = [item for item in inventory if 'memory' in item]
+
+    return max(datasets, key=lambda item: item['memory']) if datasets else None
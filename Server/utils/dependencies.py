@@ -0,0 +1,218 @@
+# dependencies.py
+from typing import Iterable, List, Set, Tuple, Union
+import os
+import re
+import glob
+from .ignore import IgnoreRules
+from .scripts import LANGUAGES, getLanguage, getPathVariables, getScriptCalls, readScriptLines
+
+# Python imports: group 1 -> module of "from ... import"; group 2 -> names
+# imported; group 3 -> modules of "import ..."
+PYTHON_IMPORT_REGEX = r'^from\s+(\.*[\w.]*)\s+import\s+(.+)$|^import\s+(.+)$'
+
+
+def getFilesUnderMain(mainFolder: str, folders: bool = False) -> Set[str]:
+    """Gets the files (or folders) under the main folder in a single
+    walk, normalized for lookups (`os.path.normcase`)
+
+    Parameters
+    ----------
+    mainFolder : str
+        main folder
+    folders : bool, optional
+        True to get the folders instead of the files, by default False
+
+    Returns
+    -------
+    Set[str]
+        normalized paths
+    """
+    paths = set()
+    for root, dirs, files in os.walk(mainFolder):
+        paths.update(
+            os.path.normcase(os.path.join(root, name))
+            for name in (dirs if folders else files)
+        )
+
+    return paths
+
+
+def expandPatterns(
+    patterns: Iterable[str],
+    mainFolder: str,
+    extensions: Tuple[str, ...] = tuple(LANGUAGES)
+) -> Tuple[List[str], List[str]]:
+    """Expands glob patterns and folders into the scripts under the
+    main folder. Relative patterns are relative to the main folder and
+    `**` matches any number of folders. Folders add every script under
+    them, except the folders and files matched by the ignore rules.
+    Duplicates are removed
+
+    Parameters
+    ----------
+    patterns : Iterable[str]
+        glob patterns or folders
+    mainFolder : str
+        main folder
+    extensions : Tuple[str, ...], optional
+        extensions of the scripts, by default the script languages
+
+    Returns
+    -------
+    Tuple[List[str], List[str]]
+        scripts found (sorted) and patterns without matches
+    """
+    mainFolder = os.path.normpath(mainFolder)
+    mainRoot = os.path.normcase(mainFolder) + os.sep
+    ignoreRules = IgnoreRules.fromFolder(mainFolder)
+    scripts = set()
+    unmatched = list()
+    for pattern in patterns:
+        pattern = os.path.expanduser(pattern.strip())
+        if not pattern:
+            continue
+        pattern = os.path.normpath(os.path.join(mainFolder, pattern))
+        if os.path.isdir(pattern):
+            paths = list()
+            for root, dirs, files in os.walk(pattern):
+                relativeRoot = os.path.relpath(root, mainFolder)
+                dirs[:] = ignoreRules.filterFolders(relativeRoot, dirs)
+                paths.extend(os.path.join(root, file) for file in files)
+        else:
+            paths = glob.glob(pattern, recursive=True)
+        found = {
+            path for path in paths
+            if path.endswith(extensions) and
+            os.path.normcase(path).startswith(mainRoot) and
+            os.path.isfile(path) and
+            not ignoreRules.matches(os.path.relpath(path, mainFolder))
+        }
+        if not found:
+            unmatched.append(pattern)
+        scripts.update(found)
+
+    return sorted(scripts), unmatched
+
+
+def _getPythonImports(script: str, mainFolder: str) -> List[str]:
+    """Gets the modules of the main folder imported by a Python
+    script (searched in the folder of the script and in the main
+    folder; other modules are packages and are left out)
+
+    Parameters
+    ----------
+    script : str
+        script path
+    mainFolder : str
+        main folder
+
+    Returns
+    -------
+    List[str]
+        module files
+    """
+    scriptFolder = os.path.dirname(script)
+    modules = list()
+    for _, statement in readScriptLines(script):
+        match = re.match(PYTHON_IMPORT_REGEX, statement)
+        if not match:
+            continue
+        if match[3]:
+            names = [re.split(r'\s+as\s+', name.strip())[0] for name in match[3].split(',')]
+            candidates = [(name, scriptFolder) for name in names]
+        else:
+            module = match[1]
+            level = len(module) - len(module.lstrip('.'))
+            folder = scriptFolder
+            for _ in range(max(level - 1, 0)):
+                folder = os.path.dirname(folder)
+            module = module.lstrip('.')
+            names = [
+                re.split(r'\s+as\s+', name.strip())[0]
+                for name in match[2].strip('()').split(',')
+            ]
+            # "from package import module" may import a module
+            candidates = [(module, folder)] + [
+                (f'{module}.{name}' if module else name, folder)
+                for name in names if name != '*'
+            ]
+            if level:
+                candidates = [(name, folder) for name, folder in candidates if name]
+        for name, folder in candidates:
+            parts = name.split('.')
+            for base in dict.fromkeys((folder, mainFolder)):
+                path = os.path.join(base, *parts)
+                for candidate in (path + '.py', os.path.join(path, '__init__.py')):
+                    if os.path.isfile(candidate):
+                        modules.append(candidate)
+                        break
+                else:
+                    continue
+                break
+
+    return modules
+
+
+def discoverDependencies(
+    mainScript: str,
+    mainFolder: str,
+    rootPath: Union[str, None] = None
+) -> Tuple[List[str], List[str]]:
+    """Discovers the scripts called by the main script, recursively:
+    do/run/include (Stata), source (R), run_path/exec (Python),
+    include (Julia) and the imports of Python modules in the main
+    folder. Paths are resolved with the path variables of the
+    configuration files (see templates)
+
+    Parameters
+    ----------
+    mainScript : str
+        main script
+    mainFolder : str
+        main folder
+    rootPath : str, optional
+        project root path, by default the main folder
+
+    Returns
+    -------
+    Tuple[List[str], List[str]]
+        scripts found under the main folder (sorted, without the main
+        script) and calls that could not be resolved
+    """
+    mainFolder = os.path.normpath(mainFolder)
+    mainRoot = os.path.normcase(mainFolder) + os.sep
+    language = getLanguage(mainScript)
+    if language is None:
+        return [], []
+    variables = getPathVariables(language, rootPath or mainFolder, mainFolder)
+    workPath = os.path.dirname(mainScript)
+    visited = {os.path.normcase(mainScript)}
+    pending = [mainScript]
+    scripts = list()
+    unresolved = list()
+    while pending:
+        script = pending.pop()
+        try:
+            called = [
+                (statement, path) for _, statement, path in getScriptCalls(script, variables, workPath)
+            ]
+            if getLanguage(script) == "python":
+                called.extend(
+                    (None, path) for path in _getPythonImports(script, mainFolder)
+                )
+        except (OSError, KeyError):
+            continue
+        for statement, path in called:
+            if path is None or not os.path.isfile(path):
+                unresolved.append(f'{os.path.basename(script)}: {statement}')
+                continue
+            path = os.path.normpath(path)
+            key = os.path.normcase(path)
+            if key in visited or not key.startswith(mainRoot):
+                continue
+            visited.add(key)
+            scripts.append(path)
+            if getLanguage(path) is not None:
+                pending.append(path)
+
+    return sorted(scripts), unresolved
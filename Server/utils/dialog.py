@@ -1,13 +1,24 @@
 # popups.py
 import PySimpleGUI as sg
+import os
+import time
 from typing import Tuple, Union, List, Dict
 from .updateFields import enableDisableFields # window.disable() not working on linux
+from .folderIndex import FolderIndex
+from .progress import formatBytes
 
 enableDisableExceptions = [
     'status',
     'time',
     'return'
 ]
+# Checkbox marks of the tree picker (ttk trees have no checkboxes)
+UNCHECKED_MARK = '\u2610 '
+CHECKED_MARK = '\u2611 '
+# Entries shown per folder in the tree picker (the filter finds the rest)
+TREE_FOLDER_LIMIT = 2000
+# Seconds without typing before the filter of the tree picker is applied
+TREE_FILTER_DELAY = 0.3
 
 def errorMessageBox(window: object, errors: Dict[str, List[str]], icon=bytes) -> None:
     """Display error message box
@@ -232,4 +243,278 @@ def selectFolder(title: str) -> str:
         no_window=True
     )
     
-    return folder
\ No newline at end of file
+    return folder
+
+def selectFromTree(
+    window: object,
+    mainFolder: str,
+    title: str,
+    extensions: Union[Tuple[str, ...], None] = None,
+    foldersOnly: bool = False,
+    icon=bytes
+) -> List[str]:
+    """Dialog box to pick files (or folders) of the main folder in a
+    tree. Folders are listed when expanded, and the filter searches the
+    index of the main folder (built in the background). Entries are
+    checked with the space bar, a double click (files) or the buttons;
+    checking a folder checks the files under it
+
+    Parameters
+    ----------
+    window : object
+        Master window
+    mainFolder : str
+        main folder
+    title : str
+        dialog box title
+    extensions : Tuple[str, ...], optional
+        extensions of the files listed, by default every file
+    foldersOnly : bool, optional
+        pick folders instead of files, by default False
+    icon: bytes
+        Window icon
+
+    Returns
+    -------
+    List[str]
+        files (or folders) checked, empty if cancelled
+    """
+    index = FolderIndex(mainFolder, extensions, foldersOnly)
+    index.start()
+    layout = [
+        [
+            sg.Text('Filter'),
+            sg.Input(key='treeFilter', enable_events=True, expand_x=True, tooltip='Text or glob pattern (e.g. *.do)'),
+            sg.Text('', key='treeIndexStatus', size=(26, 1))
+        ],
+        [
+            sg.Tree(
+                data=sg.TreeData(),
+                headings=['Size'],
+                col0_width=60,
+                col_widths=[10],
+                auto_size_columns=False,
+                num_rows=20,
+                key='tree',
+                show_expanded=False,
+                select_mode=sg.TABLE_SELECT_MODE_EXTENDED,
+                expand_x=True,
+                expand_y=True
+            )
+        ],
+        [
+            sg.Text('0 checked', key='treeChecked', size=(16, 1)),
+            sg.Push(),
+            sg.Button('Check Selected', key='treeCheck'),
+            sg.Button('Uncheck Selected', key='treeUncheck'),
+            sg.Button('OK', key='treeOk', size=(8, 1)),
+            sg.Button('Cancel', key='treeCancel', size=(8, 1))
+        ]
+    ]
+    treeWindow = sg.Window(
+        title=title,
+        layout=layout,
+        icon=icon,
+        resizable=True,
+        keep_on_top=True,
+        finalize=True
+    )
+    tree = treeWindow['tree']
+    widget = tree.Widget
+    tree.bind('<<TreeviewOpen>>', 'Open')
+    tree.bind('<space>', 'Space')
+    tree.bind('<Double-Button-1>', 'Double')
+    labels = dict()
+    loaded = set()
+    checked = set()
+
+    def register(iid: str) -> str:
+        # items inserted directly in the widget are unknown to
+        # PySimpleGUI, which maps the selection to keys
+        tree.IdToKey[iid] = iid
+        tree.KeyToID[iid] = iid
+        return iid
+
+    def insertNode(parent: str, path: str, text: str, isFolder: bool, size: int) -> None:
+        if widget.exists(path):
+            return
+        mark = CHECKED_MARK if path in checked else UNCHECKED_MARK
+        register(widget.insert(
+            parent, 'end', iid=path, text=mark + text, values=('' if isFolder else formatBytes(size),)
+        ))
+        labels[path] = text
+        if isFolder:
+            # placeholder child, so the folder can be expanded
+            register(widget.insert(path, 'end', text=''))
+
+    def insertEntries(parent: str, folder: str) -> None:
+        entries = index.listFolder(folder)
+        for name, isFolder, size in entries[:TREE_FOLDER_LIMIT]:
+            insertNode(parent, os.path.join(folder, name), name, isFolder, size)
+        if len(entries) > TREE_FOLDER_LIMIT:
+            register(widget.insert(parent, 'end', text=f'... {len(entries) - TREE_FOLDER_LIMIT} more (use the filter)'))
+
+    def applyFilter(query: str) -> None:
+        widget.delete(*widget.get_children(''))
+        loaded.clear()
+        if not query.strip():
+            insertEntries('', index.mainFolder)
+            return
+        matches, truncated = index.search(query)
+        for relativePath in matches:
+            isFolder = relativePath.endswith('/')
+            path = os.path.join(index.mainFolder, *relativePath.rstrip('/').split('/'))
+            try:
+                size = 0 if isFolder else os.path.getsize(path)
+            except OSError:
+                continue
+            insertNode('', path, relativePath, isFolder, size)
+        if truncated:
+            register(widget.insert('', 'end', text='... more results (refine the filter)'))
+
+    def setChecked(path: str, state: bool) -> None:
+        if state:
+            checked.add(path)
+        else:
+            checked.discard(path)
+        if path in labels and widget.exists(path):
+            widget.item(path, text=(CHECKED_MARK if state else UNCHECKED_MARK) + labels[path])
+
+    def toggle(paths: List[str], state: Union[bool, None] = None) -> None:
+        for path in paths:
+            if path not in labels:
+                continue
+            newState = path not in checked if state is None else state
+            if not foldersOnly and os.path.isdir(path):
+                for file in index.getFiles(path):
+                    setChecked(file, newState)
+            setChecked(path, newState)
+        treeWindow['treeChecked'].update(
+            f'{sum(1 for path in checked if foldersOnly or not os.path.isdir(path))} checked'
+        )
+
+    enableDisableFields(
+        window=window,
+        exceptionKeys=enableDisableExceptions,
+        enable=False
+    )
+    insertEntries('', index.mainFolder)
+    filterChanged = None
+    filteredBeforeReady = False
+    selected = list()
+
+    while True:
+        event, values = treeWindow.read(timeout=100)
+
+        if event in (sg.WIN_CLOSED, 'treeCancel'):
+            break
+        if event == 'treeOk':
+            selected = sorted(path for path in checked if foldersOnly or not os.path.isdir(path))
+            break
+        if event == 'treeOpen':
+            iid = widget.focus()
+            if iid in labels and iid not in loaded:
+                widget.delete(*widget.get_children(iid))
+                insertEntries(iid, iid)
+                loaded.add(iid)
+        if event in ('treeSpace', 'treeCheck', 'treeUncheck'):
+            state = {'treeCheck': True, 'treeUncheck': False}.get(event)
+            toggle(list(widget.selection()), state)
+        if event == 'treeDouble':
+            iid = widget.focus()
+            if iid in labels and (foldersOnly or not os.path.isdir(iid)):
+                toggle([iid])
+        if event == 'treeFilter':
+            filterChanged = time.time()
+        if filterChanged and time.time() - filterChanged >= TREE_FILTER_DELAY:
+            filterChanged = None
+            filteredBeforeReady = not index.ready
+            applyFilter(values['treeFilter'])
+        if filteredBeforeReady and index.ready:
+            # the filter is applied again on the complete index
+            filteredBeforeReady = False
+            applyFilter(values['treeFilter'])
+        treeWindow['treeIndexStatus'].update(
+            f"{len(index.paths)} paths indexed{'' if index.ready else '...'}"
+        )
+
+    index.cancel()
+    treeWindow.close()
+
+    enableDisableFields(
+        window=window,
+        exceptionKeys=enableDisableExceptions,
+        enable=True
+    )
+    window.bring_to_front()
+
+    return selected
+
+
+def importPatternsBox(window: object, mainFolder: str, icon=bytes) -> List[str]:
+    """Dialog box to import dependencies in bulk: glob patterns
+    (relative to the main folder, `**` for any number of folders) or
+    folders, one per line
+
+    Parameters
+    ----------
+    window : object
+        Master window
+    mainFolder : str
+        main folder
+    icon: bytes
+        Window icon
+
+    Returns
+    -------
+    List[str]
+        patterns and folders, empty if cancelled
+    """
+    layout = [
+        [sg.Text('Glob patterns or folders, one per line (e.g. code/**/*.do)')],
+        [sg.Multiline(key='importPatterns', size=(70, 8), expand_x=True)],
+        [
+            sg.Button('Add Folder', key='importFolder'),
+            sg.Push(),
+            sg.Button('OK', key='importOk', size=(8, 1)),
+            sg.Button('Cancel', key='importCancel', size=(8, 1))
+        ]
+    ]
+    importWindow = sg.Window(
+        title='Import Dependencies',
+        layout=layout,
+        icon=icon,
+        keep_on_top=True
+    )
+
+    enableDisableFields(
+        window=window,
+        exceptionKeys=enableDisableExceptions,
+        enable=False
+    )
+    patterns = list()
+
+    while True:
+        event, values = importWindow.read()
+
+        if event in (sg.WIN_CLOSED, 'importCancel'):
+            break
+        if event == 'importOk':
+            patterns = [line.strip() for line in values['importPatterns'].splitlines() if line.strip()]
+            break
+        if event == 'importFolder':
+            folder = sg.PopupGetFolder('Select Folder', no_window=True, initial_folder=mainFolder)
+            if folder:
+                text = values['importPatterns'].rstrip('\n')
+                importWindow['importPatterns'].update(f'{text}\n{folder}' if text else folder)
+
+    importWindow.close()
+
+    enableDisableFields(
+        window=window,
+        exceptionKeys=enableDisableExceptions,
+        enable=True
+    )
+    window.bring_to_front()
+
+    return patterns
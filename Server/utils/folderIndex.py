@@ -0,0 +1,186 @@
+# folderIndex.py
+from typing import List, Tuple, Union
+import os
+import re
+import fnmatch
+import threading
+from .ignore import IgnoreRules
+
+# Maximum number of paths returned by a search
+SEARCH_LIMIT = 500
+
+
+class FolderIndex(object):
+    """Index of the files and folders of a main folder, for the tree
+    picker: folders are listed when they are expanded (and cached), and
+    the whole folder is indexed in a background thread for the filter.
+    Folders matched by the ignore rules are left out. Files may be
+    limited to some extensions, or left out (folders only)
+    """
+
+    def __init__(
+        self,
+        mainFolder: str,
+        extensions: Union[Tuple[str, ...], None] = None,
+        foldersOnly: bool = False
+    ) -> None:
+
+        self.mainFolder = os.path.normpath(mainFolder)
+        self.extensions = extensions
+        self.foldersOnly = foldersOnly
+        self.ignoreRules = IgnoreRules.fromFolder(self.mainFolder)
+        # relative paths (folders end with "/"), filled by the thread
+        self.paths = list()
+        self.ready = False
+        self._listings = dict()
+        self._lock = threading.Lock()
+        self._cancelEvent = threading.Event()
+        self._thread = None
+        self._lastQuery = ''
+        self._lastMatches = None
+
+    def _isListed(self, name: str, isFolder: bool) -> bool:
+        """Checks if a file or folder is shown"""
+        if isFolder:
+            return True
+        if self.foldersOnly:
+            return False
+
+        return self.extensions is None or name.endswith(self.extensions)
+
+    def listFolder(self, path: str) -> List[Tuple[str, bool, int]]:
+        """Lists a folder (cached): folders first, then files, sorted
+        by name
+
+        Parameters
+        ----------
+        path : str
+            folder (under the main folder)
+
+        Returns
+        -------
+        List[Tuple[str, bool, int]]
+            name, folder flag and size (0 for folders) of each entry
+        """
+        path = os.path.normpath(path)
+        if path in self._listings:
+            return self._listings[path]
+        prefix = os.path.relpath(path, self.mainFolder)
+        prefix = '' if prefix == '.' else prefix.replace(os.sep, '/') + '/'
+        entries = list()
+        try:
+            with os.scandir(path) as content:
+                for item in content:
+                    try:
+                        isFolder = item.is_dir()
+                        if not self._isListed(item.name, isFolder):
+                            continue
+                        if self.ignoreRules.matches(prefix + item.name, isFolder=isFolder):
+                            continue
+                        entries.append((item.name, isFolder, 0 if isFolder else item.stat().st_size))
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        entries.sort(key=lambda entry: (not entry[1], entry[0].lower()))
+        self._listings[path] = entries
+
+        return entries
+
+    def start(self) -> None:
+        """Starts indexing the main folder in a background thread"""
+        self._thread = threading.Thread(target=self._build, daemon=True)
+        self._thread.start()
+
+    def _build(self) -> None:
+        """Indexes the main folder (worker thread)"""
+        for root, dirs, files in os.walk(self.mainFolder):
+            if self._cancelEvent.is_set():
+                return
+            relativeRoot = os.path.relpath(root, self.mainFolder)
+            dirs[:] = sorted(self.ignoreRules.filterFolders(relativeRoot, dirs))
+            prefix = '' if relativeRoot == '.' else relativeRoot.replace(os.sep, '/') + '/'
+            paths = [prefix + folder + '/' for folder in dirs]
+            paths.extend(
+                prefix + file for file in sorted(files)
+                if self._isListed(file, False) and not self.ignoreRules.matches(prefix + file)
+            )
+            with self._lock:
+                self.paths.extend(paths)
+        self.ready = True
+
+    def cancel(self) -> None:
+        """Stops indexing"""
+        self._cancelEvent.set()
+
+    def search(self, query: str, limit: int = SEARCH_LIMIT) -> Tuple[List[str], bool]:
+        """Searches the index: a case-insensitive substring of the path,
+        or a glob pattern (if the query has `*`, `?` or `[`). Once the
+        index is complete, a query that extends the previous one only
+        filters its matches
+
+        Parameters
+        ----------
+        query : str
+            text or glob pattern
+        limit : int, optional
+            maximum number of paths returned, by default SEARCH_LIMIT
+
+        Returns
+        -------
+        Tuple[List[str], bool]
+            relative paths found and a flag for truncated results
+        """
+        query = query.strip().lower()
+        if any(char in query for char in '*?['):
+            regex = re.compile(fnmatch.translate(query if '/' in query else '*' + query))
+            isMatch = lambda path: bool(regex.match(path.lower()))
+        else:
+            isMatch = lambda path: query in path.lower()
+        if (
+            self.ready and self._lastMatches is not None and
+            self._lastQuery and query.startswith(self._lastQuery) and
+            not any(char in query for char in '*?[')
+        ):
+            candidates = self._lastMatches
+        else:
+            with self._lock:
+                candidates = list(self.paths)
+        matches = [path for path in candidates if isMatch(path)]
+        if self.ready:
+            self._lastQuery = query
+            self._lastMatches = matches
+
+        return matches[:limit], len(matches) > limit
+
+    def getFiles(self, folder: str) -> List[str]:
+        """Gets the files listed under a folder (from the index if it
+        is complete, otherwise from a walk)
+
+        Parameters
+        ----------
+        folder : str
+            folder (under the main folder)
+
+        Returns
+        -------
+        List[str]
+            file paths
+        """
+        relativeFolder = os.path.relpath(folder, self.mainFolder)
+        prefix = '' if relativeFolder == '.' else relativeFolder.replace(os.sep, '/') + '/'
+        if self.ready:
+            return [
+                os.path.join(self.mainFolder, *path.split('/'))
+                for path in self.paths if path.startswith(prefix) and not path.endswith('/')
+            ]
+        files = list()
+        for root, dirs, names in os.walk(folder):
+            relativeRoot = os.path.relpath(root, self.mainFolder)
+            dirs[:] = self.ignoreRules.filterFolders(relativeRoot, dirs)
+            files.extend(
+                os.path.join(root, name) for name in names
+                if self._isListed(name, False) and not self.ignoreRules.matches(os.path.join(relativeRoot, name))
+            )
+
+        return files
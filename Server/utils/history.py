@@ -0,0 +1,204 @@
+# history.py
+from typing import Dict, List, Union, Any
+import json
+import datetime
+import statistics
+from .settings import loadSettings
+from .catalog import connect
+
+# Metrics compared with the history (besides the stages)
+TOTAL_METRIC = 'Total'
+PREPARATION_METRIC = 'Preparation'
+RUN_METRIC = 'Run time'
+STAGE_PREFIX = 'Stage '
+
+
+def getMetrics(
+    preparationSeconds: Union[float, None],
+    runSeconds: Union[float, None],
+    stageSeconds: Union[Dict[str, float], None] = None
+) -> Dict[str, float]:
+    """Gets the metrics of a run compared with the history
+
+    Parameters
+    ----------
+    preparationSeconds : float | None
+        preparation time
+    runSeconds : float | None
+        run time
+    stageSeconds : Dict[str, float], optional
+        duration of each stage (script), by default None
+
+    Returns
+    -------
+    Dict[str, float]
+        metric and seconds
+    """
+    metrics = dict()
+    if preparationSeconds is not None and runSeconds is not None:
+        metrics[TOTAL_METRIC] = preparationSeconds + runSeconds
+    if preparationSeconds is not None:
+        metrics[PREPARATION_METRIC] = preparationSeconds
+    if runSeconds is not None:
+        metrics[RUN_METRIC] = runSeconds
+    for script, seconds in (stageSeconds or dict()).items():
+        metrics[f'{STAGE_PREFIX}{script}'] = seconds
+
+    return metrics
+
+
+def getHistory(
+    project: str,
+    mainScript: str,
+    excludePath: str = '',
+    catalogPath: Union[str, None] = None
+) -> List[Dict[str, float]]:
+    """Gets the metrics of the previous successful runs of a main
+    script (most recent first, at most `regression.history` runs).
+    Runs stopped by a limit are left out
+
+    Parameters
+    ----------
+    project : str
+        project
+    mainScript : str
+        main script (as selected in the app)
+    excludePath : str, optional
+        replication folder left out (the current run), by default ''
+    catalogPath : str, optional
+        catalog path, by default the path in the settings
+
+    Returns
+    -------
+    List[Dict[str, float]]
+        metrics of each run
+    """
+    connection = connect(catalogPath)
+    try:
+        rows = connection.execute(
+            'SELECT preparationSeconds, runSeconds, stageSeconds FROM replications '
+            'WHERE project = ? AND mainScript = ? AND exitCode = 0 AND stopped IS NULL '
+            'AND path != ? ORDER BY started DESC LIMIT ?',
+            (project, mainScript, excludePath, loadSettings()['regression']['history'])
+        ).fetchall()
+    finally:
+        connection.close()
+
+    return [
+        getMetrics(
+            row['preparationSeconds'],
+            row['runSeconds'],
+            json.loads(row['stageSeconds']) if row['stageSeconds'] else None
+        )
+        for row in rows
+    ]
+
+
+def compareWithHistory(
+    metrics: Dict[str, float],
+    history: List[Dict[str, float]]
+) -> List[Dict[str, Any]]:
+    """Compares the metrics of a run with the median of the previous
+    runs. A metric regressed if it is `regression.threshold` times the
+    median, and at least `regression.minSeconds` above it. Metrics with
+    less than `regression.minRuns` previous values are not compared
+
+    Parameters
+    ----------
+    metrics : Dict[str, float]
+        metrics of the run
+    history : List[Dict[str, float]]
+        metrics of the previous runs
+
+    Returns
+    -------
+    List[Dict[str, Any]]
+        metric, current value, median, ratio, runs and regression flag
+    """
+    settings = loadSettings()['regression']
+    comparison = list()
+    for metric, current in metrics.items():
+        previous = [run[metric] for run in history if run.get(metric) is not None]
+        if len(previous) < settings['minRuns']:
+            continue
+        median = statistics.median(previous)
+        ratio = current / median if median > 0 else None
+        regression = (
+            ratio is not None
+            and ratio >= settings['threshold']
+            and current - median >= settings['minSeconds']
+        )
+        comparison.append({
+            'metric': metric,
+            'current': current,
+            'median': median,
+            'ratio': ratio,
+            'runs': len(previous),
+            'regression': regression
+        })
+
+    return comparison
+
+
+def estimateRunTime(history: List[Dict[str, float]]) -> Union[float, None]:
+    """Estimates the run time of a replication from the previous runs
+
+    Parameters
+    ----------
+    history : List[Dict[str, float]]
+        metrics of the previous runs
+
+    Returns
+    -------
+    float | None
+        median run time in seconds, or None without history
+    """
+    previous = [run[RUN_METRIC] for run in history if run.get(RUN_METRIC) is not None]
+    if not previous:
+        return None
+
+    return statistics.median(previous)
+
+
+def describeRegressions(comparison: List[Dict[str, Any]]) -> str:
+    """Describes the metrics that regressed (e.g. for the status line)
+
+    Parameters
+    ----------
+    comparison : List[Dict[str, Any]]
+        comparison with the history
+
+    Returns
+    -------
+    str
+        metrics and ratios (e.g. "Run time 3.1x"), or an empty string
+    """
+    return ', '.join(
+        f"{row['metric']} {row['ratio']:.1f}x" for row in comparison if row['regression']
+    )
+
+
+def formatEta(expectedRunTime: Union[float, None], elapsed: float) -> str:
+    """Formats the time left of a running replication, from the run
+    time expected
+
+    Parameters
+    ----------
+    expectedRunTime : float | None
+        run time expected (see estimateRunTime)
+    elapsed : float
+        seconds since the scripts started
+
+    Returns
+    -------
+    str
+        time left (e.g. "ETA: 0:12:30"), or an empty string without
+        history
+    """
+    if expectedRunTime is None:
+        return ''
+    remaining = expectedRunTime - elapsed
+    if remaining < 0:
+        return f'ETA: overdue (usually {datetime.timedelta(seconds=round(expectedRunTime))})'
+
+    return f'ETA: {datetime.timedelta(seconds=round(remaining))}'
@@ -0,0 +1,154 @@
+# ignore.py
+from typing import List
+import os
+import re
+from .settings import loadSettings
+
+# Ignore file (in the main folder)
+IGNORE_FILE = '.replicationignore'
+# Folders never replicated: hidden folders, data and replications
+DEFAULT_PATTERNS = ['.*/', 'initial_dataset*/', 'Replications*/']
+
+
+def translatePattern(pattern: str) -> str:
+    """Translates a glob pattern into a regular expression. `*` and
+    `?` do not match `/`, `**` matches any number of folders
+
+    Parameters
+    ----------
+    pattern : str
+        glob pattern (without the trailing `/` of folder patterns)
+
+    Returns
+    -------
+    str
+        regular expression
+    """
+    regex = ''
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if pattern.startswith('**/', index):
+            regex += '(?:.*/)?'
+            index += 3
+            continue
+        if pattern.startswith('**', index):
+            regex += '.*'
+            index += 2
+            continue
+        if char == '*':
+            regex += '[^/]*'
+        elif char == '?':
+            regex += '[^/]'
+        elif char == '[':
+            end = pattern.find(']', index + 1)
+            if end == -1:
+                regex += re.escape(char)
+            else:
+                content = pattern[index + 1:end]
+                if content.startswith('!'):
+                    content = '^' + content[1:]
+                regex += f'[{content}]'
+                index = end
+        else:
+            regex += re.escape(char)
+        index += 1
+
+    return regex
+
+
+class IgnoreRules(object):
+    """Rules of the folders and files left out of the replication
+    structure (glob patterns, as in .gitignore): patterns without `/`
+    match the name at any depth, other patterns match the path relative
+    to the main folder, and patterns ending in `/` match folders only.
+    The patterns are compiled into one regular expression for files and
+    one for folders
+    """
+
+    def __init__(self, patterns: List[str]) -> None:
+
+        self.patterns = list()
+        anyRegex = list()
+        folderRegex = list()
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if not pattern or pattern.startswith('#'):
+                continue
+            self.patterns.append(pattern)
+            folderOnly = pattern.endswith('/')
+            pattern = pattern.rstrip('/')
+            if '/' in pattern:
+                regex = '^' + translatePattern(pattern.lstrip('/')) + '$'
+            else:
+                regex = '(?:^|/)' + translatePattern(pattern) + '$'
+            folderRegex.append(regex)
+            if not folderOnly:
+                anyRegex.append(regex)
+        self._anyRegex = re.compile('|'.join(anyRegex)) if anyRegex else None
+        self._folderRegex = re.compile('|'.join(folderRegex)) if folderRegex else None
+
+    @classmethod
+    def fromFolder(cls, mainFolder: str) -> 'IgnoreRules':
+        """Gets the rules of a main folder: the default patterns, the
+        `ignorePatterns` setting and the patterns in .replicationignore
+
+        Parameters
+        ----------
+        mainFolder : str
+            main folder
+
+        Returns
+        -------
+        IgnoreRules
+            rules
+        """
+        patterns = [*DEFAULT_PATTERNS, *loadSettings()['ignorePatterns']]
+        ignoreFile = os.path.join(mainFolder, IGNORE_FILE)
+        if os.path.isfile(ignoreFile):
+            with open(ignoreFile, encoding='utf-8', errors='replace') as f:
+                patterns.extend(f.read().splitlines())
+
+        return cls(patterns)
+
+    def matches(self, relativePath: str, isFolder: bool = False) -> bool:
+        """Checks if a path is ignored
+
+        Parameters
+        ----------
+        relativePath : str
+            path relative to the main folder
+        isFolder : bool, optional
+            the path is a folder, by default False
+
+        Returns
+        -------
+        bool
+            True if the path is ignored
+        """
+        regex = self._folderRegex if isFolder else self._anyRegex
+        if regex is None:
+            return False
+
+        return bool(regex.search(relativePath.replace(os.sep, '/')))
+
+    def filterFolders(self, root: str, folders: List[str]) -> List[str]:
+        """Filters the folders of a walk (the ignored ones are pruned)
+
+        Parameters
+        ----------
+        root : str
+            path of the folders, relative to the main folder ('' or '.'
+            for the main folder)
+        folders : List[str]
+            folder names
+
+        Returns
+        -------
+        List[str]
+            folders not ignored
+        """
+        prefix = '' if root in ('', '.') else root.replace(os.sep, '/') + '/'
+
+        return [folder for folder in folders if not self.matches(prefix + folder, isFolder=True)]
+
@@ -0,0 +1,280 @@
+# julia.py
+from typing import Dict, List, Union, Any
+import os
+import json
+import time
+import shlex
+import hashlib
+import subprocess
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+from .settings import loadSettings, getCachePath
+from .runtimes import Runtime, getProgram
+
+# Files of a Julia project (environment)
+PROJECT_FILE = 'Project.toml'
+MANIFEST_FILE = 'Manifest.toml'
+# Files in the cache of an environment
+SYSIMAGE_FILE = 'sysimage.so'
+READY_FILE = 'ready.json'
+LOCK_FILE = '.lock'
+# Commands run in the container to build the cache
+INSTANTIATE_CODE = 'using Pkg; Pkg.instantiate(); Pkg.precompile()'
+SYSIMAGE_CODE = """using PackageCompiler, Pkg
+packages = Symbol.(collect(keys(Pkg.project().dependencies)))
+create_sysimage(packages; sysimage_path={path})"""
+
+
+def findJuliaProject(script: str, mainFolder: str) -> Union[str, None]:
+    """Finds the Julia project of a script: the first folder with a
+    Project.toml, from the folder of the script up to the main folder
+
+    Parameters
+    ----------
+    script : str
+        script path
+    mainFolder : str
+        main folder
+
+    Returns
+    -------
+    str | None
+        project folder, or None if the script has no project
+    """
+    folder = os.path.dirname(os.path.abspath(script))
+    mainFolder = os.path.abspath(mainFolder)
+    while True:
+        if os.path.isfile(os.path.join(folder, PROJECT_FILE)):
+            return folder
+        if folder == mainFolder or os.path.dirname(folder) == folder:
+            return None
+        folder = os.path.dirname(folder)
+
+
+def getProjectFiles(projectPath: str) -> List[str]:
+    """Gets the files of a Julia project
+
+    Parameters
+    ----------
+    projectPath : str
+        project folder
+
+    Returns
+    -------
+    List[str]
+        Project.toml and Manifest.toml (if it exists)
+    """
+    return [
+        os.path.join(projectPath, file)
+        for file in (PROJECT_FILE, MANIFEST_FILE)
+        if os.path.isfile(os.path.join(projectPath, file))
+    ]
+
+
+def getEnvironmentKey(projectPath: str, runtime: Runtime) -> str:
+    """Gets the cache key of a Julia environment: the hash of the
+    Manifest (Project.toml if there is no Manifest) and of the
+    runtime image, since precompiled code depends on the Julia
+    version
+
+    Parameters
+    ----------
+    projectPath : str
+        project folder
+    runtime : Runtime
+        runtime backend
+
+    Returns
+    -------
+    str
+        cache key
+    """
+    digest = hashlib.sha256()
+    files = getProjectFiles(projectPath)
+    with open(files[-1], 'rb') as f:
+        digest.update(f.read())
+    digest.update(f'{runtime.name}:{runtime.getKey()}'.encode())
+
+    return digest.hexdigest()[:16]
+
+
+class JuliaEnvironment(object):
+    """Cached environment of a Julia project: a depot with the
+    packages installed and precompiled and, if PackageCompiler is
+    available in the container, a sysimage with the packages of the
+    project. The cache is keyed by the Manifest hash, so repeated
+    runs of the same project skip the precompilation
+    """
+
+    def __init__(self, runtime: Runtime, projectPath: Union[str, None]) -> None:
+
+        self._runtime = runtime
+        self.projectPath = projectPath
+        self.key = getEnvironmentKey(projectPath, runtime) if projectPath else ''
+        self.cachePath = getCachePath('julia', self.key) if projectPath else ''
+        self.depotPath = os.path.join(self.cachePath, 'depot') if projectPath else ''
+        self.sysimage = ''
+        self.cached = False
+        self.built = False
+        self.buildTime = 0.0
+        self.errors = list()
+        self._readCache()
+
+    def _readCache(self) -> None:
+        """Reads the state of the cache"""
+        if not self.projectPath:
+            return
+        readyFile = os.path.join(self.cachePath, READY_FILE)
+        if not os.path.isfile(readyFile):
+            return
+        with open(readyFile) as f:
+            info = json.load(f)
+        self.cached = True
+        self.buildTime = info.get('buildTime', 0.0)
+        self.errors = info.get('errors', [])
+        sysimage = os.path.join(self.cachePath, SYSIMAGE_FILE)
+        if os.path.isfile(sysimage):
+            self.sysimage = sysimage
+
+    def getEnvironment(self) -> Dict[str, str]:
+        """Gets the environment variables of the Julia processes. The
+        depot of the cache comes first, followed by the default depots
+        (trailing separator), so packages bundled in the image are used
+
+        Returns
+        -------
+        Dict[str, str]
+            environment variables
+        """
+        if not self.projectPath:
+            return dict()
+
+        return {'JULIA_DEPOT_PATH': self.depotPath + os.pathsep}
+
+    def _runJulia(self, code: str, timeout: int) -> Union[str, None]:
+        """Runs Julia code in the runtime, in the project
+
+        Parameters
+        ----------
+        code : str
+            Julia code
+        timeout : int
+            timeout in seconds
+
+        Returns
+        -------
+        str | None
+            error message, or None if the code ran
+        """
+        args = self._runtime.wrap(
+            [*shlex.split(getProgram('julia')), f'--project={self.projectPath}', '-e', code],
+            list(self.getEnvironment())
+        )
+        try:
+            result = subprocess.run(
+                args,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                universal_newlines=True,
+                timeout=timeout,
+                env={**os.environ, **self.getEnvironment()}
+            )
+        except (OSError, subprocess.TimeoutExpired) as error:
+            return str(error)
+        if result.returncode != 0:
+            return '\n'.join(result.stdout.strip().splitlines()[-5:])
+
+        return None
+
+    def prepare(self) -> None:
+        """Builds the cache of the environment, if it does not exist.
+        The cache is locked while it is built, so concurrent
+        replications of the same project build it only once. Errors
+        are recorded and the replication runs without the cache
+        """
+        if not self.projectPath or self.cached:
+            return
+        settings = loadSettings()
+        timeout = settings['juliaBuildTimeout']
+        with open(os.path.join(self.cachePath, LOCK_FILE), 'a') as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # built by another replication while waiting for the lock
+                self._readCache()
+                if self.cached:
+                    return
+                start = time.time()
+                error = self._runJulia(INSTANTIATE_CODE, timeout)
+                if error:
+                    # not cached, so that the next replication tries again
+                    self.errors = [f'Precompilation failed: {error}']
+                    return
+                if settings['juliaSysimage']:
+                    sysimage = os.path.join(self.cachePath, SYSIMAGE_FILE)
+                    temporary = f'{sysimage}.{os.getpid()}.tmp'
+                    error = self._runJulia(
+                        SYSIMAGE_CODE.format(path=json.dumps(temporary)),
+                        timeout
+                    )
+                    if error:
+                        self.errors.append(f'Sysimage not built: {error}')
+                    else:
+                        os.replace(temporary, sysimage)
+                with open(os.path.join(self.cachePath, READY_FILE), 'w') as f:
+                    json.dump({'buildTime': time.time() - start, 'errors': self.errors}, f)
+                self._readCache()
+                self.built = True
+            finally:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def getProgram(self, threads: int = 0) -> str:
+        """Gets the Julia command (without the script)
+
+        Parameters
+        ----------
+        threads : int, optional
+            number of threads, by default Julia's default
+
+        Returns
+        -------
+        str
+            command
+        """
+        args = shlex.split(getProgram('julia'))
+        if self.projectPath:
+            args.append(f'--project={self.projectPath}')
+        if threads:
+            args.append(f'--threads={threads}')
+        if self.sysimage:
+            args.append(f'--sysimage={self.sysimage}')
+
+        return ' '.join(shlex.quote(arg) for arg in args)
+
+    def describe(self) -> Dict[str, Any]:
+        """Describes the environment
+
+        Returns
+        -------
+        Dict[str, Any]
+            item and value
+        """
+        if not self.projectPath:
+            return {'Project': 'None (default environment)'}
+        if self.built:
+            cache = f'Built ({self.buildTime:.0f} seconds)'
+        elif self.cached:
+            cache = 'Reused'
+        else:
+            cache = 'Not available'
+
+        return {
+            'Project': self.projectPath,
+            'Manifest key': self.key,
+            'Depot': self.depotPath,
+            'Sysimage': self.sysimage or 'None',
+            'Cache': cache
+        }
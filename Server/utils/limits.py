@@ -0,0 +1,328 @@
+# limits.py
+from typing import Callable, Dict, List, Union, Any
+import os
+import time
+import shutil
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+from .settings import loadSettings
+from .processes import PRIORITY_CLASSES, setPriority
+
+# Limits: key -> window key; value -> (settings key, unit in bytes/seconds)
+LIMIT_FIELDS = {
+    "limitTime": ("wallClockHours", 3600),
+    "limitMemory": ("memoryGB", 1024 ** 3),
+    "limitCpus": ("cpus", 1),
+    "limitDisk": ("diskGB", 1024 ** 3)
+}
+# cgroup v2 unified hierarchy
+CGROUP_CONTROLLERS = '/sys/fs/cgroup/cgroup.controllers'
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+class ResourceLimits(object):
+    """Limits of a replication run: wall-clock time (seconds), memory
+    (bytes), CPU share (number of CPUs) and growth of the replication
+    folder (bytes). A value of 0 means no limit
+    """
+
+    def __init__(
+        self,
+        wallClock: float = 0,
+        memory: float = 0,
+        cpus: float = 0,
+        disk: float = 0
+    ) -> None:
+
+        self.wallClock = wallClock
+        self.memory = memory
+        self.cpus = cpus
+        self.disk = disk
+
+    @classmethod
+    def fromValues(cls, values: Dict[str, Any]) -> 'ResourceLimits':
+        """Creates the limits of a run from the window values. Project
+        limits (settings file) are the default, and the maximum
+        allowed for each run
+
+        Parameters
+        ----------
+        values : Dict[str, Any]
+            window values
+
+        Returns
+        -------
+        ResourceLimits
+            limits of the run
+        """
+        projectLimits = loadSettings()['limits']
+        limits = dict()
+        for key, (settingsKey, unit) in LIMIT_FIELDS.items():
+            projectValue = float(projectLimits.get(settingsKey, 0))
+            runValue = float(values.get(key) or 0)
+            if projectValue and runValue:
+                value = min(projectValue, runValue)
+            else:
+                value = projectValue or runValue
+            limits[settingsKey] = value * unit
+
+        return cls(
+            wallClock=limits['wallClockHours'],
+            memory=limits['memoryGB'],
+            cpus=limits['cpus'],
+            disk=limits['diskGB']
+        )
+
+    def __bool__(self) -> bool:
+        return any((self.wallClock, self.memory, self.cpus, self.disk))
+
+    def describe(self) -> Dict[str, str]:
+        """Describes the limits
+
+        Returns
+        -------
+        Dict[str, str]
+            limit name and value
+        """
+        return {
+            'Wall-clock': f'{self.wallClock / 3600:g} hours' if self.wallClock else 'None',
+            'Memory': f'{self.memory / 1024 ** 3:g} GB' if self.memory else 'None',
+            'CPUs': f'{self.cpus:g}' if self.cpus else 'None',
+            'Disk growth': f'{self.disk / 1024 ** 3:g} GB' if self.disk else 'None'
+        }
+
+
+def getLimitsBackend() -> str:
+    """Gets the mechanism used to apply the memory and CPU limits:
+    'cgroup' (cgroup v2 through a systemd scope), 'prlimit' (resource
+    limits of the process) or the one defined in the settings. The
+    watchdog is always used for wall-clock time and disk growth
+
+    Returns
+    -------
+    str
+        'cgroup' or 'prlimit'
+    """
+    backend = loadSettings()['limitsBackend']
+    if backend != 'auto':
+        return backend
+    if os.path.isfile(CGROUP_CONTROLLERS) and shutil.which('systemd-run'):
+        return 'cgroup'
+
+    return 'prlimit'
+
+
+def wrapCommand(
+    args: List[str],
+    limits: ResourceLimits,
+    backend: str,
+    priority: str = 'normal'
+) -> List[str]:
+    """Wraps a command to run it in a transient systemd scope with the
+    memory and CPU limits and the CPU and I/O weights of the priority
+    class (cgroup v2 backend)
+
+    Parameters
+    ----------
+    args : List[str]
+        command arguments
+    limits : ResourceLimits
+        limits of the run
+    backend : str
+        limits backend
+    priority : str, optional
+        priority class (see processes.PRIORITY_CLASSES), by default
+        'normal'
+
+    Returns
+    -------
+    List[str]
+        command arguments
+    """
+    if backend != 'cgroup' or not (limits.memory or limits.cpus or priority != 'normal'):
+        return args
+    properties = list()
+    if priority != 'normal':
+        weight = PRIORITY_CLASSES[priority][3]
+        properties.extend(['-p', f'CPUWeight={weight}', '-p', f'IOWeight={weight}'])
+    if limits.memory:
+        properties.extend(['-p', f'MemoryMax={int(limits.memory)}', '-p', 'MemorySwapMax=0'])
+    if limits.cpus:
+        properties.extend(['-p', f'CPUQuota={int(limits.cpus * 100)}%'])
+
+    return ['systemd-run', '--user', '--scope', '--quiet', *properties, '--', *args]
+
+
+def getPreexecFunction(
+    limits: ResourceLimits,
+    backend: str,
+    cpus: Union[List[int], None] = None,
+    priority: str = 'normal'
+) -> Callable[[], None]:
+    """Gets the function run in the child process before the command:
+    creates a new session (process group), binds the process to the
+    CPUs allocated, lowers its CPU and I/O priority (inherited by the
+    processes it starts) and, with the prlimit backend, sets the
+    data segment limit of the process (RLIMIT_DATA: memory allocated,
+    not the address space reserved, which runtimes like Julia, the JVM
+    or Go reserve far beyond what they use)
+
+    Parameters
+    ----------
+    limits : ResourceLimits
+        limits of the run
+    backend : str
+        limits backend
+    cpus : List[int] | None, optional
+        CPUs the process is bound to, by default None
+    priority : str, optional
+        priority class (see processes.PRIORITY_CLASSES), by default
+        'normal'
+
+    Returns
+    -------
+    Callable[[], None]
+        function for `subprocess.Popen(preexec_fn=...)`
+    """
+    def preexec() -> None:
+        os.setsid()
+        if cpus and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cpus)
+        setPriority(priority)
+        if backend == 'prlimit' and limits.memory and resource:
+            memory = int(limits.memory)
+            resource.setrlimit(resource.RLIMIT_DATA, (memory, memory))
+
+    return preexec
+
+
+def getProcessGroupsMemory(pgids: List[int]) -> int:
+    """Gets the resident memory of every process in the process
+    groups
+
+    Parameters
+    ----------
+    pgids : List[int]
+        process groups
+
+    Returns
+    -------
+    int
+        resident memory in bytes
+    """
+    memory = 0
+    pgids = set(pgids)
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f'/proc/{pid}/stat', 'rb') as f:
+                # the command name may contain spaces; fields start after ')'
+                fields = f.read().rsplit(b')', 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[2]) in pgids:
+            memory += int(fields[21]) * PAGE_SIZE
+
+    return memory
+
+
+def getFolderSize(folder: str) -> int:
+    """Gets the size of a folder in bytes
+
+    Parameters
+    ----------
+    folder : str
+        folder
+
+    Returns
+    -------
+    int
+        size in bytes
+    """
+    size = 0
+    for root, _, files in os.walk(folder):
+        for file in files:
+            try:
+                size += os.lstat(os.path.join(root, file)).st_size
+            except OSError:
+                pass
+
+    return size
+
+
+class Watchdog(object):
+    """Checks the limits of a run while it is running. Memory is
+    checked every `limitsCheckInterval` seconds and the replication
+    folder every `diskCheckInterval` seconds. Peaks are recorded
+    for the report
+    """
+
+    def __init__(self, limits: ResourceLimits, replicationPath: str) -> None:
+
+        settings = loadSettings()
+        self._limits = limits
+        self._replicationPath = replicationPath
+        self._checkInterval = settings['limitsCheckInterval']
+        self._diskInterval = settings['diskCheckInterval']
+        self._startTime = time.time()
+        self._initialSize = getFolderSize(replicationPath) if limits.disk else 0
+        self._lastCheck = 0.0
+        self._lastDiskCheck = self._startTime
+        self.peakMemory = 0
+        self.peakDisk = 0
+        self.exceeded = ''
+        # time paused (see pause and resume), not counted as wall-clock
+        self.pausedTime = 0.0
+        self._pausedAt = None
+
+    def pause(self) -> None:
+        """Stops counting the wall-clock time (run paused)"""
+        if self._pausedAt is None:
+            self._pausedAt = time.time()
+
+    def resume(self) -> None:
+        """Counts the wall-clock time again (run resumed)"""
+        if self._pausedAt is not None:
+            self.pausedTime += time.time() - self._pausedAt
+            self._pausedAt = None
+
+    def check(self, pgids: List[int]) -> Union[str, None]:
+        """Checks the limits
+
+        Parameters
+        ----------
+        pgids : List[int]
+            process groups of the run
+
+        Returns
+        -------
+        str | None
+            description of the limit exceeded, or None
+        """
+        now = time.time()
+        if self.exceeded or now - self._lastCheck < self._checkInterval:
+            return None
+        self._lastCheck = now
+        if self._pausedAt is not None:
+            return None
+        if self._limits.wallClock and now - self._startTime - self.pausedTime > self._limits.wallClock:
+            self.exceeded = f'Wall-clock time limit exceeded ({self._limits.describe()["Wall-clock"]})'
+            return self.exceeded
+        if pgids:
+            memory = getProcessGroupsMemory(pgids)
+            self.peakMemory = max(self.peakMemory, memory)
+            if self._limits.memory and memory > self._limits.memory:
+                self.exceeded = f'Memory limit exceeded ({self._limits.describe()["Memory"]})'
+                return self.exceeded
+        if self._limits.disk and now - self._lastDiskCheck >= self._diskInterval:
+            self._lastDiskCheck = now
+            growth = getFolderSize(self._replicationPath) - self._initialSize
+            self.peakDisk = max(self.peakDisk, growth)
+            if growth > self._limits.disk:
+                self.exceeded = f'Disk growth limit exceeded ({self._limits.describe()["Disk growth"]})'
+                return self.exceeded
+
+        return None
@@ -0,0 +1,172 @@
+# numbering.py
+from typing import Generator, Tuple, Any
+import os
+import re
+import shutil
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+# Counter file (under the replications folder) with the last number allocated
+COUNTER_FILE = '.counter'
+# Replications per shard. Replications numbered from SHARD_SIZE onwards are
+# placed in sub-folders (e.g. Replications/Rep1000-1999/Rep1234)
+SHARD_SIZE = 1000
+REPLICATION_REGEX = r'^Rep(\d+)$'
+SHARD_REGEX = r'^Rep(\d+)-(\d+)$'
+
+
+def getReplicationFolder(replicationsPath: str, number: int) -> str:
+    """Gets the folder of a replication number
+
+    Parameters
+    ----------
+    replicationsPath : str
+        path for replications
+    number : int
+        replication number
+
+    Returns
+    -------
+    str
+        replication folder
+    """
+    if number < SHARD_SIZE:
+        return os.path.join(replicationsPath, f'Rep{number:03}')
+    shardStart = number // SHARD_SIZE * SHARD_SIZE
+    shard = f'Rep{shardStart}-{shardStart + SHARD_SIZE - 1}'
+
+    return os.path.join(replicationsPath, shard, f'Rep{number}')
+
+
+def iterReplicationFolders(replicationsPath: str) -> Generator[Tuple[int, str], Any, Any]:
+    """Yields the replication folders (including the ones in
+    shards). Entries that do not follow the naming convention
+    are ignored
+
+    Parameters
+    ----------
+    replicationsPath : str
+        path for replications
+
+    Yields
+    ------
+    Tuple[int, str]
+        replication number and folder
+    """
+    if not os.path.isdir(replicationsPath):
+        return
+    with os.scandir(replicationsPath) as content:
+        for item in content:
+            if not item.is_dir():
+                continue
+            match = re.search(REPLICATION_REGEX, item.name)
+            if match:
+                yield int(match[1]), item.path
+            elif re.search(SHARD_REGEX, item.name):
+                yield from iterReplicationFolders(item.path)
+
+
+def _readCounter(counterHandler: object, replicationsPath: str) -> int:
+    """Reads the last number allocated. If the counter file is
+    empty (first allocation, or replications created by older
+    versions of the app), the replications folder is scanned once
+
+    Parameters
+    ----------
+    counterHandler : io.TextIOWrapper
+        counter file handler
+    replicationsPath : str
+        path for replications
+
+    Returns
+    -------
+    int
+        last number allocated
+    """
+    counterHandler.seek(0)
+    content = counterHandler.read().strip()
+    if content.isdigit():
+        return int(content)
+
+    return max([number for number, _ in iterReplicationFolders(replicationsPath)], default=0)
+
+
+def allocateReplicationFolder(replicationsPath: str) -> str:
+    """Allocates the next replication number and creates its folder.
+    The counter file is locked while the number is allocated, and the
+    folder is created with `os.mkdir`, which fails if the folder exists
+    (e.g. created by a user without the lock), in which case the next
+    number is tried. Concurrent users never get the same folder
+
+    Parameters
+    ----------
+    replicationsPath : str
+        path for replications
+
+    Returns
+    -------
+    str
+        replication folder created
+    """
+    os.makedirs(replicationsPath, exist_ok=True)
+    counterPath = os.path.join(replicationsPath, COUNTER_FILE)
+    with open(counterPath, 'a+') as counter:
+        if fcntl:
+            fcntl.flock(counter, fcntl.LOCK_EX)
+        try:
+            number = _readCounter(counter, replicationsPath)
+            while True:
+                number += 1
+                folder = getReplicationFolder(replicationsPath, number)
+                os.makedirs(os.path.dirname(folder), exist_ok=True)
+                try:
+                    os.mkdir(folder)
+                except FileExistsError:
+                    continue
+                break
+            counter.seek(0)
+            counter.truncate()
+            counter.write(str(number))
+            counter.flush()
+            os.fsync(counter.fileno())
+        finally:
+            if fcntl:
+                fcntl.flock(counter, fcntl.LOCK_UN)
+
+    return folder
+
+
+def releaseReplicationFolder(replicationsPath: str, folder: str) -> None:
+    """Removes the folder of a replication that was never run (e.g.
+    its preparation failed). Its number is allocated again if no
+    later number was allocated meanwhile (the counter is locked)
+
+    Parameters
+    ----------
+    replicationsPath : str
+        path for replications
+    folder : str
+        replication folder (see allocateReplicationFolder)
+    """
+    counterPath = os.path.join(replicationsPath, COUNTER_FILE)
+    match = re.search(REPLICATION_REGEX, os.path.basename(folder))
+    if not match or not os.path.isfile(counterPath):
+        shutil.rmtree(folder, ignore_errors=True)
+        return
+    number = int(match[1])
+    with open(counterPath, 'r+') as counter:
+        if fcntl:
+            fcntl.flock(counter, fcntl.LOCK_EX)
+        try:
+            shutil.rmtree(folder, ignore_errors=True)
+            if _readCounter(counter, replicationsPath) == number and not os.path.exists(folder):
+                counter.seek(0)
+                counter.truncate()
+                counter.write(str(number - 1))
+                counter.flush()
+                os.fsync(counter.fileno())
+        finally:
+            if fcntl:
+                fcntl.flock(counter, fcntl.LOCK_UN)
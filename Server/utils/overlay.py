@@ -0,0 +1,219 @@
+# overlay.py
+from typing import List
+import os
+import shutil
+import subprocess
+from .settings import loadSettings
+from .ignore import IgnoreRules
+from .runtimes import SIF_RUNTIMES
+
+# Backends of the overlay: fuse-overlayfs mounted on the host, or
+# mounted in the container by Singularity/Apptainer (--fusemount)
+OVERLAY_BACKENDS = ('fuse-overlayfs', 'singularity')
+# Program that mounts the overlay
+OVERLAY_PROGRAM = 'fuse-overlayfs'
+# Prefix of whiteout files (entries of the lower layer hidden in the
+# overlay)
+WHITEOUT_PREFIX = '.wh.'
+# Seconds allowed to mount and unmount the overlay
+OVERLAY_TIMEOUT = 30
+
+
+class OverlayError(RuntimeError):
+    """Raised when the overlay cannot be mounted or unmounted"""
+
+
+class Overlay(object):
+    """Replication folder mounted as an overlay: the main folder is the
+    read-only lower layer and the replication folder is the upper
+    layer, so files are not copied and the replication folder ends up
+    with the files written by the run (and the files of the app).
+
+    With the fuse-overlayfs backend the overlay is mounted over the
+    replication folder on the host while the replication runs: the
+    folder is moved to a hidden upper folder (`.RepNNN.upper`) and
+    moved back when the overlay is released. With the singularity
+    backend the overlay is only mounted in the container, and the
+    replication folder is the upper layer
+    """
+
+    def __init__(self, lowerPath: str, replicationPath: str, backend: str = 'fuse-overlayfs') -> None:
+
+        if backend not in OVERLAY_BACKENDS:
+            raise ValueError(f'Unknown overlay backend "{backend}"')
+        self.lowerPath = os.path.normpath(lowerPath)
+        self.replicationPath = os.path.normpath(replicationPath)
+        self.backend = backend
+        parentPath, name = os.path.split(self.replicationPath)
+        self.workPath = os.path.join(parentPath, f'.{name}.work')
+        self.upperPath = self.replicationPath
+        self.mounted = False
+        self.whiteouts = list()
+
+    def isAvailable(self) -> bool:
+        """Checks if fuse-overlayfs is installed (on the host; with the
+        singularity backend it runs on the host too, see --fusemount)
+
+        Returns
+        -------
+        bool
+            True if fuse-overlayfs is found
+        """
+        return bool(shutil.which(OVERLAY_PROGRAM))
+
+    def prepare(self, ignoreRules: IgnoreRules) -> None:
+        """Creates the work folder and hides the entries of the main
+        folder matched by the ignore rules (top level only), including
+        the folder of the replications, whose view through the overlay
+        would contain the overlay itself
+
+        Parameters
+        ----------
+        ignoreRules : IgnoreRules
+            ignore rules of the main folder
+        """
+        os.makedirs(self.workPath, exist_ok=True)
+        replicationsFolder = os.path.relpath(self.replicationPath, self.lowerPath).split(os.sep)[0]
+        with os.scandir(self.lowerPath) as content:
+            for item in content:
+                if item.name == replicationsFolder or ignoreRules.matches(item.name, isFolder=item.is_dir()):
+                    self._addWhiteout(item.name)
+
+    def _addWhiteout(self, name: str) -> None:
+        """Hides an entry of the lower layer (whiteout file)"""
+        whiteout = os.path.join(self.replicationPath, WHITEOUT_PREFIX + name)
+        open(whiteout, 'w').close()
+        self.whiteouts.append(WHITEOUT_PREFIX + name)
+
+    def getOptions(self) -> str:
+        """Gets the mount options (layers) of fuse-overlayfs
+
+        Returns
+        -------
+        str
+            mount options
+
+        Raises
+        ------
+        OverlayError
+            if a path cannot be used in the options
+        """
+        paths = (self.lowerPath, self.upperPath, self.workPath)
+        if any(',' in path or ':' in path for path in paths):
+            raise OverlayError('Paths of the overlay layers cannot contain "," or ":"')
+
+        return f'lowerdir={self.lowerPath},upperdir={self.upperPath},workdir={self.workPath}'
+
+    def getFuseMount(self) -> List[str]:
+        """Gets the options of Singularity/Apptainer that mount the
+        overlay over the replication folder in the container
+
+        Returns
+        -------
+        List[str]
+            runtime options
+        """
+        return ['--fusemount', f'host:{OVERLAY_PROGRAM} -o {self.getOptions()} {self.replicationPath}']
+
+    def mount(self) -> None:
+        """Mounts the overlay over the replication folder on the host
+        (fuse-overlayfs backend). The replication folder is moved to
+        the upper folder first
+
+        Raises
+        ------
+        OverlayError
+            if the overlay is not mounted
+        """
+        if self.backend != 'fuse-overlayfs' or self.mounted:
+            return
+        parentPath, name = os.path.split(self.replicationPath)
+        self.upperPath = os.path.join(parentPath, f'.{name}.upper')
+        os.replace(self.replicationPath, self.upperPath)
+        os.mkdir(self.replicationPath)
+        try:
+            result = subprocess.run(
+                [OVERLAY_PROGRAM, '-o', self.getOptions(), self.replicationPath],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                timeout=OVERLAY_TIMEOUT
+            )
+        except (OSError, subprocess.TimeoutExpired) as error:
+            self._restoreUpper()
+            raise OverlayError(f'Overlay not mounted: {error}')
+        if result.returncode:
+            self._restoreUpper()
+            raise OverlayError(f'Overlay not mounted: {result.stdout.decode(errors="replace").strip()}')
+        self.mounted = True
+
+    def _restoreUpper(self) -> None:
+        """Moves the upper folder back to the replication folder"""
+        os.rmdir(self.replicationPath)
+        os.replace(self.upperPath, self.replicationPath)
+        self.upperPath = self.replicationPath
+
+    def unmount(self) -> None:
+        """Unmounts the overlay (lazily if it is still busy, e.g. by
+        processes left by the run) and moves the upper folder back to
+        the replication folder
+
+        Raises
+        ------
+        OverlayError
+            if the overlay is not unmounted
+        """
+        if not self.mounted:
+            return
+        program = shutil.which('fusermount3') or shutil.which('fusermount') or 'fusermount'
+        for options in (['-u'], ['-u', '-z']):
+            try:
+                result = subprocess.run(
+                    [program, *options, self.replicationPath],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    timeout=OVERLAY_TIMEOUT
+                )
+            except (OSError, subprocess.TimeoutExpired):
+                continue
+            if result.returncode == 0:
+                self.mounted = False
+                self._restoreUpper()
+                return
+
+        raise OverlayError(f'Overlay not unmounted (the files are in {self.upperPath})')
+
+    def release(self) -> None:
+        """Unmounts the overlay and removes the work folder and the
+        whiteouts, so the replication folder holds the upper layer:
+        the files written by the run and the files of the app
+        """
+        self.unmount()
+        for whiteout in self.whiteouts:
+            try:
+                os.remove(os.path.join(self.replicationPath, whiteout))
+            except OSError:
+                pass
+        self.whiteouts = list()
+        shutil.rmtree(self.workPath, ignore_errors=True)
+
+
+def getOverlayBackend(runtime: str) -> str:
+    """Gets the overlay backend of a runtime: the `overlayBackend`
+    setting, or (auto) the singularity backend for SIF runtimes and
+    fuse-overlayfs otherwise
+
+    Parameters
+    ----------
+    runtime : str
+        runtime name
+
+    Returns
+    -------
+    str
+        overlay backend
+    """
+    backend = loadSettings()['overlayBackend']
+    if backend == 'auto':
+        return 'singularity' if runtime in SIF_RUNTIMES else 'fuse-overlayfs'
+
+    return backend
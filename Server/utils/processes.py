@@ -0,0 +1,403 @@
+# processes.py
+from typing import Any, Dict, List, Set, Tuple, Union
+import os
+import time
+import signal
+import ctypes
+import platform
+import subprocess
+
+# Number of the ioprio_set system call (not exposed by the os module)
+IOPRIO_SET_SYSCALLS = {
+    "x86_64": 251,
+    "aarch64": 30,
+    "ppc64le": 273
+}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_SHIFT = 13
+# I/O scheduling classes
+IOPRIO_CLASSES = {
+    "realtime": 1,
+    "best-effort": 2,
+    "idle": 3
+}
+# Priority classes of the runs: nice value, I/O class and level, and
+# cgroup weights (CPUWeight, IOWeight) with the cgroup limits backend
+PRIORITY_CLASSES = {
+    "normal": (0, "best-effort", 4, 100),
+    "low": (10, "best-effort", 7, 50),
+    "background": (19, "idle", 0, 10)
+}
+# Seconds allowed for the processes to end after SIGKILL
+KILL_TIMEOUT = 5.0
+# Seconds between checks of the processes while terminating
+TERMINATION_INTERVAL = 0.1
+
+
+def signalProcessGroup(process: object, sig: int) -> None:
+    """Sends a signal to the process group(s) of a replication.
+    Runners other than `subprocess.Popen` (e.g. stages run in
+    parallel) handle the signal themselves
+
+    Parameters
+    ----------
+    process : subprocess.Popen | object
+        replication process
+    sig : int
+        signal
+    """
+    if isinstance(process, subprocess.Popen):
+        try:
+            os.killpg(os.getpgid(process.pid), sig)
+        except ProcessLookupError:
+            pass
+    else:
+        process.send_signal(sig)
+
+
+def setIoPriority(ioClass: str, level: int = 0, pid: int = 0) -> bool:
+    """Sets the I/O scheduling class of a process (Linux). Threads
+    have their own class, so a pid of 0 sets the calling thread
+
+    Parameters
+    ----------
+    ioClass : str
+        class (see IOPRIO_CLASSES)
+    level : int, optional
+        priority within the class (0 to 7, best-effort and realtime),
+        by default 0
+    pid : int, optional
+        process or thread id, by default 0 (calling thread)
+
+    Returns
+    -------
+    bool
+        True if the class was set
+    """
+    number = IOPRIO_SET_SYSCALLS.get(platform.machine())
+    if number is None:
+        return False
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+    except OSError:
+        return False
+    value = (IOPRIO_CLASSES[ioClass] << IOPRIO_CLASS_SHIFT) | level
+
+    return libc.syscall(number, IOPRIO_WHO_PROCESS, pid, value) == 0
+
+
+def lowerThreadPriority() -> None:
+    """Lowers the CPU (nice 19) and I/O (idle class) priority of the
+    calling thread, for background work that must not slow down the
+    app or the replications running
+    """
+    try:
+        # on Linux the nice value of a thread id applies to the thread
+        os.setpriority(os.PRIO_PROCESS, 0, 19)
+    except (AttributeError, OSError):
+        pass
+    setIoPriority('idle')
+
+
+def setPriority(priority: str, pid: int = 0) -> None:
+    """Applies a priority class (CPU and I/O) to a process or thread.
+    Priorities are only lowered: the normal class leaves them as they
+    are
+
+    Parameters
+    ----------
+    priority : str
+        priority class (see PRIORITY_CLASSES)
+    pid : int, optional
+        process or thread id, by default 0 (calling thread)
+    """
+    niceValue, ioClass, level, _ = PRIORITY_CLASSES[priority]
+    if priority == 'normal':
+        return
+    try:
+        if os.getpriority(os.PRIO_PROCESS, pid) < niceValue:
+            os.setpriority(os.PRIO_PROCESS, pid, niceValue)
+    except (AttributeError, OSError):
+        pass
+    setIoPriority(ioClass, level, pid)
+
+
+def signalProcessTree(process: object, sig: int) -> None:
+    """Sends a signal to the process groups of a replication and to
+    every descendant (e.g. SIGSTOP and SIGCONT, which are not
+    forwarded by the processes). Runners without local processes
+    handle the signal themselves
+
+    Parameters
+    ----------
+    process : subprocess.Popen | object
+        replication process
+    sig : int
+        signal
+    """
+    signalProcessGroup(process, sig)
+    roots = [process.pid] if isinstance(process, subprocess.Popen) else list(getattr(process, 'pids', []))
+    if not roots:
+        return
+    for pid, stat in getProcessTree(roots).items():
+        if stat[0] != 'Z':
+            try:
+                os.kill(pid, sig)
+            except (ProcessLookupError, PermissionError):
+                pass
+
+
+class RunPause(object):
+    """Pauses the processes of a run (SIGSTOP to the process groups and
+    every descendant, see signalProcessTree) and continues them
+    (SIGCONT), counting the time paused
+    """
+
+    def __init__(self) -> None:
+
+        self._pausedAt = None
+        self._pausedSeconds = 0.0
+
+    def start(self, process: object) -> bool:
+        """Pauses the processes of a run
+
+        Parameters
+        ----------
+        process : subprocess.Popen | object
+            replication process
+
+        Returns
+        -------
+        bool
+            True if paused (False if already paused)
+        """
+        if self._pausedAt is not None:
+            return False
+        signalProcessTree(process, signal.SIGSTOP)
+        self._pausedAt = time.time()
+
+        return True
+
+    def end(self, process: Union[object, None] = None) -> bool:
+        """Ends the pause and continues the processes of the run
+
+        Parameters
+        ----------
+        process : subprocess.Popen | object, optional
+            replication process, by default None (the time paused is
+            counted, but no signal is sent, e.g. when terminated)
+
+        Returns
+        -------
+        bool
+            True if the run was paused
+        """
+        if self._pausedAt is None:
+            return False
+        if process is not None:
+            signalProcessTree(process, signal.SIGCONT)
+        self._pausedSeconds += time.time() - self._pausedAt
+        self._pausedAt = None
+
+        return True
+
+    @property
+    def active(self) -> bool:
+        """True if the run is paused"""
+        return self._pausedAt is not None
+
+    @property
+    def pausedTime(self) -> float:
+        """Time paused in seconds (including the current pause)"""
+        if self._pausedAt is None:
+            return self._pausedSeconds
+        return self._pausedSeconds + time.time() - self._pausedAt
+
+
+def _readStat(pid: int) -> Union[Tuple[str, int, int, int], None]:
+    """Reads the state, parent, process group and start time of a
+    process (/proc/<pid>/stat)
+
+    Parameters
+    ----------
+    pid : int
+        process id
+
+    Returns
+    -------
+    Tuple[str, int, int, int] | None
+        state, parent id, process group and start time (clock ticks
+        since boot), or None if the process does not exist
+    """
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            # the command name may contain spaces; fields start after ')'
+            fields = f.read().rsplit(b')', 1)[1].split()
+    except (OSError, IndexError):
+        return None
+
+    return fields[0].decode(), int(fields[1]), int(fields[2]), int(fields[19])
+
+
+def _getCgroupProcesses(pid: int) -> Set[int]:
+    """Gets the processes of the cgroup of a process, if it runs in
+    a cgroup of its own (systemd scope of the cgroup limits backend)
+
+    Parameters
+    ----------
+    pid : int
+        process id
+
+    Returns
+    -------
+    Set[int]
+        process ids (empty if the cgroup is shared or unknown)
+    """
+    try:
+        with open(f'/proc/{pid}/cgroup', 'r') as f:
+            path = f.readline().strip().split(':', 2)[2]
+        with open(f'/proc/{os.getpid()}/cgroup', 'r') as f:
+            ownPath = f.readline().strip().split(':', 2)[2]
+    except (OSError, IndexError):
+        return set()
+    if path == ownPath or not path.endswith('.scope'):
+        return set()
+    try:
+        with open(os.path.join('/sys/fs/cgroup', path.lstrip('/'), 'cgroup.procs'), 'r') as f:
+            return {int(line) for line in f if line.strip()}
+    except (OSError, ValueError):
+        return set()
+
+
+def getProcessTree(pids: List[int]) -> Dict[int, Tuple[str, int, int, int]]:
+    """Gets the processes of a replication: the process groups of the
+    processes given, their descendants and the processes of their
+    cgroup (if they run in a systemd scope), with a single scan of /proc
+
+    Parameters
+    ----------
+    pids : List[int]
+        processes started by the app (process group leaders)
+
+    Returns
+    -------
+    Dict[int, Tuple[str, int, int, int]]
+        process id and stat (see _readStat)
+    """
+    processes = dict()
+    for name in os.listdir('/proc'):
+        if name.isdigit():
+            stat = _readStat(int(name))
+            if stat:
+                processes[int(name)] = stat
+    pgids = set(pids)
+    members = {pid for pid, stat in processes.items() if pid in pgids or stat[2] in pgids}
+    for pid in pids:
+        members.update(_getCgroupProcesses(pid))
+    children = dict()
+    for pid, stat in processes.items():
+        children.setdefault(stat[1], list()).append(pid)
+    pending = list(members)
+    while pending:
+        for child in children.get(pending.pop(), []):
+            if child not in members:
+                members.add(child)
+                pending.append(child)
+
+    return {pid: processes[pid] for pid in members if pid in processes}
+
+
+def terminateProcess(process: object, gracePeriod: float) -> Dict[str, Any]:
+    """Terminates a replication: SIGTERM to the process groups and to
+    every descendant, then SIGKILL to the processes left after the
+    grace period. The processes are tracked through /proc (and the
+    cgroup of the run), so descendants that left the process groups or
+    whose parent died are stopped too. Zombies count as ended: the
+    processes started by the app are reaped by their runner (poll),
+    the others by their parent or init. Runners without local
+    processes (Slurm jobs, runs of the daemon) are cancelled through
+    the runner
+
+    Parameters
+    ----------
+    process : subprocess.Popen | object
+        replication process
+    gracePeriod : float
+        seconds allowed for the processes to end after SIGTERM
+
+    Returns
+    -------
+    Dict[str, Any]
+        how the run ended: last 'signal' sent (SIGTERM or SIGKILL, or
+        'cancel' for runners without local processes),
+        'duration' of the shutdown in seconds, number of 'processes'
+        stopped and 'survivors' (processes still running)
+    """
+    started = time.time()
+    if isinstance(process, subprocess.Popen):
+        roots = [process.pid]
+    else:
+        roots = list(getattr(process, 'pids', []))
+    if not roots:
+        signalProcessGroup(process, signal.SIGTERM)
+        return {'signal': 'cancel', 'duration': 0.0, 'processes': 0, 'survivors': []}
+    # processes are identified by id and start time (ids are reused)
+    tracked = {pid: stat[3] for pid, stat in getProcessTree(roots).items() if stat[0] != 'Z'}
+    seen = set(tracked)
+    for sig, timeout in ((signal.SIGTERM, gracePeriod), (signal.SIGKILL, KILL_TIMEOUT)):
+        signalProcessGroup(process, sig)
+        for pid in tracked:
+            try:
+                os.kill(pid, sig)
+                if sig == signal.SIGTERM:
+                    # paused processes only handle SIGTERM once continued
+                    os.kill(pid, signal.SIGCONT)
+            except (ProcessLookupError, PermissionError):
+                pass
+        deadline = time.time() + timeout
+        while True:
+            if isinstance(process, subprocess.Popen):
+                process.poll()
+            tracked = _getRunning(tracked, roots)
+            seen.update(tracked)
+            if not tracked or time.time() >= deadline:
+                break
+            time.sleep(TERMINATION_INTERVAL)
+        if not tracked:
+            break
+    if isinstance(process, subprocess.Popen):
+        process.poll()
+
+    return {
+        'signal': sig.name,
+        'duration': time.time() - started,
+        'processes': len(seen),
+        'survivors': sorted(tracked)
+    }
+
+
+def _getRunning(tracked: Dict[int, int], roots: List[int]) -> Dict[int, int]:
+    """Gets the processes tracked that are still running (not
+    zombies), adding their new descendants
+
+    Parameters
+    ----------
+    tracked : Dict[int, int]
+        process id and start time
+    roots : List[int]
+        processes started by the app
+
+    Returns
+    -------
+    Dict[int, int]
+        process id and start time of the processes running
+    """
+    running = dict()
+    for pid, stat in getProcessTree(roots + list(tracked)).items():
+        if pid in tracked and stat[3] != tracked[pid]:
+            # id reused by another process
+            continue
+        if stat[0] != 'Z':
+            running[pid] = stat[3]
+
+    return running
@@ -0,0 +1,247 @@
+# progress.py
+from typing import Callable, Dict, Union, Any
+import os
+import time
+import errno
+import shutil
+import threading
+from datetime import timedelta
+
+# Chunk size used to copy files (progress and cancellation are checked
+# between chunks)
+COPY_CHUNK_SIZE = 8 * 1024 ** 2
+# Errors of copy_file_range and sendfile when the files do not support
+# them (e.g. other filesystems), the next way of copying is used then
+COPY_FALLBACK_ERRORS = (errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTSUP)
+# Minimum interval (seconds) between progress reports
+REPORT_INTERVAL = 0.25
+
+
+class PreparationCancelled(Exception):
+    """Raised when the preparation of a replication is cancelled"""
+
+
+def formatBytes(size: float) -> str:
+    """Formats a number of bytes
+
+    Parameters
+    ----------
+    size : float
+        number of bytes
+
+    Returns
+    -------
+    str
+        formatted size (e.g. 1.2 GB)
+    """
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f'{size:.1f} {unit}'
+        size /= 1024
+
+    return f'{size:.1f} TB'
+
+
+class CopyProgress(object):
+    """Tracks the progress of the preparation of a replication
+    (files and bytes copied, throughput and ETA) and reports it
+    through a callback
+    """
+
+    def __init__(
+        self,
+        callback: Union[Callable[[Dict[str, Any]], None], None] = None,
+        cancelEvent: Union[threading.Event, None] = None
+    ) -> None:
+
+        self._callback = callback
+        self._cancelEvent = cancelEvent
+        self.phase = ''
+        self.totalFiles = 0
+        self.totalBytes = 0
+        self.copiedFiles = 0
+        self.copiedBytes = 0
+        self._startTime = time.time()
+        self._lastReport = 0.0
+
+    def setPhase(self, phase: str) -> None:
+        """Sets the current phase of the preparation
+
+        Parameters
+        ----------
+        phase : str
+            phase description
+        """
+        self.phase = phase
+        self.report(force=True)
+
+    def setTotals(self, totalFiles: int, totalBytes: int) -> None:
+        """Sets the number of files and bytes to copy
+
+        Parameters
+        ----------
+        totalFiles : int
+            number of files
+        totalBytes : int
+            number of bytes
+        """
+        self.totalFiles = totalFiles
+        self.totalBytes = totalBytes
+        self._startTime = time.time()
+        self.report(force=True)
+
+    def checkCancelled(self) -> None:
+        """Raises an exception if the preparation was cancelled
+
+        Raises
+        ------
+        PreparationCancelled
+            if the preparation was cancelled
+        """
+        if self._cancelEvent is not None and self._cancelEvent.is_set():
+            raise PreparationCancelled('Preparation cancelled')
+
+    @property
+    def throughput(self) -> float:
+        """Bytes copied per second"""
+        elapsed = time.time() - self._startTime
+
+        return self.copiedBytes / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Union[float, None]:
+        """Seconds to finish copying (None if unknown)"""
+        if not self.throughput:
+            return None
+
+        return (self.totalBytes - self.copiedBytes) / self.throughput
+
+    @property
+    def percentage(self) -> int:
+        """Percentage of bytes (or files, if empty) copied"""
+        if self.totalBytes:
+            return int(100 * self.copiedBytes / self.totalBytes)
+        if self.totalFiles:
+            return int(100 * self.copiedFiles / self.totalFiles)
+
+        return 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Gets the current progress
+
+        Returns
+        -------
+        Dict[str, Any]
+            progress (phase, files, bytes, throughput, ETA, percentage
+            and a text description)
+        """
+        text = self.phase
+        if self.totalFiles:
+            eta = '--:--:--' if self.eta is None else str(timedelta(seconds=round(self.eta)))
+            text += (
+                f': {self.copiedFiles}/{self.totalFiles} files, '
+                f'{formatBytes(self.copiedBytes)}/{formatBytes(self.totalBytes)}, '
+                f'{formatBytes(self.throughput)}/s, ETA {eta}'
+            )
+
+        return {
+            'phase': self.phase,
+            'copiedFiles': self.copiedFiles,
+            'totalFiles': self.totalFiles,
+            'copiedBytes': self.copiedBytes,
+            'totalBytes': self.totalBytes,
+            'throughput': self.throughput,
+            'eta': self.eta,
+            'percentage': self.percentage,
+            'text': text
+        }
+
+    def report(self, force: bool = False) -> None:
+        """Reports the progress through the callback (at most once
+        every REPORT_INTERVAL seconds, unless forced)
+
+        Parameters
+        ----------
+        force : bool, optional
+            report regardless of the interval, by default False
+        """
+        now = time.time()
+        if self._callback and (force or now - self._lastReport >= REPORT_INTERVAL):
+            self._lastReport = now
+            self._callback(self.snapshot())
+
+    def skipFile(self, size: int) -> None:
+        """Counts a file that is not copied (already staged). Its
+        bytes are taken out of the total, so they do not count towards
+        the throughput and the ETA
+
+        Parameters
+        ----------
+        size : int
+            file size
+        """
+        self.totalBytes -= size
+        self.copiedFiles += 1
+        self.report()
+
+    def copyFile(self, source: str, destination: str) -> None:
+        """Copies a file (content and metadata) in chunks, reporting
+        the progress and checking for cancellation between chunks.
+        Chunks are copied by the kernel (copy_file_range, or sendfile),
+        and read and written only where neither is supported
+
+        Parameters
+        ----------
+        source : str
+            source file
+        destination : str
+            destination file or folder
+        """
+        if os.path.isdir(destination):
+            destination = os.path.join(destination, os.path.basename(source))
+        with open(source, 'rb') as fIn, open(destination, 'wb') as fOut:
+            fdIn, fdOut = fIn.fileno(), fOut.fileno()
+            copyChunks = [_readWriteChunk]
+            if hasattr(os, 'sendfile'):
+                copyChunks.insert(0, _sendChunk)
+            if hasattr(os, 'copy_file_range'):
+                copyChunks.insert(0, _copyChunkRange)
+            while True:
+                self.checkCancelled()
+                try:
+                    copied = copyChunks[0](fdIn, fdOut)
+                except OSError as error:
+                    # nothing is copied by a failed call (the offsets
+                    # are unchanged), so the next way takes over
+                    if error.errno not in COPY_FALLBACK_ERRORS or len(copyChunks) == 1:
+                        raise
+                    copyChunks.pop(0)
+                    continue
+                if not copied:
+                    break
+                self.copiedBytes += copied
+                self.report()
+        shutil.copystat(source, destination)
+        self.copiedFiles += 1
+        self.report()
+
+
+def _copyChunkRange(fdIn: int, fdOut: int) -> int:
+    """Copies a chunk with copy_file_range (no copy in user space,
+    reflinks or server-side copies where supported)"""
+    return os.copy_file_range(fdIn, fdOut, COPY_CHUNK_SIZE)
+
+
+def _sendChunk(fdIn: int, fdOut: int) -> int:
+    """Copies a chunk with sendfile (no copy in user space)"""
+    return os.sendfile(fdOut, fdIn, None, COPY_CHUNK_SIZE)
+
+
+def _readWriteChunk(fdIn: int, fdOut: int) -> int:
+    """Copies a chunk by reading and writing it"""
+    chunk = os.read(fdIn, COPY_CHUNK_SIZE)
+    view = memoryview(chunk)
+    while view:
+        view = view[os.write(fdOut, view):]
+
+    return len(chunk)
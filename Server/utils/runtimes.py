@@ -0,0 +1,289 @@
+# runtimes.py
+from typing import Dict, List, Union, Any
+import os
+import json
+import time
+import shutil
+import subprocess
+from .settings import loadSettings, getCachePath
+from .container import getImageKey
+
+# Cache file (under the cache directory) with the start-up overhead
+# measured for each runtime and image
+STARTUP_CACHE_FILE = 'runtimes.json'
+# Command run to measure the start-up overhead
+STARTUP_PROBE = ['true']
+# Interpreter of each language (may be overridden with the `programs` setting)
+PROGRAMS = {
+    "python": "python3",
+    "r": "Rscript",
+    "stata": "stata-mp -b do",
+    "julia": "julia"
+}
+
+
+class Runtime(object):
+    """Runtime backend: runs the commands of a replication in a
+    container (or directly on the host). Subclasses define how a
+    command is wrapped
+    """
+
+    name = ''
+    executable = ''
+    container = True
+
+    def __init__(self, image: str = '', mounts: Union[List[str], None] = None) -> None:
+
+        self.image = image
+        self.mounts = mounts or list()
+        self.startup = None
+        self.startupCached = False
+        # working directory of the commands (current directory if empty)
+        self.workPath = ''
+        # extra options of the runtime (e.g. the overlay of the run)
+        self.options = list()
+
+    def isAvailable(self) -> bool:
+        """Checks if the runtime is installed
+
+        Returns
+        -------
+        bool
+            True if the executable of the runtime is found
+        """
+        return bool(shutil.which(self.executable))
+
+    def wrap(self, args: List[str], variables: Union[List[str], None] = None) -> List[str]:
+        """Wraps a command to run it in the runtime
+
+        Parameters
+        ----------
+        args : List[str]
+            command arguments
+        variables : List[str], optional
+            environment variables passed to the command, by default None
+
+        Returns
+        -------
+        List[str]
+            command arguments
+        """
+        raise NotImplementedError
+
+    def getKey(self) -> str:
+        """Gets the cache key of the image
+
+        Returns
+        -------
+        str
+            cache key
+        """
+        return self.image
+
+    def measureStartup(self) -> Union[float, None]:
+        """Measures the start-up overhead of the runtime (time to run
+        a command that does nothing). Measures are cached by runtime
+        and image, so each image is measured once
+
+        Returns
+        -------
+        float | None
+            seconds, or None if the runtime failed to start
+        """
+        cacheFile = os.path.join(getCachePath(), STARTUP_CACHE_FILE)
+        cacheKey = f'{self.name}:{self.getKey()}'
+        cache = dict()
+        if os.path.isfile(cacheFile):
+            try:
+                with open(cacheFile) as f:
+                    cache = json.load(f)
+            except (OSError, ValueError):
+                cache = dict()
+        if cacheKey in cache:
+            self.startup = cache[cacheKey]
+            self.startupCached = True
+            return self.startup
+        start = time.perf_counter()
+        try:
+            subprocess.run(
+                self.wrap(STARTUP_PROBE),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=loadSettings()['inspectTimeout']
+            )
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        self.startup = time.perf_counter() - start
+        cache[cacheKey] = self.startup
+        temporary = f'{cacheFile}.{os.getpid()}'
+        with open(temporary, 'w') as f:
+            json.dump(cache, f, indent=4)
+        os.replace(temporary, cacheFile)
+
+        return self.startup
+
+
+class SingularityRuntime(Runtime):
+    """Singularity container (SIF image)"""
+
+    name = 'singularity'
+    executable = 'singularity'
+
+    def wrap(self, args: List[str], variables: Union[List[str], None] = None) -> List[str]:
+        # the environment of the host is passed to the container
+        return [self.executable, 'exec', *self.options, self.image, *args]
+
+    def getKey(self) -> str:
+        return getImageKey(self.image)
+
+
+class ApptainerRuntime(SingularityRuntime):
+    """Apptainer container (SIF image)"""
+
+    name = 'apptainer'
+    executable = 'apptainer'
+
+
+class DockerRuntime(Runtime):
+    """Docker container (image reference). The mounts are bound at
+    the same path and the command runs as the user of the app, in the
+    current directory
+    """
+
+    name = 'docker'
+    executable = 'docker'
+
+    def wrap(self, args: List[str], variables: Union[List[str], None] = None) -> List[str]:
+        command = [
+            self.executable, 'run', '--rm', '--init',
+            '--user', f'{os.getuid()}:{os.getgid()}',
+            '--workdir', self.workPath or os.getcwd()
+        ]
+        for mount in self.mounts:
+            command.extend(['--volume', f'{mount}:{mount}'])
+        for variable in variables or list():
+            # the value is taken from the environment of the client
+            command.extend(['--env', variable])
+
+        return [*command, self.image, *args]
+
+
+class PodmanRuntime(DockerRuntime):
+    """Podman container (image reference)"""
+
+    name = 'podman'
+    executable = 'podman'
+
+
+class LocalRuntime(Runtime):
+    """Runs the commands directly on the host, without a container.
+    Meant for quick iterations and for tests with stub interpreters
+    (see the `programs` setting)
+    """
+
+    name = 'local'
+    executable = ''
+    container = False
+
+    def isAvailable(self) -> bool:
+        return True
+
+    def wrap(self, args: List[str], variables: Union[List[str], None] = None) -> List[str]:
+        return list(args)
+
+    def getKey(self) -> str:
+        return 'host'
+
+
+RUNTIMES = {
+    runtime.name: runtime
+    for runtime in (
+        SingularityRuntime,
+        ApptainerRuntime,
+        DockerRuntime,
+        PodmanRuntime,
+        LocalRuntime
+    )
+}
+# Runtimes that run SIF images
+SIF_RUNTIMES = ('singularity', 'apptainer')
+
+
+def getRuntime(name: str, image: str = '', mounts: Union[List[str], None] = None) -> Runtime:
+    """Gets a runtime backend. For SIF runtimes, Apptainer is used
+    if Singularity is not installed (and vice versa)
+
+    Parameters
+    ----------
+    name : str
+        runtime name (see RUNTIMES)
+    image : str, optional
+        container image, by default ''
+    mounts : List[str], optional
+        paths bound in the container, by default None
+
+    Returns
+    -------
+    Runtime
+        runtime backend
+
+    Raises
+    ------
+    ValueError
+        if the runtime is unknown
+    """
+    if name not in RUNTIMES:
+        raise ValueError(f'Unknown runtime "{name}"')
+    runtime = RUNTIMES[name](image, mounts)
+    if name in SIF_RUNTIMES and not runtime.isAvailable():
+        alternative = RUNTIMES[SIF_RUNTIMES[1 - SIF_RUNTIMES.index(name)]](image, mounts)
+        if alternative.isAvailable():
+            return alternative
+
+    return runtime
+
+
+def getProgram(language: str) -> str:
+    """Gets the interpreter command of a language
+
+    Parameters
+    ----------
+    language : str
+        script language
+
+    Returns
+    -------
+    str
+        command
+    """
+    return loadSettings()['programs'].get(language, PROGRAMS[language])
+
+
+def describeRuntime(runtime: Runtime, starts: int = 1) -> Dict[str, Any]:
+    """Describes a runtime for the report
+
+    Parameters
+    ----------
+    runtime : Runtime
+        runtime backend
+    starts : int, optional
+        processes started in the run, by default 1
+
+    Returns
+    -------
+    Dict[str, Any]
+        item and value
+    """
+    if runtime.startup is None:
+        startup = 'Not measured'
+        total = 'Unknown'
+    else:
+        startup = f'{runtime.startup:.3f} s' + (' (cached)' if runtime.startupCached else '')
+        total = f'{runtime.startup * starts:.3f} s ({starts} start(s))'
+
+    return {
+        'Runtime': runtime.name,
+        'Image': runtime.image or 'None',
+        'Start-up': startup,
+        'Overhead': total
+    }
@@ -0,0 +1,564 @@
+# scripts.py
+from typing import Dict, List, Tuple, Union, Set
+import os
+import re
+
+# Stata error in the last line of a log
+STATA_ERROR_REGEX = r"^r\(([0-9]+)\);"
+# Script languages: key -> extension; value -> language
+LANGUAGES = {
+    ".do": "stata",
+    ".R": "r",
+    ".py": "python",
+    ".jl": "julia"
+}
+# Calls to other scripts: key -> language; value -> regular expression
+CALL_COMMANDS = {
+    "stata": r"^(?:qui(?:etly)?\s+|cap(?:ture)?\s+|noi(?:sily)?\s+)*(?:do|run|include)\s+(.+)$",
+    "r": r"^source\s*\((.+)\)\s*;?$",
+    "python": r"^(?:runpy\.)?run_path\s*\((.+)\)$|^exec\s*\(\s*open\s*\((.+?)\)\.read\(\)\s*\)$",
+    "julia": r"^include\s*\((.+)\)$"
+}
+# Commands/functions that read data
+INPUT_COMMANDS = {
+    "stata": r"^(?:qui(?:etly)?\s+|cap(?:ture)?\s+)*(use|merge|append|joinby|cross|import|insheet|infile)\b",
+    "r": r"\b(read_dta|read\.dta|readRDS|read\.csv|read_csv|fread|load|read_parquet|read_excel|read_sav|read_feather|open_dataset)\s*\(",
+    "python": r"\b(read_stata|read_csv|read_parquet|read_pickle|read_excel|read_feather|load)\s*\(",
+    "julia": r"\b(load|read|readdlm|DataFrame)\s*\("
+}
+# Commands/functions that write data
+OUTPUT_COMMANDS = {
+    "stata": r"^(?:qui(?:etly)?\s+|cap(?:ture)?\s+)*(save|saveold|export|outsheet|esttab|estout|graph\s+export|gr\s+export|putexcel\s+set|outreg2|texsave)\b",
+    "r": r"\b(write_dta|saveRDS|write\.csv|write_csv|fwrite|save|ggsave|write_parquet|write_xlsx|write_feather|pdf|png)\s*\(",
+    "python": r"\b(to_stata|to_csv|to_parquet|to_pickle|to_excel|to_feather|savefig|save|savez)\s*\(",
+    "julia": r"\b(save|write|writedlm|savefig)\s*\("
+}
+# Declared inputs and outputs in comments, e.g. "* @outputs: ${path_source_i}/clean.dta"
+DECLARATION_REGEX = r"@(inputs|outputs)\s*:?\s*(.+)$"
+# Commands that change the working directory
+CHANGE_DIRECTORY_REGEX = {
+    "stata": r"^(?:cap(?:ture)?\s+)?cd\b",
+    "r": r"\bsetwd\s*\(",
+    "python": r"\bos\.chdir\s*\(",
+    "julia": r"\bcd\s*\("
+}
+# Variable assignments: group 1 -> name; group 2 -> value
+ASSIGNMENT_REGEX = {
+    "stata": r"^gl(?:o|ob|oba|obal)?\s+(\w+)\s*(?:=\s*)?(.+)$",
+    "r": r"^([\w.$]+)\s*(?:<-|=)\s*(.+)$",
+    "python": r"^([A-Za-z_]\w*)\s*=\s*(.+)$",
+    "julia": r"^(?:const\s+)?([A-Za-z_]\w*)\s*=\s*(.+)$"
+}
+# Lines allowed after the first call in a master script. They are not run
+# when stages are executed separately
+HOUSEKEEPING_REGEX = {
+    "stata": r"^(?:cap(?:ture)?\s+)?(?:log\s+close|exit|clear(?:\s+all)?|timer\s+.+|di(?:s|sp|spl|spla|splay)?\b.*)$",
+    "r": r"^(?:print|cat|message|sink)\s*\(.*\)\s*;?$",
+    "python": r"^print\s*\(.*\)$",
+    "julia": r"^(?:println|print)\s*\(.*\)$"
+}
+# Lines removed from the prelude of stage wrappers (concurrent stages
+# cannot share the same log)
+PRELUDE_EXCLUDE_REGEX = {
+    "stata": r"^(?:cap(?:ture)?\s+)?log\s+",
+    "r": r"^sink\s*\(",
+    "python": r"^$",
+    "julia": r"^$"
+}
+
+
+def getLanguage(script: str) -> Union[str, None]:
+    """Gets the language of a script from its extension
+
+    Parameters
+    ----------
+    script : str
+        script path
+
+    Returns
+    -------
+    str | None
+        language, or None if not supported
+    """
+    _, extension = os.path.splitext(script)
+
+    return LANGUAGES.get(extension)
+
+
+def getPathVariables(language: str, rootPath: str, replicationPath: str) -> Dict[str, str]:
+    """Gets the path variables defined in the configuration
+    files (see templates) for a given language
+
+    Parameters
+    ----------
+    language : str
+        script language
+    rootPath : str
+        project root path
+    replicationPath : str
+        replication path
+
+    Returns
+    -------
+    Dict[str, str]
+        variable name and path
+    """
+    source = os.path.join(rootPath, "initial_dataset")
+    paths = {
+        "root_path": rootPath,
+        "path_rep": replicationPath,
+        "path_source": source,
+        "path_source_p": os.path.join(source, "modified"),
+        "path_source_i": os.path.join(source, "intermediate"),
+        "path_source_e": os.path.join(source, "external")
+    }
+    if language == "r":
+        return {
+            name.replace("path_source", "paths$source"): path
+            for name, path in paths.items()
+        }
+    if language == "python":
+        return {name.upper(): path for name, path in paths.items()}
+
+    return paths
+
+
+def readScriptLines(script: str) -> List[Tuple[int, str]]:
+    """Reads a script and returns its statements without
+    comments. Stata continuation lines (///) are joined
+
+    Parameters
+    ----------
+    script : str
+        script path
+
+    Returns
+    -------
+    List[Tuple[int, str]]
+        line number and statement
+    """
+    language = getLanguage(script)
+    with open(script, 'r', encoding='latin-1') as f:
+        lines = f.readlines()
+    statements = list()
+    inBlockComment = False
+    pending = ''
+    pendingNumber = 0
+    for number, line in enumerate(lines, start=1):
+        text = line.strip()
+        if language == "stata":
+            if inBlockComment:
+                if '*/' not in text:
+                    continue
+                text = text.split('*/', 1)[1].strip()
+                inBlockComment = False
+            text = re.sub(r'/\*.*?\*/', '', text)
+            if '/*' in text:
+                text, _ = text.split('/*', 1)
+                inBlockComment = True
+            if text.startswith('*'):
+                continue
+            text = re.sub(r'(^|\s)//(?!/).*$', '', text).strip()
+            if text.endswith('///'):
+                pending += text[:-3] + ' '
+                pendingNumber = pendingNumber or number
+                continue
+        else:
+            if text.startswith('#'):
+                continue
+        if pending:
+            text = pending + text
+            number = pendingNumber
+            pending = ''
+            pendingNumber = 0
+        if text:
+            statements.append((number, text.strip()))
+
+    return statements
+
+
+def readDeclarations(script: str) -> Dict[str, List[str]]:
+    """Reads the inputs and outputs declared in the comments
+    of a script (`@inputs: file1, file2` / `@outputs: file3`)
+
+    Parameters
+    ----------
+    script : str
+        script path
+
+    Returns
+    -------
+    Dict[str, List[str]]
+        declared inputs and outputs
+    """
+    declarations = {"inputs": list(), "outputs": list()}
+    with open(script, 'r', encoding='latin-1') as f:
+        for line in f:
+            match = re.search(DECLARATION_REGEX, line.strip())
+            if match:
+                for item in re.split(r'[,;]', match[2]):
+                    if item.strip():
+                        declarations[match[1]].append(item.strip().strip('"\''))
+
+    return declarations
+
+
+def splitArguments(text: str) -> List[str]:
+    """Splits the top-level arguments of a function call. `text`
+    starts right after the opening parenthesis
+
+    Parameters
+    ----------
+    text : str
+        text after the opening parenthesis
+
+    Returns
+    -------
+    List[str]
+        arguments
+    """
+    arguments = list()
+    depth = 0
+    quote = None
+    current = ''
+    for char in text:
+        if quote:
+            current += char
+            if char == quote:
+                quote = None
+            continue
+        if char in '"\'':
+            quote = char
+        elif char in '([{':
+            depth += 1
+        elif char in ')]}':
+            if depth == 0:
+                break
+            depth -= 1
+        elif char == ',' and depth == 0:
+            arguments.append(current.strip())
+            current = ''
+            continue
+        current += char
+    if current.strip():
+        arguments.append(current.strip())
+
+    return arguments
+
+
+def resolvePath(
+    expression: str,
+    language: str,
+    variables: Dict[str, str],
+    workPath: str
+) -> Union[str, None]:
+    """Resolves a path expression to an absolute path, using the
+    known path variables. Relative paths are resolved against
+    the working directory
+
+    Parameters
+    ----------
+    expression : str
+        path expression
+    language : str
+        script language
+    variables : Dict[str, str]
+        known path variables
+    workPath : str
+        working directory of the script
+
+    Returns
+    -------
+    str | None
+        absolute path, or None if the expression cannot be resolved
+    """
+    expression = expression.strip()
+    if language == "stata":
+        expression = re.sub(r'^`"(.*)"\'$', r'\1', expression).strip('"')
+        expression = re.sub(
+            r'\$\{(\w+)\}|\$(\w+)',
+            lambda m: variables.get(m[1] or m[2], m[0]),
+            expression
+        )
+        if re.search(r'[$`\']', expression):
+            return None
+        path = expression
+    elif language in ("r", "julia"):
+        joinCall = re.match(r'^(?:file\.path|joinpath)\s*\((.*)\)$', expression)
+        if joinCall:
+            parts = [
+                resolvePath(arg, language, variables, '')
+                for arg in splitArguments(joinCall[1] + ')')
+            ]
+            if None in parts:
+                return None
+            path = os.path.join(*parts)
+        elif re.match(r'^"[^"]*"$|^\'[^\']*\'$', expression):
+            path = expression[1:-1]
+        elif expression in variables:
+            path = variables[expression]
+        else:
+            return None
+    else:
+        parts = [part.strip() for part in expression.split('/')] \
+            if re.match(r'^[A-Z_]+\s*/', expression) else [expression]
+        resolved = list()
+        for part in parts:
+            if re.match(r'^r?"[^"]*"$|^r?\'[^\']*\'$', part):
+                resolved.append(part.lstrip('r')[1:-1])
+            elif part in variables:
+                resolved.append(variables[part])
+            else:
+                return None
+        path = os.path.join(*resolved)
+    if not path:
+        return None
+
+    return os.path.normpath(os.path.join(workPath, path)) if workPath else path
+
+
+def _getPathArgument(statement: str, language: str, commands: Dict[str, str]) -> List[str]:
+    """Gets the path expressions in a command/function call. Only
+    path-like arguments are returned (string literals with path
+    characters, keyword arguments such as `file = ...`, path
+    joins and known variables are checked by the caller)
+
+    Parameters
+    ----------
+    statement : str
+        statement
+    language : str
+        script language
+    commands : Dict[str, str]
+        input or output commands
+
+    Returns
+    -------
+    List[str]
+        path expressions
+    """
+    if language == "stata":
+        match = re.search(r'\busing\s+(`".*?"\'|"[^"]*"|[^\s,]+)', statement)
+        if not match:
+            match = re.search(
+                r'^(?:qui(?:etly)?\s+|cap(?:ture)?\s+)*(?:use|save|saveold|graph\s+export|gr\s+export|putexcel\s+set|(?:import|export)\s+\w+)\s+(`".*?"\'|"[^"]*"|[^\s,]+)',
+                statement
+            )
+        return [match[1]] if match else []
+    expressions = list()
+    call = re.search(commands[language], statement)
+    for argument in splitArguments(statement[call.end():]):
+        keyword = re.match(r'^(?:file|path|filename|fname|path_or_buf)\s*=\s*(.+)$', argument)
+        if keyword:
+            expressions.append(keyword[1])
+        elif re.match(r'^\w+\s*=', argument):
+            continue
+        elif re.match(r'^[rf]?["\'].*[./\\].*["\']$', argument):
+            expressions.append(argument)
+        elif re.match(r'^(?:file\.path|joinpath|os\.path\.join)\s*\(|^[A-Z_]+\s*/', argument):
+            expressions.append(argument)
+
+    return expressions
+
+
+def _addExtension(path: str, language: str) -> str:
+    """Adds the default extension (.dta) to Stata datasets
+
+    Parameters
+    ----------
+    path : str
+        path
+    language : str
+        script language
+
+    Returns
+    -------
+    str
+        path with extension
+    """
+    if language == "stata" and not os.path.splitext(path)[1]:
+        return path + ".dta"
+    return path
+
+
+def getScriptCalls(
+    script: str,
+    variables: Dict[str, str],
+    workPath: str
+) -> List[Tuple[int, str, Union[str, None]]]:
+    """Gets the calls to other scripts (do/run/include, source,
+    run_path, include) in a script
+
+    Parameters
+    ----------
+    script : str
+        script path
+    variables : Dict[str, str]
+        known path variables
+    workPath : str
+        working directory of the script
+
+    Returns
+    -------
+    List[Tuple[int, str, str | None]]
+        line number, statement and absolute path of the called
+        script (None if it cannot be resolved)
+    """
+    language = getLanguage(script)
+    variables = dict(variables)
+    calls = list()
+    for number, statement in readScriptLines(script):
+        updateVariables(statement, language, variables, workPath)
+        match = re.search(CALL_COMMANDS[language], statement)
+        if not match:
+            continue
+        expression = match[1] or (match.lastindex > 1 and match[2]) or ''
+        if language != "stata":
+            expression = splitArguments(expression + ')')[0]
+        else:
+            expression = re.match(r'`".*?"\'|"[^"]*"|[^\s,]+', expression)[0]
+        path = resolvePath(expression, language, variables, workPath)
+        if path and language == "stata" and not os.path.splitext(path)[1]:
+            path += ".do"
+        calls.append((number, statement, path))
+
+    return calls
+
+
+def updateVariables(
+    statement: str,
+    language: str,
+    variables: Dict[str, str],
+    workPath: str
+) -> None:
+    """Updates the known path variables with an assignment
+    statement, if the value can be resolved
+
+    Parameters
+    ----------
+    statement : str
+        statement
+    language : str
+        script language
+    variables : Dict[str, str]
+        known path variables (updated in place)
+    workPath : str
+        working directory of the script
+    """
+    match = re.search(ASSIGNMENT_REGEX[language], statement)
+    if match:
+        value = resolvePath(match[2], language, variables, '')
+        if value is not None:
+            variables[match[1]] = value
+
+
+def getScriptInputsOutputs(
+    script: str,
+    variables: Dict[str, str],
+    workPath: str,
+    visited: Union[Set[str], None] = None
+) -> Tuple[Set[str], Set[str], bool]:
+    """Infers the data files read and written by a script (and
+    by the scripts it calls), adding the declared inputs and
+    outputs. A script is opaque if some of its reads or writes
+    cannot be resolved, or if it changes the working directory
+
+    Parameters
+    ----------
+    script : str
+        script path
+    variables : Dict[str, str]
+        known path variables
+    workPath : str
+        working directory of the script
+    visited : Set[str], optional
+        scripts already inspected, by default None
+
+    Returns
+    -------
+    Tuple[Set[str], Set[str], bool]
+        inputs, outputs and opaque flag
+    """
+    visited = visited if visited is not None else set()
+    visited.add(os.path.normcase(script))
+    language = getLanguage(script)
+    variables = dict(variables)
+    inputs = set()
+    outputs = set()
+    opaque = False
+    tempfiles = set()
+    for _, statement in readScriptLines(script):
+        updateVariables(statement, language, variables, workPath)
+        if language == "stata":
+            match = re.search(r'^tempfile\s+(.+)$', statement)
+            if match:
+                tempfiles.update(match[1].split())
+                continue
+        if re.search(CHANGE_DIRECTORY_REGEX[language], statement):
+            opaque = True
+        call = re.search(CALL_COMMANDS[language], statement)
+        if call:
+            continue
+        for commands, paths in ((INPUT_COMMANDS, inputs), (OUTPUT_COMMANDS, outputs)):
+            if not re.search(commands[language], statement):
+                continue
+            expressions = _getPathArgument(statement, language, commands)
+            if not expressions:
+                opaque = True
+            for expression in expressions:
+                if language == "stata" and \
+                        re.sub(r'^"|"$', '', expression).strip("`'") in tempfiles:
+                    continue
+                path = resolvePath(expression, language, variables, workPath)
+                if path is None:
+                    opaque = True
+                else:
+                    paths.add(_addExtension(path, language))
+    for _, _, calledScript in getScriptCalls(script, variables, workPath):
+        if calledScript is None or not os.path.isfile(calledScript):
+            opaque = True
+        elif os.path.normcase(calledScript) not in visited:
+            calledInputs, calledOutputs, calledOpaque = getScriptInputsOutputs(
+                calledScript, variables, workPath, visited
+            )
+            inputs.update(calledInputs)
+            outputs.update(calledOutputs)
+            opaque = opaque or calledOpaque
+    # Declared paths use the Stata globals syntax, e.g. ${path_source_i}/clean.dta
+    declarationVariables = {
+        name.replace('paths$source', 'path_source').lower(): path
+        for name, path in variables.items()
+    }
+    declarations = readDeclarations(script)
+    for key, paths in (("inputs", inputs), ("outputs", outputs)):
+        for expression in declarations[key]:
+            path = resolvePath(expression, "stata", declarationVariables, workPath)
+            if path is not None:
+                paths.add(path)
+
+    return inputs, outputs, opaque
+
+
+def checkStataLog(logFile: str) -> Tuple[int, List[str]]:
+    """Checks a Stata log for errors. Stata always returns a code
+    of 0 in batch mode, so the last line of the log is examined
+
+    Parameters
+    ----------
+    logFile : str
+        Stata log
+
+    Returns
+    -------
+    Tuple[int, List[str]]
+        return code and last lines of the log
+    """
+    try:
+        with open(logFile, 'r', encoding="latin-1") as f:
+            lastLines = f.readlines()[-10:]
+    except OSError as error:
+        return 1, [str(error)]
+    if lastLines and re.search(STATA_ERROR_REGEX, lastLines[-1]):
+        return 1, lastLines
+
+    return 0, lastLines
@@ -0,0 +1,153 @@
+# settings.py
+from typing import Dict, Any
+import os
+import json
+
+# Project settings file (placed next to the application, under .replication).
+# The REPLICATION_SETTINGS environment variable points to another file
+# (e.g. benchmarks and tests)
+SETTINGS_FILE = os.environ.get('REPLICATION_SETTINGS') or os.path.join(
+    os.path.split(os.path.split(os.path.abspath(__file__))[0])[0],
+    'settings.json'
+)
+# Default settings. Any key may be overridden in the settings file
+DEFAULT_SETTINGS = {
+    # Folder of the projects (the root path of a project is the folder
+    # named after the project under it)
+    "projectsPath": "/bplimext/projects",
+    # Directory for user caches (container metadata, etc.)
+    "cacheDir": os.path.join(os.path.expanduser('~'), '.cache', 'replicationApp'),
+    # Seconds allowed for `singularity inspect` and runtime probes
+    "inspectTimeout": 120,
+    # Folders and files left out of the replication structure (glob
+    # patterns, as in .replicationignore)
+    "ignorePatterns": [],
+    # Stage the files of the replication in the background while the
+    # fields of the app are filled (moved to the replication on Run)
+    "speculativeStaging": True,
+    # Backend of overlay runs: fuse-overlayfs (mounted on the host),
+    # singularity (mounted in the container) or auto (singularity for
+    # SIF runtimes)
+    "overlayBackend": "auto",
+    # Maximum number of sub-scripts run concurrently (parallel execution)
+    "parallelWorkers": 4,
+    # Limits of each run (0 = no limit). They are the default, and the
+    # maximum allowed, for the limits set in the app
+    "limits": {
+        "wallClockHours": 0,
+        "memoryGB": 0,
+        "cpus": 0,
+        "diskGB": 0
+    },
+    # Mechanism for memory and CPU limits: auto, cgroup or prlimit
+    "limitsBackend": "auto",
+    # Priority class of the runs (normal, low or background): nice value
+    # and I/O class of the processes and of the copies, or cgroup weights
+    "priority": "normal",
+    # Seconds allowed for the processes of a run to end after SIGTERM
+    # (Stop, limits exceeded), before SIGKILL
+    "terminationGracePeriod": 10,
+    # Mechanism to record the data files opened by the runs: auto,
+    # inotify, strace or off
+    "accessTracer": "auto",
+    # Seconds between checks of wall-clock time and memory
+    "limitsCheckInterval": 2,
+    # Seconds between checks of the replication folder growth
+    "diskCheckInterval": 30,
+    # Threads of each run when there is no CPU limit (0 = every CPU)
+    "threadsPerRun": 0,
+    # Bind the processes of each run to the cores allocated
+    "cpuAffinity": False,
+    # Build a sysimage of the packages of Julia projects (needs
+    # PackageCompiler in the container)
+    "juliaSysimage": True,
+    # Seconds allowed to precompile a Julia environment (each step)
+    "juliaBuildTimeout": 3600,
+    # Default runtime: singularity, apptainer, docker, podman or local
+    "runtime": "singularity",
+    # Interpreter of each language (python, r, stata, julia), if not the
+    # default (e.g. a stub interpreter with the local runtime)
+    "programs": {},
+    # Slurm jobs: partition, account, qos, extra sbatch options and
+    # seconds between checks of the job state
+    "slurm": {
+        "partition": "",
+        "account": "",
+        "qos": "",
+        "options": [],
+        "pollInterval": 10
+    },
+    # Run replications through the daemon (see replicationDaemon.py)
+    "useDaemon": False,
+    # Folder of the daemons of the server: each user has a private folder
+    # in it (socket, runs and log), and the runs traced are registered in
+    # it (see utils/tracer.py)
+    "daemonPath": "/var/tmp/replicationApp",
+    # Socket of the daemon (by default daemon.sock in the folder of the user)
+    "daemonSocket": "",
+    # Replications run at the same time by the daemon
+    "daemonMaxRuns": 2,
+    # Catalog of replications of every project (by default catalog.db in
+    # .replicationApp under the projects folder, shared by the users)
+    "catalogPath": "",
+    # Comparison of each run with the previous runs of the same main
+    # script: a time regressed if it is `threshold` times the median of
+    # the last `history` runs, and at least `minSeconds` above it.
+    # Metrics with less than `minRuns` previous values are not compared
+    "regression": {
+        "threshold": 1.5,
+        "minSeconds": 60,
+        "history": 10,
+        "minRuns": 2
+    }
+}
+
+
+def loadSettings(settingsFile: str = SETTINGS_FILE) -> Dict[str, Any]:
+    """Loads the project settings. Keys missing from the
+    settings file (including keys of nested settings, e.g.
+    `limits`) take the default value
+
+    Parameters
+    ----------
+    settingsFile : str, optional
+        path to JSON settings file, by default SETTINGS_FILE
+
+    Returns
+    -------
+    Dict[str, Any]
+        settings
+    """
+    settings = {
+        key: dict(value) if isinstance(value, dict) else value
+        for key, value in DEFAULT_SETTINGS.items()
+    }
+    if os.path.isfile(settingsFile):
+        with open(settingsFile) as fileIn:
+            for key, value in json.load(fileIn).items():
+                if isinstance(value, dict) and isinstance(settings.get(key), dict):
+                    settings[key].update(value)
+                else:
+                    settings[key] = value
+
+    return settings
+
+
+def getCachePath(*parts: str) -> str:
+    """Gets a path under the cache directory, creating
+    the directory if it does not exist
+
+    Parameters
+    ----------
+    parts : str
+        sub-directories under the cache directory
+
+    Returns
+    -------
+    str
+        cache path
+    """
+    cachePath = os.path.join(loadSettings()['cacheDir'], *parts)
+    os.makedirs(cachePath, exist_ok=True)
+
+    return cachePath
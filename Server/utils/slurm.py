@@ -0,0 +1,309 @@
+# slurm.py
+from typing import Dict, List, Tuple, Union, Any
+import os
+import json
+import math
+import time
+import shlex
+import signal
+import subprocess
+from .settings import loadSettings
+from .limits import ResourceLimits
+
+# Files (under the replication folder) of the Slurm job
+BATCH_SCRIPT = 'replication.sbatch'
+JOB_FILE = '.slurm.json'
+LOG_FILE = 'slurm-%j.out'
+# Job states (sacct) of jobs that finished successfully
+COMPLETED_STATES = ('COMPLETED',)
+# Lines of the job log reported as errors
+ERROR_LINES = 20
+
+
+def formatTimeLimit(seconds: float) -> str:
+    """Formats a time limit for sbatch (D-HH:MM:SS)
+
+    Parameters
+    ----------
+    seconds : float
+        seconds
+
+    Returns
+    -------
+    str
+        time limit
+    """
+    minutes = math.ceil(seconds / 60)
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+
+    return f'{days}-{hours:02}:{minutes:02}:00'
+
+
+def createBatchScript(
+    outFile: str,
+    jobName: str,
+    args: List[str],
+    workPath: str,
+    logPath: str,
+    limits: ResourceLimits,
+    cpus: int,
+    variables: Dict[str, str]
+) -> None:
+    """Creates the batch script of a replication. The resources are
+    requested from the limits of the run and the `slurm` settings
+    (partition, account, qos and extra options)
+
+    Parameters
+    ----------
+    outFile : str
+        path to batch script
+    jobName : str
+        job name
+    args : List[str]
+        command that runs the main script
+    workPath : str
+        working directory of the job
+    logPath : str
+        folder for the job log
+    limits : ResourceLimits
+        limits of the run
+    cpus : int
+        CPUs per task
+    variables : Dict[str, str]
+        environment variables of the job
+    """
+    settings = loadSettings()['slurm']
+    options = [
+        f'--job-name={jobName}',
+        f'--output={os.path.join(logPath, LOG_FILE)}',
+        f'--chdir={workPath}',
+        '--ntasks=1',
+        f'--cpus-per-task={max(1, cpus)}'
+    ]
+    if limits.wallClock:
+        options.append(f'--time={formatTimeLimit(limits.wallClock)}')
+    if limits.memory:
+        options.append(f'--mem={math.ceil(limits.memory / 1024 ** 2)}M')
+    for option in ('partition', 'account', 'qos'):
+        if settings.get(option):
+            options.append(f'--{option}={settings[option]}')
+    options.extend(settings.get('options', []))
+
+    script = '#!/bin/bash\n'
+    script += ''.join(f'#SBATCH {option}\n' for option in options)
+    script += '\n'
+    script += ''.join(
+        f'export {name}={shlex.quote(value)}\n' for name, value in variables.items()
+    )
+    script += '\necho "Job $SLURM_JOB_ID on $(hostname), started $(date)"\n'
+    script += ' '.join(shlex.quote(arg) for arg in args) + '\n'
+    script += 'code=$?\n'
+    script += 'echo "Finished $(date) with exit code $code"\n'
+    script += 'exit $code\n'
+
+    with open(outFile, 'w') as fOut:
+        fOut.write(script)
+
+
+def _runCommand(args: List[str]) -> str:
+    """Runs a Slurm command
+
+    Parameters
+    ----------
+    args : List[str]
+        command arguments
+
+    Returns
+    -------
+    str
+        standard output
+
+    Raises
+    ------
+    RuntimeError
+        if the command fails
+    """
+    try:
+        result = subprocess.run(
+            args,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            timeout=loadSettings()['inspectTimeout']
+        )
+    except (OSError, subprocess.TimeoutExpired) as error:
+        raise RuntimeError(f'{args[0]}: {error}')
+    if result.returncode != 0:
+        raise RuntimeError(f'{args[0]}: {result.stderr.strip()}')
+
+    return result.stdout.strip()
+
+
+class SlurmJob(object):
+    """Replication submitted to Slurm. Mimics the interface of
+    `subprocess.Popen` (`poll`, `communicate`, `returncode`, `args`,
+    `send_signal`), so that the app supervises it as a local process.
+    The state is read with `squeue` while the job is queued or
+    running, and with `sacct` once it leaves the queue
+    """
+
+    def __init__(self, batchScript: str, mainScript: str, replicationPath: str) -> None:
+
+        self._batchScript = batchScript
+        self._replicationPath = replicationPath
+        self._pollInterval = loadSettings()['slurm']['pollInterval']
+        self._lastPoll = 0.0
+        self.args = [batchScript, mainScript]
+        self.jobId = ''
+        self.state = ''
+        self.info = dict()
+        self.returncode = None
+
+    @property
+    def pids(self) -> List[int]:
+        """Local processes of the job (none: it runs on a compute node)"""
+        return list()
+
+    @property
+    def logFile(self) -> str:
+        """Log of the job"""
+        return os.path.join(self._replicationPath, LOG_FILE.replace('%j', self.jobId))
+
+    def submit(self) -> 'SlurmJob':
+        """Submits the batch script. The job id is saved in the
+        replication folder
+
+        Returns
+        -------
+        SlurmJob
+            the job
+        """
+        output = _runCommand(['sbatch', '--parsable', self._batchScript])
+        # --parsable prints "jobid" or "jobid;cluster"
+        self.jobId = output.splitlines()[-1].split(';')[0].strip()
+        self.state = 'PENDING'
+        self._save()
+
+        return self
+
+    def _save(self) -> None:
+        """Saves the job id and state in the replication folder"""
+        with open(os.path.join(self._replicationPath, JOB_FILE), 'w') as f:
+            json.dump(
+                {'jobId': self.jobId, 'state': self.state, 'returnCode': self.returncode, **self.info},
+                f,
+                indent=4
+            )
+
+    def _readAccounting(self) -> Union[Dict[str, str], None]:
+        """Reads the accounting of the job (`sacct`)
+
+        Returns
+        -------
+        Dict[str, str] | None
+            state, exit code, elapsed time and nodes, or None if the
+            job is not in the accounting yet
+        """
+        fields = ('State', 'ExitCode', 'Elapsed', 'NodeList')
+        output = _runCommand([
+            'sacct', '-n', '-P', '-X', '-j', self.jobId, '-o', ','.join(fields)
+        ])
+        accounting = dict(zip(fields, output.splitlines()[0].split('|'))) if output else dict()
+        if not accounting.get('State', '').strip():
+            return None
+
+        return accounting
+
+    def poll(self) -> Union[int, None]:
+        """Checks if the job finished (at most once every
+        `pollInterval` seconds)
+
+        Returns
+        -------
+        int | None
+            return code, or None if the job is queued or running
+        """
+        if self.returncode is not None:
+            return self.returncode
+        now = time.time()
+        if now - self._lastPoll < self._pollInterval:
+            return None
+        self._lastPoll = now
+        try:
+            queued = _runCommand(['squeue', '-h', '-j', self.jobId, '-o', '%T'])
+        except RuntimeError:
+            # finished jobs may be rejected by squeue
+            queued = ''
+        if queued:
+            self.state = queued.splitlines()[0].strip()
+            return None
+        try:
+            accounting = self._readAccounting()
+        except RuntimeError:
+            accounting = None
+        if accounting is None:
+            # left the queue, but not yet in the accounting
+            return None
+        self.info = accounting
+        # sacct states may have a suffix (e.g. "CANCELLED by 1000")
+        self.state = accounting['State'].split()[0]
+        exitCode = int(accounting['ExitCode'].split(':')[0] or 0)
+        if self.state in COMPLETED_STATES:
+            self.returncode = exitCode
+        else:
+            self.returncode = exitCode or 1
+        self._save()
+
+        return self.returncode
+
+    def communicate(self) -> Tuple[bytes, bytes]:
+        """Waits for the job to finish
+
+        Returns
+        -------
+        Tuple[bytes, bytes]
+            empty output and the last lines of the log (as errors)
+        """
+        while self.poll() is None:
+            time.sleep(self._pollInterval)
+        lines = list()
+        if os.path.isfile(self.logFile):
+            with open(self.logFile, 'rb') as f:
+                lines = f.read().splitlines()[-ERROR_LINES:]
+
+        return b'', b'\n'.join(lines)
+
+    def send_signal(self, sig: int) -> None:
+        """Cancels the job (SIGTERM/SIGKILL) or sends it a signal
+
+        Parameters
+        ----------
+        sig : int
+            signal
+        """
+        if not self.jobId:
+            return
+        if sig in (signal.SIGTERM, signal.SIGKILL):
+            _runCommand(['scancel', self.jobId])
+        else:
+            _runCommand(['scancel', f'--signal={signal.Signals(sig).name[3:]}', self.jobId])
+        # the state is read again on the next poll
+        self._lastPoll = 0.0
+
+    def describe(self) -> Dict[str, Any]:
+        """Describes the job for the report
+
+        Returns
+        -------
+        Dict[str, Any]
+            item and value
+        """
+        return {
+            'Job ID': self.jobId,
+            'State': self.state,
+            'Nodes': self.info.get('NodeList', ''),
+            'Elapsed': self.info.get('Elapsed', ''),
+            'Batch script': self._batchScript,
+            'Log': self.logFile
+        }
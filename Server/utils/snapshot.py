@@ -0,0 +1,75 @@
+# snapshot.py
+from typing import Dict, Iterable, List, Tuple
+import os
+
+# Snapshot of a folder: relative path -> (size, modification time in ns)
+Snapshot = Dict[str, Tuple[int, int]]
+
+
+def takeSnapshot(rootPath: str, exclude: Iterable[str] = ()) -> Snapshot:
+    """Takes a snapshot of the files under a folder from their stat
+    (size and modification time), without reading them. Symbolic
+    links are not followed
+
+    Parameters
+    ----------
+    rootPath : str
+        folder
+    exclude : Iterable[str], optional
+        relative paths of files and folders left out, by default ()
+
+    Returns
+    -------
+    Snapshot
+        size and modification time of each file, by relative path
+    """
+    exclude = set(exclude)
+    snapshot = dict()
+    pending = ['']
+    while pending:
+        relativeFolder = pending.pop()
+        try:
+            content = os.scandir(os.path.join(rootPath, relativeFolder))
+        except OSError:
+            continue
+        with content:
+            for item in content:
+                relativePath = os.path.join(relativeFolder, item.name)
+                if relativePath in exclude:
+                    continue
+                try:
+                    if item.is_dir(follow_symlinks=False):
+                        pending.append(relativePath)
+                    elif item.is_file(follow_symlinks=False):
+                        stat = item.stat(follow_symlinks=False)
+                        snapshot[relativePath] = (stat.st_size, stat.st_mtime_ns)
+                except OSError:
+                    continue
+
+    return snapshot
+
+
+def diffSnapshots(before: Snapshot, after: Snapshot) -> Tuple[List[str], List[str], List[str]]:
+    """Compares two snapshots of a folder. A file is modified if its
+    size or modification time changed
+
+    Parameters
+    ----------
+    before : Snapshot
+        snapshot taken first
+    after : Snapshot
+        snapshot taken last
+
+    Returns
+    -------
+    Tuple[List[str], List[str], List[str]]
+        files added, modified and removed (sorted)
+    """
+    added = sorted(path for path in after if path not in before)
+    modified = sorted(
+        path for path, stat in after.items()
+        if path in before and before[path] != stat
+    )
+    removed = sorted(path for path in before if path not in after)
+
+    return added, modified, removed
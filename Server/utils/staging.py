@@ -0,0 +1,223 @@
+# staging.py
+from typing import Callable, Dict, Tuple, Union, Any
+import os
+import shutil
+import threading
+from .checks import checkMainFolder, checkMainScript, checkDependencies, checkTools
+from .processes import lowerThreadPriority
+from .progress import PreparationCancelled
+from .settings import loadSettings
+
+# Prefix of the staging folders (hidden, under Replications, so they are
+# on the same filesystem as the replication folders)
+STAGING_PREFIX = '.staging-'
+# Seconds without changes to the fields before staging starts
+STAGING_DELAY = 1.0
+
+
+def getStagingPath(mainFolder: str) -> str:
+    """Gets the staging folder of the app for a main folder
+
+    Parameters
+    ----------
+    mainFolder : str
+        main folder
+
+    Returns
+    -------
+    str
+        staging folder
+    """
+    return os.path.join(mainFolder, 'Replications', f'{STAGING_PREFIX}{os.getpid()}')
+
+
+def removeStaleStaging(mainFolder: str) -> None:
+    """Removes the staging folders left by apps that are no longer
+    running
+
+    Parameters
+    ----------
+    mainFolder : str
+        main folder
+    """
+    replicationsPath = os.path.join(mainFolder, 'Replications')
+    if not os.path.isdir(replicationsPath):
+        return
+    for name in os.listdir(replicationsPath):
+        if not name.startswith(STAGING_PREFIX):
+            continue
+        try:
+            os.kill(int(name[len(STAGING_PREFIX):]), 0)
+        except ValueError:
+            continue
+        except ProcessLookupError:
+            shutil.rmtree(os.path.join(replicationsPath, name), ignore_errors=True)
+        except PermissionError:
+            # running, as another user
+            continue
+
+
+class Stager(object):
+    """Stages a replication in the background while the fields of the
+    app are filled: once the main folder, main script, dependencies and
+    tools are valid, the folders and files are copied to a hidden
+    staging folder, at low CPU and I/O priority. When the fields change,
+    the staging restarts and only copies what changed. On Run, the
+    staging folder is moved to the replication folder (rename), and the
+    preparation copies only what is missing.
+
+    `stage` stages the replication of some fields in a folder (called
+    with the fields, the folder, a cancel event and a progress callback)
+    and `callback` is called with the progress of the staging
+    """
+
+    def __init__(
+        self,
+        stage: Callable[[Dict[str, Any], str, threading.Event, Callable[[Dict[str, Any]], None]], None],
+        callback: Union[Callable[[Dict[str, Any]], None], None] = None
+    ) -> None:
+
+        self._stage = stage
+        self._callback = callback
+        self._thread = None
+        self._cancelEvent = threading.Event()
+        self._key = None
+        self._mode = None
+        self.path = ''
+        self.structureStaged = False
+        self.done = False
+
+    @staticmethod
+    def getKey(items: Dict[str, Any]) -> Tuple:
+        """Gets the fields that determine the files staged"""
+        return (
+            items.get('mainFolderInput', ''),
+            items.get('mainScriptInput', ''),
+            tuple(items.get('dependencies', [])),
+            tuple(items.get('tools', [])),
+            items.get('containerDefinition', ''),
+            bool(items.get('sparseStructure'))
+        )
+
+    @staticmethod
+    def getMode(items: Dict[str, Any]) -> Tuple:
+        """Gets the fields that determine the folder structure staged"""
+        return items.get('mainFolderInput', ''), bool(items.get('sparseStructure'))
+
+    def update(self, items: Dict[str, Any]) -> None:
+        """Updates the staging with the current fields (restarted if
+        the fields changed). Overlay runs copy nothing, so they are not
+        staged
+
+        Parameters
+        ----------
+        items : Dict[str, Any]
+            fields of the app (see getWindowItems)
+        """
+        if items.get('overlayRun') or not loadSettings()['speculativeStaging']:
+            self.cancel()
+            self._key = None
+            return
+        key = Stager.getKey(items)
+        if key == self._key:
+            return
+        self.cancel()
+        self._key = key
+        self.done = False
+        self._cancelEvent = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(dict(items), self._cancelEvent),
+            daemon=True
+        )
+        self._thread.start()
+
+    def _isValid(self, items: Dict[str, Any]) -> bool:
+        """Checks if the fields staged are valid"""
+        mainFolder = items.get('mainFolderInput', '')
+        return (
+            checkMainFolder(mainFolder)[0] and
+            checkMainScript(items.get('mainScriptInput', ''), mainFolder)[0] and
+            checkDependencies(items.get('dependencies', []), mainFolder)[0] and
+            checkTools(items.get('tools', []), mainFolder)[0]
+        )
+
+    def _run(self, items: Dict[str, Any], cancelEvent: threading.Event) -> None:
+        """Stages the replication (worker thread)"""
+        lowerThreadPriority()
+        if cancelEvent.wait(STAGING_DELAY) or not self._isValid(items):
+            return
+        mode = Stager.getMode(items)
+        if mode != self._mode:
+            # other main folder or structure: staged from scratch
+            if self.path:
+                shutil.rmtree(self.path, ignore_errors=True)
+            self._mode = mode
+            removeStaleStaging(items['mainFolderInput'])
+            self.path = getStagingPath(items['mainFolderInput'])
+            self.structureStaged = False
+            shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path, exist_ok=True)
+        try:
+            self._stage(items, self.path, cancelEvent, self._onProgress)
+        except PreparationCancelled:
+            return
+        except Exception:
+            # the fields are checked again (and errors shown) on Run
+            return
+        self.done = True
+        self._onProgress({'phase': 'Staged', 'text': 'done'})
+
+    def _onProgress(self, progress: Dict[str, Any]) -> None:
+        """Tracks the phases of the staging"""
+        if progress['phase'] in ('Copying files', 'Staged') and not self._mode[1]:
+            self.structureStaged = True
+        if self._callback:
+            self._callback(progress)
+
+    def cancel(self) -> None:
+        """Cancels the staging in progress (the files staged are kept)"""
+        self._cancelEvent.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def claim(self, items: Dict[str, Any], replicationPath: str) -> Union[bool, None]:
+        """Moves the staging folder to the replication folder (empty,
+        just allocated), if it was staged for the same main folder and
+        structure. The staging in progress is stopped: the preparation
+        copies the files missing or changed
+
+        Parameters
+        ----------
+        items : Dict[str, Any]
+            fields of the replication
+        replicationPath : str
+            replication folder
+
+        Returns
+        -------
+        bool | None
+            True if the folder structure was staged (False if only some
+            files), or None if nothing was claimed
+        """
+        self.cancel()
+        self._key = None
+        self.done = False
+        if items.get('overlayRun') or Stager.getMode(items) != self._mode or not os.path.isdir(self.path):
+            return None
+        try:
+            os.replace(self.path, replicationPath)
+        except OSError:
+            return None
+        self._mode = None
+
+        return self.structureStaged
+
+    def discard(self) -> None:
+        """Removes the staging folder"""
+        self.cancel()
+        if self.path:
+            shutil.rmtree(self.path, ignore_errors=True)
+        self._mode = None
+        self.path = ''
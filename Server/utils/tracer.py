@@ -0,0 +1,414 @@
+# tracer.py
+from typing import Any, Dict, List, Union
+import os
+import re
+import time
+import json
+import uuid
+import fcntl
+import shutil
+import select
+import struct
+import ctypes
+import hashlib
+import threading
+from .settings import loadSettings
+from .processes import getProcessTree
+from .daemonClient import getServerPath
+
+# inotify events (see inotify(7)): file closed, opened, moved in,
+# created, queue overflow, folder
+IN_CLOSE_WRITE = 0x00000008
+IN_CLOSE_NOWRITE = 0x00000010
+IN_OPEN = 0x00000020
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+# Events watched: closes are watched too, since identical consecutive
+# events are merged and repeated opens would count once otherwise.
+# Folders created (or moved in) while tracing are watched as well
+INOTIFY_MASK = IN_OPEN | IN_CLOSE_WRITE | IN_CLOSE_NOWRITE | IN_CREATE | IN_MOVED_TO
+# Header of an inotify event: wd, mask, cookie and name length
+INOTIFY_EVENT = struct.Struct('iIII')
+# Bytes read from the inotify descriptor at once
+INOTIFY_BUFFER = 1024 ** 2
+# Seconds between samples of the read offsets (see sample)
+SAMPLE_INTERVAL = 1.0
+# Folder of the strace logs, in the replication folder
+STRACE_FOLDER = '.trace'
+# Successful open calls in strace logs (-y decodes the returned fd)
+STRACE_OPEN_REGEX = re.compile(r'\bopen(?:at2?)?\(.*\)\s+=\s+\d+<(.+)>$')
+# Folder (in the folder of the daemons, shared by the users of the
+# server) where the runs being traced are registered, one locked empty
+# file per run. It only holds locks: every user may create files in it,
+# and only remove their own (sticky)
+TRACERS_FOLDER = 'tracers'
+
+
+def _getLibc() -> Union[ctypes.CDLL, None]:
+    """Gets the C library, if it has inotify"""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.inotify_init1
+    except (OSError, AttributeError):
+        return None
+
+    return libc
+
+
+def getTracerBackend() -> str:
+    """Gets the mechanism used to trace the data files opened:
+    'inotify' (watches on the data folders, no overhead on the run),
+    'strace' (the run is traced, slower), 'off' or the one defined in
+    the settings
+
+    Returns
+    -------
+    str
+        'inotify', 'strace' or 'off'
+    """
+    backend = loadSettings()['accessTracer']
+    if backend != 'auto':
+        return backend
+    if _getLibc():
+        return 'inotify'
+    if shutil.which('strace'):
+        return 'strace'
+
+    return 'off'
+
+
+class AccessTracer(object):
+    """Records the data files opened by a run: files under the data
+    folder, each once, with the number of opens and the bytes read.
+    Opens are recorded by inotify (any process opening a data file
+    while the run is traced is recorded) or by strace (only the
+    processes of the run), and bytes read are sampled from the read
+    offsets of the open files of the run (see sample). inotify falls
+    back to strace if the folders cannot be watched (e.g.
+    `max_user_watches` reached). Runs are registered while traced, so
+    that inotify lists are marked shared when other runs of the server
+    traced the same data folder at the same time (their opens cannot
+    be told apart)
+    """
+
+    def __init__(self, dataPath: str, tracePath: str, backend: str) -> None:
+
+        self._dataPath = os.path.realpath(dataPath)
+        self._dataRoot = os.path.join(self._dataPath, '')
+        self._tracePath = os.path.join(tracePath, STRACE_FOLDER)
+        self.backend = backend if os.path.isdir(dataPath) else 'off'
+        self._libc = None
+        self._fd = -1
+        self._folders = dict()
+        self._events = dict()
+        self._opens = dict()
+        self._read = dict()
+        self._logs = list()
+        self._thread = None
+        # written to wake the thread reading the events when stopped
+        self._stopPipe = None
+        self._lastSample = 0.0
+        # locked file of the run in the registry (see _register)
+        self._registration = None
+        # False if opens may be missing (inotify queue overflowed, new
+        # folder not watched or strace log not read)
+        self.complete = True
+        # True if other runs traced the data folder at the same time
+        # (inotify), None if unknown
+        self.shared = False
+        self.note = ''
+        if self.backend == 'strace' and not shutil.which('strace'):
+            self.backend = 'off'
+            self.note = 'strace not found'
+
+    def start(self) -> None:
+        """Starts tracing (inotify watches). With strace, the
+        commands of the run are traced instead (see wrap)
+        """
+        if not os.path.isdir(self._dataPath):
+            return
+        # runs traced with any backend are registered, since their
+        # opens are seen by the inotify watches of other runs
+        self._register()
+        if self.backend != 'inotify':
+            return
+        self._libc = _getLibc()
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC) if self._libc else -1
+        if self._fd < 0:
+            self._fallback(f'inotify not available ({os.strerror(ctypes.get_errno())})')
+            return
+        error = self._watchFolders(self._dataPath)
+        if error:
+            self._fallback(f'inotify watches not added ({error})')
+            return
+        self._stopPipe = os.pipe()
+        self._thread = threading.Thread(target=self._readEvents, daemon=True)
+        self._thread.start()
+
+    def _watchFolders(self, rootPath: str) -> str:
+        """Adds inotify watches on a folder and its sub-folders
+
+        Parameters
+        ----------
+        rootPath : str
+            folder
+
+        Returns
+        -------
+        str
+            error, empty if every folder is watched
+        """
+        for root, _, _ in os.walk(rootPath):
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(root), INOTIFY_MASK)
+            if wd < 0:
+                return os.strerror(ctypes.get_errno())
+            self._folders[wd] = root
+
+        return ''
+
+    def _register(self) -> None:
+        """Registers the run as traced: a file locked while tracing,
+        named after the data folder, in the registry of the server.
+        The file is created under another name and renamed once
+        locked, so that other runs never see it unlocked
+        """
+        try:
+            folder = os.path.join(getServerPath(), TRACERS_FOLDER)
+            if not os.path.isdir(folder):
+                os.makedirs(folder, exist_ok=True)
+                os.chmod(folder, 0o1777)
+            path = os.path.join(folder, f'{self._getKey()}.{uuid.uuid4().hex}')
+            fileOut = open(f'{path}.new', 'w')
+            try:
+                os.chmod(f'{path}.new', 0o644)
+                fcntl.flock(fileOut, fcntl.LOCK_EX)
+                os.rename(f'{path}.new', path)
+            except OSError:
+                fileOut.close()
+                raise
+        except (OSError, LookupError) as error:
+            if self.backend == 'inotify':
+                self.shared = None
+                self.note = f'runs sharing the data folder not checked ({error})'
+            return
+        self._registration = (path, fileOut)
+        self._checkShared()
+
+    def _getKey(self) -> str:
+        """Key of the data folder in the registry"""
+        return hashlib.sha1(os.fsencode(self._dataPath)).hexdigest()[:16]
+
+    def _checkShared(self) -> None:
+        """Checks if other runs are traced with the same data folder
+        (their files in the registry are locked). Files left by runs
+        that crashed are not locked, and are removed (those of other
+        users are left, and are not counted)
+        """
+        if self.backend != 'inotify' or not self._registration or self.shared:
+            return
+        folder, name = os.path.split(self._registration[0])
+        prefix = f'{self._getKey()}.'
+        try:
+            names = os.listdir(folder)
+        except OSError:
+            return
+        for other in names:
+            if not other.startswith(prefix) or other.endswith('.new') or other == name:
+                continue
+            path = os.path.join(folder, other)
+            try:
+                with open(path) as fileIn:
+                    fcntl.flock(fileIn, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    os.remove(path)
+            except BlockingIOError:
+                self.shared = True
+                return
+            except OSError:
+                continue
+
+    def _unregister(self) -> None:
+        """Removes the run from the registry"""
+        if not self._registration:
+            return
+        path, fileOut = self._registration
+        self._registration = None
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        fileOut.close()
+
+    def _fallback(self, error: str) -> None:
+        """Closes the inotify descriptor and traces with strace, if
+        available"""
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+        self._folders = dict()
+        # strace records only the processes of the run
+        self.shared = False
+        self.note = error
+        self.backend = 'strace' if shutil.which('strace') else 'off'
+
+    def _readEvents(self) -> None:
+        """Reads the inotify events until the tracer is stopped, then
+        the events left in the queue"""
+        while True:
+            ready, _, _ = select.select([self._fd, self._stopPipe[0]], [], [])
+            if self._fd not in ready:
+                # stopped (the pipe stays readable) and no events left
+                break
+            try:
+                data = os.read(self._fd, INOTIFY_BUFFER)
+            except BlockingIOError:
+                continue
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    self.complete = False
+                    self.note = 'inotify queue overflowed, opens may be missing'
+                elif mask & IN_OPEN and not mask & IN_ISDIR:
+                    # the name is counted as is, joined once stopped
+                    key = (wd, name)
+                    self._events[key] = self._events.get(key, 0) + 1
+                elif mask & (IN_CREATE | IN_MOVED_TO) and mask & IN_ISDIR and wd in self._folders:
+                    # files opened in the folder before it is watched
+                    # are missed (the bytes read are still sampled)
+                    error = self._watchFolders(os.path.join(self._folders[wd], os.fsdecode(name)))
+                    if error:
+                        self.complete = False
+                        self.note = f'new folders not watched ({error}), opens may be missing'
+
+    def wrap(self, args: List[str]) -> List[str]:
+        """Wraps a command to trace the files it opens (strace
+        backend, each command to its own log)
+
+        Parameters
+        ----------
+        args : List[str]
+            command
+
+        Returns
+        -------
+        List[str]
+            command traced
+        """
+        if self.backend != 'strace':
+            return args
+        os.makedirs(self._tracePath, exist_ok=True)
+        logFile = os.path.join(self._tracePath, f'strace.{len(self._logs) + 1}.log')
+        self._logs.append(logFile)
+
+        return [
+            'strace', '-f', '-qq', '-y', '-e', 'trace=open,openat,openat2',
+            '-e', 'signal=none', '-o', logFile, '--', *args
+        ]
+
+    def sample(self, pids: List[int]) -> None:
+        """Samples the read offsets of the data files open by the
+        processes of the run (every SAMPLE_INTERVAL seconds). The
+        largest offset of each file is the bytes read (at least)
+
+        Parameters
+        ----------
+        pids : List[int]
+            processes started by the run (process group leaders)
+        """
+        now = time.time()
+        if self.backend == 'off' or not pids or now - self._lastSample < SAMPLE_INTERVAL:
+            return
+        self._lastSample = now
+        self._checkShared()
+        for pid in getProcessTree(pids):
+            try:
+                fds = os.listdir(f'/proc/{pid}/fd')
+            except OSError:
+                continue
+            for fd in fds:
+                try:
+                    path = os.readlink(f'/proc/{pid}/fd/{fd}')
+                    if not path.startswith(self._dataRoot):
+                        continue
+                    with open(f'/proc/{pid}/fdinfo/{fd}') as fileIn:
+                        position = int(fileIn.readline().split()[1])
+                except (OSError, IndexError, ValueError):
+                    continue
+                self._read[path] = max(self._read.get(path, 0), position)
+
+    def stop(self) -> None:
+        """Stops tracing and collects the files opened. Later calls do
+        nothing
+        """
+        self._checkShared()
+        self._unregister()
+        if self._thread:
+            os.write(self._stopPipe[1], b'\0')
+            self._thread.join()
+            self._thread = None
+            for fd in (self._fd, *self._stopPipe):
+                os.close(fd)
+            self._fd = -1
+            for (wd, name), count in self._events.items():
+                path = os.path.join(self._folders[wd], os.fsdecode(name))
+                self._opens[path] = self._opens.get(path, 0) + count
+            self._events = dict()
+        for logFile in self._logs:
+            try:
+                with open(logFile, errors='replace') as fileIn:
+                    for line in fileIn:
+                        match = STRACE_OPEN_REGEX.search(line.rstrip())
+                        if match and match[1].startswith(self._dataRoot):
+                            self._opens[match[1]] = self._opens.get(match[1], 0) + 1
+            except OSError as error:
+                self.complete = False
+                self.note = f'strace log not read ({error})'
+        self._logs = list()
+
+    @property
+    def files(self) -> List[Dict[str, Any]]:
+        """Data files opened: 'path', 'opens' (0 if only seen open
+        while sampling), 'size' and 'read' (bytes read at least, None
+        if never sampled), sorted by path"""
+        files = list()
+        for path in sorted(set(self._opens).union(self._read)):
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = None
+            files.append({
+                'path': path,
+                'opens': self._opens.get(path, 0),
+                'size': size,
+                'read': self._read.get(path)
+            })
+
+        return files
+
+    def writeJson(self, outFile: str) -> None:
+        """Writes the data files opened (see files) to a JSON file
+
+        Parameters
+        ----------
+        outFile : str
+            JSON file
+        """
+        with open(outFile, 'w') as fileOut:
+            json.dump(
+                {
+                    'dataPath': self._dataPath,
+                    'backend': self.backend,
+                    'complete': self.complete,
+                    'shared': self.shared,
+                    'files': self.files
+                },
+                fileOut,
+                indent=4
+            )
@@ -1,5 +1,6 @@
 # removeFields.py
-from typing import List, Union
+from typing import Any, Dict, List, Union
+import PySimpleGUI as sg
 import json
 
 def updateField(
@@ -27,7 +28,8 @@ def updateListboxItems(
     append: bool = True
 ) -> None:
     """Updates items from a Listbox. If `files` is
-    None, the selected values are removed
+    None, the selected values are removed. Files already
+    in the Listbox are not added again
 
     Parameters
     ----------
@@ -43,14 +45,13 @@ def updateListboxItems(
     currentFiles = window[key].get_list_values()
     if files:
         if append:
-            for file in files:
-                currentFiles.append(file)
-            window[key].update(sorted(currentFiles))
+            window[key].update(sorted(set(currentFiles).union(files)))
         else:
-            window[key].update(sorted(files))
+            window[key].update(sorted(set(files)))
     else:
         selectedIndexes = window[key].get_indexes()
         if selectedIndexes:
+            selectedIndexes = set(selectedIndexes)
             newValues = [file for index, file in enumerate(currentFiles) if index not in selectedIndexes]
             window[key].update(sorted(newValues))
 
@@ -59,7 +60,8 @@ def enableDisableFields(
     exceptionKeys: List[str],
     enable: bool = False
 ) -> None:
-    """Enable / disable fields 
+    """Enable / disable fields. Text and progress elements
+    cannot be disabled and are skipped
 
     Parameters
     ----------
@@ -73,6 +75,8 @@ def enableDisableFields(
     disabled = not enable
     windowKeys = window.key_dict.keys()
     for field in windowKeys:
+        if isinstance(window[field], (sg.Text, sg.ProgressBar)):
+            continue
         if field not in exceptionKeys:
             window[field].update(disabled=disabled)
 
@@ -93,3 +97,29 @@ def setFromJson(window: object, jsonFile: str) -> None:
     for key in data:
         window[key].update(data[key])
 
+
+def getWindowItems(window: object) -> Dict[str, Any]:
+    """Gets the values of the App fields (inputs, lists, checkboxes
+    and combos), as saved in structure.json
+
+    Parameters
+    ----------
+    window : object
+        App window
+
+    Returns
+    -------
+    Dict[str, Any]
+        field key and value
+    """
+    items = dict()
+    windowDict = window.key_dict
+    for key in windowDict.keys():
+        if isinstance(windowDict[key], sg.Input):
+            items[key] = windowDict[key].get()
+        if isinstance(windowDict[key], sg.Listbox):   
+            items[key] = windowDict[key].get_list_values()
+        if isinstance(windowDict[key], (sg.Checkbox, sg.Combo)):
+            items[key] = windowDict[key].get()
+
+    return items